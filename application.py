@@ -7,21 +7,114 @@
 import os
 from common.config import get_config
 from common.logger import log, logging
-from lib.hana_api import HanaAPI
+import lib.fid_columns as fid_columns
+from lib.bar_aggregator import create_bar_aggregator
+from lib.collector_state import CollectorState
+from lib.gap_backfill import create_gap_backfill
+from lib.journal import create_journal_writer
+from lib.metrics import REGISTRY, create_metrics_server
+from lib.profiler import create_profiler
+from lib.pubsub import create_pubsub_server
+from lib.sequence import create_sequence_store
+from lib.shm_feed import create_shm_publisher
+from lib.sink import create_sink_pipeline
+from lib.subscription import configured_targets
+from lib.tick_cache import create_tick_cache, create_tick_cache_server
 from lib.transaction_processor import TransactionProcessor
-import util.datetime_util as datetime_util
+from lib.watchdog import create_watchdog
+
+
+# FIELD
+# 8: TIME
+# 9: DATE
+# 1098: SELL SIGN
+# 30: SELL START PRICE
+# 31: SELL HIGH PRICE
+# 32: SELL LOW PRICE
+# 33: SELL CLOSE PRICE
+# 6: BUY SIGN
+# 40: BUY START PRICE
+# 41: BUY HIGH PRICE
+# 42: BUY LOW PRICE
+# 43: BUY CLOSE PRICE
+# 666: SPREAD
+FID_OUTPUT_FIELDS = ('8', '9', '30', '31', '32', '33', '6', '40', '41', '42', '43', '1098', '666')
+
+_LOGINS = REGISTRY.counter('hana1q_logins_total', 'Agent login results.', ('result',))
+
+
+def create_api(config, headless=False):
+    """ create 1Q API handler (replay stand-in when replay mode is enabled)
+    :param config: configuration for API HANDLER
+    :param headless: create the windowless control
+    :return: API handler
+    """
+    if config.get('replay', {}).get('enabled') is True:
+        from lib.replay_api import ReplayHanaAPI
+        return ReplayHanaAPI(config)
+    if headless is True:
+        from lib.hana_api import HeadlessHanaAPI
+        return HeadlessHanaAPI(config)
+    from lib.hana_api import HanaAPI
+    return HanaAPI(config)
 
 
 class Application:
 
-    def __init__(self, window=None):
+    def __init__(self, window=None, api=None, headless=False, serve=True, collect=True):
         """ constructor
-        :param window: window handler
+        :param window: window handler (refreshed from the collector state by its own timer)
+        :param api: API handler (default: created from configuration)
+        :param headless: create the windowless API control (no QApplication/widget required)
+        :param serve: serve local consumers (metrics, tick cache, shared memory feed, pub/sub) while listening
+        :param collect: create the collector subsystems (journal, sinks, sequences, tick cache, bars, gaps,
+                        watchdog, profiler). False: FID only application touching none of the collector files
+                        or ports, ex: backfill next to a live collector (implies serve=False)
         """
         self._API_CONFIG = get_config('1q_api')
-        self._api = HanaAPI(self._API_CONFIG)
-        self._transaction_processor = TransactionProcessor()
+        self._FID_CONFIG = get_config('fid', {})
+        # FID responses are parsed from the event data block unless configured (or found) otherwise
+        self._fid_extraction = self._FID_CONFIG.get('extraction', 'block')
+        self._api = api if api is not None else create_api(self._API_CONFIG, headless)
+        # every collector subsystem is disabled through its configuration section
+        section = (lambda name: get_config(name, None)) if collect is True else (lambda name: None)
+        self._journal = create_journal_writer(section('journal'))
+        self._sink_pipeline = create_sink_pipeline(section('sink'), 'sink')
+        self._targets = configured_targets(self._API_CONFIG)
+        # restart-safe sequences and duplicate index shared by every processor (None: per-run counters)
+        self._sequences = create_sequence_store(section('sequence'))
+        # most recent ticks per symbol for local consumers (None: cache disabled)
+        self._tick_cache = create_tick_cache(section('tick_cache'))
+        # ports and the shared memory segment are taken by listen_real (None: not serving)
+        self._serve = serve is True and collect is True
+        self._metrics_server = None
+        self._tick_cache_server = None
+        self._shm_publisher = None
+        self._pubsub_server = None
+        # symbol - transaction processor (every processor shares the sink pipeline)
+        self._transaction_processors = {}
+        self._BARS_CONFIG = section('bars')
+        self._bar_pipeline = create_sink_pipeline(self._BARS_CONFIG.get('sink'), 'bars') if self._BARS_CONFIG else None
+        # symbol - bar aggregator (None: aggregation disabled)
+        self._bar_aggregators = {}
+        self._UI_CONFIG = get_config('ui', {})
+        self._state = CollectorState(self._UI_CONFIG.get('max_log_lines', 1000))
+        # backfilled bars go to the gap sink (default: bar sink)
+        gaps_config = section('gaps')
+        self._gap_pipeline = create_sink_pipeline(gaps_config.get('sink'), 'gaps') if gaps_config else None
+        gap_pipeline = self._gap_pipeline or self._bar_pipeline
+        self._gap_detector, self._gap_backfiller = create_gap_backfill(
+            gaps_config, self, gap_pipeline.put if gap_pipeline is not None else lambda row: None)
+        # inactivity is only an outage in sessions where gaps are detected
+        self._watchdog = create_watchdog(section('watchdog'), self, self._gap_detector)
+        # agent calls are profiled from the first one (login included)
+        self._profiler = create_profiler(section('profiler'))
+        if self._profiler is not None:
+            self._profiler.install(self._api, self)
+            self._profiler.start()
         self._window = window
+        if self._window is not None:
+            self._window.bind_state(self._state, self._UI_CONFIG.get('refresh_hz', 5), self.get_sink_stats)
 
     def _log(self, level, message):
         """ logger
@@ -33,7 +126,7 @@ class Application:
         if self._window is not None:
             if logging.getLevelName(level) == 'ERROR':
                 message = 'ERROR: ' + str(message)
-            self._window.append_log(message)
+            self._state.append_log(message)
 
     def get_connection_state(self) -> bool:
         """ check API connection status
@@ -54,6 +147,20 @@ class Application:
         """ disconnect
         :return: void
         """
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            REGISTRY.unregister_collector(self.collect_metrics)
+            self._metrics_server = None
+        if self._tick_cache_server is not None:
+            self._tick_cache_server.stop()
+            self._tick_cache_server = None
+        if self._pubsub_server is not None:
+            self._pubsub_server.stop()
+            self._pubsub_server = None
+        if self._gap_backfiller is not None:
+            self._gap_backfiller.stop()
         is_connected = self.get_connection_state()
         logout_successful = False
         if is_connected is True:
@@ -62,6 +169,24 @@ class Application:
         unregister_successful = self._api.unregister_real_all()
         self._log(logging.INFO, '[disconnect] Unregister successful: {}'.format(str(unregister_successful)))
         self._api.terminate()
+        if self._profiler is not None:
+            self._profiler.stop()
+        if self._sequences is not None:
+            self._sequences.close()
+        if self._shm_publisher is not None:
+            self._shm_publisher.close()
+            self._shm_publisher = None
+        if self._journal is not None:
+            self._journal.close()
+        if self._sink_pipeline is not None:
+            self._sink_pipeline.stop()
+        for aggregator in self._bar_aggregators.values():
+            if aggregator is not None:
+                aggregator.flush()
+        if self._bar_pipeline is not None:
+            self._bar_pipeline.stop()
+        if self._gap_pipeline is not None:
+            self._gap_pipeline.stop()
 
     def connect(self):
         """ connect
@@ -81,6 +206,7 @@ class Application:
         # 2nd login attempt (expect success)
         self._api.set_login_mode(0, 0)
         login_successful = self._api.login()
+        _LOGINS.labels('success' if login_successful else 'failure').inc()
         if login_successful is False:
             raise Exception('[connect] Login process failed.')
 
@@ -88,33 +214,256 @@ class Application:
         self._log(logging.INFO, '[connect] Login process successful. [login: {}, state: {}]'
                   .format(str(login_successful), str(login_state)))
 
+    def reconnect(self) -> bool:
+        """ drop the current session, login again and register every real subscription again
+        :return: reconnect successful
+        """
+        try:
+            self._api.terminate()
+        except Exception as _e:
+            self._log(logging.ERROR, '[reconnect] Terminate failed. ({})'.format(str(_e)))
+        self.connect()
+        if self._sequences is not None:
+            self._sequences.restart_run()
+        subscriptions = self._api.subscriptions
+        register_successful = subscriptions.register_all(force=True)
+        for subscription in subscriptions:
+            if subscription.registered:
+                self._api.get_real_output_data(subscription.real_name, subscription.symbol, wait=False)
+        self._log(logging.INFO, '[reconnect] Register real: {}'.format(str(register_successful)))
+        return register_successful
+
+    def call_soon(self, callback):
+        """ call function on the agent event thread (serialised with real event handling)
+        :param callback: function()
+        :return: void
+        """
+        self._api.call_soon(callback)
+
+    def dump_profile(self):
+        """ write the agent call profile report (on demand, also written on disconnect)
+        :return: report text (None: profiler disabled)
+        """
+        if self._profiler is None:
+            return None
+        self._profiler.dump()
+        return self._profiler.report()
+
+    def get_watchdog_stats(self):
+        """ connection watchdog counters (outages, reconnect time, downtime)
+        :return: counters dictionary (None: watchdog disabled)
+        """
+        if self._watchdog is None:
+            return None
+        return self._watchdog.stats()
+
     # -------------------------------------------------------------------------------------------------
     # REAL PART
     # -------------------------------------------------------------------------------------------------
 
-    def on_receive_real_event(self, message):
-        """ receive REAL EVENT
+    def on_receive_real_event(self, message, processor, aggregator=None):
+        """ receive REAL EVENT (routed by the subscription of its symbol)
         :param message: EVENT message
+        :param processor: transaction processor of the subscribed symbol
+        :param aggregator: bar aggregator of the subscribed symbol (None: aggregation disabled)
         :return: void
         """
-        transaction = self._transaction_processor.process(message)
-        self._meta.set_meta('EVENT_AT', transaction['date_time_seq'])
-        self._window.set_received_at(datetime_util.datetime_sequence_to_datetime(transaction['date_time_seq']))
-        if self._window is not None:
-            if transaction['id'] is not None:
-                self._window.set_last_transaction('ID: {}, VALUE: {}'.format(str(transaction['id']),
-                                                                             str(transaction['price'])))
-            else:
-                self._window.set_last_transaction('GENERATED TRANSACTION ID DUPLICATED.')
+        if self._journal is not None:
+            self._journal.append(message)
+        transaction = processor.process(message)
+        if transaction.seq is None:
+            # re-delivered tick (replay, reconnect): already sent and aggregated
+            self._state.on_duplicated()
+            return
+        if self._shm_publisher is not None:
+            self._shm_publisher.publish(transaction)
+        if self._pubsub_server is not None:
+            self._pubsub_server.publish(transaction)
+        if aggregator is not None:
+            aggregator.on_transaction(transaction)
+        if self._gap_detector is not None:
+            self._gap_detector.on_transaction(transaction.symbol, transaction.date_time_seq)
+        self._state.on_transaction(transaction)
+
+    def _get_transaction_processor(self, symbol):
+        """ transaction processor of symbol
+        :param symbol: symbol
+        :return: transaction processor
+        """
+        processor = self._transaction_processors.get(symbol)
+        if processor is None:
+            processor = TransactionProcessor(self._sink_pipeline, symbol, sequences=self._sequences,
+                                             tick_cache=self._tick_cache)
+            self._transaction_processors[symbol] = processor
+        return processor
+
+    def _get_bar_aggregator(self, symbol):
+        """ bar aggregator of symbol
+        :param symbol: symbol
+        :return: bar aggregator (None: aggregation disabled)
+        """
+        if symbol not in self._bar_aggregators:
+            emit = self._bar_pipeline.put if self._bar_pipeline is not None else lambda row: None
+            self._bar_aggregators[symbol] = create_bar_aggregator(self._BARS_CONFIG, emit, symbol)
+        return self._bar_aggregators[symbol]
+
+    def add_symbol(self, real_name, symbol) -> bool:
+        """ subscribe REAL of symbol (while listening, no reconnect required)
+        :param real_name: real name (ex: V00)
+        :param symbol: symbol
+        :return: register successful
+        """
+        processor = self._get_transaction_processor(symbol)
+        aggregator = self._get_bar_aggregator(symbol)
+        register_real = self._api.subscriptions.add(
+            real_name, symbol, lambda message: self.on_receive_real_event(message, processor, aggregator))
+        self._log(logging.INFO, '[add_symbol] Register real: {} {} ({})'.format(real_name, symbol, str(register_real)))
+        if register_real is True:
+            self._api.get_real_output_data(real_name, symbol, wait=False)
+        return register_real
+
+    def remove_symbol(self, real_name, symbol) -> bool:
+        """ unsubscribe REAL of symbol (listening ends with the last subscription)
+        :param real_name: real name
+        :param symbol: symbol
+        :return: unregister successful
+        """
+        unregister_real = self._api.subscriptions.remove(real_name, symbol)
+        self._log(logging.INFO, '[remove_symbol] Unregister real: {} {} ({})'
+                  .format(real_name, symbol, str(unregister_real)))
+        return unregister_real
 
     def listen_real(self):
-        """ listen REAL
+        """ listen REAL of every configured target
         :return: void
         """
-        self._api.set_real_event_handler(self.on_receive_real_event)
-        register_real = self._api.register_real()
-        self._log(logging.INFO, '[listen_real] Register real: {}'.format(str(register_real)))
-        self._api.get_real_output_data()
+        if self._sink_pipeline is not None:
+            self._sink_pipeline.start()
+        if self._bar_pipeline is not None:
+            self._bar_pipeline.start()
+        if self._gap_pipeline is not None:
+            self._gap_pipeline.start()
+        if self._serve is True:
+            self._start_servers()
+        for real_name, symbol in self._targets:
+            self.add_symbol(real_name, symbol)
+        if self._gap_backfiller is not None:
+            self._gap_backfiller.start()
+        if self._watchdog is not None:
+            self._watchdog.start()
+        self._api.wait_real_events()
+
+    def _start_servers(self):
+        """ create and start the endpoints of local consumers (before the first real event)
+        :return: void
+        """
+        self._metrics_server = create_metrics_server(get_config('metrics', None))
+        if self._metrics_server is not None:
+            REGISTRY.register_collector(self.collect_metrics)
+            self._metrics_server.start()
+        self._tick_cache_server = create_tick_cache_server(get_config('tick_cache', None), self._tick_cache)
+        if self._tick_cache_server is not None:
+            self._tick_cache_server.start()
+        # shared memory feed of processed ticks for strategy processes on this host (None: feed disabled)
+        self._shm_publisher = create_shm_publisher(get_config('shm_feed', None))
+        # TCP / WebSocket fan-out of processed ticks for downstream clients (None: server disabled)
+        self._pubsub_server = create_pubsub_server(get_config('pubsub', None))
+        if self._pubsub_server is not None:
+            self._pubsub_server.start()
+
+    def get_gap_stats(self):
+        """ gap detection/backfill counters
+        :return: counters dictionary (None: gap detection disabled)
+        """
+        if self._gap_backfiller is None:
+            return None
+        stats = self._gap_backfiller.stats()
+        stats['detected'] = self._gap_detector.detected
+        return stats
+
+    def get_sequence_stats(self):
+        """ per-symbol sequence counters (next sequence, remembered keys, duplicated ticks)
+        :return: symbol - counters dictionary (None: sequence store disabled)
+        """
+        if self._sequences is None:
+            return None
+        return self._sequences.stats()
+
+    def get_tick_cache(self):
+        """ in-memory tick cache (in-process consumers, the query endpoint serves the others)
+        :return: tick cache (None: cache disabled)
+        """
+        return self._tick_cache
+
+    def get_pubsub_stats(self):
+        """ pub/sub server and per-connection counters
+        :return: counters dictionary (None: server disabled)
+        """
+        if self._pubsub_server is None:
+            return None
+        return self._pubsub_server.stats()
+
+    def get_symbols(self):
+        """ subscribed symbols
+        :return: list of symbols
+        """
+        return [subscription.symbol for subscription in self._api.subscriptions]
+
+    def get_subscription_stats(self):
+        """ per-symbol subscription counters
+        :return: "real_name:symbol" - counters dictionary
+        """
+        return self._api.subscriptions.stats()
+
+    def collect_metrics(self):
+        """ scrape time metrics (runs on the metrics server thread, reads counters only)
+        :return: list of (name, type, help, [(labels dictionary, value)])
+        """
+        subscriptions = list(self._api.subscriptions)
+        pipelines = [pipeline for pipeline in (self._sink_pipeline, self._bar_pipeline, self._gap_pipeline)
+                     if pipeline is not None]
+        pipeline_stats = [(pipeline.name, pipeline.stats()) for pipeline in pipelines]
+        families = [
+            ('hana1q_ticks_received_total', 'counter', 'Real events received per subscription.',
+             [({'real_name': s.real_name, 'symbol': s.symbol}, s.received) for s in subscriptions]),
+            ('hana1q_ticks_unrouted_total', 'counter', 'Real events without subscription (dropped).',
+             [({}, self._api.subscriptions.unrouted)]),
+            ('hana1q_subscription_registered', 'gauge', 'Real subscription registered (1) or not (0).',
+             [({'real_name': s.real_name, 'symbol': s.symbol}, 1 if s.registered else 0) for s in subscriptions]),
+            ('hana1q_sink_queue_depth', 'gauge', 'Transactions queued in the sink pipeline.',
+             [({'pipeline': name}, stats['queue_depth']) for name, stats in pipeline_stats]),
+            ('hana1q_sink_dropped_total', 'counter', 'Transactions dropped by sink backpressure.',
+             [({'pipeline': name}, stats['dropped']) for name, stats in pipeline_stats]),
+            ('hana1q_sink_written_total', 'counter', 'Transactions written by the sink.',
+             [({'pipeline': name}, stats['written']) for name, stats in pipeline_stats])
+        ]
+        if self._watchdog is not None:
+            families.append(('hana1q_connection_down', 'gauge', 'Outage in progress (1) or not (0).',
+                             [({}, 1 if self._watchdog.stats()['down'] else 0)]))
+        if self._pubsub_server is not None:
+            families.extend(self._pubsub_server.collect_metrics())
+        return families
+
+    def get_state(self):
+        """ collector state snapshot
+        :return: collector state
+        """
+        return self._state
+
+    def get_bar_stats(self):
+        """ per-symbol bar aggregator counters
+        :return: symbol - counters dictionary
+        """
+        return {symbol: aggregator.stats() for symbol, aggregator in self._bar_aggregators.items()
+                if aggregator is not None}
+
+    def get_sink_stats(self):
+        """ sink pipeline counters
+        :return: counters dictionary (None: no sink configured)
+        """
+        if self._sink_pipeline is None:
+            return None
+        return self._sink_pipeline.stats()
 
     # -------------------------------------------------------------------------------------------------
     # FID PART
@@ -135,13 +484,14 @@ class Application:
         """
         self._api.release_request_id(rid)
 
-    def init_fid(self, rid):
+    def init_fid(self, rid, symbol=None):
         """ initialize FID
         :param rid: request id
+        :param symbol: symbol (default: first configured target symbol)
         :return: initialize successful
         """
         f = self._api.set_fid_input(rid, '9001', 'FX')
-        s = self._api.set_fid_input(rid, '9002', 'D05GBP/AUD')
+        s = self._api.set_fid_input(rid, '9002', symbol or self._targets[0][1])
         g = self._api.set_fid_input(rid, 'GID', '1003')
         t = self._api.set_fid_input(rid, '9119', '1')
         return f and s and g and t
@@ -157,32 +507,71 @@ class Application:
         e = self._api.set_fid_input(rid, '9035', end_date_seq)
         return s and e
 
-    def request_fid(self, rid):
+    def request_fid(self, rid, pn='1', pnc='', req_count=9999, wait=True):
         """ request FID
         :param rid: request id
+        :param pn: classification of continuous queries (ref. HanaAPI.request_fid_data_list)
+        :param pnc: continuous query context of the previous response
+        :param req_count: number of rows per page (max: 9999)
+        :param wait: block until the response event is handled
         :return: fid number
         """
-        # FIELD
-        # 8: TIME
-        # 9: DATE
-        # 1098: SELL SIGN
-        # 30: SELL START PRICE
-        # 31: SELL HIGH PRICE
-        # 32: SELL LOW PRICE
-        # 33: SELL CLOSE PRICE
-        # 6: BUY SIGN
-        # 40: BUY START PRICE
-        # 41: BUY HIGH PRICE
-        # 42: BUY LOW PRICE
-        # 43: BUY CLOSE PRICE
-        # 666: SPREAD
-        fields = '8,9,30,31,32,33,6,40,41,42,43,1098,666'
-        return self._api.request_fid_data_list(rid, fields, '1', '', 9999, 9999)
+        return self._api.request_fid_data_list(rid, ','.join(FID_OUTPUT_FIELDS), pn, pnc, 9999, req_count, wait)
+
+    def set_fid_event_handler(self, event_handler):
+        """ set FID response handler
+        :param event_handler: handler(rid, block, length)
+        :return: void
+        """
+        if self._profiler is not None and event_handler is not None:
+            event_handler = self._profiler.wrap('event:fid', event_handler)
+        self._api.set_fid_event_handler(event_handler)
+
+    def get_fid_next_context(self):
+        """ continuous query state of the FID response being handled
+        :return: (pre next classification, pre next context)
+        """
+        return self._api.get_fid_next_context()
+
+    def get_fid_batch(self, rid, block=None, symbol=None):
+        """ read FID response into typed columns
+        block extraction parses the data block delivered with the FID event in one pass (the agent has no
+        row or column output call, cell extraction costs one GetFidOutputData call per cell). a block that
+        does not split into the response row count with the configured separators switches the application
+        to cell extraction.
+        :param rid: request id
+        :param block: data block delivered with the FID event (used by block extraction)
+        :param symbol: symbol of the batch (default: first configured target symbol)
+        :return: column batch
+        """
+        symbol = symbol or self._targets[0][1]
+        if self._fid_extraction == 'block' and block:
+            try:
+                batch = fid_columns.extract_block(block, FID_OUTPUT_FIELDS, symbol,
+                                                  row_separator=self._FID_CONFIG.get('block_row_separator', '\n'),
+                                                  field_separator=self._FID_CONFIG.get('block_field_separator', '\t'))
+                count = self._api.get_fid_output_count(rid)
+                if len(batch) == count:
+                    return batch
+                reason = 'rows: {}, expected: {}'.format(str(len(batch)), str(count))
+            except fid_columns.FidColumnProcessException as _e:
+                reason = str(_e)
+            log.error('[app] FID data block does not match the configured separators, cell extraction from now. '
+                      '({})'.format(reason))
+            self._fid_extraction = 'cell'
+        return fid_columns.extract_cells(self._api, rid, symbol)
+
+    def process_events(self, timeout_ms=100):
+        """ deliver pending API events
+        :param timeout_ms: maximum processing time
+        :return: void
+        """
+        self._api.process_events(timeout_ms)
 
     def get_fid_output_data(self, rid, fid_code, row):
         """ return FID request output
         :param rid: request id
-        :param fid_code: FID CODE (ref. request_fid method comment)
+        :param fid_code: FID CODE (ref. FID_OUTPUT_FIELDS comment)
         :param row: row index
         :return: response output
         """
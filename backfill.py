@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+    Historical FID backfill
+    author: modorigoon
+    since: 0.2.0
+"""
+import sys
+from common.logger import init_logging, log
+from common.config import get_config, get_opts
+from application import Application
+from lib.backfill import create_backfill_engine
+from lib.subscription import configured_targets
+
+
+def main():
+    init_logging()
+    opts = get_opts()
+    if 'f' not in opts:
+        log.error('[backfill] start date (-f YYYYMMDD) is required.')
+        sys.exit(1)
+    api_config = get_config('1q_api')
+    qt_app = None
+    if api_config.get('replay', {}).get('enabled') is not True:
+        # the COM control needs a Qt application even without a window
+        from PyQt5.QtWidgets import QApplication
+        qt_app = QApplication(sys.argv)
+    # FID requests only: the journal, sinks, sequences, bars, gaps, watchdog, profiler and every port of the
+    # collector stay with the collector
+    app = Application(collect=False)
+    try:
+        app.connect()
+        backfill_config = get_config('backfill')
+        symbols = list(dict.fromkeys(symbol for _, symbol in configured_targets(api_config)))
+        for symbol in symbols:
+            engine = create_backfill_engine(app, backfill_config, symbol)
+            stats = engine.run(opts['f'], opts.get('t', opts['f']))
+            log.info('[backfill] result. (symbol: {}) {}'.format(symbol, str(stats)))
+    except Exception as _e:
+        log.error('[backfill] ERROR: {}'.format(str(_e)))
+        sys.exit(1)
+    finally:
+        app.disconnect()
+        del qt_app
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+    Date time sequence conversion micro benchmark
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.datetime_benchmark -e local [count]
+"""
+import calendar
+import datetime
+import sys
+import time
+from util.datetime_util import (date_time_columns_to_epoch, datetime_sequence_to_datetime, datetime_to_sequence,
+                                sequence_to_epoch)
+
+_TICKS_PER_SECOND = 10
+_ROWS_PER_DATE = 1440
+
+
+def _measure(name, func, values):
+    """ run function over every value
+    :param name: case name
+    :param func: function(value)
+    :param values: input values
+    :return: elapsed seconds
+    """
+    started_at = time.perf_counter()
+    for value in values:
+        func(value)
+    elapsed = time.perf_counter() - started_at
+    print('{:<28} {:>10,} calls  {:>8.3f} s  {:>8.1f} ns/call'
+          .format(name, len(values), elapsed, elapsed / len(values) * 1e9))
+    return elapsed
+
+
+def _legacy_to_datetime(sequence):
+    sequence = str(sequence)
+    if len(sequence) != 14:
+        return None
+    return datetime.datetime.strptime(sequence, '%Y%m%d%H%M%S')
+
+
+def _legacy_to_sequence(date_time):
+    return date_time.strftime('%Y%m%d%H%M%S')
+
+
+def _legacy_to_epoch(sequence):
+    return float(calendar.timegm((int(sequence[0:4]), int(sequence[4:6]), int(sequence[6:8]),
+                                  int(sequence[8:10]), int(sequence[10:12]), int(sequence[12:14]))))
+
+
+def _legacy_columns_to_epoch(columns):
+    dates, times = columns
+    return [_legacy_to_epoch('{:08d}{:06d}'.format(date, hhmmss)) for date, hhmmss in zip(dates, times)]
+
+
+def _fast_columns_to_epoch(columns):
+    return date_time_columns_to_epoch(*columns)
+
+
+def main(count):
+    epoch = calendar.timegm((2020, 3, 2, 0, 0, 0))
+    # tick stream: _TICKS_PER_SECOND ticks share one date time sequence
+    sequences = [time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + i // _TICKS_PER_SECOND)) for i in range(count)]
+    # distinct seconds (memo never hits)
+    distinct = [time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + i)) for i in range(count)]
+    date_times = [datetime.datetime.strptime(sequence, '%Y%m%d%H%M%S') for sequence in distinct]
+    # FID response pages: minute bars, dates as YYYYMMDD and times as HHMMSS integers
+    pages = []
+    for start in range(0, count, _ROWS_PER_DATE):
+        stamps = [time.gmtime(epoch + (start + i) * 60) for i in range(min(_ROWS_PER_DATE, count - start))]
+        pages.append(([stamp.tm_year * 10000 + stamp.tm_mon * 100 + stamp.tm_mday for stamp in stamps],
+                      [stamp.tm_hour * 10000 + stamp.tm_min * 100 + stamp.tm_sec for stamp in stamps]))
+
+    for fast, legacy, value in ((datetime_sequence_to_datetime, _legacy_to_datetime, distinct[-1]),
+                                (sequence_to_epoch, _legacy_to_epoch, distinct[-1]),
+                                (lambda d: datetime_to_sequence(d, 'second'), _legacy_to_sequence, date_times[-1])):
+        if fast(value) != legacy(value):
+            raise AssertionError('conversion mismatch: {} != {}'.format(fast(value), legacy(value)))
+    if list(_fast_columns_to_epoch(pages[0])) != _legacy_columns_to_epoch(pages[0]):
+        raise AssertionError('column conversion mismatch')
+
+    legacy = _measure('legacy strptime (ticks)', _legacy_to_datetime, sequences)
+    fast = _measure('fast datetime (ticks)', datetime_sequence_to_datetime, sequences)
+    legacy_distinct = _measure('legacy strptime (distinct)', _legacy_to_datetime, distinct)
+    fast_distinct = _measure('fast datetime (distinct)', datetime_sequence_to_datetime, distinct)
+    print('to datetime speed up: {:.2f}x (ticks), {:.2f}x (distinct seconds)'
+          .format(legacy / fast, legacy_distinct / fast_distinct))
+    legacy_reverse = _measure('legacy strftime', _legacy_to_sequence, date_times)
+    fast_reverse = _measure('fast to sequence', lambda d: datetime_to_sequence(d, 'second'), date_times)
+    print('to sequence speed up: {:.2f}x'.format(legacy_reverse / fast_reverse))
+    legacy_epoch = _measure('legacy timegm epoch', _legacy_to_epoch, sequences)
+    fast_epoch = _measure('fast epoch', sequence_to_epoch, sequences)
+    print('to epoch speed up: {:.2f}x'.format(legacy_epoch / fast_epoch))
+    legacy_columns = _measure('legacy FID rows (pages)', _legacy_columns_to_epoch, pages)
+    fast_columns = _measure('vectorized FID columns (pages)', _fast_columns_to_epoch, pages)
+    print('FID columns speed up: {:.2f}x ({:.1f} ns/row)'
+          .format(legacy_columns / fast_columns, fast_columns / count * 1e9))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 1000000)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+    Raw tick journal benchmark (journal append vs debug log line)
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.journal_benchmark -e local [count]
+"""
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import time
+from lib.journal import JournalReader, JournalWriter
+from lib.synthetic import generate_v00_blocks
+
+
+def _measure(name, func, blocks):
+    """ run function over every block
+    :param name: case name
+    :param func: function(block)
+    :param blocks: real blocks
+    :return: elapsed seconds
+    """
+    started_at = time.perf_counter()
+    for block in blocks:
+        func(block)
+    elapsed = time.perf_counter() - started_at
+    print('{:<16} {:>10,} blocks  {:>8.3f} s  {:>8.1f} ns/block'
+          .format(name, len(blocks), elapsed, elapsed / len(blocks) * 1e9))
+    return elapsed
+
+
+def main(count):
+    blocks = list(generate_v00_blocks(count))
+    directory = tempfile.mkdtemp(prefix='journal-benchmark-')
+    try:
+        # same handler and format the collector uses for its debug log
+        debug_log = logging.getLogger('journal-benchmark')
+        debug_log.propagate = False
+        debug_log.setLevel(logging.DEBUG)
+        handler = logging.handlers.RotatingFileHandler(os.path.join(directory, 'debug.log'),
+                                                       maxBytes=100 * 1024 * 1024, backupCount=1)
+        handler.setFormatter(logging.Formatter('[%(asctime)s][%(levelname)s|%(filename)s:%(lineno)s] >> %(message)s'))
+        debug_log.addHandler(handler)
+        logged = _measure('debug log', lambda block: debug_log.debug('[api] receive real: {}'.format(str(block))),
+                          blocks)
+        handler.close()
+
+        writer = JournalWriter(os.path.join(directory, 'journal'))
+        journaled = _measure('journal append', writer.append, blocks)
+        writer.close()
+        print('journal speed up: {:.1f}x'.format(logged / journaled))
+
+        started_at = time.perf_counter()
+        total = 0
+        for _, payload in JournalReader(os.path.join(directory, 'journal')).iter_records():
+            total += len(payload)
+        elapsed = time.perf_counter() - started_at
+        print('journal read     {:>10,} bytes   {:>8.3f} s  {:>8.1f} MB/s'.format(total, elapsed,
+                                                                                   total / elapsed / 1e6))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 1000000)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    Per-tick logging overhead benchmark
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.log_benchmark -e local [count]
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+from common.logger import init_logging, log
+from lib.synthetic import generate_v00_blocks
+from lib.transaction_processor import TransactionProcessor
+
+_SYMBOL = 'D05GBP/AUD'
+_FORMAT = '[%(asctime)s][%(levelname)s|%(filename)s:%(lineno)s] >> %(message)s'
+
+
+def _legacy_tick(processor):
+    """ per-tick path before the rework: eager receive/send/process log lines """
+    def tick(block):
+        log.debug('[api] receive real: {} {} {}'.format(str('V00'), str(_SYMBOL), str(block)))
+        transaction = processor.process(block)
+        log.info('[send] transaction: {}'.format(str(transaction)))
+        log.info('[process] transaction: {}, sent: {}'.format(str(transaction), str(True)))
+        return transaction
+    return tick
+
+
+def _current_tick(processor):
+    """ per-tick path of HanaAPIBase.real_data_handler and TransactionProcessor.process """
+    def tick(block):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('[api] receive real: %s %s %s', 'V00', _SYMBOL, block)
+        return processor.process(block)
+    return tick
+
+
+def _set_handler(path, asynchronous):
+    """ replace the logger handlers with a file handler (queued when asynchronous)
+    :param path: log file path
+    :param asynchronous: write from a listener thread
+    :return: listener or None
+    """
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+    file_handler = logging.FileHandler(path, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(_FORMAT))
+    if not asynchronous:
+        log.addHandler(file_handler)
+        return None
+    records = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def _measure(name, tick, blocks):
+    """ run tick over every block (mean and tail latency of the tick thread)
+    :param name: case name
+    :param tick: function(block)
+    :param blocks: real blocks
+    :return: elapsed seconds (calling thread only)
+    """
+    clock = time.perf_counter
+    latencies = []
+    started_at = clock()
+    for block in blocks:
+        tick_started_at = clock()
+        tick(block)
+        latencies.append(clock() - tick_started_at)
+    elapsed = clock() - started_at
+    latencies.sort()
+    print('{:<32} {:>10,} ticks  {:>8.3f} s  {:>10.1f} ns/tick  p99 {:>8.1f} us  max {:>9.1f} us'
+          .format(name, len(blocks), elapsed, elapsed / len(blocks) * 1e9,
+                  latencies[int(len(latencies) * 0.99)] * 1e6, latencies[-1] * 1e6))
+    return elapsed
+
+
+def main(count):
+    blocks = list(generate_v00_blocks(count))
+    processor = TransactionProcessor(symbol=_SYMBOL)
+    # the configured handlers are put back afterwards
+    init_logging()
+    handlers = list(log.handlers)
+    for handler in handlers:
+        log.removeHandler(handler)
+    level = log.level
+    directory = tempfile.mkdtemp(prefix='log-benchmark-')
+    try:
+        baseline = None
+        for level_name in ('DEBUG', 'INFO', 'WARNING'):
+            log.setLevel(level_name)
+            for asynchronous in (False, True):
+                mode = 'async' if asynchronous else 'sync'
+                path = os.path.join(directory, '{}-{}.log'.format(level_name.lower(), mode))
+                listener = _set_handler(path, asynchronous)
+                legacy = _measure('{} {} legacy'.format(level_name, mode), _legacy_tick(processor), blocks)
+                current = _measure('{} {} current'.format(level_name, mode), _current_tick(processor), blocks)
+                if listener is not None:
+                    drain_started_at = time.perf_counter()
+                    listener.stop()
+                    for handler in listener.handlers:
+                        handler.close()
+                    print('{:<32} {:>8.3f} s (listener drain, off the tick thread)'
+                          .format('', time.perf_counter() - drain_started_at))
+                print('{:<32} {:.2f}x'.format('speed up', legacy / current))
+                if baseline is None:
+                    baseline = legacy
+        print('DEBUG sync legacy is the previous default configuration ({:.1f} ns/tick)'
+              .format(baseline / len(blocks) * 1e9))
+    finally:
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+            handler.close()
+        for handler in handlers:
+            log.addHandler(handler)
+        log.setLevel(level)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 100000)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+    Transaction parser micro benchmark
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.parse_benchmark -e local [count]
+"""
+import logging
+import sys
+import time
+from common.logger import init_logging, log
+from lib.synthetic import generate_v00_blocks
+from lib.transaction import TransactionParser, price_to_fixed
+from lib.transaction_processor import TransactionProcessor
+
+
+def _measure(name, func, blocks):
+    """ run function over every block
+    :param name: case name
+    :param func: function(block)
+    :param blocks: real blocks
+    :return: elapsed seconds
+    """
+    started_at = time.perf_counter()
+    for block in blocks:
+        func(block)
+    elapsed = time.perf_counter() - started_at
+    print('{:<24} {:>10,} blocks  {:>8.3f} s  {:>8.1f} ns/block  {:>12,.0f} blocks/s'
+          .format(name, len(blocks), elapsed, elapsed / len(blocks) * 1e9, len(blocks) / elapsed))
+    return elapsed
+
+
+def _legacy_fixed_point(block):
+    """ legacy parser plus the price conversion the fast parser includes """
+    transaction = TransactionProcessor.parse(block)
+    transaction['price'] = price_to_fixed(transaction['price'])
+    return transaction
+
+
+def _legacy_process(block):
+    """ legacy per-tick path: parse and format the send/process log lines """
+    transaction = TransactionProcessor.parse(block)
+    '[send] transaction: {}'.format(str(transaction))
+    '[process] transaction: {}, sent: {}'.format(str(transaction), str(True))
+    return transaction
+
+
+def main(count):
+    # keep the log file out of the measurement (legacy path still formats its log lines eagerly)
+    init_logging()
+    log.setLevel(logging.WARNING)
+    blocks = list(generate_v00_blocks(count))
+    parse = TransactionParser('D05GBP/AUD').parse_function()
+    processor = TransactionProcessor(symbol='D05GBP/AUD')
+
+    legacy = _measure('legacy parse', TransactionProcessor.parse, blocks)
+    legacy_fixed = _measure('legacy parse + fixed', _legacy_fixed_point, blocks)
+    fast = _measure('fast parse', parse, blocks)
+    legacy_process = _measure('legacy process', _legacy_process, blocks)
+    fast_process = _measure('fast process', processor.process, blocks)
+    print('parse speed up: {:.2f}x (string fields), {:.2f}x (fixed-point price)'
+          .format(legacy / fast, legacy_fixed / fast))
+    print('process speed up: {:.2f}x'.format(legacy_process / fast_process))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 1000000)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+    End to end tick pipeline benchmark on the replay API stand-in
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.replay_benchmark -e local [count]
+"""
+import gc
+import logging
+import os
+import sys
+import time
+from common.config import get_config
+from common.logger import init_logging, log
+from application import Application
+from lib.replay_api import ReplayHanaAPI
+from lib.synthetic import generate_v00_blocks
+
+
+def _rss_bytes():
+    """ resident set size of current process
+    :return: bytes (None: unsupported platform)
+    """
+    try:
+        with open('/proc/self/statm') as rf:
+            return int(rf.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentile(sorted_values, percent):
+    """ nearest rank percentile
+    :param sorted_values: sorted values
+    :param percent: percentile (0 - 100)
+    :return: value
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(count, speed=0, log_level=logging.WARNING):
+    """ replay synthetic blocks through Application.on_receive_real_event
+    :param count: number of blocks
+    :param speed: replay speed (0: as fast as possible)
+    :param log_level: log level during the run
+    :return: result dictionary
+    """
+    init_logging()
+    log.setLevel(log_level)
+    blocks = list(generate_v00_blocks(count))
+    api = ReplayHanaAPI(get_config('1q_api'), blocks=blocks, speed=speed, record_latency=True)
+    app = Application(api=api)
+    app.connect()
+    gc.collect()
+    rss_before = _rss_bytes()
+    started_at = time.perf_counter()
+    app.listen_real()
+    elapsed = time.perf_counter() - started_at
+    rss_after = _rss_bytes()
+    app.disconnect()
+
+    latencies = sorted(api.handler_latencies)
+    return {
+        'ticks': api.delivered,
+        'elapsed_s': elapsed,
+        'ticks_per_s': api.delivered / elapsed if elapsed else 0.0,
+        'p50_us': _percentile(latencies, 50) * 1e6,
+        'p99_us': _percentile(latencies, 99) * 1e6,
+        'max_us': (latencies[-1] if latencies else 0.0) * 1e6,
+        'rss_growth_kb': None if rss_before is None else (rss_after - rss_before) / 1024
+    }
+
+
+def main(count):
+    result = run(count)
+    print('ticks          : {:,}'.format(result['ticks']))
+    print('elapsed        : {:.3f} s'.format(result['elapsed_s']))
+    print('throughput     : {:,.0f} ticks/s'.format(result['ticks_per_s']))
+    print('latency p50    : {:.1f} us'.format(result['p50_us']))
+    print('latency p99    : {:.1f} us'.format(result['p99_us']))
+    print('latency max    : {:.1f} us'.format(result['max_us']))
+    if result['rss_growth_kb'] is not None:
+        print('memory growth  : {:,.0f} KiB'.format(result['rss_growth_kb']))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 200000)
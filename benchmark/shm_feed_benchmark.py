@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+    Shared memory tick feed benchmark (publish cost and publish-to-read latency with several reader processes)
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.shm_feed_benchmark -e local [count]
+"""
+import multiprocessing
+import os
+import sys
+import time
+from lib.shm_feed import SharedMemoryPublisher, SharedMemoryReader
+from lib.transaction import Transaction
+
+_SYMBOLS = ('D05GBP/AUD', 'D05EUR/USD', 'D05USD/JPY', 'D05AUD/USD')
+_READERS = (1, 3)
+_TICKS_PER_SECOND = 5000
+_PACING_BATCH = 50
+
+
+def _read(name, count, ready, results):
+    """ reader process: poll until every tick was read or skipped
+    :param name: segment name
+    :param count: number of published ticks
+    :param ready: event set once attached
+    :param results: queue receiving (ticks, overruns, sorted latencies in ns)
+    :return: void
+    """
+    reader = SharedMemoryReader(name)
+    ready.set()
+    latencies = []
+    deadline = time.monotonic() + 60 + count / _TICKS_PER_SECOND
+    while len(latencies) + reader.overruns < count and time.monotonic() < deadline:
+        ticks = reader.poll()
+        if not ticks:
+            time.sleep(0)
+            continue
+        now = time.monotonic_ns()
+        latencies.extend(now - tick[4] for tick in ticks)
+    reader.close()
+    latencies.sort()
+    results.put((len(latencies), reader.overruns, latencies))
+
+
+def _percentile(latencies, ratio):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * ratio))] / 1e3 if latencies else float('nan')
+
+
+def _run(count, readers):
+    """ publish count ticks at _TICKS_PER_SECOND to reader processes
+    :param count: number of ticks
+    :param readers: number of reader processes
+    :return: void
+    """
+    name = 'hana1q-benchmark-{}'.format(os.getpid())
+    publisher = SharedMemoryPublisher(name, capacity=65536)
+    transactions = [Transaction(_SYMBOLS[i % len(_SYMBOLS)], '20200302{:06d}'.format(90000 + i // 1000),
+                                189234 + i % 50, i) for i in range(count)]
+    results = multiprocessing.Queue()
+    events = [multiprocessing.Event() for _ in range(readers)]
+    processes = [multiprocessing.Process(target=_read, args=(name, count, ready, results)) for ready in events]
+    try:
+        for process in processes:
+            process.start()
+        for ready in events:
+            ready.wait(30)
+        publish_ns = 0
+        started_at = time.perf_counter()
+        for i, transaction in enumerate(transactions):
+            publish_started_at = time.perf_counter_ns()
+            publisher.publish(transaction)
+            publish_ns += time.perf_counter_ns() - publish_started_at
+            if i % _PACING_BATCH == 0:
+                delay = started_at + i / _TICKS_PER_SECOND - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        elapsed = time.perf_counter() - started_at
+        reports = [results.get(timeout=120) for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        publisher.close()
+    print('readers {}  {:,} ticks in {:.2f} s  publish {:.0f} ns/tick'
+          .format(readers, count, elapsed, publish_ns / count))
+    for i, (ticks, overruns, latencies) in enumerate(reports):
+        print('  reader {}  read {:>9,}  overruns {:>7,}  p50 {:>9.1f} us  p99 {:>9.1f} us  max {:>10.1f} us'
+              .format(i, ticks, overruns, _percentile(latencies, 0.5), _percentile(latencies, 0.99),
+                      latencies[-1] / 1e3 if latencies else float('nan')))
+
+
+def main(count):
+    print('cpus: {}, rate: {:,} ticks/s'.format(os.cpu_count(), _TICKS_PER_SECOND))
+    for readers in _READERS:
+        _run(count, readers)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 200000)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+    SQLite tick store benchmark (sustained insert rate, range query and latest-N latency)
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.sqlite_benchmark -e local [count]
+"""
+import calendar
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from lib.sqlite_store import SQLiteTickStore
+from lib.transaction import Transaction
+
+_SYMBOLS = ('D05GBP/AUD', 'D05EUR/USD', 'D05USD/JPY', 'D05AUD/USD')
+_TICKS_PER_SECOND = 20
+_BATCH_SIZE = 500
+_QUERIES = 1000
+
+
+def _generate(count):
+    """ transactions of every symbol, _TICKS_PER_SECOND per symbol and second
+    :param count: number of transactions
+    :return: generator of transactions
+    """
+    epoch = calendar.timegm((2020, 3, 2, 0, 0, 0))
+    per_second = _TICKS_PER_SECOND * len(_SYMBOLS)
+    date_time_seq = None
+    price = 189234
+    for i in range(count):
+        if i % per_second == 0:
+            date_time_seq = time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + i // per_second))
+        price += (i * 7919) % 5 - 2
+        yield Transaction(_SYMBOLS[i % len(_SYMBOLS)], date_time_seq, price, i // len(_SYMBOLS))
+
+
+def _percentiles(latencies):
+    latencies.sort()
+    return (latencies[len(latencies) // 2] * 1e3, latencies[int(len(latencies) * 0.99)] * 1e3,
+            latencies[-1] * 1e3)
+
+
+def main(count):
+    directory = tempfile.mkdtemp(prefix='sqlite-benchmark-')
+    path = os.path.join(directory, 'ticks.db')
+    try:
+        store = SQLiteTickStore(path)
+        batch = []
+        started_at = window_at = time.perf_counter()
+        window_rows = 0
+        report_every = max(_BATCH_SIZE, count // 10 // _BATCH_SIZE * _BATCH_SIZE)
+        first = last = None
+        for transaction in _generate(count):
+            batch.append(transaction)
+            if len(batch) < _BATCH_SIZE:
+                continue
+            store.insert_batch(batch)
+            first = first or batch[0]
+            last = batch[-1]
+            window_rows += len(batch)
+            batch = []
+            if store.inserted % report_every == 0:
+                now = time.perf_counter()
+                print('insert {:>12,} rows  {:>10,.0f} rows/s (last {:,} rows)'
+                      .format(store.inserted, window_rows / (now - window_at), window_rows))
+                window_at = now
+                window_rows = 0
+        if batch:
+            store.insert_batch(batch)
+            last = batch[-1]
+        elapsed = time.perf_counter() - started_at
+        print('insert total {:>7,} rows  {:>8.3f} s  {:>10,.0f} rows/s  (batch: {} rows, file: {:,.1f} MB)'
+              .format(store.inserted, elapsed, store.inserted / elapsed, _BATCH_SIZE,
+                      sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6))
+        store.checkpoint()
+        store.close()
+
+        reader = SQLiteTickStore(path, readonly=True)
+        first_epoch = calendar.timegm(time.strptime(first.date_time_seq, '%Y%m%d%H%M%S'))
+        last_epoch = calendar.timegm(time.strptime(last.date_time_seq, '%Y%m%d%H%M%S'))
+        generator = random.Random(7)
+        for window_s in (1, 60, 3600):
+            latencies = []
+            rows = 0
+            for _ in range(_QUERIES):
+                at = generator.randint(first_epoch, max(first_epoch, last_epoch - window_s))
+                low = time.strftime('%Y%m%d%H%M%S', time.gmtime(at))
+                high = time.strftime('%Y%m%d%H%M%S', time.gmtime(at + window_s - 1))
+                query_started_at = time.perf_counter()
+                rows += len(reader.range(generator.choice(_SYMBOLS), low, high))
+                latencies.append(time.perf_counter() - query_started_at)
+            print('range {:>5}s  {:>8.1f} rows/query  p50 {:>8.3f} ms  p99 {:>8.3f} ms  max {:>8.3f} ms'
+                  .format(window_s, rows / _QUERIES, *_percentiles(latencies)))
+        for latest_n in (1, 100):
+            latencies = []
+            for _ in range(_QUERIES):
+                query_started_at = time.perf_counter()
+                reader.latest(generator.choice(_SYMBOLS), latest_n)
+                latencies.append(time.perf_counter() - query_started_at)
+            print('latest {:>4}  p50 {:>8.3f} ms  p99 {:>8.3f} ms  max {:>8.3f} ms'
+                  .format(latest_n, *_percentiles(latencies)))
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 50000000)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    Startup benchmark (import time of the entry modules and time to first tick against the replay stand-in)
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.startup_benchmark -e local [runs]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_MODULES = ('common.config', 'common.logger', 'application', 'headless')
+_REPLAY_COUNT = 200
+
+
+def _relocate(section, directory):
+    """ move every project relative data path of the configuration into directory
+    :param section: configuration dictionary
+    :param directory: target directory
+    :return: void
+    """
+    for key, value in section.items():
+        if isinstance(value, dict):
+            _relocate(value, directory)
+        elif isinstance(value, str) and value.startswith('data/'):
+            section[key] = os.path.join(directory, value)
+
+
+def _child_import(module):
+    started_at = time.perf_counter()
+    __import__(module)
+    print(json.dumps({'import': time.perf_counter() - started_at}))
+
+
+def _child_first_tick(directory):
+    """ replay collector run: time from interpreter start to the first real event handled """
+    from common.config import get_config_object, set_config_object
+    config = get_config_object()
+    config['1q_api']['replay'].update({'enabled': True, 'count': _REPLAY_COUNT, 'speed': 0})
+    config['metrics']['enabled'] = False
+    config['log']['file_name'] = os.path.join(directory, 'hana-1q.log')
+    _relocate(config, directory)
+    set_config_object(config)
+    from common.logger import init_logging
+    init_logging()
+    from application import Application
+    imported_at = time.time()
+    app = Application(headless=True)
+    created_at = time.time()
+    first_tick = []
+    handler = app.on_receive_real_event
+
+    def on_receive_real_event(message, processor, aggregator=None):
+        if not first_tick:
+            first_tick.append(time.time())
+        handler(message, processor, aggregator)
+
+    app.on_receive_real_event = on_receive_real_event
+    app.connect()
+    connected_at = time.time()
+    app.listen_real()
+    app.disconnect()
+    print(json.dumps({'imported': imported_at, 'created': created_at, 'connected': connected_at,
+                      'first_tick': first_tick[0]}))
+
+
+def _run_child(env, *args) -> dict:
+    """ run a benchmark case in a fresh interpreter
+    :param env: environment mode
+    :param args: case arguments
+    :return: (spawned at, case result dictionary)
+    """
+    spawned_at = time.time()
+    output = subprocess.run([sys.executable, '-m', 'benchmark.startup_benchmark', '-e', env, '-l', 'WARNING',
+                             'child'] + list(args), check=True, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    result['spawned'] = spawned_at
+    return result
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] * 1e3
+
+
+def main(env, runs):
+    for module in _MODULES:
+        imports = [_run_child(env, 'import', module)['import'] for _ in range(runs)]
+        print('import {:<16} median {:>8.1f} ms  min {:>8.1f} ms  ({} runs)'
+              .format(module, _median(imports), min(imports) * 1e3, runs))
+    steps = {'imported': [], 'created': [], 'connected': [], 'first_tick': []}
+    for _ in range(runs):
+        directory = tempfile.mkdtemp(prefix='startup-benchmark-')
+        try:
+            result = _run_child(env, 'first_tick', directory)
+        finally:
+            shutil.rmtree(directory)
+        for step, values in steps.items():
+            values.append(result[step] - result['spawned'])
+    for step, values in steps.items():
+        print('{:<22} median {:>8.1f} ms  min {:>8.1f} ms  (from process spawn)'
+              .format(step, _median(values), min(values) * 1e3))
+
+
+if __name__ == '__main__':
+    if 'child' in sys.argv:
+        case, argument = sys.argv[sys.argv.index('child') + 1:][:2]
+        if case == 'import':
+            _child_import(argument)
+        else:
+            _child_first_tick(argument)
+    else:
+        from common.config import get_env_mode
+        main(get_env_mode() or 'local', int(sys.argv[-1]) if sys.argv[-1].isdigit() else 10)
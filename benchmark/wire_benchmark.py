@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    Wire format benchmark (JSON lines of the sink vs fixed-width records vs delta batch, size and speed)
+    author: modorigoon
+    since: 0.2.0
+
+    usage: python -m benchmark.wire_benchmark -e local [count]
+"""
+import json
+import sys
+import time
+from lib.sink import encode_line
+from lib.synthetic import generate_v00_blocks
+from lib.transaction import TransactionParser
+from lib.wire import SymbolTable, decode_batch, decode_records, encode_batch, encode_records, to_record
+
+_SYMBOLS = ('D05GBP/AUD', 'D05EUR/USD', 'D05USD/JPY', 'D05AUD/USD')
+_BATCH_SIZE = 500
+
+
+def _encode_json(transactions) -> bytes:
+    return ''.join(encode_line(transaction) + '\n' for transaction in transactions).encode('utf-8')
+
+
+def _decode_json(data) -> list:
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+def _measure(name, encode, decode, batches):
+    """ encode then decode every batch
+    :param name: case name
+    :param encode: function(batch) -> bytes
+    :param decode: function(bytes)
+    :param batches: list of batches
+    :return: void
+    """
+    count = sum(len(batch) for batch in batches)
+    started_at = time.perf_counter()
+    encoded = [encode(batch) for batch in batches]
+    encode_elapsed = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    for data in encoded:
+        decode(data)
+    decode_elapsed = time.perf_counter() - started_at
+    size = sum(len(data) for data in encoded)
+    print('{:<14} {:>7.1f} bytes/tick  encode {:>7.1f} ns/tick  decode {:>7.1f} ns/tick'
+          .format(name, size / count, encode_elapsed / count * 1e9, decode_elapsed / count * 1e9))
+
+
+def main(count):
+    # interleaved symbols, 10 ticks per second each
+    per_symbol = count // len(_SYMBOLS)
+    blocks = list(zip(*(generate_v00_blocks(per_symbol, symbol=symbol, seed=i) for i, symbol in enumerate(_SYMBOLS))))
+    parsers = [TransactionParser(symbol) for symbol in _SYMBOLS]
+    symbols = SymbolTable(_SYMBOLS)
+    transactions = []
+    records = []
+    for seq, row in enumerate(blocks):
+        for parser, block in zip(parsers, row):
+            transaction = parser.parse(block, seq)
+            transactions.append(transaction)
+            records.append(to_record(transaction, symbols))
+    count = len(records)
+    started_at = time.perf_counter()
+    for transaction in transactions:
+        to_record(transaction, symbols)
+    print('{:,} ticks, {} symbols, batch {}  (to_record {:.1f} ns/tick)'.format(
+        count, len(_SYMBOLS), _BATCH_SIZE, (time.perf_counter() - started_at) / count * 1e9))
+    transaction_batches = [transactions[i:i + _BATCH_SIZE] for i in range(0, count, _BATCH_SIZE)]
+    record_batches = [records[i:i + _BATCH_SIZE] for i in range(0, count, _BATCH_SIZE)]
+    _measure('json lines', _encode_json, _decode_json, transaction_batches)
+    _measure('fixed records', encode_records, decode_records, record_batches)
+    _measure('delta batch', lambda batch: encode_batch(batch, symbols.symbols), decode_batch, record_batches)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[-1]) if sys.argv[-1].isdigit() else 200000)
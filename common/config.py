@@ -4,22 +4,38 @@
     author: modorigoon
     since: 0.1.0
 """
-import json
 import os
 import sys
-import getopt
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
 
 __env__ = None
+__opts__ = None
 __CONFIG__ = None
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+def resolve_path(path):
+    """ resolve path relative to the project root
+    :param path: absolute or project relative path
+    :return: absolute path
+    """
+    if os.path.isabs(path):
+        return path
+    return os.path.join(ROOT_DIR, path)
+
+
 def get_opts():
-    """ get executions parameters
+    """ get executions parameters (command line parsed once)
     :return: options - value mapping dictionary
     """
+    global __opts__
+    if __opts__ is not None:
+        return dict(__opts__)
+    import getopt
     _opts = {}
-    opts, args = getopt.getopt(sys.argv[1:], 'e:s:l:')
+    opts, args = getopt.getopt(sys.argv[1:], 'e:s:l:f:t:')
     for opt, arg in opts:
         if opt == '-e':
             _opts['e'] = arg
@@ -27,7 +43,22 @@ def get_opts():
             _opts['s'] = arg
         elif opt == '-l':
             _opts['l'] = arg
-    return _opts
+        elif opt == '-f':
+            _opts['f'] = arg
+        elif opt == '-t':
+            _opts['t'] = arg
+    __opts__ = _opts
+    return dict(_opts)
+
+
+def set_opts(opts):
+    """ replace executions parameters (ex: test runner, the command line is not ours)
+    :param opts: options - value mapping dictionary
+    :return: void
+    """
+    global __opts__, __env__
+    __opts__ = dict(opts)
+    __env__ = None
 
 
 def get_env_mode(nocache=False):
@@ -38,6 +69,7 @@ def get_env_mode(nocache=False):
     global __env__
     if nocache is False and __env__ is not None:
         return __env__
+    import getopt
     try:
         _opts = get_opts()
         if 'e' in _opts:
@@ -48,6 +80,50 @@ def get_env_mode(nocache=False):
         sys.exit(1)
 
 
+def _freeze(value):
+    """ read only copy of a parsed configuration value
+    :param value: configuration value
+    :return: mappings as read only mappings, lists as tuples
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    """ mutable copy of a read only configuration value
+    :param value: configuration value
+    :return: mappings as dictionaries, tuples as lists
+    """
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class Configuration(namedtuple('Configuration', ('env', 'options', 'values'))):
+    """ execution environment parsed once: environment mode, execution parameters and environment variables
+    (read only, sections are mappings and lists are tuples)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, env, options, values):
+        return super().__new__(cls, env, MappingProxyType(dict(options or {})), _freeze(values or {}))
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def to_dict(self) -> dict:
+        """ mutable copy of the environment variables (ex: configuration handed to a worker process)
+        :return: environment variables dictionary
+        """
+        return _thaw(self.values)
+
+
 def load_config_resource(mode=None):
     """ load the executions environment file
     :param mode: environment mode value
@@ -57,34 +133,57 @@ def load_config_resource(mode=None):
     if mode is None:
         mode = get_env_mode()
     if mode is not None:
+        import json
         with open(os.path.join(ROOT_DIR, 'resource/environment-' + str(mode).lower() + '.json')) as rf:
-            __CONFIG__ = json.loads(rf.read())
+            __CONFIG__ = Configuration(mode, get_opts(), json.loads(rf.read()))
+
+
+def get_configuration() -> Configuration:
+    """ returns configuration (environment file loaded on first use)
+    :return: configuration
+    """
+    if __CONFIG__ is None:
+        load_config_resource()
+        if __CONFIG__ is None:
+            raise ConfigurationProcessException('[config] invalid executions environment object.')
+    return __CONFIG__
 
 
 def get_config_object():
     """ returns config object
-    :return: config object
+    :return: config object (mutable copy)
     """
-    return __CONFIG__
+    return get_configuration().to_dict()
+
+
+def set_config_object(config):
+    """ replace config object (ex: configuration handed to a worker process)
+    :param config: config object
+    :return: void
+    """
+    global __CONFIG__
+    __CONFIG__ = config if isinstance(config, Configuration) else Configuration(get_env_mode(), get_opts(), config)
 
 
 class ConfigurationProcessException(Exception):
     pass
 
 
-def get_config(name=None):
+_NO_DEFAULT = object()
+
+
+def get_config(name=None, default=_NO_DEFAULT):
     """ returns execution environment variable
     :param name: variable key
+    :param default: value returned when the key is not configured (raise if omitted)
     :return: variable value
     """
-    if __CONFIG__ is None:
-        raise ConfigurationProcessException('[config] invalid executions environment object.')
+    values = get_configuration().values
     if not name:
-        return __CONFIG__
-    if name not in __CONFIG__:
+        return values
+    if name not in values:
+        if default is not _NO_DEFAULT:
+            return default
         raise ConfigurationProcessException('[config] invalid executions environment variable key. (name: {})'
                                             .format(name))
-    return __CONFIG__[name]
-
-
-load_config_resource()
+    return values[name]
@@ -4,14 +4,12 @@
     author: modorigoon
     since: 0.1.0
 """
+import atexit
+import logging
 import os
-import logging.handlers
+import threading
 from common.config import get_opts, get_config
 
-_LOGGER_CONFIG = get_config('log')
-log = logging.getLogger(__name__)
-_opts = get_opts()
-
 _LEVEL_NAME_VALUE = {
     'CRITICAL': 50,
     'ERROR': 40,
@@ -20,19 +18,71 @@ _LEVEL_NAME_VALUE = {
     'DEBUG': 10
 }
 
-_LOG_LEVEL_NAME = None
-if 'l' in _opts and _opts['l']:
-    _LOG_LEVEL_NAME = _opts['l']
-if _LOG_LEVEL_NAME is None:
-    _LOG_LEVEL_NAME = _LOGGER_CONFIG['level']
-log.setLevel(_LEVEL_NAME_VALUE[_LOG_LEVEL_NAME])
-
-if _LOGGER_CONFIG['file_name'] is not None:
-    formatter = logging.Formatter('[%(asctime)s][%(levelname)s|%(filename)s:%(lineno)s] >> %(message)s')
-    max_bytes = 1024 * 1024 * int(_LOGGER_CONFIG['max_file_size_mb'])
-    log_fully_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-                                  _LOGGER_CONFIG['file_name'])
-    handler = logging.handlers.RotatingFileHandler(filename=log_fully_path, maxBytes=max_bytes,
-                                                   backupCount=int(_LOGGER_CONFIG['backup_count']))
-    handler.setFormatter(formatter)
-    log.addHandler(handler)
+# records are queued by the calling thread (Qt/event thread) and written by the listener thread
+_listener = None
+_configured = False
+_configure_lock = threading.Lock()
+
+# importing the module reads neither the command line nor the configuration: entry points call init_logging
+# once the configuration is known (until then, records of WARNING and above go to stderr)
+log = logging.getLogger(__name__)
+
+
+def init_logging():
+    """ apply log level (-l option or configuration) and file handler (once, called by the entry points)
+    :return: void
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        _apply_config(log)
+
+
+def _apply_config(logger):
+    """ apply log configuration to logger
+    :param logger: logger
+    :return: void
+    """
+    global _listener
+    logger_config = get_config('log')
+    opts = get_opts()
+    log_level_name = None
+    if 'l' in opts and opts['l']:
+        log_level_name = opts['l']
+    if log_level_name is None:
+        log_level_name = logger_config['level']
+    logger.setLevel(_LEVEL_NAME_VALUE[log_level_name])
+
+    if logger_config['file_name'] is not None:
+        # the handler modules are imported only when a log file is configured
+        import queue
+        from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+        formatter = logging.Formatter('[%(asctime)s][%(levelname)s|%(filename)s:%(lineno)s] >> %(message)s')
+        max_bytes = 1024 * 1024 * int(logger_config['max_file_size_mb'])
+        log_fully_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      logger_config['file_name'])
+        handler = RotatingFileHandler(filename=log_fully_path, maxBytes=max_bytes,
+                                      backupCount=int(logger_config['backup_count']))
+        handler.setFormatter(formatter)
+        if logger_config.get('async', True) is True:
+            _queue = queue.SimpleQueue()
+            logger.addHandler(QueueHandler(_queue))
+            _listener = QueueListener(_queue, handler, respect_handler_level=True)
+            _listener.start()
+        else:
+            logger.addHandler(handler)
+
+
+def stop_listener():
+    """ write queued records and stop the listener thread (registered at exit)
+    :return: void
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_listener)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+    Headless collector (no window)
+    author: modorigoon
+    since: 0.2.0
+"""
+import signal
+import sys
+from common.logger import init_logging, log
+from common.config import get_config
+from application import Application
+from lib.collector_state import StatusReporter
+
+
+class HeadlessCollector:
+
+    def __init__(self, qt_app=None):
+        """ constructor
+        :param qt_app: QCoreApplication (None: replay mode without Qt)
+        """
+        self._qt_app = qt_app
+        self._app = Application(headless=True)
+        self._reporter = StatusReporter(self._app.get_state(), get_config('headless', {}).get('status_interval_s', 10),
+                                        self._app.get_sink_stats)
+        self._running = False
+        self.failed = False
+
+    def run(self):
+        """ connect and collect until stopped
+        :return: void
+        """
+        try:
+            log.info('[headless] start collector.')
+            self._running = True
+            self._reporter.start()
+            self._app.connect()
+            self._app.listen_real()
+        except Exception as _e:
+            self.failed = True
+            log.error('[headless] ERROR: {}'.format(str(_e)))
+        finally:
+            self.stop()
+
+    def dump_profile(self, *args):
+        """ write the agent call profile report (also used as SIGUSR1 handler)
+        :return: void
+        """
+        try:
+            self._app.dump_profile()
+        except Exception as _e:
+            log.error('[headless] dump profile ERROR: {}'.format(str(_e)))
+
+    def stop(self, *args):
+        """ disconnect and leave the event loop (also used as signal handler)
+        :return: void
+        """
+        if self._running is False:
+            return
+        self._running = False
+        try:
+            self._app.disconnect()
+        except Exception as _e:
+            log.error('[headless] stop ERROR: {}'.format(str(_e)))
+        finally:
+            self._reporter.stop()
+            self._reporter.report()
+            log.info('[headless] collector stopped.')
+            if self._qt_app is not None:
+                self._qt_app.quit()
+
+
+def _handle_dump_signal(collector):
+    """ dump the profile report on SIGUSR1 (not available on Windows)
+    :param collector: headless collector
+    :return: void
+    """
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, collector.dump_profile)
+
+
+def run_headless():
+    """ run the headless collector until it is stopped (SIGINT/SIGTERM) or the replay source ends
+    :return: exit code (1: collector failed)
+    """
+    replay = get_config('1q_api').get('replay', {}).get('enabled') is True
+    if replay:
+        collector = HeadlessCollector()
+        signal.signal(signal.SIGINT, collector.stop)
+        signal.signal(signal.SIGTERM, collector.stop)
+        _handle_dump_signal(collector)
+        collector.run()
+        return 1 if collector.failed else 0
+    from PyQt5.QtCore import QCoreApplication, QTimer
+    qt_app = QCoreApplication(sys.argv)
+    collector = HeadlessCollector(qt_app)
+    signal.signal(signal.SIGINT, collector.stop)
+    signal.signal(signal.SIGTERM, collector.stop)
+    _handle_dump_signal(collector)
+    # wake the interpreter periodically so signal handlers run while Qt owns the thread
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+    QTimer.singleShot(0, collector.run)
+    exit_code = qt_app.exec_()
+    return 1 if collector.failed else exit_code
+
+
+def main():
+    init_logging()
+    sys.exit(run_headless())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+    Historical FID backfill engine
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import datetime
+import json
+import os
+import time
+from common.config import resolve_path
+from common.logger import log
+from lib.sink import SinkPipeline, create_sink
+
+# classification of continuous queries (ref. HanaAPI.request_fid_data_list)
+_PN_FIRST = '1'
+_PN_NEXT = '3'
+# sleep after an event slice that delivered nothing (process_events returns at once when the queue is empty)
+_IDLE_SLEEP_S = 0.005
+
+
+class BackfillProcessException(Exception):
+    pass
+
+
+class BackfillChunk(collections.namedtuple('BackfillChunk', 'start_date end_date')):
+    """ date range requested by one FID request (YYYYMMDD, inclusive) """
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return '{}-{}'.format(self.start_date, self.end_date)
+
+
+def split_date_range(from_date: str, to_date: str, chunk_days=1):
+    """ split date range into chunks
+    :param from_date: first date (YYYYMMDD)
+    :param to_date: last date (YYYYMMDD, inclusive)
+    :param chunk_days: days per chunk
+    :return: list of chunks
+    """
+    start = datetime.datetime.strptime(from_date, '%Y%m%d')
+    end = datetime.datetime.strptime(to_date, '%Y%m%d')
+    if end < start:
+        raise BackfillProcessException('[backfill] invalid date range. ({} - {})'.format(from_date, to_date))
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + datetime.timedelta(days=int(chunk_days) - 1))
+        chunks.append(BackfillChunk(start.strftime('%Y%m%d'), chunk_end.strftime('%Y%m%d')))
+        start = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+class BackfillCheckpoint:
+    """ completed chunk keys persisted after every chunk (resume point after a crash)
+    keys are scoped by symbol, every symbol of a run shares one checkpoint file.
+    """
+
+    def __init__(self, path=None, symbol=None):
+        """ constructor
+        :param path: checkpoint file path (None: not persisted)
+        :param symbol: symbol of the chunks (key prefix)
+        """
+        self._path = resolve_path(path) if path else None
+        self._prefix = '{}:'.format(symbol) if symbol else ''
+        self._completed = set()
+        if self._path is not None and os.path.exists(self._path):
+            with open(self._path, encoding='utf-8') as rf:
+                self._completed = set(json.loads(rf.read()).get('completed', []))
+
+    def is_completed(self, chunk: BackfillChunk) -> bool:
+        return self._prefix + chunk.key in self._completed
+
+    def mark_completed(self, chunk: BackfillChunk):
+        """ record completed chunk (atomic replace of the checkpoint file)
+        :param chunk: completed chunk
+        :return: void
+        """
+        self._completed.add(self._prefix + chunk.key)
+        if self._path is None:
+            return
+        parent = os.path.dirname(self._path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        temporary_path = self._path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as wf:
+            wf.write(json.dumps({'completed': sorted(self._completed)}))
+            wf.flush()
+            os.fsync(wf.fileno())
+        os.replace(temporary_path, self._path)
+
+
+class _Request:
+    """ chunk progress, kept across retries (a retry continues after the last received page) """
+
+    __slots__ = ('chunk', 'attempt', 'requested_at', 'pages', 'rows', 'pnc', 'rejected', 'first_position',
+                 'last_position')
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.attempt = 0
+        self.requested_at = None
+        self.pages = 0
+        self.rows = 0
+        # continuation context of the next page ('': first page)
+        self.pnc = ''
+        # rows refused by the sink
+        self.rejected = 0
+        # sink positions before the first row and of the last row (checkpoint once flushed)
+        self.first_position = None
+        self.last_position = None
+
+
+class BackfillEngine:
+    """ drive RequestFidArray over a long date range
+    the range is split into chunks, up to max_in_flight request ids are active at once, requests are
+    spaced by the agent rate limit, next pages are requested with the received continuation context
+    and every page is streamed into the sink as it arrives. a chunk is checkpointed once the sink has
+    written its last row, and a timed out chunk is requested again from its last continuation context
+    (pages already streamed are not requested twice).
+    """
+
+    def __init__(self, app, sink, symbol, chunk_days=1, max_in_flight=2, requests_per_second=2.0,
+                 page_size=9999, request_timeout_s=30, max_retries=3, checkpoint_path=None, poll_ms=50,
+                 resolution='1m'):
+        """ constructor
+        :param app: application (FID part)
+        :param sink: row sink pipeline (put(row))
+        :param symbol: symbol
+        :param chunk_days: days per request
+        :param max_in_flight: maximum number of active request ids
+        :param requests_per_second: agent rate limit
+        :param page_size: rows per page (max: 9999)
+        :param request_timeout_s: response timeout (the chunk is retried)
+        :param max_retries: retries per chunk
+        :param checkpoint_path: completed chunk checkpoint file
+        :param poll_ms: event processing slice
+        :param resolution: bar resolution of the FID response, tagged on every row
+                           (ref. lib.bar_aggregator.BAR_RESOLUTIONS)
+        """
+        self._app = app
+        self._sink = sink
+        self._symbol = symbol
+        self._chunk_days = int(chunk_days)
+        self._max_in_flight = max(1, int(max_in_flight))
+        self._request_interval = 1.0 / float(requests_per_second) if requests_per_second else 0.0
+        self._page_size = min(9999, int(page_size))
+        self._request_timeout = float(request_timeout_s)
+        self._max_retries = int(max_retries)
+        self._checkpoint = BackfillCheckpoint(checkpoint_path, symbol)
+        self._poll_ms = int(poll_ms)
+        self._resolution = resolution
+
+        self._pending = collections.deque()
+        self._requests = {}
+        self._continuations = collections.deque()
+        # received chunks waiting for the sink to write their rows (in completion order)
+        self._flushing = collections.deque()
+        self._next_request_at = 0.0
+        self._stats = collections.Counter()
+
+    def run(self, from_date: str, to_date: str) -> dict:
+        """ backfill date range (blocking, resumes after completed chunks)
+        :param from_date: first date (YYYYMMDD)
+        :param to_date: last date (YYYYMMDD, inclusive)
+        :return: counters dictionary
+        """
+        for chunk in split_date_range(from_date, to_date, self._chunk_days):
+            if self._checkpoint.is_completed(chunk):
+                self._stats['chunks_skipped'] += 1
+            else:
+                self._pending.append(_Request(chunk))
+        log.info('[backfill] start. (symbol: {}, range: {} - {}, chunks: {}, skipped: {})'
+                 .format(self._symbol, from_date, to_date, str(len(self._pending)),
+                         str(self._stats['chunks_skipped'])))
+        self._app.set_fid_event_handler(self.on_fid_event)
+        self._sink.start()
+        try:
+            while self._pending or self._requests:
+                self._expire()
+                self._issue()
+                pages = self._stats['pages']
+                self._app.process_events(self._poll_ms)
+                self._checkpoint_flushed()
+                if pages == self._stats['pages']:
+                    # nothing arrived, do not spin on the event queue
+                    time.sleep(_IDLE_SLEEP_S)
+        finally:
+            self._app.set_fid_event_handler(None)
+            self._sink.stop()
+            self._checkpoint_flushed()
+        if self._flushing:
+            self._stats['chunks_unconfirmed'] += len(self._flushing)
+            log.error('[backfill] chunks not written by the sink, not checkpointed. (chunks: {})'
+                      .format(', '.join(request.chunk.key for request in self._flushing)))
+        log.info('[backfill] finished. (symbol: {}) {}'.format(self._symbol, str(dict(self._stats))))
+        return dict(self._stats)
+
+    def _rate_limit_ready(self) -> bool:
+        """ check agent rate limit
+        :return: a request may be sent now
+        """
+        return time.monotonic() >= self._next_request_at
+
+    def _send(self, rid, request, pn, pnc):
+        """ send FID page request
+        :param rid: request id
+        :param request: request state
+        :param pn: classification of continuous queries
+        :param pnc: continuous query context
+        :return: void
+        """
+        self._next_request_at = time.monotonic() + self._request_interval
+        request.requested_at = time.monotonic()
+        self._app.request_fid(rid, pn, pnc, self._page_size, wait=False)
+        self._stats['requests'] += 1
+
+    def _issue(self):
+        """ send continuation pages first, then start new chunks up to max_in_flight
+        :return: void
+        """
+        while self._rate_limit_ready():
+            if self._continuations:
+                rid, pnc = self._continuations.popleft()
+                if rid in self._requests:
+                    self._send(rid, self._requests[rid], _PN_NEXT, pnc)
+                continue
+            if not self._pending or len(self._requests) >= self._max_in_flight:
+                return
+            request = self._pending.popleft()
+            chunk = request.chunk
+            rid = self._app.create_request_id()
+            if not (self._app.init_fid(rid, self._symbol)
+                    and self._app.set_fid_date_range(rid, chunk.start_date, chunk.end_date)):
+                self._app.release_request_id(rid)
+                self._retry(request, 'set FID input failed')
+                continue
+            if request.first_position is None:
+                request.first_position = self._sink.position()
+            self._requests[rid] = request
+            # a retried chunk continues after its last received page
+            self._send(rid, request, _PN_NEXT if request.pnc else _PN_FIRST, request.pnc)
+
+    def _retry(self, request, reason):
+        """ requeue failed chunk (from its last continuation context)
+        :param request: request state
+        :param reason: failure reason
+        :return: void
+        """
+        chunk = request.chunk
+        if request.attempt + 1 > self._max_retries:
+            self._stats['chunks_failed'] += 1
+            log.error('[backfill] chunk failed. (chunk: {}, reason: {})'.format(chunk.key, reason))
+            return
+        request.attempt += 1
+        request.requested_at = None
+        self._stats['retries'] += 1
+        log.warning('[backfill] retry chunk. (chunk: {}, attempt: {}, page: {}, reason: {})'
+                    .format(chunk.key, str(request.attempt), str(request.pages + 1), reason))
+        self._pending.append(request)
+
+    def _expire(self):
+        """ retry requests without response within the timeout
+        :return: void
+        """
+        now = time.monotonic()
+        waiting = {rid for rid, _ in self._continuations}
+        for rid, request in list(self._requests.items()):
+            if rid in waiting or request.requested_at is None:
+                continue
+            if now - request.requested_at > self._request_timeout:
+                del self._requests[rid]
+                self._app.release_request_id(rid)
+                self._retry(request, 'response timeout')
+
+    def on_fid_event(self, rid, block, length):
+        """ FID response handler: stream rows and request the next page or complete the chunk
+        :param rid: request id
+        :param block: data block
+        :param length: length of data
+        :return: void
+        """
+        request = self._requests.get(rid)
+        if request is None:
+            return
+        batch = self._app.get_fid_batch(rid, block, self._symbol)
+        put = self._sink.put
+        resolution = self._resolution
+        for row in batch.iter_rows():
+            row['resolution'] = resolution
+            if not put(row):
+                request.rejected += 1
+        request.pages += 1
+        request.rows += len(batch)
+        self._stats['pages'] += 1
+        self._stats['rows'] += len(batch)
+        _, pnc = self._app.get_fid_next_context()
+        if pnc and len(batch):
+            request.pnc = pnc
+            self._continuations.append((rid, pnc))
+            return
+        del self._requests[rid]
+        self._app.release_request_id(rid)
+        request.last_position = self._sink.position()
+        self._flushing.append(request)
+        self._checkpoint_flushed()
+
+    def _checkpoint_flushed(self):
+        """ checkpoint received chunks whose rows have been written by the sink
+        (a chunk with rows dropped or failed is not checkpointed: the next run requests it again)
+        :return: void
+        """
+        while self._flushing and self._sink.flushed(self._flushing[0].last_position):
+            request = self._flushing.popleft()
+            if request.rejected or self._sink.lost_after(request.first_position):
+                self._stats['chunks_unconfirmed'] += 1
+                log.error('[backfill] chunk rows lost by the sink, not checkpointed. (chunk: {}, rejected: {})'
+                          .format(request.chunk.key, str(request.rejected)))
+                continue
+            self._checkpoint.mark_completed(request.chunk)
+            self._stats['chunks_completed'] += 1
+            log.info('[backfill] chunk completed. (chunk: {}, pages: {}, rows: {})'
+                     .format(request.chunk.key, str(request.pages), str(request.rows)))
+
+
+def create_backfill_engine(app, config, symbol):
+    """ create backfill engine from configuration
+    :param app: application
+    :param config: backfill configuration
+    :param symbol: symbol
+    :return: backfill engine
+    """
+    sink_config = config['sink']
+    pipeline = SinkPipeline(create_sink(sink_config),
+                            queue_size=sink_config.get('queue_size', 100000),
+                            batch_size=sink_config.get('batch_size', 1000),
+                            flush_interval_ms=sink_config.get('flush_interval_ms', 200),
+                            backpressure=SinkPipeline.BLOCK)
+    return BackfillEngine(app, pipeline, symbol=symbol,
+                          chunk_days=config.get('chunk_days', 1),
+                          max_in_flight=config.get('max_in_flight', 2),
+                          requests_per_second=config.get('requests_per_second', 2.0),
+                          page_size=config.get('page_size', 9999),
+                          request_timeout_s=config.get('request_timeout_s', 30),
+                          max_retries=config.get('max_retries', 3),
+                          checkpoint_path=config.get('checkpoint_path'),
+                          resolution=config.get('resolution', '1m'))
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+    Real-time OHLC bar aggregator
+    author: modorigoon
+    since: 0.2.0
+"""
+import time
+from lib.transaction import PRICE_DIGITS, TransactionParser, date_time_sequence_to_epoch, fixed_to_price
+
+# resolution name - bar length in seconds
+BAR_RESOLUTIONS = {
+    '1s': 1,
+    '5s': 5,
+    '10s': 10,
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '30m': 1800,
+    '1h': 3600,
+    '1d': 86400
+}
+DEFAULT_RESOLUTIONS = ('1s', '1m', '5m', '1h')
+
+# sign of close compared with the previous bar close (FID 1098 / 6)
+SIGN_UP = 2
+SIGN_FLAT = 3
+SIGN_DOWN = 5
+
+
+class BarAggregatorProcessException(Exception):
+    pass
+
+
+def _sign(close, previous_close):
+    if previous_close is None or close == previous_close:
+        return SIGN_FLAT
+    return SIGN_UP if close > previous_close else SIGN_DOWN
+
+
+class _Bar:
+    """ open bar of one resolution (fixed-point prices) """
+
+    __slots__ = ('resolution', 'seconds', 'start', 'ticks', 'sell_open', 'sell_high', 'sell_low', 'sell_close',
+                 'buy_open', 'buy_high', 'buy_low', 'buy_close', 'previous_sell_close', 'previous_buy_close')
+
+    def __init__(self, resolution, seconds):
+        self.resolution = resolution
+        self.seconds = seconds
+        self.start = None
+        self.ticks = 0
+        self.sell_open = self.sell_high = self.sell_low = self.sell_close = 0
+        self.buy_open = self.buy_high = self.buy_low = self.buy_close = 0
+        self.previous_sell_close = None
+        self.previous_buy_close = None
+
+    def open(self, start, sell, buy):
+        self.start = start
+        self.ticks = 1
+        self.sell_open = self.sell_high = self.sell_low = self.sell_close = sell
+        self.buy_open = self.buy_high = self.buy_low = self.buy_close = buy
+
+
+class BarAggregator:
+    """ incremental bid/ask OHLC bars of one symbol at several resolutions
+    a tick only updates the finest open bar; when a bar closes it is merged into the next coarser bar,
+    so the cost per tick does not depend on the number of resolutions and only the open bar of every
+    resolution is kept. bars are emitted on the first tick of the next bar (or on flush) in the FID
+    response row layout, so live and backfilled bars are interchangeable.
+    """
+
+    def __init__(self, emit, symbol=None, resolutions=DEFAULT_RESOLUTIONS, price_digits=PRICE_DIGITS):
+        """ constructor
+        :param emit: function(row) receiving closed bars
+        :param symbol: symbol
+        :param resolutions: resolution names (ref. BAR_RESOLUTIONS, every length a multiple of the finer ones)
+        :param price_digits: fixed-point digits of prices
+        """
+        for resolution in resolutions:
+            if resolution not in BAR_RESOLUTIONS:
+                raise BarAggregatorProcessException('[bar] invalid resolution. ({})'.format(str(resolution)))
+        resolutions = sorted(set(resolutions), key=BAR_RESOLUTIONS.get)
+        if not resolutions:
+            raise BarAggregatorProcessException('[bar] no resolution configured.')
+        for finer, coarser in zip(resolutions, resolutions[1:]):
+            if BAR_RESOLUTIONS[coarser] % BAR_RESOLUTIONS[finer] != 0:
+                raise BarAggregatorProcessException('[bar] {} bars can not be built from {} bars.'
+                                                    .format(coarser, finer))
+        self._emit = emit
+        self._symbol = symbol
+        self._price_digits = price_digits
+        self._bars = [_Bar(resolution, BAR_RESOLUTIONS[resolution]) for resolution in resolutions]
+        self._finest = self._bars[0]
+        self._last_date_time_seq = None
+        self._last_start = None
+        self._parse = TransactionParser(symbol, price_digits=price_digits).parse_function()
+        self.ticks = 0
+        self.late = 0
+        self.emitted = 0
+
+    def on_block(self, block):
+        """ aggregate V00 real block (blocks not parsed yet, ex: journal replay)
+        :param block: raw real block
+        :return: void
+        """
+        transaction = self._parse(block)
+        self.on_tick(transaction.date_time_seq, transaction.price, transaction.buy_price)
+
+    def on_transaction(self, transaction):
+        """ aggregate parsed transaction (tick path, the block is not split again)
+        :param transaction: transaction record
+        :return: void
+        """
+        self.on_tick(transaction.date_time_seq, transaction.price, transaction.buy_price)
+
+    def on_tick(self, date_time_seq, sell, buy):
+        """ aggregate tick
+        :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+        :param sell: fixed-point sell price
+        :param buy: fixed-point buy price
+        :return: void
+        """
+        self.ticks += 1
+        bar = self._finest
+        # consecutive ticks share the date time sequence, the bar start is computed once per sequence
+        if date_time_seq != self._last_date_time_seq:
+            epoch = int(date_time_sequence_to_epoch(date_time_seq))
+            self._last_date_time_seq = date_time_seq
+            self._last_start = epoch - epoch % bar.seconds
+        start = self._last_start
+        if start == bar.start:
+            bar.ticks += 1
+            if sell > bar.sell_high:
+                bar.sell_high = sell
+            elif sell < bar.sell_low:
+                bar.sell_low = sell
+            bar.sell_close = sell
+            if buy > bar.buy_high:
+                bar.buy_high = buy
+            elif buy < bar.buy_low:
+                bar.buy_low = buy
+            bar.buy_close = buy
+        elif bar.start is None or start > bar.start:
+            if bar.ticks:
+                self._roll(start)
+            bar.open(start, sell, buy)
+        else:
+            # tick older than the open bar, its bar was already emitted
+            self.late += 1
+
+    def _roll(self, start):
+        """ close the finest bar and every coarser bar not containing start
+        :param start: start of the next finest bar (epoch seconds, None: close every bar)
+        :return: void
+        """
+        closed = self._finest
+        self._close(closed)
+        for bar in self._bars[1:]:
+            # merge the closed bar into the next coarser bar
+            bar_start = closed.start - closed.start % bar.seconds
+            if bar.ticks and bar.start == bar_start:
+                bar.ticks += closed.ticks
+                if closed.sell_high > bar.sell_high:
+                    bar.sell_high = closed.sell_high
+                if closed.sell_low < bar.sell_low:
+                    bar.sell_low = closed.sell_low
+                bar.sell_close = closed.sell_close
+                if closed.buy_high > bar.buy_high:
+                    bar.buy_high = closed.buy_high
+                if closed.buy_low < bar.buy_low:
+                    bar.buy_low = closed.buy_low
+                bar.buy_close = closed.buy_close
+            else:
+                bar.open(bar_start, closed.sell_open, closed.buy_open)
+                bar.ticks = closed.ticks
+                bar.sell_high, bar.sell_low, bar.sell_close = closed.sell_high, closed.sell_low, closed.sell_close
+                bar.buy_high, bar.buy_low, bar.buy_close = closed.buy_high, closed.buy_low, closed.buy_close
+            closed.ticks = 0
+            if start is not None and start - start % bar.seconds == bar.start:
+                # coarser bars contain this bar
+                return
+            self._close(bar)
+            closed = bar
+        closed.ticks = 0
+
+    def _close(self, bar):
+        """ emit bar (FID response row layout, ref. lib.fid_columns.FidColumnBatch.iter_rows)
+        :param bar: closed bar
+        :return: void
+        """
+        digits = self._price_digits
+        moment = time.gmtime(bar.start)
+        self._emit({
+            'symbol': self._symbol,
+            'resolution': bar.resolution,
+            'ticks': bar.ticks,
+            '9': moment.tm_year * 10000 + moment.tm_mon * 100 + moment.tm_mday,
+            '8': moment.tm_hour * 10000 + moment.tm_min * 100 + moment.tm_sec,
+            '1098': _sign(bar.sell_close, bar.previous_sell_close),
+            '30': fixed_to_price(bar.sell_open, digits),
+            '31': fixed_to_price(bar.sell_high, digits),
+            '32': fixed_to_price(bar.sell_low, digits),
+            '33': fixed_to_price(bar.sell_close, digits),
+            '6': _sign(bar.buy_close, bar.previous_buy_close),
+            '40': fixed_to_price(bar.buy_open, digits),
+            '41': fixed_to_price(bar.buy_high, digits),
+            '42': fixed_to_price(bar.buy_low, digits),
+            '43': fixed_to_price(bar.buy_close, digits),
+            '666': bar.buy_close - bar.sell_close
+        })
+        bar.previous_sell_close = bar.sell_close
+        bar.previous_buy_close = bar.buy_close
+        self.emitted += 1
+
+    def flush(self):
+        """ emit every open bar (end of session)
+        :return: void
+        """
+        if self._finest.ticks:
+            self._roll(None)
+
+    def stats(self) -> dict:
+        """ aggregator counters
+        :return: counters dictionary
+        """
+        return {'ticks': self.ticks, 'late': self.late, 'emitted': self.emitted}
+
+
+def create_bar_aggregator(config, emit, symbol):
+    """ create bar aggregator from configuration
+    :param config: bars configuration (None: aggregation disabled)
+    :param emit: function(row) receiving closed bars
+    :param symbol: symbol
+    :return: bar aggregator or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return BarAggregator(emit, symbol, config.get('resolutions', DEFAULT_RESOLUTIONS))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    Collector state snapshot
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import threading
+import time
+from common.logger import log
+
+
+class CollectorState:
+    """ latest state written by the tick path and read by the UI refresh timer / status reporters
+    the tick path only assigns attributes; formatting happens when the snapshot is read.
+    """
+
+    __slots__ = ('last_transaction', 'tick_count', 'duplicated_count', 'started_at', '_log_lines',
+                 '_rate_tick_count', '_rate_at')
+
+    def __init__(self, max_log_lines=1000):
+        """ constructor
+        :param max_log_lines: maximum number of buffered log lines (oldest lines are dropped)
+        """
+        self.last_transaction = None
+        self.tick_count = 0
+        self.duplicated_count = 0
+        self.started_at = time.monotonic()
+        self._log_lines = collections.deque(maxlen=int(max_log_lines))
+        self._rate_tick_count = 0
+        self._rate_at = self.started_at
+
+    def on_transaction(self, transaction):
+        """ record processed transaction (tick path)
+        :param transaction: transaction record
+        :return: void
+        """
+        self.last_transaction = transaction
+        self.tick_count += 1
+
+    def on_duplicated(self):
+        """ record duplicated transaction (tick path)
+        :return: void
+        """
+        self.duplicated_count += 1
+
+    def append_log(self, message: str):
+        """ buffer log line for the window
+        :param message: log message
+        :return: void
+        """
+        self._log_lines.append(message)
+
+    def drain_log(self):
+        """ take buffered log lines
+        :return: list of log lines
+        """
+        lines = []
+        while self._log_lines:
+            lines.append(self._log_lines.popleft())
+        return lines
+
+    def ticks_per_second(self) -> float:
+        """ tick rate since the previous call
+        :return: ticks per second
+        """
+        now = time.monotonic()
+        elapsed = now - self._rate_at
+        count = self.tick_count
+        rate = (count - self._rate_tick_count) / elapsed if elapsed > 0 else 0.0
+        self._rate_tick_count = count
+        self._rate_at = now
+        return rate
+
+
+class StatusReporter:
+    """ periodic status log line from a background thread (headless mode) """
+
+    def __init__(self, state: CollectorState, interval_s=10, stats_provider=None):
+        """ constructor
+        :param state: collector state
+        :param interval_s: report interval in seconds
+        :param stats_provider: function returning sink counters (or None)
+        """
+        self._state = state
+        self._interval = float(interval_s)
+        self._stats_provider = stats_provider
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ start reporter thread
+        :return: void
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='status-reporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stop reporter thread
+        :return: void
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def report(self):
+        """ log current status
+        :return: void
+        """
+        stats = self._stats_provider() if self._stats_provider is not None else None
+        state = self._state
+        log.info('[status] {:.1f} ticks/s, ticks: {}, duplicated: {}, queue: {}, written: {}'
+                 .format(state.ticks_per_second(), state.tick_count, state.duplicated_count,
+                         stats['queue_depth'] if stats else 0, stats['written'] if stats else 0))
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            self.report()
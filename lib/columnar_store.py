@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+"""
+    Columnar daily tick/bar store (partitioned by kind, symbol and trading day)
+    author: modorigoon
+    since: 0.2.0
+"""
+import datetime
+import itertools
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from urllib.parse import quote, unquote
+from common.config import resolve_path
+from common.logger import log
+from lib.transaction import PRICE_DIGITS, Transaction, price_to_fixed
+
+TICKS = 'ticks'
+BARS = 'bars'
+
+# kind - ((column name, array type code or 'str'), ...), date_time_seq first (statistics column)
+SCHEMAS = {
+    TICKS: (('date_time_seq', 'q'), ('seq', 'q'), ('price', 'q')),
+    BARS: (('date_time_seq', 'q'), ('resolution', 'str'), ('ticks', 'q'),
+           ('sell_sign', 'b'), ('sell_open', 'q'), ('sell_high', 'q'), ('sell_low', 'q'), ('sell_close', 'q'),
+           ('buy_sign', 'b'), ('buy_open', 'q'), ('buy_high', 'q'), ('buy_low', 'q'), ('buy_close', 'q'),
+           ('spread', 'q'))
+}
+# bar column - FID code of the bar row (ref. lib.bar_aggregator.BarAggregator._close)
+BAR_FIELDS = (('sell_sign', '1098', False), ('sell_open', '30', True), ('sell_high', '31', True),
+               ('sell_low', '32', True), ('sell_close', '33', True), ('buy_sign', '6', False),
+               ('buy_open', '40', True), ('buy_high', '41', True), ('buy_low', '42', True),
+               ('buy_close', '43', True), ('spread', '666', False))
+
+FORMAT_COLUMNAR = 'hcol'
+FORMAT_PARQUET = 'parquet'
+_MAGIC = b'HCOL'
+_VERSION = 1
+_TRAILER = struct.Struct('<Q4s')
+# part file numbers are unique per process (several writers may share a partition, ex: bar and gap sinks)
+_PART_NUMBERS = itertools.count(1)
+
+
+class ColumnarStoreProcessException(Exception):
+    pass
+
+
+def _pyarrow():
+    """ pyarrow modules when installed
+    :return: (pyarrow, pyarrow.parquet) or None
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow, pyarrow.parquet
+    except ImportError:
+        return None
+
+
+def resolve_format(store_format='auto') -> str:
+    """ storage format (auto: parquet when pyarrow is installed, dependency-free columnar files otherwise)
+    :param store_format: auto, parquet or hcol
+    :return: parquet or hcol
+    """
+    if store_format == FORMAT_COLUMNAR:
+        return FORMAT_COLUMNAR
+    if _pyarrow() is not None:
+        return FORMAT_PARQUET
+    if store_format == FORMAT_PARQUET:
+        raise ColumnarStoreProcessException('[columnar] parquet format requires pyarrow.')
+    return FORMAT_COLUMNAR
+
+
+def is_bar_row(row) -> bool:
+    """ check row is a bar (FID bar row: backfill, gap backfill or bar aggregator)
+    :param row: row dictionary
+    :return: bar row
+    """
+    return '9' in row
+
+
+def bar_values(row, price_digits=PRICE_DIGITS):
+    """ column values of a bar row (BARS schema order)
+    :param row: FID bar row (resolution when tagged)
+    :param price_digits: fixed-point digits of prices
+    :return: (date_time_seq as integer, values after date_time_seq)
+    """
+    values = [row.get('resolution') or '', int(row.get('ticks') or 0)]
+    for _, code, is_price in BAR_FIELDS:
+        value = row.get(code)
+        if is_price:
+            values.append(price_to_fixed(str(value), price_digits) if value not in (None, '') else 0)
+        else:
+            values.append(int(value) if value not in (None, '') else 0)
+    return int(row['9']) * 1000000 + int(row['8']), values
+
+
+def previous_date(date: int) -> int:
+    """ calendar date before date
+    :param date: date (YYYYMMDD)
+    :return: previous date (YYYYMMDD)
+    """
+    moment = datetime.datetime.strptime(str(date), '%Y%m%d') - datetime.timedelta(days=1)
+    return int(moment.strftime('%Y%m%d'))
+
+
+def partition_path(root, kind, symbol, date) -> str:
+    """ directory of one partition
+    :param root: store root directory
+    :param kind: ticks or bars
+    :param symbol: symbol
+    :param date: trading date (YYYYMMDD)
+    :return: partition directory
+    """
+    return os.path.join(root, kind, 'symbol=' + quote(str(symbol), safe=''), 'date=' + str(date))
+
+
+# -------------------------------------------------------------------------------------------------
+# row group part
+# -------------------------------------------------------------------------------------------------
+
+class _RowGroup:
+    """ buffered rows of one partition as typed columns """
+
+    __slots__ = ('columns', 'rows', 'min', 'max')
+
+    def __init__(self, schema):
+        self.columns = [[] if type_code == 'str' else array(type_code) for _, type_code in schema]
+        self.rows = 0
+        self.min = None
+        self.max = None
+
+    def add(self, date_time_seq, values):
+        """ append row
+        :param date_time_seq: date time sequence as integer
+        :param values: values after date_time_seq (schema order)
+        :return: void
+        """
+        columns = self.columns
+        columns[0].append(date_time_seq)
+        for i, value in enumerate(values, 1):
+            columns[i].append(value)
+        self.rows += 1
+        if self.min is None or date_time_seq < self.min:
+            self.min = date_time_seq
+        if self.max is None or date_time_seq > self.max:
+            self.max = date_time_seq
+
+
+def _encode_column(column, type_code, level) -> bytes:
+    if type_code == 'str':
+        return zlib.compress('\n'.join(column).encode('utf-8'), level)
+    return zlib.compress(column.tobytes(), level)
+
+
+def _decode_column(data, type_code, rows, byteorder):
+    raw = zlib.decompress(data)
+    if type_code == 'str':
+        return raw.decode('utf-8').split('\n') if rows else []
+    column = array(type_code)
+    column.frombytes(raw)
+    if byteorder != sys.byteorder:
+        column.byteswap()
+    return column
+
+
+class _ColumnarFile:
+    """ part file of the dependency-free format
+    layout: magic, compressed column chunks of every row group, JSON footer (schema, chunk offsets,
+    min/max date_time_seq per row group and file), footer length and magic.
+    """
+
+    def __init__(self, path, schema, level):
+        self._path = path
+        self._schema = schema
+        self._level = level
+        self._file = open(path + '.tmp', 'wb')
+        self._file.write(_MAGIC)
+        self._row_groups = []
+
+    def write(self, group: _RowGroup):
+        chunks = {}
+        for (name, type_code), column in zip(self._schema, group.columns):
+            data = _encode_column(column, type_code, self._level)
+            chunks[name] = [self._file.tell(), len(data)]
+            self._file.write(data)
+        self._row_groups.append({'rows': group.rows, 'min': group.min, 'max': group.max, 'columns': chunks})
+
+    def close(self):
+        """ write footer and make the part file visible (durable: synced before the rename)
+        :return: void
+        """
+        groups = self._row_groups
+        footer = json.dumps({
+            'version': _VERSION,
+            'byteorder': sys.byteorder,
+            'schema': [list(column) for column in self._schema],
+            'rows': sum(group['rows'] for group in groups),
+            'min': min(group['min'] for group in groups) if groups else None,
+            'max': max(group['max'] for group in groups) if groups else None,
+            'row_groups': groups
+        }, separators=(',', ':')).encode('utf-8')
+        self._file.write(footer)
+        self._file.write(_TRAILER.pack(len(footer), _MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        # a part file becomes visible to readers once complete
+        os.replace(self._path + '.tmp', self._path)
+
+
+class _ParquetFile:
+    """ part file written with pyarrow (row group statistics are kept by parquet) """
+
+    def __init__(self, path, schema, level):
+        pyarrow, parquet = _pyarrow()
+        self._pyarrow = pyarrow
+        self._path = path
+        self._schema = schema
+        types = {'q': pyarrow.int64(), 'l': pyarrow.int64(), 'b': pyarrow.int8(), 'str': pyarrow.string()}
+        self._arrow_schema = pyarrow.schema([(name, types[type_code]) for name, type_code in schema])
+        self._writer = parquet.ParquetWriter(path + '.tmp', self._arrow_schema, compression='zstd',
+                                             compression_level=level, write_statistics=True)
+
+    def write(self, group: _RowGroup):
+        arrays = [self._pyarrow.array(column if isinstance(column, list) else column.tolist(), type=field.type)
+                  for column, field in zip(group.columns, self._arrow_schema)]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(arrays, schema=self._arrow_schema),
+                                 row_group_size=group.rows)
+
+    def close(self):
+        self._writer.close()
+        with open(self._path + '.tmp', 'r+b') as wf:
+            os.fsync(wf.fileno())
+        os.replace(self._path + '.tmp', self._path)
+
+
+# -------------------------------------------------------------------------------------------------
+# writer part
+# -------------------------------------------------------------------------------------------------
+
+class ColumnarStoreWriter:
+    """ buffer ticks and bars per partition into row groups and write compressed part files
+    a part file is kept open per partition and closed (made visible) when the partition trading day is left,
+    when it holds max_row_groups row groups, on flush (flush barrier of the sink) or on close.
+    """
+
+    def __init__(self, root, row_group_size=65536, max_row_groups=64, compression_level=6, store_format='auto',
+                 price_digits=PRICE_DIGITS, roll_hour=0):
+        """ constructor
+        :param root: store root directory
+        :param row_group_size: rows per row group
+        :param max_row_groups: row groups per part file
+        :param compression_level: zlib (hcol) or zstd (parquet) level
+        :param store_format: auto, parquet or hcol (ref. resolve_format)
+        :param price_digits: fixed-point digits of bar prices
+        :param roll_hour: hour the trading day starts (exchange time, ref. lib.journal.trading_day)
+        """
+        self._root = resolve_path(root)
+        self._row_group_size = int(row_group_size)
+        self._max_row_groups = int(max_row_groups)
+        self._level = int(compression_level)
+        self.format = resolve_format(store_format)
+        self._price_digits = price_digits
+        self._roll_hour = int(roll_hour)
+        # calendar date - previous calendar date (rows before roll_hour belong to the previous trading day)
+        self._previous_dates = {}
+        # (kind, symbol, trading day) - [row group, part file, written row groups]
+        self._partitions = {}
+        # (kind, symbol) - latest trading day
+        self._dates = {}
+        self.rows = 0
+        self.files = 0
+
+    def append(self, item):
+        """ buffer tick (Transaction or its dictionary) or bar (FID bar row, resolution when tagged)
+        :param item: transaction or bar row
+        :return: void
+        """
+        if isinstance(item, Transaction):
+            self._add(TICKS, item.symbol, int(item.date_time_seq), (item.seq or 0, item.price))
+            return
+        row = item if isinstance(item, dict) else item.to_dict()
+        if is_bar_row(row):
+            date_time_seq, values = bar_values(row, self._price_digits)
+            self._add(BARS, row.get('symbol'), date_time_seq, values)
+        else:
+            self._add(TICKS, row.get('symbol'), int(row['date_time_seq']), (row.get('seq') or 0, row['price']))
+
+    def trading_day(self, date_time_seq: int) -> int:
+        """ trading day of a date time sequence (days roll at roll_hour)
+        :param date_time_seq: date time sequence as integer (YYYYMMDDHHMMSS)
+        :return: trading day (YYYYMMDD)
+        """
+        date = date_time_seq // 1000000
+        if self._roll_hour and date_time_seq // 10000 % 100 < self._roll_hour:
+            previous = self._previous_dates.get(date)
+            if previous is None:
+                previous = previous_date(date)
+                self._previous_dates[date] = previous
+            return previous
+        return date
+
+    def _add(self, kind, symbol, date_time_seq, values):
+        date = self.trading_day(date_time_seq)
+        key = (kind, symbol, date)
+        partition = self._partitions.get(key)
+        if partition is None:
+            latest = self._dates.get((kind, symbol))
+            if latest is None or date > latest:
+                # trading day changed: earlier partitions of the symbol are complete
+                self._dates[(kind, symbol)] = date
+                self._close_partitions(kind, symbol, date)
+            partition = [_RowGroup(SCHEMAS[kind]), None, 0]
+            self._partitions[key] = partition
+        group = partition[0]
+        group.add(date_time_seq, values)
+        self.rows += 1
+        if group.rows >= self._row_group_size:
+            self._write_group(key, partition)
+
+    def _write_group(self, key, partition):
+        """ write buffered row group of partition
+        :param key: (kind, symbol, date)
+        :param partition: partition state
+        :return: void
+        """
+        group = partition[0]
+        if not group.rows:
+            return
+        kind, symbol, date = key
+        if partition[1] is None:
+            directory = partition_path(self._root, kind, symbol, date)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, 'part-{}-{}-{:04d}.{}'.format(
+                time.strftime('%Y%m%d%H%M%S'), os.getpid(), next(_PART_NUMBERS), self.format))
+            part_type = _ParquetFile if self.format == FORMAT_PARQUET else _ColumnarFile
+            partition[1] = part_type(path, SCHEMAS[kind], self._level)
+        partition[1].write(group)
+        partition[0] = _RowGroup(SCHEMAS[kind])
+        partition[2] += 1
+        if partition[2] >= self._max_row_groups:
+            self._close_file(partition)
+
+    def _close_file(self, partition):
+        if partition[1] is not None:
+            partition[1].close()
+            partition[1] = None
+            partition[2] = 0
+            self.files += 1
+
+    def _close_partitions(self, kind, symbol, before_date):
+        for key in [key for key in self._partitions if key[0] == kind and key[1] == symbol and key[2] < before_date]:
+            partition = self._partitions.pop(key)
+            self._write_group(key, partition)
+            self._close_file(partition)
+
+    def flush(self):
+        """ write buffered rows and close the open part files (every appended row is durable and visible)
+        :return: void
+        """
+        for key, partition in self._partitions.items():
+            self._write_group(key, partition)
+            self._close_file(partition)
+
+    def close(self):
+        """ write buffered rows and close every part file
+        :return: void
+        """
+        for key, partition in list(self._partitions.items()):
+            try:
+                self._write_group(key, partition)
+                self._close_file(partition)
+            except Exception as _e:
+                log.error('[columnar] close partition failed. (partition: {}, error: {})'.format(str(key), str(_e)))
+        self._partitions.clear()
+
+
+# -------------------------------------------------------------------------------------------------
+# reader part
+# -------------------------------------------------------------------------------------------------
+
+def _read_footer(rf) -> dict:
+    rf.seek(-_TRAILER.size, os.SEEK_END)
+    length, magic = _TRAILER.unpack(rf.read(_TRAILER.size))
+    if magic != _MAGIC:
+        raise ColumnarStoreProcessException('[columnar] invalid part file.')
+    rf.seek(-_TRAILER.size - length, os.SEEK_END)
+    return json.loads(rf.read(length).decode('utf-8'))
+
+
+class ColumnarStoreReader:
+    """ load a date time range of one symbol into typed columns
+    partitions outside the date range are not listed, part files and row groups whose min/max
+    date_time_seq statistics do not overlap the range are not decompressed.
+    """
+
+    def __init__(self, root):
+        """ constructor
+        :param root: store root directory
+        """
+        self._root = resolve_path(root)
+        self.files_skipped = 0
+        self.row_groups_skipped = 0
+        self.row_groups_read = 0
+
+    def symbols(self, kind=TICKS):
+        """ stored symbols
+        :param kind: ticks or bars
+        :return: list of symbols
+        """
+        directory = os.path.join(self._root, kind)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(unquote(name[len('symbol='):]) for name in os.listdir(directory) if name.startswith('symbol='))
+
+    def part_files(self, kind, symbol, from_date, to_date):
+        """ part files of the partitions between from_date and to_date
+        :param kind: ticks or bars
+        :param symbol: symbol
+        :param from_date: first trading date (YYYYMMDD)
+        :param to_date: last trading date (YYYYMMDD)
+        :return: list of paths
+        """
+        directory = os.path.join(self._root, kind, 'symbol=' + quote(str(symbol), safe=''))
+        if not os.path.isdir(directory):
+            return []
+        paths = []
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith('date=') or not int(from_date) <= int(name[len('date='):]) <= int(to_date):
+                continue
+            partition = os.path.join(directory, name)
+            paths.extend(os.path.join(partition, part) for part in sorted(os.listdir(partition))
+                         if part.endswith('.' + FORMAT_COLUMNAR) or part.endswith('.' + FORMAT_PARQUET))
+        return paths
+
+    def read(self, kind, symbol, from_date_time_seq, to_date_time_seq, columns=None) -> dict:
+        """ rows of symbol between two date time sequences (inclusive) in file order
+        :param kind: ticks or bars
+        :param symbol: symbol
+        :param from_date_time_seq: first date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param to_date_time_seq: last date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param columns: column names (None: every column)
+        :return: column name - typed array (list for text columns)
+        """
+        low = int(str(from_date_time_seq).ljust(14, '0'))
+        high = int(str(to_date_time_seq).ljust(14, '9'))
+        schema = SCHEMAS[kind]
+        names = [name for name, _ in schema] if columns is None else list(columns)
+        types = dict(schema)
+        result = {name: [] if types[name] == 'str' else array(types[name]) for name in names}
+        # rows before the roll hour of a date are stored in the partition of the previous trading day
+        for path in self.part_files(kind, symbol, previous_date(low // 1000000), high // 1000000):
+            if path.endswith('.' + FORMAT_PARQUET):
+                self._read_parquet(path, low, high, names, types, result)
+            else:
+                self._read_columnar(path, low, high, names, types, result)
+        return result
+
+    def _read_columnar(self, path, low, high, names, types, result):
+        with open(path, 'rb') as rf:
+            footer = _read_footer(rf)
+            if footer['rows'] == 0 or footer['max'] < low or footer['min'] > high:
+                self.files_skipped += 1
+                return
+            byteorder = footer['byteorder']
+            for group in footer['row_groups']:
+                if group['max'] < low or group['min'] > high:
+                    self.row_groups_skipped += 1
+                    continue
+                self.row_groups_read += 1
+                decoded = {}
+                for name in set(names) | {'date_time_seq'}:
+                    offset, length = group['columns'][name]
+                    rf.seek(offset)
+                    decoded[name] = _decode_column(rf.read(length), types[name], group['rows'], byteorder)
+                self._append(decoded, group['min'], group['max'], low, high, names, result)
+
+    def _read_parquet(self, path, low, high, names, types, result):
+        _, parquet = _pyarrow()
+        part = parquet.ParquetFile(path)
+        metadata = part.metadata
+        for index in range(metadata.num_row_groups):
+            statistics = metadata.row_group(index).column(0).statistics
+            if statistics is not None and statistics.has_min_max \
+                    and (statistics.max < low or statistics.min > high):
+                self.row_groups_skipped += 1
+                continue
+            self.row_groups_read += 1
+            table = part.read_row_group(index, columns=list(set(names) | {'date_time_seq'}))
+            decoded = {}
+            for name in table.column_names:
+                values = table.column(name).to_pylist()
+                decoded[name] = values if types[name] == 'str' else array(types[name], values)
+            sequence = decoded['date_time_seq']
+            self._append(decoded, min(sequence) if sequence else 0, max(sequence) if sequence else 0, low, high,
+                         names, result)
+
+    @staticmethod
+    def _append(decoded, group_min, group_max, low, high, names, result):
+        if low <= group_min and group_max <= high:
+            # row group entirely inside the range
+            for name in names:
+                result[name].extend(decoded[name])
+            return
+        selected = [i for i, value in enumerate(decoded['date_time_seq']) if low <= value <= high]
+        for name in names:
+            column = decoded[name]
+            result[name].extend(column[i] for i in selected)
+
+
+def create_columnar_writer(config):
+    """ create columnar store writer from configuration
+    :param config: columnar configuration
+    :return: columnar store writer
+    """
+    return ColumnarStoreWriter(config['path'],
+                               row_group_size=config.get('row_group_size', 65536),
+                               max_row_groups=config.get('max_row_groups', 64),
+                               compression_level=config.get('compression_level', 6),
+                               store_format=config.get('format', 'auto'),
+                               roll_hour=config.get('roll_hour', 0))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+    Columnar FID response batch
+    author: modorigoon
+    since: 0.2.0
+"""
+from array import array
+from lib.transaction import PRICE_DIGITS, fixed_to_price, price_to_fixed
+from util.datetime_util import date_time_columns_to_epoch
+
+# FID code - (column name, array type code, kind)
+FID_COLUMNS = (
+    ('9', 'date', 'l', 'int'),
+    ('8', 'time', 'l', 'int'),
+    ('1098', 'sell_sign', 'b', 'int'),
+    ('30', 'sell_open', 'q', 'price'),
+    ('31', 'sell_high', 'q', 'price'),
+    ('32', 'sell_low', 'q', 'price'),
+    ('33', 'sell_close', 'q', 'price'),
+    ('6', 'buy_sign', 'b', 'int'),
+    ('40', 'buy_open', 'q', 'price'),
+    ('41', 'buy_high', 'q', 'price'),
+    ('42', 'buy_low', 'q', 'price'),
+    ('43', 'buy_close', 'q', 'price'),
+    ('666', 'spread', 'q', 'int'),
+)
+_COLUMN_CODES = frozenset(code for code, _, _, _ in FID_COLUMNS)
+_PRICE_CODES = frozenset(code for code, _, _, kind in FID_COLUMNS if kind == 'price')
+
+
+class FidColumnProcessException(Exception):
+    pass
+
+
+def _to_int(value) -> int:
+    value = str(value).strip()
+    return int(value) if value else 0
+
+
+class FidColumnBatch:
+    """ FID response held as preallocated typed columns (dates/times as int, prices as fixed-point int) """
+
+    __slots__ = ('symbol', 'size', 'price_digits', '_columns')
+
+    def __init__(self, size, symbol=None, price_digits=PRICE_DIGITS):
+        """ constructor
+        :param size: number of rows
+        :param symbol: symbol
+        :param price_digits: fixed-point digits of prices
+        """
+        self.symbol = symbol
+        self.size = size
+        self.price_digits = price_digits
+        self._columns = {code: array(type_code, bytes(array(type_code).itemsize * size))
+                         for code, _, type_code, _ in FID_COLUMNS}
+
+    def __len__(self):
+        return self.size
+
+    def column(self, fid_code) -> array:
+        """ typed column of FID code
+        :param fid_code: FID code (ref. FID_COLUMNS)
+        :return: column array
+        """
+        return self._columns[str(fid_code)]
+
+    def fill(self, fid_code, values):
+        """ convert raw response values into the column
+        :param fid_code: FID code
+        :param values: raw values (row order)
+        :return: void
+        """
+        fid_code = str(fid_code)
+        column = self._columns[fid_code]
+        if len(values) != self.size:
+            raise FidColumnProcessException('[fid] column size mismatch. (fid: {}, size: {}, expected: {})'
+                                            .format(fid_code, str(len(values)), str(self.size)))
+        if fid_code in _PRICE_CODES:
+            digits = self.price_digits
+            for i, value in enumerate(values):
+                value = str(value).strip()
+                column[i] = price_to_fixed(value, digits) if value else 0
+        else:
+            for i, value in enumerate(values):
+                column[i] = _to_int(value)
+
+    def date_time_seq(self, row) -> str:
+        """ date time sequence of row
+        :param row: row index
+        :return: date time sequence (YYYYMMDDHHMMSS)
+        """
+        return '{:08d}{:06d}'.format(self._columns['9'][row], self._columns['8'][row])
+
+    def epochs(self) -> array:
+        """ epoch seconds of every row (date and time columns converted at once, UTC wall clock)
+        :return: epoch seconds (array of int64)
+        """
+        return date_time_columns_to_epoch(self._columns['9'], self._columns['8'])
+
+    def iter_rows(self):
+        """ rows in FID response layout (prices as decimal strings)
+        :return: generator of row dictionaries
+        """
+        columns = [(code, self._columns[code], code in _PRICE_CODES) for code, _, _, _ in FID_COLUMNS]
+        digits = self.price_digits
+        for i in range(self.size):
+            row = {'symbol': self.symbol}
+            for code, column, is_price in columns:
+                row[code] = fixed_to_price(column[i], digits) if is_price else column[i]
+            yield row
+
+    def to_numpy(self) -> dict:
+        """ columns as NumPy arrays (requires numpy)
+        :return: column name - ndarray dictionary
+        """
+        import numpy
+        return {name: numpy.frombuffer(self._columns[code], dtype=numpy.dtype(type_code))
+                for code, name, type_code, _ in FID_COLUMNS}
+
+
+def extract_cells(api, rid, symbol=None, price_digits=PRICE_DIGITS) -> FidColumnBatch:
+    """ extract FID response column by column (one output call per cell, no per call logging)
+    :param api: API handler
+    :param rid: request id
+    :param symbol: symbol
+    :param price_digits: fixed-point digits of prices
+    :return: column batch
+    """
+    count = api.get_fid_output_count(rid)
+    batch = FidColumnBatch(count, symbol, price_digits)
+    for code, _, _, _ in FID_COLUMNS:
+        batch.fill(code, api.get_fid_output_column(rid, code, count))
+    return batch
+
+
+def extract_block(block, fields, symbol=None, price_digits=PRICE_DIGITS, row_separator='\n',
+                  field_separator='\t') -> FidColumnBatch:
+    """ extract FID response from the data block delivered with the FID event (one pass, no output calls)
+    every row must hold exactly the requested fields (a trailing separator is allowed), a block split with
+    the wrong separators is refused instead of being read into shifted columns.
+    :param block: data block
+    :param fields: requested FID codes (block field order)
+    :param symbol: symbol
+    :param price_digits: fixed-point digits of prices
+    :param row_separator: row separator of block
+    :param field_separator: field separator of block
+    :return: column batch
+    """
+    lines = [line for line in str(block).split(row_separator) if line.strip()]
+    table = [line.split(field_separator) for line in lines]
+    width = len(fields)
+    for row in table:
+        if len(row) < width or any(value.strip() for value in row[width:]):
+            raise FidColumnProcessException('[fid] block row does not match the requested fields. '
+                                            '(fields: {}, row: {!r})'.format(str(width), field_separator.join(row)))
+    batch = FidColumnBatch(len(table), symbol, price_digits)
+    for index, code in enumerate(fields):
+        if str(code) in _COLUMN_CODES:
+            batch.fill(code, [row[index] for row in table])
+    return batch
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+    Real stream gap detection and FID backfill
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import json
+import os
+import time
+from common.config import resolve_path
+from common.logger import log
+from lib.bar_aggregator import BAR_RESOLUTIONS
+from lib.scheduler import PeriodicTask
+from lib.transaction import date_time_sequence_to_epoch
+
+# classification of continuous queries (ref. HanaAPI.request_fid_data_list)
+_PN_FIRST = '1'
+_PN_NEXT = '3'
+
+
+class GapProcessException(Exception):
+    pass
+
+
+class Gap(collections.namedtuple('Gap', 'symbol from_date_time_seq to_date_time_seq')):
+    """ silent interval of one symbol (last tick before - first tick after, exclusive) """
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return '{}:{}-{}'.format(self.symbol, self.from_date_time_seq, self.to_date_time_seq)
+
+    @property
+    def seconds(self):
+        return (date_time_sequence_to_epoch(self.to_date_time_seq)
+                - date_time_sequence_to_epoch(self.from_date_time_seq))
+
+
+def _session_seconds(time_text: str) -> int:
+    """ HHMMSS to seconds of day
+    :param time_text: time (HHMMSS)
+    :return: seconds of day
+    """
+    return int(time_text[0:2]) * 3600 + int(time_text[2:4]) * 60 + int(time_text[4:6])
+
+
+class GapDetector:
+    """ flags silent intervals on the date time sequence stream of every symbol
+    the threshold depends on the session the interval starts in (ex: a longer threshold overnight).
+    """
+
+    def __init__(self, on_gap, threshold_s=30, sessions=None):
+        """ constructor
+        :param on_gap: function(gap) called for every detected gap
+        :param threshold_s: default silent interval threshold
+        :param sessions: list of {"start": HHMMSS, "end": HHMMSS, "threshold_s": N} (end exclusive, may wrap
+                         midnight, threshold_s 0: gaps are ignored in this session)
+        """
+        self._on_gap = on_gap
+        self._threshold = float(threshold_s)
+        self._sessions = [(_session_seconds(session['start']), _session_seconds(session['end']),
+                           float(session['threshold_s'])) for session in (sessions or [])]
+        # symbol - [last date time sequence, its epoch seconds]
+        self._last = {}
+        self.detected = 0
+
+    def threshold(self, date_time_seq: str) -> float:
+        """ threshold of the session containing date time sequence
+        :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+        :return: threshold seconds (0: disabled)
+        """
+        if not self._sessions:
+            return self._threshold
+        second = _session_seconds(date_time_seq[8:14])
+        for start, end, threshold in self._sessions:
+            if (start <= second < end) if start <= end else (second >= start or second < end):
+                return threshold
+        return self._threshold
+
+    def on_transaction(self, symbol, date_time_seq):
+        """ track date time sequence of symbol (tick path)
+        :param symbol: symbol
+        :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+        :return: void
+        """
+        last = self._last.get(symbol)
+        if last is None:
+            self._last[symbol] = [date_time_seq, date_time_sequence_to_epoch(date_time_seq)]
+            return
+        if date_time_seq == last[0]:
+            return
+        epoch = date_time_sequence_to_epoch(date_time_seq)
+        threshold = self.threshold(last[0])
+        if 0 < threshold < epoch - last[1]:
+            self.detected += 1
+            self._on_gap(Gap(symbol, last[0], date_time_seq))
+        if epoch >= last[1]:
+            last[0] = date_time_seq
+            last[1] = epoch
+
+
+class _Request:
+
+    __slots__ = ('gap', 'attempt', 'requested_at', 'pages', 'rows')
+
+    def __init__(self, gap, attempt):
+        self.gap = gap
+        self.attempt = attempt
+        self.requested_at = None
+        self.pages = 0
+        self.rows = 0
+
+
+class GapBackfiller:
+    """ backfill detected gaps with targeted FID requests (one request id at a time)
+    the requested dates cover the gap; only rows whose bar starts strictly inside the gap are kept, so the
+    bars emitted live on both edges are never duplicated, and rows already merged are skipped.
+    requests are driven by a periodic task posted to the agent event thread (app.call_soon) and answered
+    through the FID event handler, so every request runs between real events and never blocks them.
+    merged row keys are appended to merged_path, a restart does not emit a merged bar again.
+    """
+
+    def __init__(self, app, emit, resolution='1m', requests_per_second=1.0, request_timeout_s=30, max_retries=3,
+                 poll_interval_ms=500, max_merged_keys=100000, merged_path=None):
+        """ constructor
+        :param app: application (FID part)
+        :param emit: function(row) receiving backfilled rows
+        :param resolution: bar resolution of the FID response (ref. BAR_RESOLUTIONS)
+        :param requests_per_second: agent rate limit
+        :param request_timeout_s: response timeout (the gap is retried)
+        :param max_retries: retries per gap
+        :param poll_interval_ms: request scheduling interval
+        :param max_merged_keys: remembered merged row keys (oldest are forgotten)
+        :param merged_path: merged row keys file (None: remembered in memory only)
+        """
+        if resolution not in BAR_RESOLUTIONS:
+            raise GapProcessException('[gap] invalid resolution. ({})'.format(str(resolution)))
+        self._app = app
+        self._emit = emit
+        self._resolution = resolution
+        self._seconds = BAR_RESOLUTIONS[resolution]
+        self._request_interval = 1.0 / float(requests_per_second) if requests_per_second else 0.0
+        self._request_timeout = float(request_timeout_s)
+        self._max_retries = int(max_retries)
+        self._task = PeriodicTask('gap-backfill', float(poll_interval_ms) / 1000, self._post_poll)
+        self._poll_pending = False
+        self._pending = collections.deque()
+        self._scheduled = set()
+        self._merged = collections.OrderedDict()
+        self._max_merged_keys = int(max_merged_keys)
+        self._merged_path = resolve_path(merged_path) if merged_path else None
+        if self._merged_path is not None:
+            self._load_merged()
+        self._rid = None
+        self._request = None
+        self._continuation = None
+        self._next_request_at = 0.0
+        self._stats = collections.Counter()
+
+    def start(self):
+        """ take over the FID event handler and start scheduling
+        :return: void
+        """
+        self._app.set_fid_event_handler(self.on_fid_event)
+        self._task.start()
+
+    def stop(self):
+        """ stop scheduling (pending gaps are logged)
+        :return: void
+        """
+        self._task.stop()
+        self._app.set_fid_event_handler(None)
+        for gap, _ in self._pending:
+            log.warning('[gap] not backfilled: {}'.format(gap.key))
+
+    def _load_merged(self):
+        """ read merged row keys of previous runs (the newest max_merged_keys, the file is compacted)
+        :return: void
+        """
+        if not os.path.exists(self._merged_path):
+            return
+        lines = 0
+        with open(self._merged_path, encoding='utf-8') as rf:
+            for line in rf:
+                try:
+                    key = tuple(json.loads(line))
+                except ValueError:
+                    # line cut by a crash
+                    continue
+                lines += 1
+                self._merged[key] = True
+                if len(self._merged) > self._max_merged_keys:
+                    self._merged.popitem(last=False)
+        if lines > len(self._merged):
+            temporary_path = self._merged_path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as wf:
+                wf.writelines(json.dumps(list(key)) + '\n' for key in self._merged)
+            os.replace(temporary_path, self._merged_path)
+        log.info('[gap] merged keys loaded. (keys: {})'.format(str(len(self._merged))))
+
+    def _save_merged(self, keys):
+        """ append merged row keys of a page (once its rows were handed to emit)
+        :param keys: list of keys
+        :return: void
+        """
+        if self._merged_path is None or not keys:
+            return
+        parent = os.path.dirname(self._merged_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(self._merged_path, 'a', encoding='utf-8') as wf:
+            wf.writelines(json.dumps(list(key)) + '\n' for key in keys)
+
+    def schedule(self, gap: Gap):
+        """ queue gap backfill (tick path, duplicated gaps are ignored)
+        :param gap: gap
+        :return: void
+        """
+        if gap.key in self._scheduled:
+            return
+        self._scheduled.add(gap.key)
+        self._pending.append((gap, 0))
+        self._stats['gaps'] += 1
+        log.warning('[gap] detected: {} ({:.0f}s)'.format(gap.key, gap.seconds))
+
+    def _post_poll(self):
+        """ timer callback: run poll on the agent event thread (one pending poll at most)
+        :return: void
+        """
+        if self._poll_pending:
+            return
+        self._poll_pending = True
+        self._app.call_soon(self._run_poll)
+
+    def _run_poll(self):
+        self._poll_pending = False
+        self.poll()
+
+    def poll(self):
+        """ expire, continue or start a request (agent event thread)
+        :return: void
+        """
+        try:
+            now = time.monotonic()
+            if self._request is not None:
+                if self._continuation is not None and now >= self._next_request_at:
+                    pnc, self._continuation = self._continuation, None
+                    self._send(_PN_NEXT, pnc)
+                elif now - self._request.requested_at > self._request_timeout:
+                    self._finish(False, 'response timeout')
+                return
+            if self._pending and now >= self._next_request_at:
+                self._start(*self._pending.popleft())
+        except Exception as _e:
+            log.error('[gap] poll ERROR: {}'.format(str(_e)))
+
+    def _start(self, gap, attempt):
+        """ set FID inputs for the dates covering the gap and request the first page
+        :param gap: gap
+        :param attempt: attempt number
+        :return: void
+        """
+        rid = self._app.create_request_id()
+        self._rid = rid
+        self._request = _Request(gap, attempt)
+        if not (self._app.init_fid(rid, gap.symbol)
+                and self._app.set_fid_date_range(rid, gap.from_date_time_seq[:8], gap.to_date_time_seq[:8])):
+            self._finish(False, 'set FID input failed')
+            return
+        self._send(_PN_FIRST, '')
+
+    def _send(self, pn, pnc):
+        self._next_request_at = time.monotonic() + self._request_interval
+        self._request.requested_at = time.monotonic()
+        self._app.request_fid(self._rid, pn, pnc, wait=False)
+        self._stats['requests'] += 1
+
+    def _finish(self, successful, reason=None):
+        """ release request id, retry failed gap
+        :param successful: gap backfilled
+        :param reason: failure reason
+        :return: void
+        """
+        request = self._request
+        self._app.release_request_id(self._rid)
+        self._rid = None
+        self._request = None
+        self._continuation = None
+        gap = request.gap
+        if successful:
+            self._scheduled.discard(gap.key)
+            self._stats['gaps_backfilled'] += 1
+            log.info('[gap] backfilled: {} (pages: {}, rows: {})'.format(gap.key, request.pages, request.rows))
+        elif request.attempt + 1 > self._max_retries:
+            self._scheduled.discard(gap.key)
+            self._stats['gaps_failed'] += 1
+            log.error('[gap] backfill failed: {} ({})'.format(gap.key, reason))
+        else:
+            self._stats['retries'] += 1
+            log.warning('[gap] retry backfill: {} ({})'.format(gap.key, reason))
+            self._pending.append((gap, request.attempt + 1))
+
+    def on_fid_event(self, rid, block, length):
+        """ FID response handler: merge rows inside the gap, request the next page or finish
+        :param rid: request id
+        :param block: data block
+        :param length: length of data
+        :return: void
+        """
+        if rid == self._rid and self._request is not None:
+            self._merge(self._request, block)
+
+    def _merge(self, request, block):
+        """ merge rows of the received page
+        :param request: request state
+        :param block: data block
+        :return: void
+        """
+        rid = self._rid
+        gap = request.gap
+        seconds = self._seconds
+        # bars starting strictly after the bar of the last tick and before the bar of the first tick
+        from_epoch = date_time_sequence_to_epoch(gap.from_date_time_seq)
+        to_epoch = date_time_sequence_to_epoch(gap.to_date_time_seq)
+        lower = from_epoch - from_epoch % seconds
+        upper = to_epoch - to_epoch % seconds
+        batch = self._app.get_fid_batch(rid, block, gap.symbol)
+        merged = []
+        for row, epoch in zip(batch.iter_rows(), batch.epochs()):
+            if not lower < epoch < upper:
+                continue
+            key = (gap.symbol, row['9'], row['8'])
+            if key in self._merged:
+                self._stats['duplicates'] += 1
+                continue
+            self._merged[key] = True
+            if len(self._merged) > self._max_merged_keys:
+                self._merged.popitem(last=False)
+            row['resolution'] = self._resolution
+            self._emit(row)
+            merged.append(key)
+            request.rows += 1
+            self._stats['rows'] += 1
+        self._save_merged(merged)
+        request.pages += 1
+        _, pnc = self._app.get_fid_next_context()
+        if pnc and len(batch):
+            self._continuation = pnc
+            return
+        self._finish(True)
+
+    def stats(self) -> dict:
+        """ backfill counters
+        :return: counters dictionary
+        """
+        stats = dict(self._stats)
+        stats['pending'] = len(self._pending) + (1 if self._request is not None else 0)
+        return stats
+
+
+def create_gap_backfill(config, app, emit):
+    """ create gap detector and backfiller from configuration
+    :param config: gaps configuration (None: gap detection disabled)
+    :param app: application
+    :param emit: function(row) receiving backfilled rows
+    :return: (gap detector, gap backfiller) or (None, None)
+    """
+    if not config or config.get('enabled') is not True:
+        return None, None
+    backfiller = GapBackfiller(app, emit, resolution=config.get('resolution', '1m'),
+                               requests_per_second=config.get('requests_per_second', 1.0),
+                               request_timeout_s=config.get('request_timeout_s', 30),
+                               max_retries=config.get('max_retries', 3),
+                               poll_interval_ms=config.get('poll_interval_ms', 500),
+                               max_merged_keys=config.get('max_merged_keys', 100000),
+                               merged_path=config.get('merged_path'))
+    detector = GapDetector(backfiller.schedule, config.get('threshold_s', 30), config.get('sessions'))
+    return detector, backfiller
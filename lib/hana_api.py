@@ -4,14 +4,20 @@
     author: modorigoon
     since: 0.1.0
 """
+import logging
+import time
 from common.logger import log
+from lib.metrics import REGISTRY
+from lib.subscription import SubscriptionManager
 from PyQt5.QtCore import *
 from PyQt5.QAxContainer import *
 
+_CALL_SECONDS = REGISTRY.histogram('hana1q_api_call_seconds', 'Agent control dynamicCall latency.', ('method',))
 
-class HanaAPI(QAxWidget):
 
-    _real_event_handler = None
+class HanaAPIBase:
+    """ 1Q agent control methods, mixed into a widget (HanaAPI) or a windowless object (HeadlessHanaAPI) """
+
     _fid_event_handler = None
 
     def __init__(self, config):
@@ -24,13 +30,35 @@ class HanaAPI(QAxWidget):
         self._CREDENTIALS = config['credentials']
         self._REAL_NAME = config['target']['real_name']
         self._SYMBOL = config['target']['symbol']
+        self.subscriptions = SubscriptionManager(self.register_real, self.unregister_real)
         self.setControl(self._PROGRAM_ID)
 
-        # self.OnGetFidData.connect(self.fid_data_handler)
+        self.OnGetFidData.connect(self.fid_data_handler)
         self.OnGetRealData.connect(self.real_data_handler)
         self.OnAgentEventHandler.connect(self.on_agent_event_handler)
+        # emitted from other threads, delivered (queued) on the thread owning the control
+        self.call_requested.connect(self._run_call)
 
         self.event_connect_loop = QEventLoop()
+        self.fid_event_loop = QEventLoop()
+        # method name - latency histogram child
+        self._call_metrics = {}
+
+    def _call(self, signature, *args):
+        """ dynamicCall timed into the API call latency histogram
+        :param signature: method signature (ex: CommInit())
+        :param args: method arguments
+        :return: method result
+        """
+        histogram = self._call_metrics.get(signature)
+        if histogram is None:
+            histogram = _CALL_SECONDS.labels(signature.split('(', 1)[0])
+            self._call_metrics[signature] = histogram
+        started_at = time.perf_counter()
+        try:
+            return self.dynamicCall(signature, *args)
+        finally:
+            histogram.observe(time.perf_counter() - started_at)
 
     # -------------------------------------------------------------------------------------------------
     # communication module control part
@@ -41,7 +69,7 @@ class HanaAPI(QAxWidget):
         :return: initialize successful
         """
         log.info('[api] call - CommInit()')
-        result = self.dynamicCall('CommInit()')
+        result = self._call('CommInit()')
         return True if result == 0 else False
 
     def get_comm_state(self) -> bool:
@@ -49,22 +77,44 @@ class HanaAPI(QAxWidget):
         :return: normal operation status of communication module
         """
         log.info('[api] call - CommGetConnectState()')
-        state = self.dynamicCall('CommGetConnectState()')
+        state = self._call('CommGetConnectState()')
         return True if state == 1 else False
 
     def terminate(self):
         """ terminate communication module
         :return: void
         """
-        log.info('[api] call - CommTerminate({})'.format(str(1)))
-        self.dynamicCall('CommTerminate(bSocketClose)', 1)
+        log.info('[api] call - CommTerminate(1)')
+        self._call('CommTerminate(bSocketClose)', 1)
+
+    def process_events(self, timeout_ms=100):
+        """ deliver pending agent events (used by drivers running outside the Qt main loop)
+        :param timeout_ms: maximum processing time
+        :return: void
+        """
+        QCoreApplication.processEvents(QEventLoop.AllEvents, timeout_ms)
+
+    def call_soon(self, callback):
+        """ call function on the agent event thread (next event loop iteration, safe from any thread)
+        a timer started by another thread would belong to that thread (without an event loop it never fires),
+        the signal is queued to the control thread instead.
+        :param callback: function()
+        :return: void
+        """
+        self.call_requested.emit(callback)
+
+    def _run_call(self, callback):
+        try:
+            callback()
+        except Exception as _e:
+            log.error('[api] call ERROR: {}'.format(str(_e)))
 
     def get_last_api_error(self):
         """ query the last error message in API
         :return: last error message
         """
         log.info('[api] call - GetLastErrMsg()')
-        return self.dynamicCall('GetLastErrMsg()')
+        return self._call('GetLastErrMsg()')
 
     def on_agent_event_handler(self, event_type, param, value):
         """ agent event loop handler
@@ -73,7 +123,7 @@ class HanaAPI(QAxWidget):
         :param value: value
         :return: void
         """
-        log.info('[api] on event({}) {} - {}'.format(str(event_type), str(param), str(value)))
+        log.info('[api] on event(%s) %s - %s', event_type, param, value)
 
     # -------------------------------------------------------------------------------------------------
     # certification part
@@ -89,8 +139,8 @@ class HanaAPI(QAxWidget):
                        1(option) - 0: cert, 1: only query market price
         :return: setup successful
         """
-        log.info('[api] call - SetLoginMode({}, {})'.format(str(option), str(login_mode)))
-        result = self.dynamicCall('SetLoginMode(nOption, nMode)', option, login_mode)
+        log.info('[api] call - SetLoginMode(%s, %s)', option, login_mode)
+        result = self._call('SetLoginMode(nOption, nMode)', option, login_mode)
         return True if result else False
 
     def get_login_mode(self, option):
@@ -98,8 +148,8 @@ class HanaAPI(QAxWidget):
         :param option: query option (0: mock, 1: query market price, 2: employee/customer)
         :return: login mode
         """
-        log.info('[api] call - GetLoginMode({})'.format(str(option)))
-        return self.dynamicCall('GetLoginMode(nOption)', option)
+        log.info('[api] call - GetLoginMode(%s)', option)
+        return self._call('GetLoginMode(nOption)', option)
 
     def login(self) -> bool:
         """ login
@@ -107,21 +157,21 @@ class HanaAPI(QAxWidget):
         """
         try:
             # disable the agent control message dialog
-            self.dynamicCall('SetOffAgentMessageBox(nOption)', 1)
+            self._call('SetOffAgentMessageBox(nOption)', 1)
             log.info('[api] call - CommLogin(*, *, *)')
-            result = self.dynamicCall('CommLogin(sUserId, sPwd, sCertPass)', self._CREDENTIALS['id'],
-                                      self._CREDENTIALS['password'], self._CREDENTIALS['cert'])
+            result = self._call('CommLogin(sUserId, sPwd, sCertPass)', self._CREDENTIALS['id'],
+                                self._CREDENTIALS['password'], self._CREDENTIALS['cert'])
             return True if result else False
         finally:
             # enable the agent control message dialog
-            self.dynamicCall('SetOffAgentMessageBox(nOption)', 0)
+            self._call('SetOffAgentMessageBox(nOption)', 0)
 
     def logout(self) -> bool:
         """ logout
         :return: logout successful
         """
         log.info('[api] call - CommLogout(*)')
-        result = self.dynamicCall('CommLogout(sUserId)', self._CREDENTIALS['id'])
+        result = self._call('CommLogout(sUserId)', self._CREDENTIALS['id'])
         return True if result == 0 else False
 
     def get_login_state(self) -> bool:
@@ -129,31 +179,39 @@ class HanaAPI(QAxWidget):
         :return: login state
         """
         log.info('[api] call - GetLoginState()')
-        result = self.dynamicCall('GetLoginState()')
+        result = self._call('GetLoginState()')
         return True if result else False
 
     # -------------------------------------------------------------------------------------------------
     # real api part
     # -------------------------------------------------------------------------------------------------
 
-    def register_real(self) -> bool:
+    def register_real(self, real_name=None, symbol=None) -> bool:
         """ subscribe to real register api
+        :param real_name: real name (default: configured target)
+        :param symbol: symbol (default: configured target)
         :return: subscribe successful
         """
-        log.info('[api] call - RegisterReal({}, {})'.format(str(self._REAL_NAME), str(self._SYMBOL)))
-        result = self.dynamicCall('RegisterReal(strRealName, strRealKey)', self._REAL_NAME, self._SYMBOL)
+        real_name = real_name or self._REAL_NAME
+        symbol = symbol or self._SYMBOL
+        log.info('[api] call - RegisterReal(%s, %s)', real_name, symbol)
+        result = self._call('RegisterReal(strRealName, strRealKey)', real_name, symbol)
         return True if result == 0 else False
 
-    def unregister_real(self) -> bool:
-        """ unsubscribe to real register api
+    def unregister_real(self, real_name=None, symbol=None) -> bool:
+        """ unsubscribe to real register api (the real event loop ends with the last subscription)
+        :param real_name: real name (default: configured target)
+        :param symbol: symbol (default: configured target)
         :return: unsubscribe successful
         """
+        real_name = real_name or self._REAL_NAME
+        symbol = symbol or self._SYMBOL
         try:
-            log.info('[api] call - UnRegisterReal({}, {})'.format(str(self._REAL_NAME), str(self._SYMBOL)))
-            result = self.dynamicCall('UnRegisterReal(strRealName, strRealKey)', self._REAL_NAME, self._SYMBOL)
+            log.info('[api] call - UnRegisterReal(%s, %s)', real_name, symbol)
+            result = self._call('UnRegisterReal(strRealName, strRealKey)', real_name, symbol)
             return True if result == 1 else False
         finally:
-            if self.event_connect_loop is not None:
+            if self.event_connect_loop is not None and not self.subscriptions.active():
                 self.event_connect_loop.quit()
 
     def unregister_real_all(self):
@@ -162,38 +220,48 @@ class HanaAPI(QAxWidget):
         """
         try:
             log.info('[api] call - AllUnRegisterReal()')
-            result = self.dynamicCall('AllUnRegisterReal()')
+            result = self._call('AllUnRegisterReal()')
             return True if result == 1 else False
         finally:
+            self.subscriptions.mark_unregistered()
             if self.event_connect_loop is not None:
                 self.event_connect_loop.quit()
 
-    def get_real_output_data(self) -> str:
+    def get_real_output_data(self, real_name=None, symbol=None, wait=True) -> str:
         """ get real api output data
+        :param real_name: real name (default: configured target)
+        :param symbol: symbol (default: configured target)
+        :param wait: run the real event loop until every real is unregistered
         :return: response data
         """
-        log.info('[api] call - GetRealOutputData({}, {})'.format(str(self._REAL_NAME), str(self._SYMBOL)))
-        response = self.dynamicCall('GetRealOutputData(strRealName, realItem)', self._REAL_NAME, self._SYMBOL)
-        self.event_connect_loop.exec_()
+        real_name = real_name or self._REAL_NAME
+        symbol = symbol or self._SYMBOL
+        log.info('[api] call - GetRealOutputData(%s, %s)', real_name, symbol)
+        response = self._call('GetRealOutputData(strRealName, realItem)', real_name, symbol)
+        if wait is True:
+            self.wait_real_events()
         return response
 
+    def wait_real_events(self):
+        """ run the real event loop until every real is unregistered
+        :return: void
+        """
+        self.event_connect_loop.exec_()
+
     def real_data_handler(self, name, key, block, length):
-        """ real api event handler
+        """ real api event handler (routed to the subscription of name/key)
+        blocks without subscription (ex: in flight after remove_symbol) are dropped and counted as unrouted, never
+        handled as another symbol.
         :param name: real name
         :param key: real key
         :param block: data
         :param length: length of data
         :return: void
         """
-        log.debug('[api] receive real: {}'.format(str(block)))
-        self._real_event_handler(block)
-
-    def set_real_event_handler(self, event_handler):
-        """ set real event handler
-        :param event_handler: handler
-        :return: void
-        """
-        self._real_event_handler = event_handler
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('[api] receive real: %s %s %s', name, key, block)
+        if not self.subscriptions.dispatch(name, key, block) and log.isEnabledFor(logging.DEBUG):
+            log.debug('[api] unrouted real dropped: %s %s (unrouted: %d)', name, key, self.subscriptions.unrouted)
 
     # -------------------------------------------------------------------------------------------------
     # FID event part
@@ -206,29 +274,34 @@ class HanaAPI(QAxWidget):
         :param length: length of data
         :return: void
         """
-        # below is an example of the processing reference logic, not actual business logic.
-        count = self.get_fid_output_count(rid)
-        log.debug('[api] received data count: {}'.format(str(count)))
-        responses = []
-        for i in range(0, count):
-            response = {'TIME': self.get_fid_output_data(rid, '8', i), 'DATE': self.get_fid_output_data(rid, '9', i)}
-            responses.append(response)
-        log.debug('[api] response output: {}'.format(str(responses)))
+        try:
+            if self._fid_event_handler is not None:
+                self._fid_event_handler(rid, block, length)
+        finally:
+            if self.fid_event_loop.isRunning():
+                self.fid_event_loop.quit()
+
+    def set_fid_event_handler(self, event_handler):
+        """ set FID event handler
+        :param event_handler: handler(rid, block, length)
+        :return: void
+        """
+        self._fid_event_handler = event_handler
 
     def create_request_id(self):
         """ generate inquiry id all request ids are required for FID inquiry
         :return: request id
         """
         log.info('[api] call - CreateRequestID()')
-        return self.dynamicCall('CreateRequestID()')
+        return self._call('CreateRequestID()')
 
     def release_request_id(self, rid):
         """ release request id
         :param rid: request id
         :return: void
         """
-        log.info('[api] call - ReleaseRqId({})'.format(str(rid)))
-        self.dynamicCall('ReleaseRqId(nRqId)', rid)
+        log.info('[api] call - ReleaseRqId(%s)', rid)
+        self._call('ReleaseRqId(nRqId)', rid)
 
     def set_fid_input(self, rid, fid, value):
         """ FID inquiry input value registration
@@ -237,8 +310,8 @@ class HanaAPI(QAxWidget):
         :param value: input value
         :return: register input value successful
         """
-        log.info('[api] call - SetFidInputData({}, {}, {})'.format(str(rid), str(fid), str(value)))
-        result = self.dynamicCall('SetFidInputData(nRqId, strFID, strValue)', rid, fid, value)
+        log.info('[api] call - SetFidInputData(%s, %s, %s)', rid, fid, value)
+        result = self._call('SetFidInputData(nRqId, strFID, strValue)', rid, fid, value)
         return True if result == 1 else False
 
     def request_fid(self, rid, fields, screen_no):
@@ -248,10 +321,10 @@ class HanaAPI(QAxWidget):
         :param screen_no: screen number
         :return: FID number
         """
-        log.info('[api] call - RequestFid({}, {}, {})'.format(str(rid), str(fields), str(screen_no)))
-        return self.dynamicCall('RequestFid(nRqId, strOutputFidList, strScreenNo)', rid, fields, screen_no)
+        log.info('[api] call - RequestFid(%s, %s, %s)', rid, fields, screen_no)
+        return self._call('RequestFid(nRqId, strOutputFidList, strScreenNo)', rid, fields, screen_no)
 
-    def request_fid_data_list(self, rid, fields, pn, pnc, screen_no, req_count):
+    def request_fid_data_list(self, rid, fields, pn, pnc, screen_no, req_count, wait=True):
         """ request fid (multiple records)
         :param rid: request id
         :param fields: search result fields
@@ -259,22 +332,32 @@ class HanaAPI(QAxWidget):
         :param pnc: serial transaction key received in response to inquiry
         :param screen_no: screen number
         :param req_count: number of data to receive in response to inquiry (max: 9999)
+        :param wait: block until the response event is handled
         :return: FID number
         """
-        log.info('[api] call - RequestFidArray({}, {}, {}, {}, {}, {})'.format(str(rid), str(fields), str(pn), str(pnc),
-                                                                               str(screen_no), str(req_count)))
-        fid_code = self.dynamicCall('RequestFidArray(nRqId, strOutputFidList, strPreNext, strPreNextContext, '
-                                    'strScreenNo, nRequestCount)', rid, fields, pn, pnc, screen_no, req_count)
-        self.event_connect_loop.exec_()
+        log.info('[api] call - RequestFidArray(%s, %s, %s, %s, %s, %s)', rid, fields, pn, pnc, screen_no, req_count)
+        fid_code = self._call('RequestFidArray(nRqId, strOutputFidList, strPreNext, strPreNextContext, '
+                              'strScreenNo, nRequestCount)', rid, fields, pn, pnc, screen_no, req_count)
+        if wait is True:
+            self.fid_event_loop.exec_()
         return fid_code
 
+    def get_fid_next_context(self):
+        """ continuous query state of the last received FID response
+        :return: (pre next classification, pre next context) - empty context when there is no next page
+        """
+        log.info('[api] call - GetCommRecvOptionValue(0), GetCommRecvOptionValue(1)')
+        pn = self._call('GetCommRecvOptionValue(nOptionType)', 0)
+        pnc = self._call('GetCommRecvOptionValue(nOptionType)', 1)
+        return str(pn or '').strip(), str(pnc or '').strip()
+
     def get_fid_output_count(self, rid):
         """ FID count of data inquiry response data
         :param rid: request id
         :return: count of data
         """
-        log.info('[api] call - GetFidOutputRowCnt({})'.format(str(rid)))
-        return self.dynamicCall('GetFidOutputRowCnt(nRequestId)', rid)
+        log.info('[api] call - GetFidOutputRowCnt(%s)', rid)
+        return self._call('GetFidOutputRowCnt(nRequestId)', rid)
 
     def get_fid_output_data(self, rid, fid, row):
         """ FID return data inquiry response value
@@ -283,5 +366,31 @@ class HanaAPI(QAxWidget):
         :param row: data row INDEX
         :return: response data
         """
-        log.info('[api] call - GetFidOutputData({}, {}, {})'.format(str(rid), str(fid), str(row)))
-        return self.dynamicCall('GetFidOutputData(nRequestId, strFid, nRow)', rid, fid, row)
+        log.info('[api] call - GetFidOutputData(%s, %s, %s)', rid, fid, row)
+        return self._call('GetFidOutputData(nRequestId, strFid, nRow)', rid, fid, row)
+
+    def get_fid_output_column(self, rid, fid, count):
+        """ FID return data of every row for one field (logged once per column, not per cell)
+        the agent has no bulk output call, this is still one GetFidOutputData call per cell
+        (block extraction of the FID event data block makes no output call, ref. Application.get_fid_batch).
+        :param rid: request id
+        :param fid: response field FID value
+        :param count: count of response data
+        :return: list of response data
+        """
+        log.info('[api] call - GetFidOutputData(%s, %s, 0..%s)', rid, fid, count - 1)
+        call = self._call
+        return [call('GetFidOutputData(nRequestId, strFid, nRow)', rid, fid, row) for row in range(count)]
+
+
+class HanaAPI(HanaAPIBase, QAxWidget):
+    """ agent control hosted by a widget (requires QApplication) """
+
+    # call_soon requests (signals are declared on the QObject classes)
+    call_requested = pyqtSignal(object)
+
+
+class HeadlessHanaAPI(HanaAPIBase, QAxObject):
+    """ windowless agent control (QCoreApplication is enough) """
+
+    call_requested = pyqtSignal(object)
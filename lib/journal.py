@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+    Raw tick capture journal
+    author: modorigoon
+    since: 0.2.0
+
+    segment file layout (little endian)
+      header (64 bytes) : magic(4) version(u16) reserved(u16) created ns(i64) write offset(u64) records(u64)
+      record            : length(u32) received ns(i64) payload(length bytes, utf-8 real block)
+    every segment has an index file (<segment>.idx) holding the u64 offset of each record.
+"""
+import datetime
+import glob
+import mmap
+import os
+import struct
+import time
+from array import array
+from common.config import resolve_path
+from common.logger import log
+
+_MAGIC = b'HQJ1'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHqQQ')
+_HEADER_SIZE = 64
+_RECORD = struct.Struct('<Iq')
+_INDEX_FLUSH_COUNT = 1024
+_SEGMENT_SUFFIX = '.seg'
+_INDEX_SUFFIX = '.idx'
+
+
+class JournalProcessException(Exception):
+    pass
+
+
+def trading_day(received_ns: int, roll_hour=0) -> str:
+    """ trading day of receive time (days roll at roll_hour local time)
+    :param received_ns: receive time (epoch nanoseconds)
+    :param roll_hour: hour the trading day starts
+    :return: trading day (YYYYMMDD)
+    """
+    moment = datetime.datetime.fromtimestamp(received_ns / 1e9) - datetime.timedelta(hours=roll_hour)
+    return moment.strftime('%Y%m%d')
+
+
+def _next_roll_ns(received_ns: int, roll_hour=0) -> int:
+    """ start of the trading day following the receive time
+    :param received_ns: receive time (epoch nanoseconds)
+    :param roll_hour: hour the trading day starts
+    :return: epoch nanoseconds
+    """
+    day = datetime.datetime.strptime(trading_day(received_ns, roll_hour), '%Y%m%d')
+    boundary = day + datetime.timedelta(days=1, hours=roll_hour)
+    return int(boundary.timestamp()) * 1000000000
+
+
+class JournalWriter:
+    """ append-only journal of raw real blocks in pre-allocated memory-mapped segments """
+
+    def __init__(self, path, segment_size_mb=64, roll_hour=0):
+        """ constructor
+        :param path: journal directory
+        :param segment_size_mb: pre-allocated segment size
+        :param roll_hour: hour the trading day (and the segment) rolls
+        """
+        self._path = resolve_path(path)
+        self._segment_size = int(segment_size_mb) * 1024 * 1024
+        self._roll_hour = int(roll_hour)
+        self._file = None
+        self._map = None
+        self._segment_path = None
+        self._offset = 0
+        self._records = 0
+        self._roll_at_ns = 0
+        self._index = array('Q')
+        self._index_file = None
+
+    @property
+    def segment_path(self):
+        return self._segment_path
+
+    def _next_sequence(self, day) -> int:
+        """ sequence of the next segment of day (after the highest existing one, deleted segments leave holes)
+        :param day: trading day (YYYYMMDD)
+        :return: segment sequence
+        """
+        sequences = [-1]
+        for path in glob.glob(os.path.join(self._path, day + '-*' + _SEGMENT_SUFFIX)):
+            number = os.path.basename(path)[len(day) + 1:-len(_SEGMENT_SUFFIX)]
+            if number.isdigit():
+                sequences.append(int(number))
+        return max(sequences) + 1
+
+    def _new_segment(self, received_ns):
+        """ close current segment and open the next pre-allocated segment
+        :param received_ns: receive time of the first record
+        :return: void
+        """
+        self.close()
+        os.makedirs(self._path, exist_ok=True)
+        day = trading_day(received_ns, self._roll_hour)
+        sequence = self._next_sequence(day)
+        while True:
+            self._segment_path = os.path.join(self._path, '{}-{:06d}{}'.format(day, sequence, _SEGMENT_SUFFIX))
+            try:
+                self._file = open(self._segment_path, 'x+b')
+                break
+            except FileExistsError:
+                # created meanwhile (another writer on the directory): take the next one
+                sequence += 1
+        self._file.truncate(self._segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self._segment_size)
+        self._offset = _HEADER_SIZE
+        self._records = 0
+        self._roll_at_ns = _next_roll_ns(received_ns, self._roll_hour)
+        _HEADER.pack_into(self._map, 0, _MAGIC, _VERSION, 0, received_ns, self._offset, 0)
+        self._index_file = open(self._segment_path[:-len(_SEGMENT_SUFFIX)] + _INDEX_SUFFIX, 'ab')
+        log.info('[journal] segment opened: {}'.format(self._segment_path))
+
+    def append(self, block: str, received_ns=None) -> int:
+        """ append raw real block
+        :param block: raw real block
+        :param received_ns: receive time (default: now, epoch nanoseconds)
+        :return: record offset in segment
+        """
+        if received_ns is None:
+            received_ns = time.time_ns()
+        payload = block.encode('utf-8')
+        size = _RECORD.size + len(payload)
+        if size > self._segment_size - _HEADER_SIZE:
+            raise JournalProcessException('[journal] record is larger than segment. (size: {})'.format(size))
+        if self._map is None or received_ns >= self._roll_at_ns or self._offset + size > self._segment_size:
+            self._new_segment(received_ns)
+        offset = self._offset
+        _RECORD.pack_into(self._map, offset, len(payload), received_ns)
+        self._map[offset + _RECORD.size:offset + size] = payload
+        self._offset = offset + size
+        self._records += 1
+        # write offset/record count last so a reader never sees a partial record
+        struct.pack_into('<QQ', self._map, 16, self._offset, self._records)
+        self._index.append(offset)
+        if len(self._index) >= _INDEX_FLUSH_COUNT:
+            self._flush_index()
+        return offset
+
+    def _flush_index(self):
+        if self._index_file is not None and self._index:
+            self._index.tofile(self._index_file)
+            self._index_file.flush()
+            del self._index[:]
+
+    def flush(self):
+        """ flush segment and index to disk
+        :return: void
+        """
+        if self._map is not None:
+            self._map.flush()
+        self._flush_index()
+
+    def close(self):
+        """ close current segment (the unused tail is truncated)
+        :return: void
+        """
+        if self._map is None:
+            return
+        self.flush()
+        self._map.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._index_file.close()
+        self._map = None
+        self._file = None
+        self._index_file = None
+
+
+class JournalReader:
+    """ zero-copy reader of journal segments """
+
+    def __init__(self, path):
+        """ constructor
+        :param path: journal directory
+        """
+        self._path = resolve_path(path)
+
+    def segments(self, from_day=None, to_day=None):
+        """ segment paths in write order
+        :param from_day: first trading day (YYYYMMDD, inclusive)
+        :param to_day: last trading day (YYYYMMDD, inclusive)
+        :return: list of segment paths
+        """
+        paths = sorted(glob.glob(os.path.join(self._path, '*' + _SEGMENT_SUFFIX)))
+        selected = []
+        for path in paths:
+            day = os.path.basename(path)[:8]
+            if (from_day is None or day >= from_day) and (to_day is None or day <= to_day):
+                selected.append(path)
+        return selected
+
+    @staticmethod
+    def segment_index(segment_path) -> array:
+        """ record offsets of segment
+        :param segment_path: segment path
+        :return: array of offsets
+        """
+        offsets = array('Q')
+        index_path = segment_path[:-len(_SEGMENT_SUFFIX)] + _INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as rf:
+                offsets.frombytes(rf.read())
+        return offsets
+
+    @staticmethod
+    def iter_segment(segment_path):
+        """ iterate records of a segment without copying payloads
+        the memoryview is only valid until the next record is requested.
+        :param segment_path: segment path
+        :return: generator of (received ns, payload memoryview)
+        """
+        with open(segment_path, 'rb') as rf:
+            if os.fstat(rf.fileno()).st_size < _HEADER_SIZE:
+                return
+            mapped = mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        payload = None
+        try:
+            magic, version, _, _, end, _ = _HEADER.unpack_from(mapped, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise JournalProcessException('[journal] invalid segment: {}'.format(segment_path))
+            offset = _HEADER_SIZE
+            while offset < end:
+                length, received_ns = _RECORD.unpack_from(mapped, offset)
+                start = offset + _RECORD.size
+                payload = view[start:start + length]
+                yield received_ns, payload
+                payload.release()
+                offset = start + length
+        finally:
+            if payload is not None:
+                payload.release()
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # views derived from a payload are still alive, the map is closed when they are collected
+                pass
+
+    def iter_records(self, from_day=None, to_day=None):
+        """ iterate records of every segment
+        :param from_day: first trading day (YYYYMMDD, inclusive)
+        :param to_day: last trading day (YYYYMMDD, inclusive)
+        :return: generator of (received ns, payload memoryview)
+        """
+        for segment_path in self.segments(from_day, to_day):
+            yield from self.iter_segment(segment_path)
+
+    def iter_blocks(self, from_day=None, to_day=None):
+        """ iterate decoded records (replay source format)
+        :param from_day: first trading day (YYYYMMDD, inclusive)
+        :param to_day: last trading day (YYYYMMDD, inclusive)
+        :return: generator of (received at epoch seconds, block)
+        """
+        for received_ns, payload in self.iter_records(from_day, to_day):
+            yield received_ns / 1e9, str(payload, 'utf-8')
+
+
+def create_journal_writer(config):
+    """ create journal writer from configuration
+    :param config: journal configuration (None: journal disabled)
+    :return: journal writer or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return JournalWriter(config['path'], config.get('segment_size_mb', 64), config.get('roll_hour', 0))
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+    Metrics registry and text exposition endpoint
+    author: modorigoon
+    since: 0.2.0
+"""
+import bisect
+import threading
+from common.logger import log
+
+# latency buckets in seconds (COM calls, sink flushes)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsProcessException(Exception):
+    pass
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(extra[0], _escape(extra[1])))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        # single attribute update under the GIL, no lock on the hot path
+        self.value += amount
+
+
+class _GaugeChild:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _HistogramChild:
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """ metric family (children per label values) """
+
+    def __init__(self, name, documentation, metric_type, label_names=(), buckets=None):
+        """ constructor
+        :param name: metric name
+        :param documentation: help text
+        :param metric_type: counter, gauge or histogram
+        :param label_names: label names
+        :param buckets: histogram bucket upper bounds
+        """
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.label_names = tuple(label_names)
+        self._buckets = tuple(sorted(buckets)) if buckets is not None else None
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = self.labels() if not self.label_names else None
+
+    def _new_child(self):
+        if self.type == 'counter':
+            return _CounterChild()
+        if self.type == 'gauge':
+            return _GaugeChild()
+        return _HistogramChild(self._buckets)
+
+    def labels(self, *values):
+        """ child of label values (keep the returned child on hot paths)
+        :param values: label values (label name order)
+        :return: child metric
+        """
+        if len(values) != len(self.label_names):
+            raise MetricsProcessException('[metrics] invalid label values. (metric: {}, labels: {})'
+                                          .format(self.name, str(values)))
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def samples(self):
+        """ exposition samples
+        :return: list of (name suffix, label values, extra label, value)
+        """
+        samples = []
+        for values, child in list(self._children.items()):
+            if self.type != 'histogram':
+                samples.append(('', values, None, child.value))
+                continue
+            cumulative = 0
+            for bound, count in zip(child.bounds + (float('inf'),), child.counts):
+                cumulative += count
+                samples.append(('_bucket', values, ('le', _format_value(float(bound))), cumulative))
+            samples.append(('_sum', values, None, child.sum))
+            samples.append(('_count', values, None, child.count))
+        return samples
+
+
+class MetricsRegistry:
+    """ metric families and scrape time collectors """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, name, documentation, metric_type, label_names, buckets=None) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Metric(name, documentation, metric_type, label_names, buckets)
+                self._metrics[name] = metric
+            elif metric.type != metric_type or metric.label_names != tuple(label_names):
+                raise MetricsProcessException('[metrics] metric registered with another type. ({})'.format(name))
+            return metric
+
+    def counter(self, name, documentation, label_names=()) -> Metric:
+        return self._register(name, documentation, 'counter', label_names)
+
+    def gauge(self, name, documentation, label_names=()) -> Metric:
+        return self._register(name, documentation, 'gauge', label_names)
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS) -> Metric:
+        return self._register(name, documentation, 'histogram', label_names, buckets)
+
+    def register_collector(self, collector):
+        """ add scrape time collector (reads counters kept elsewhere, nothing is done on the hot path)
+        :param collector: function() returning list of (name, type, help, [(labels dictionary, value)])
+        :return: void
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """ text exposition format
+        :return: exposition text
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for suffix, values, extra, value in metric.samples():
+                lines.append('{}{}{} {}'.format(metric.name, suffix, _format_labels(metric.label_names, values, extra),
+                                                _format_value(value)))
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as _e:
+                log.error('[metrics] collector ERROR: {}'.format(str(_e)))
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append('# HELP {} {}'.format(name, documentation))
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                for labels, value in samples:
+                    lines.append('{}{} {}'.format(name, _format_labels(labels.keys(), labels.values()),
+                                                  _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def create_metrics_server(config, registry=REGISTRY):
+    """ create metrics server from configuration
+    :param config: metrics configuration (None: metrics endpoint disabled)
+    :param registry: metrics registry
+    :return: metrics server or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    # the HTTP server modules are imported only when the endpoint is enabled
+    from lib.metrics_server import MetricsServer
+    return MetricsServer(registry, config.get('host', '127.0.0.1'), config.get('port', 9108))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+    Metrics HTTP endpoint
+    author: modorigoon
+    since: 0.2.0
+"""
+import http.server
+import threading
+from common.logger import log
+from lib.metrics import CONTENT_TYPE, REGISTRY
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """ local HTTP endpoint serving the registry (GET /metrics) from a background thread """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9108):
+        """ constructor
+        :param registry: metrics registry
+        :param host: bind host
+        :param port: bind port (0: any free port)
+        """
+        super().__init__((host, int(port)), _MetricsRequestHandler)
+        self.registry = registry
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        log.info('[metrics] serving on {}:{}'.format(self.server_address[0], str(self.port)))
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format, *args):
+        pass
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+    Agent call profiler (call latency, event thread stalls, folded stack samples)
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+from common.config import resolve_path
+from common.logger import log
+
+# agent methods of the replay stand-in (it has no dynamicCall to wrap)
+STAND_IN_METHODS = ('comm_init', 'get_comm_state', 'terminate', 'get_last_api_error', 'set_login_mode',
+                    'get_login_mode', 'login', 'logout', 'get_login_state', 'register_real', 'unregister_real',
+                    'unregister_real_all', 'get_real_output_data', 'create_request_id', 'release_request_id',
+                    'set_fid_input', 'request_fid', 'request_fid_data_list', 'get_fid_next_context',
+                    'get_fid_output_count', 'get_fid_output_data', 'get_fid_output_column')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+
+
+def fold_stack(frame) -> str:
+    """ folded stack line (root first, ';' separated) of frame
+    :param frame: innermost frame
+    :return: folded stack
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _CallStats:
+
+    __slots__ = ('count', 'total', 'min', 'max', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.errors = 0
+
+    def add(self, elapsed, failed):
+        self.count += 1
+        self.total += elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if failed:
+            self.errors += 1
+
+
+class CallProfiler:
+    """ wall time and call count per agent call signature, event thread stall detection and stack sampling
+    every call and event handler of the event thread is tracked while it runs; a watcher thread reports
+    the ones running longer than stall_ms (the Qt event loop is blocked meanwhile) with the stack of the
+    event thread, and optionally samples that stack every sample_interval_ms (folded stack output for
+    flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, stall_ms=200, sample_interval_ms=0, report_path=None, folded_path=None, max_stalls=1000):
+        """ constructor
+        :param stall_ms: call or handler duration reported as stall (0: stall detection disabled)
+        :param sample_interval_ms: stack sampling interval of the event thread (0: sampling disabled)
+        :param report_path: report file written by dump (None: report logged only)
+        :param folded_path: folded stack samples file written by dump (None: not written)
+        :param max_stalls: kept stall records (oldest are forgotten)
+        """
+        self._stall = float(stall_ms) / 1000
+        self._sample_interval = float(sample_interval_ms) / 1000
+        self._report_path = resolve_path(report_path) if report_path else None
+        self._folded_path = resolve_path(folded_path) if folded_path else None
+        self._stats = collections.defaultdict(_CallStats)
+        self._samples = collections.Counter()
+        self._stalls = collections.deque(maxlen=int(max_stalls))
+        self._lock = threading.Lock()
+        # call running on the event thread: [name, started at, stall record reported by the watcher]
+        self._active = None
+        self._thread_id = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    # -------------------------------------------------------------------------------------------------
+    # install part
+    # -------------------------------------------------------------------------------------------------
+
+    def install(self, api, app=None):
+        """ wrap agent calls of api (dynamicCall or the stand-in methods) and the real event handler of app
+        the current thread is taken as event thread.
+        :param api: API handler
+        :param app: application (None: event handlers are not tracked)
+        :return: void
+        """
+        self._thread_id = threading.get_ident()
+        call = getattr(api, '_call', None)
+        if call is not None:
+            api._call = self._wrap_call(call)
+        else:
+            for method in STAND_IN_METHODS:
+                if hasattr(api, method):
+                    setattr(api, method, self.wrap(method, getattr(api, method)))
+        if app is not None:
+            app.on_receive_real_event = self.wrap('event:real', app.on_receive_real_event)
+
+    def _wrap_call(self, call):
+        """ wrap dynamicCall (statistics per signature)
+        :param call: function(signature, *args)
+        :return: wrapped function
+        """
+        @functools.wraps(call)
+        def profiled_call(signature, *args):
+            return self._run(signature, call, (signature,) + args, {})
+        return profiled_call
+
+    def wrap(self, name, function):
+        """ wrap function (statistics under name)
+        :param name: statistics name
+        :param function: function
+        :return: wrapped function
+        """
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            return self._run(name, function, args, kwargs)
+        return profiled
+
+    def _run(self, name, function, args, kwargs):
+        # only the outermost call of the event thread is tracked for stalls
+        tracked = self._active is None and threading.get_ident() == self._thread_id
+        started_at = time.perf_counter()
+        if tracked:
+            self._active = active = [name, started_at, None]
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started_at
+            if tracked:
+                self._active = None
+                if active[2] is not None:
+                    # reported by the watcher while running, complete its duration
+                    active[2]['elapsed_ms'] = round(elapsed * 1000, 3)
+                elif 0 < self._stall <= elapsed:
+                    self._record_stall(name, elapsed, None)
+            with self._lock:
+                self._stats[name].add(elapsed, failed)
+
+    # -------------------------------------------------------------------------------------------------
+    # watcher part
+    # -------------------------------------------------------------------------------------------------
+
+    def start(self):
+        """ start the watcher thread (stall stacks, samples)
+        :return: void
+        """
+        if self._thread_id is None:
+            self._thread_id = threading.get_ident()
+        intervals = [interval for interval in (self._sample_interval, self._stall / 4) if interval > 0]
+        if not intervals:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, args=(min(intervals),), name='call-profiler',
+                                        daemon=True)
+        self._thread.start()
+        log.info('[profiler] started. (stall: {:.0f}ms, sample interval: {:.0f}ms)'
+                 .format(self._stall * 1000, self._sample_interval * 1000))
+
+    def stop(self):
+        """ stop the watcher thread and dump the report
+        :return: void
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dump()
+
+    def _watch(self, interval):
+        """ watcher thread main loop
+        :param interval: wake up interval
+        :return: void
+        """
+        next_sample_at = 0.0
+        while not self._stop_event.wait(interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            now = time.perf_counter()
+            active = self._active
+            if active is not None and active[2] is None and 0 < self._stall <= now - active[1]:
+                # report the stall while it lasts, the stack shows where the event thread is blocked
+                active[2] = self._record_stall(active[0], now - active[1], fold_stack(frame))
+            if self._sample_interval > 0 and now >= next_sample_at:
+                next_sample_at = now + self._sample_interval
+                stack = fold_stack(frame)
+                with self._lock:
+                    self._samples[stack] += 1
+
+    def _record_stall(self, name, elapsed, stack):
+        """ keep stall record
+        :param name: call or handler name
+        :param elapsed: blocked time so far
+        :param stack: folded stack of the event thread (None: detected after the call returned)
+        :return: stall record
+        """
+        stall = {'name': name, 'at': time.time(), 'elapsed_ms': round(elapsed * 1000, 3), 'stack': stack}
+        with self._lock:
+            self._stalls.append(stall)
+        log.warning('[profiler] event thread stalled: {} ({:.1f}ms{})'
+                    .format(name, elapsed * 1000, ', running' if stack is not None else ''))
+        return stall
+
+    # -------------------------------------------------------------------------------------------------
+    # report part
+    # -------------------------------------------------------------------------------------------------
+
+    def stats(self) -> list:
+        """ call statistics sorted by total time
+        :return: list of counters dictionaries
+        """
+        with self._lock:
+            items = [(name, stats.count, stats.total, stats.min, stats.max, stats.errors)
+                     for name, stats in self._stats.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return [{'name': name, 'count': count, 'total_ms': round(total * 1000, 3),
+                 'avg_ms': round(total * 1000 / count, 3) if count else 0.0,
+                 'min_ms': round((minimum or 0.0) * 1000, 3), 'max_ms': round(maximum * 1000, 3), 'errors': errors}
+                for name, count, total, minimum, maximum, errors in items]
+
+    def report(self) -> str:
+        """ call statistics and stalls as text
+        :return: report text
+        """
+        lines = ['{:<48} {:>10} {:>12} {:>10} {:>10} {:>10} {:>7}'
+                 .format('call', 'count', 'total ms', 'avg ms', 'min ms', 'max ms', 'errors')]
+        for item in self.stats():
+            lines.append('{:<48} {:>10} {:>12.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>7}'
+                         .format(item['name'][:48], item['count'], item['total_ms'], item['avg_ms'], item['min_ms'],
+                                 item['max_ms'], item['errors']))
+        with self._lock:
+            stalls = list(self._stalls)
+        lines.append('')
+        lines.append('stalls: {}'.format(len(stalls)))
+        for stall in sorted(stalls, key=lambda s: s['elapsed_ms'], reverse=True):
+            lines.append('  {:.3f}ms {} at {}'.format(stall['elapsed_ms'], stall['name'],
+                                                     time.strftime('%H:%M:%S', time.localtime(stall['at']))))
+            if stall['stack']:
+                lines.append('    ' + stall['stack'].replace(';', '\n    '))
+        return '\n'.join(lines) + '\n'
+
+    def folded(self) -> str:
+        """ stack samples in the folded format (stack count)
+        :return: folded stacks text
+        """
+        with self._lock:
+            samples = sorted(self._samples.items())
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in samples)
+
+    def dump(self):
+        """ write the report (log and report file) and the folded stack samples
+        :return: void
+        """
+        report = self.report()
+        log.info('[profiler] report\n{}'.format(report))
+        for path, text in ((self._report_path, report), (self._folded_path, self.folded())):
+            if path is None:
+                continue
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as wf:
+                wf.write(text)
+
+
+def create_profiler(config):
+    """ create call profiler from configuration
+    :param config: profiler configuration (None: profiling disabled)
+    :return: call profiler or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return CallProfiler(stall_ms=config.get('stall_ms', 200),
+                        sample_interval_ms=config.get('sample_interval_ms', 0),
+                        report_path=config.get('report_path'),
+                        folded_path=config.get('folded_path'))
@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+"""
+    Fan-out publish/subscribe server (TCP and WebSocket)
+    author: modorigoon
+    since: 0.2.0
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import socket
+import struct
+import threading
+from common.logger import log
+
+# frame: type (uint8) + body. TCP frames are prefixed with their length (uint32), a WebSocket binary message
+# carries one frame.
+# SYMBOL (1): symbol id (uint16) + utf-8 symbol, sent before the first tick of the symbol
+# TICKS (2): count (uint16) + count * (symbol id uint16, date time YYYYMMDDHHMMSS int64, price int64, seq int64)
+FRAME_SYMBOL = 1
+FRAME_TICKS = 2
+MAX_BATCH = 65535
+_LENGTH = struct.Struct('<I')
+_FRAME_HEADER = struct.Struct('<BH')
+_TICK = struct.Struct('<Hqqq')
+
+# client control message (TCP: one JSON line, WebSocket: text message): {"subscribe": [...], "unsubscribe": [...]}
+ALL_SYMBOLS = '*'
+_MAX_CONTROL_SIZE = 65536
+
+SLOW_CLIENT_DISCONNECT = 'disconnect'
+SLOW_CLIENT_SAMPLE = 'sample'
+
+_WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_WS_TEXT = 0x1
+_WS_BINARY = 0x2
+_WS_CLOSE = 0x8
+_WS_PING = 0x9
+_WS_PONG = 0xA
+
+
+class PubSubProcessException(Exception):
+    pass
+
+
+def encode_symbol(symbol_id, symbol) -> bytes:
+    return _FRAME_HEADER.pack(FRAME_SYMBOL, symbol_id) + symbol.encode('utf-8')
+
+
+def encode_ticks(ticks) -> bytes:
+    """ encode ticks frame
+    :param ticks: list of (symbol id, date time integer, price, seq)
+    :return: frame
+    """
+    pack = _TICK.pack
+    return _FRAME_HEADER.pack(FRAME_TICKS, len(ticks)) + b''.join([pack(*tick) for tick in ticks])
+
+
+def decode_frame(frame):
+    """ decode frame
+    :param frame: frame (without the TCP length prefix)
+    :return: (FRAME_SYMBOL, (symbol id, symbol)) or (FRAME_TICKS, [(symbol id, date time, price, seq), ...])
+    """
+    frame_type, value = _FRAME_HEADER.unpack_from(frame)
+    if frame_type == FRAME_SYMBOL:
+        return frame_type, (value, bytes(frame[_FRAME_HEADER.size:]).decode('utf-8'))
+    if frame_type == FRAME_TICKS:
+        return frame_type, [_TICK.unpack_from(frame, _FRAME_HEADER.size + _TICK.size * i) for i in range(value)]
+    raise PubSubProcessException('[pubsub] unknown frame type: {}'.format(str(frame_type)))
+
+
+def _ws_frame(payload, opcode=_WS_BINARY) -> bytes:
+    length = len(payload)
+    if length < 126:
+        return struct.pack('!BB', 0x80 | opcode, length) + payload
+    if length < 65536:
+        return struct.pack('!BBH', 0x80 | opcode, 126, length) + payload
+    return struct.pack('!BBQ', 0x80 | opcode, 127, length) + payload
+
+
+async def _ws_read(reader):
+    """ read one WebSocket frame of a client (masked, not fragmented)
+    :param reader: stream reader
+    :return: (opcode, payload)
+    """
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > _MAX_CONTROL_SIZE or not first & 0x80:
+        raise PubSubProcessException('[pubsub] unsupported WebSocket frame. (length: {}, fin: {})'
+                                     .format(str(length), str(bool(first & 0x80))))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        payload = bytes(value ^ mask[i & 3] for i, value in enumerate(payload))
+    return first & 0x0F, payload
+
+
+class _Client:
+    """ connection state (loop thread only, counters read by the metrics thread) """
+
+    __slots__ = ('id', 'peer', 'transport', 'writer', 'symbols', 'queue', 'ready', 'known_symbols', 'closed',
+                 'sent', 'frames', 'bytes', 'dropped', 'sampled', 'task')
+
+    def __init__(self, client_id, peer, transport, writer):
+        self.id = client_id
+        self.peer = peer
+        self.transport = transport
+        self.writer = writer
+        self.symbols = set()
+        self.queue = collections.deque()
+        self.ready = asyncio.Event()
+        self.known_symbols = set()
+        self.closed = False
+        self.sent = 0
+        self.frames = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.sampled = 0
+        self.task = None
+
+    def write_frame(self, frame):
+        if self.transport == 'ws':
+            data = _ws_frame(frame)
+        else:
+            data = _LENGTH.pack(len(frame)) + frame
+        self.writer.write(data)
+        self.frames += 1
+        self.bytes += len(data)
+
+    def stats(self) -> dict:
+        return {'peer': self.peer, 'transport': self.transport, 'symbols': sorted(self.symbols),
+                'queue_depth': len(self.queue), 'sent': self.sent, 'frames': self.frames, 'bytes': self.bytes,
+                'dropped': self.dropped, 'sampled': self.sampled}
+
+
+class PubSubServer:
+    """ streaming server fanning processed ticks out to TCP and WebSocket clients
+    the server runs its own asyncio loop on a background thread. publish (event thread) only appends to a queue and
+    wakes the loop once per burst; the loop filters the ticks per client into bounded per-client queues written by
+    one task per client, so a slow client never blocks the collector: beyond queue_size ticks it is disconnected
+    (disconnect) or its queue keeps only the newest tick per symbol (sample).
+    """
+
+    def __init__(self, host='127.0.0.1', tcp_port=9130, ws_port=9131, queue_size=10000,
+                 slow_client=SLOW_CLIENT_SAMPLE, max_batch=256, batch_interval_ms=0):
+        """ constructor
+        :param host: bind host
+        :param tcp_port: TCP port (None: no TCP listener, 0: any free port)
+        :param ws_port: WebSocket port (None: no WebSocket listener, 0: any free port)
+        :param queue_size: queued ticks per client before the slow client policy applies
+        :param slow_client: slow client policy (disconnect, sample)
+        :param max_batch: maximum ticks per frame
+        :param batch_interval_ms: dispatch period (0: dispatch as soon as ticks are published)
+        """
+        if slow_client not in (SLOW_CLIENT_DISCONNECT, SLOW_CLIENT_SAMPLE):
+            raise PubSubProcessException('[pubsub] invalid slow client policy: {}'.format(str(slow_client)))
+        self._host = host
+        self._ports = {'tcp': tcp_port, 'ws': ws_port}
+        self._queue_size = int(queue_size)
+        self._slow_client = slow_client
+        self._max_batch = max(1, min(int(max_batch), MAX_BATCH))
+        self._batch_interval = float(batch_interval_ms) / 1000
+        self._pending = collections.deque()
+        self._wakeup_scheduled = False
+        self._loop = None
+        self._thread = None
+        self._servers = []
+        self._started = threading.Event()
+        self._error = None
+        # replaced, not updated: the metrics thread iterates the clients
+        self._clients = {}
+        self._client_ids = itertools.count(1)
+        self._symbol_ids = {}
+        self._last_text = None
+        self._last_time = 0
+        self.published = 0
+        self.disconnected_slow = 0
+        self.ports = {}
+
+    # -------------------------------------------------------------------------------------------------
+    # EVENT THREAD
+    # -------------------------------------------------------------------------------------------------
+
+    def publish(self, transaction):
+        """ queue transaction for the clients (tick path)
+        :param transaction: transaction record
+        :return: void
+        """
+        self._pending.append(transaction)
+        if not self._wakeup_scheduled and self._batch_interval == 0 and self._loop is not None:
+            self._wakeup_scheduled = True
+            self._loop.call_soon_threadsafe(self._dispatch)
+
+    def start(self):
+        """ start the loop thread and the listeners
+        :return: void
+        """
+        self._thread = threading.Thread(target=self._run, name='pubsub-server', daemon=True)
+        self._thread.start()
+        self._started.wait(10)
+        if self._error is not None:
+            raise PubSubProcessException('[pubsub] start failed. ({})'.format(str(self._error)))
+        log.info('[pubsub] serving on {} ({})'.format(self._host, ', '.join(
+            '{}: {}'.format(transport, str(port)) for transport, port in sorted(self.ports.items()))))
+
+    def stop(self):
+        """ close every connection and stop the loop thread
+        :return: void
+        """
+        if self._thread is None:
+            return
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+        self._thread = None
+        log.info('[pubsub] stopped. (published: {}, slow clients disconnected: {})'
+                 .format(str(self.published), str(self.disconnected_slow)))
+
+    # -------------------------------------------------------------------------------------------------
+    # LOOP THREAD
+    # -------------------------------------------------------------------------------------------------
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._listen())
+        except Exception as _e:
+            self._error = _e
+            self._started.set()
+            loop.close()
+            return
+        self._loop = loop
+        if self._batch_interval > 0:
+            loop.call_later(self._batch_interval, self._dispatch_periodically)
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(self._shutdown())
+            loop.close()
+            self._loop = None
+
+    async def _listen(self):
+        for transport, port in self._ports.items():
+            if port is None:
+                continue
+            handler = self._handle_ws if transport == 'ws' else self._handle_tcp
+            server = await asyncio.start_server(handler, self._host, int(port), reuse_address=True)
+            self._servers.append(server)
+            self.ports[transport] = server.sockets[0].getsockname()[1]
+
+    async def _shutdown(self):
+        for server in self._servers:
+            server.close()
+        for client in list(self._clients.values()):
+            self._close(client)
+        # closed connections end their handlers, whatever is left is cancelled
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    def _dispatch_periodically(self):
+        self._dispatch()
+        self._loop.call_later(self._batch_interval, self._dispatch_periodically)
+
+    def _dispatch(self):
+        """ move published transactions into the queues of the subscribed clients
+        :return: void
+        """
+        self._wakeup_scheduled = False
+        pending = self._pending
+        ticks = []
+        while pending:
+            transaction = pending.popleft()
+            symbol = transaction.symbol
+            symbol_id = self._symbol_ids.get(symbol)
+            if symbol_id is None:
+                symbol_id = self._symbol_ids[symbol] = len(self._symbol_ids)
+            # consecutive ticks share the date time sequence, converted once per sequence
+            if transaction.date_time_seq != self._last_text:
+                self._last_text = transaction.date_time_seq
+                self._last_time = int(transaction.date_time_seq)
+            ticks.append((symbol, (symbol_id, self._last_time, transaction.price,
+                                   transaction.seq if transaction.seq is not None else -1)))
+        if not ticks:
+            return
+        self.published += len(ticks)
+        for client in self._clients.values():
+            if client.closed or not client.symbols:
+                continue
+            queue = client.queue
+            if ALL_SYMBOLS in client.symbols:
+                queue.extend([tick for _, tick in ticks])
+            else:
+                symbols = client.symbols
+                queue.extend([tick for symbol, tick in ticks if symbol in symbols])
+            if len(queue) > self._queue_size:
+                self._on_slow_client(client)
+            if queue:
+                client.ready.set()
+
+    def _on_slow_client(self, client):
+        """ apply the slow client policy (client queue above queue_size)
+        :param client: client
+        :return: void
+        """
+        if self._slow_client == SLOW_CLIENT_DISCONNECT:
+            client.dropped += len(client.queue)
+            self.disconnected_slow += 1
+            log.warning('[pubsub] slow client disconnected: {} {} (queued: {})'
+                        .format(client.transport, client.peer, str(len(client.queue))))
+            self._close(client)
+            return
+        # keep the newest tick of every symbol (in arrival order)
+        newest = {}
+        for tick in reversed(client.queue):
+            if tick[0] not in newest:
+                newest[tick[0]] = tick
+        client.sampled += len(client.queue) - len(newest)
+        client.queue.clear()
+        client.queue.extend(reversed(list(newest.values())))
+
+    def _add_client(self, peer, transport, writer) -> _Client:
+        client = _Client(next(self._client_ids), peer, transport, writer)
+        clients = dict(self._clients)
+        clients[client.id] = client
+        self._clients = clients
+        client.task = asyncio.get_running_loop().create_task(self._send_loop(client))
+        log.info('[pubsub] client connected: {} {} (id: {})'.format(transport, peer, str(client.id)))
+        return client
+
+    def _close(self, client):
+        if client.closed:
+            return
+        client.closed = True
+        client.queue.clear()
+        client.ready.set()
+        clients = dict(self._clients)
+        clients.pop(client.id, None)
+        self._clients = clients
+        try:
+            client.writer.close()
+        except Exception as _e:
+            log.error('[pubsub] close failed: {} ({})'.format(client.peer, str(_e)))
+        log.info('[pubsub] client disconnected: {} {} (id: {}, sent: {}, dropped: {}, sampled: {})'
+                 .format(client.transport, client.peer, str(client.id), str(client.sent), str(client.dropped),
+                         str(client.sampled)))
+
+    async def _send_loop(self, client):
+        """ write the queue of client in batches (one task per client)
+        :param client: client
+        :return: void
+        """
+        symbol_names = {symbol_id: symbol for symbol, symbol_id in self._symbol_ids.items()}
+        queue = client.queue
+        try:
+            while not client.closed:
+                await client.ready.wait()
+                client.ready.clear()
+                while queue and not client.closed:
+                    batch = [queue.popleft() for _ in range(min(len(queue), self._max_batch))]
+                    for tick in batch:
+                        if tick[0] not in client.known_symbols:
+                            if tick[0] not in symbol_names:
+                                symbol_names = {symbol_id: symbol for symbol, symbol_id in self._symbol_ids.items()}
+                            client.write_frame(encode_symbol(tick[0], symbol_names[tick[0]]))
+                            client.known_symbols.add(tick[0])
+                    client.write_frame(encode_ticks(batch))
+                    client.sent += len(batch)
+                    # waits while the socket buffer of a slow client is full, its queue grows meanwhile
+                    await client.writer.drain()
+        except (ConnectionError, OSError) as _e:
+            log.info('[pubsub] send failed: {} ({})'.format(client.peer, str(_e)))
+        finally:
+            self._close(client)
+
+    def _control(self, client, message):
+        """ apply control message of client
+        :param client: client
+        :param message: JSON text
+        :return: void
+        """
+        try:
+            control = json.loads(message)
+            subscribe = [str(symbol) for symbol in control.get('subscribe', [])]
+            unsubscribe = [str(symbol) for symbol in control.get('unsubscribe', [])]
+        except (ValueError, AttributeError, TypeError) as _e:
+            log.warning('[pubsub] invalid control message: {} ({})'.format(client.peer, str(_e)))
+            return
+        client.symbols = (client.symbols | set(subscribe)) - set(unsubscribe)
+
+    async def _handle_tcp(self, reader, writer):
+        peer = str(writer.get_extra_info('peername'))
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = self._add_client(peer, 'tcp', writer)
+        try:
+            while not client.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._control(client, line.decode('utf-8'))
+        except (ConnectionError, OSError, asyncio.LimitOverrunError, ValueError) as _e:
+            log.info('[pubsub] receive failed: {} ({})'.format(peer, str(_e)))
+        finally:
+            self._close(client)
+
+    async def _handle_ws(self, reader, writer):
+        peer = str(writer.get_extra_info('peername'))
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        headers = {}
+        for line in request.decode('latin-1').split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if key is None or 'websocket' not in headers.get('upgrade', '').lower():
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode('latin-1') + _WS_GUID).digest()).decode('ascii')
+        writer.write('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     'Sec-WebSocket-Accept: {}\r\n\r\n'.format(accept).encode('latin-1'))
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = self._add_client(peer, 'ws', writer)
+        try:
+            while not client.closed:
+                opcode, payload = await _ws_read(reader)
+                if opcode == _WS_TEXT:
+                    self._control(client, payload.decode('utf-8'))
+                elif opcode == _WS_PING:
+                    writer.write(_ws_frame(payload, _WS_PONG))
+                elif opcode == _WS_CLOSE:
+                    writer.write(_ws_frame(payload[:2], _WS_CLOSE))
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, PubSubProcessException, ValueError) as _e:
+            log.info('[pubsub] receive failed: {} ({})'.format(peer, str(_e)))
+        finally:
+            self._close(client)
+
+    # -------------------------------------------------------------------------------------------------
+    # ANY THREAD
+    # -------------------------------------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        """ server and per-connection counters
+        :return: counters dictionary
+        """
+        return {'published': self.published, 'pending': len(self._pending), 'clients': len(self._clients),
+                'disconnected_slow': self.disconnected_slow,
+                'connections': {client.id: client.stats() for client in self._clients.values()}}
+
+    def collect_metrics(self):
+        """ scrape time metrics per connection (metrics server thread)
+        :return: list of (name, type, help, [(labels dictionary, value)])
+        """
+        clients = [({'client': str(client.id), 'peer': client.peer, 'transport': client.transport}, client)
+                   for client in self._clients.values()]
+        return [
+            ('hana1q_pubsub_clients', 'gauge', 'Connected pub/sub clients.', [({}, len(clients))]),
+            ('hana1q_pubsub_slow_disconnects_total', 'counter', 'Clients disconnected by the slow client policy.',
+             [({}, self.disconnected_slow)]),
+            ('hana1q_pubsub_client_queue_depth', 'gauge', 'Ticks queued for the client.',
+             [(labels, len(client.queue)) for labels, client in clients]),
+            ('hana1q_pubsub_client_sent_total', 'counter', 'Ticks sent to the client.',
+             [(labels, client.sent) for labels, client in clients]),
+            ('hana1q_pubsub_client_bytes_total', 'counter', 'Bytes sent to the client.',
+             [(labels, client.bytes) for labels, client in clients]),
+            ('hana1q_pubsub_client_sampled_total', 'counter', 'Ticks of the client replaced by newer ticks.',
+             [(labels, client.sampled) for labels, client in clients])
+        ]
+
+
+class PubSubClient:
+    """ blocking TCP client of the pub/sub server """
+
+    def __init__(self, host='127.0.0.1', port=9130, timeout_s=None):
+        """ constructor
+        :param host: server host
+        :param port: server TCP port
+        :param timeout_s: socket timeout (None: blocking)
+        """
+        self._socket = socket.create_connection((host, int(port)), timeout=timeout_s)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile('rb')
+        self._symbols = {}
+
+    def subscribe(self, symbols):
+        self._socket.sendall((json.dumps({'subscribe': list(symbols)}) + '\n').encode('utf-8'))
+
+    def unsubscribe(self, symbols):
+        self._socket.sendall((json.dumps({'unsubscribe': list(symbols)}) + '\n').encode('utf-8'))
+
+    def read(self) -> list:
+        """ read until the next ticks frame
+        :return: list of (symbol, date time integer, price, seq) (empty: connection closed)
+        """
+        while True:
+            header = self._reader.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return []
+            frame = self._reader.read(_LENGTH.unpack(header)[0])
+            frame_type, value = decode_frame(frame)
+            if frame_type == FRAME_SYMBOL:
+                self._symbols[value[0]] = value[1]
+            else:
+                return [(self._symbols[symbol_id], date_time, price, seq) for symbol_id, date_time, price, seq in value]
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+
+def create_pubsub_server(config):
+    """ create pub/sub server from configuration
+    :param config: pub/sub configuration (None: server disabled)
+    :return: pub/sub server or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return PubSubServer(config.get('host', '127.0.0.1'), tcp_port=config.get('tcp_port', 9130),
+                        ws_port=config.get('ws_port', 9131), queue_size=config.get('queue_size', 10000),
+                        slow_client=config.get('slow_client', SLOW_CLIENT_SAMPLE),
+                        max_batch=config.get('max_batch', 256), batch_interval_ms=config.get('batch_interval_ms', 0))
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+    Replay 1Q API stand-in
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import datetime
+import json
+import logging
+import threading
+import time
+from array import array
+from common.config import resolve_path
+from common.logger import log
+from lib.journal import JournalReader
+from lib.subscription import SubscriptionManager, configured_targets
+from lib.synthetic import generate_v00_blocks
+from lib.transaction import date_time_sequence_to_epoch, fixed_to_price
+
+# separators of the FID data block rendered with each response (agent defaults, ref. fid configuration)
+FID_BLOCK_ROW_SEPARATOR = '\n'
+FID_BLOCK_FIELD_SEPARATOR = '\t'
+
+
+def read_recorded_blocks(path):
+    """ read recorded real blocks
+    each line is either "block" or "epoch seconds<TAB>block"
+    :param path: recorded file path
+    :return: generator of (received at epoch seconds or None, block)
+    """
+    with open(resolve_path(path), encoding='utf-8') as rf:
+        for line in rf:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            received_at, tab, block = line.partition('\t')
+            if tab:
+                yield float(received_at), block
+            else:
+                yield None, line
+
+
+class ReplayHanaAPI:
+    """ drop-in HanaAPI stand-in replaying V00 real blocks and FID responses without the COM agent
+    real blocks are delivered through real_data_handler from wait_real_events, which blocks
+    (like the agent event loop) until the source is exhausted or every real is unregistered.
+    methods without a docstring behave like the HanaAPI method of the same name.
+    """
+
+    _fid_event_handler = None
+
+    def __init__(self, config, blocks=None, speed=None, record_latency=False):
+        """ constructor
+        :param config: configuration for API HANDLER
+        :param blocks: iterable of real blocks or (received at, block) tuples (default: configured source)
+        :param speed: replay speed (0: as fast as possible, 1: real time, N: N times faster)
+        :param record_latency: record real handler latency per block
+        """
+        self._CREDENTIALS = config['credentials']
+        self._REAL_NAME = config['target']['real_name']
+        self._REPLAY_CONFIG = config.get('replay', {})
+        self._blocks = blocks
+        self._speed = float(self._REPLAY_CONFIG.get('speed', 0) if speed is None else speed)
+        self._record_latency = record_latency
+        self.handler_latencies = array('d')
+        self.delivered = 0
+        self.lost = 0
+
+        self._connected = False
+        self._logged_in = False
+        self._targets = configured_targets(config)
+        self.subscriptions = SubscriptionManager(self.register_real, self.unregister_real)
+        self._next_rid = 0
+        self._fid_inputs = {}
+        self._fid_outputs = {}
+        self._fid_pending = collections.deque()
+        self._fid_received_rid = None
+        # callbacks of other threads run between real blocks (ref. call_soon)
+        self._calls = collections.deque()
+        self._wakeup = threading.Event()
+
+    # -------------------------------------------------------------------------------------------------
+    # communication module control part
+    # -------------------------------------------------------------------------------------------------
+
+    def comm_init(self) -> bool:
+        self._connected = True
+        return True
+
+    def get_comm_state(self) -> bool:
+        return self._connected
+
+    def terminate(self):
+        self._connected = False
+        self._logged_in = False
+
+    def process_events(self, timeout_ms=100):
+        """ deliver pending FID response events
+        :param timeout_ms: maximum processing time
+        :return: void
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        while self._fid_pending and time.monotonic() < deadline:
+            rid, length = self._fid_pending.popleft()
+            self.fid_data_handler(rid, self._fid_block(rid), length)
+
+    def call_soon(self, callback):
+        """ call function on the replay thread (between two real blocks, like an agent event)
+        :param callback: function()
+        :return: void
+        """
+        self._calls.append(callback)
+        self._wakeup.set()
+
+    def _run_calls(self):
+        self._wakeup.clear()
+        while self._calls:
+            callback = self._calls.popleft()
+            try:
+                callback()
+            except Exception as _e:
+                log.error('[replay] call ERROR: {}'.format(str(_e)))
+
+    def get_last_api_error(self):
+        return ''
+
+    def drop_session(self):
+        """ simulate a dropped agent session (real blocks are lost until the next login)
+        :return: void
+        """
+        log.info('[replay] session dropped.')
+        self._connected = False
+        self._logged_in = False
+
+    def on_agent_event_handler(self, event_type, param, value):
+        log.info('[replay] on event({}) {} - {}'.format(str(event_type), str(param), str(value)))
+
+    # -------------------------------------------------------------------------------------------------
+    # certification part
+    # -------------------------------------------------------------------------------------------------
+
+    def set_login_mode(self, option, login_mode):
+        return True
+
+    def get_login_mode(self, option):
+        return 0
+
+    def login(self) -> bool:
+        self._logged_in = self._connected
+        return self._logged_in
+
+    def logout(self) -> bool:
+        self._logged_in = False
+        return True
+
+    def get_login_state(self) -> bool:
+        return self._logged_in
+
+    # -------------------------------------------------------------------------------------------------
+    # real api part
+    # -------------------------------------------------------------------------------------------------
+
+    def register_real(self, real_name=None, symbol=None) -> bool:
+        return self._connected
+
+    def unregister_real(self, real_name=None, symbol=None) -> bool:
+        return True
+
+    def unregister_real_all(self):
+        self.subscriptions.mark_unregistered()
+        return True
+
+    def _source(self):
+        """ replay source
+        :return: iterable of real blocks or (received at, block) tuples
+        """
+        if self._blocks is not None:
+            return self._blocks
+        journal_path = self._REPLAY_CONFIG.get('journal')
+        if journal_path:
+            return JournalReader(journal_path).iter_blocks(self._REPLAY_CONFIG.get('journal_from_day'),
+                                                           self._REPLAY_CONFIG.get('journal_to_day'))
+        path = self._REPLAY_CONFIG.get('source')
+        if path:
+            return read_recorded_blocks(path)
+        count = int(self._REPLAY_CONFIG.get('count', 100000))
+        ticks_per_second = int(self._REPLAY_CONFIG.get('ticks_per_second', 10))
+        # every configured symbol ticks in turn
+        sources = [generate_v00_blocks(count // len(self._targets), symbol=symbol,
+                                       ticks_per_second=ticks_per_second, seed=seed)
+                   for seed, (_, symbol) in enumerate(self._targets)]
+        return (block for blocks in zip(*sources) for block in blocks)
+
+    def get_real_output_data(self, real_name=None, symbol=None, wait=True) -> str:
+        """ replay real blocks (wait) until the source is exhausted or every real is unregistered
+        :return: response data
+        """
+        if wait is True:
+            self.wait_real_events()
+        return ''
+
+    def wait_real_events(self):
+        """ replay real blocks until the source is exhausted or every real is unregistered
+        the real key of each block is its first field (symbol).
+        :return: void
+        """
+        real_names = {symbol: real_name for real_name, symbol in self._targets}
+        subscriptions = self.subscriptions
+        speed = self._speed
+        first_at = None
+        started_at = time.monotonic()
+        for item in self._source():
+            if self._calls:
+                self._run_calls()
+            if not subscriptions.active():
+                break
+            received_at, block = item if isinstance(item, tuple) else (None, item)
+            key = block.split(None, 1)[0]
+            name = real_names.get(key, self._REAL_NAME)
+            if speed > 0:
+                if received_at is None:
+                    received_at = date_time_sequence_to_epoch(block.split(None, 3)[2])
+                if first_at is None:
+                    first_at = received_at
+                deadline = started_at + (received_at - first_at) / speed
+                # posted calls are not held back by quiet periods of the source
+                while self._wakeup.wait(max(0.0, deadline - time.monotonic())):
+                    self._run_calls()
+            if self._fid_pending:
+                # FID responses arrive on the same event loop as real blocks
+                self.process_events()
+            if not self._logged_in:
+                self.lost += 1
+                continue
+            if self._record_latency:
+                handled_at = time.perf_counter()
+                self.real_data_handler(name, key, block, len(block))
+                self.handler_latencies.append(time.perf_counter() - handled_at)
+            else:
+                self.real_data_handler(name, key, block, len(block))
+            self.delivered += 1
+
+    def real_data_handler(self, name, key, block, length):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('[replay] receive real: %s %s %s', name, key, block)
+        if not self.subscriptions.dispatch(name, key, block) and log.isEnabledFor(logging.DEBUG):
+            log.debug('[replay] unrouted real dropped: %s %s (unrouted: %d)', name, key, self.subscriptions.unrouted)
+
+    # -------------------------------------------------------------------------------------------------
+    # FID event part
+    # -------------------------------------------------------------------------------------------------
+
+    def fid_data_handler(self, rid, block, length):
+        self._fid_received_rid = rid
+        if self._fid_event_handler is not None:
+            self._fid_event_handler(rid, block, length)
+
+    def set_fid_event_handler(self, event_handler):
+        self._fid_event_handler = event_handler
+
+    def create_request_id(self):
+        self._next_rid += 1
+        self._fid_inputs[self._next_rid] = {}
+        return self._next_rid
+
+    def release_request_id(self, rid):
+        self._fid_inputs.pop(rid, None)
+        self._fid_outputs.pop(rid, None)
+
+    def set_fid_input(self, rid, fid, value):
+        if rid not in self._fid_inputs:
+            return False
+        self._fid_inputs[rid][str(fid)] = value
+        return True
+
+    def request_fid(self, rid, fields, screen_no):
+        return self.request_fid_data_list(rid, fields, '0', '', screen_no, 1)
+
+    def _fid_rows(self, rid):
+        """ recorded or synthetic FID response rows for request inputs
+        :param rid: request id
+        :return: list of rows (FID code - value dictionary)
+        """
+        path = self._REPLAY_CONFIG.get('fid_source')
+        if path:
+            with open(resolve_path(path), encoding='utf-8') as rf:
+                return json.loads(rf.read())
+        inputs = self._fid_inputs.get(rid, {})
+        start = datetime.datetime.strptime(inputs.get('9034', '20200302'), '%Y%m%d')
+        end = datetime.datetime.strptime(inputs.get('9035', inputs.get('9034', '20200302')), '%Y%m%d')
+        rows = []
+        moment = start
+        close = 189234
+        while moment < end + datetime.timedelta(days=1):
+            rows.append({
+                '8': moment.strftime('%H%M%S'), '9': moment.strftime('%Y%m%d'),
+                '30': fixed_to_price(close), '31': fixed_to_price(close + 7),
+                '32': fixed_to_price(close - 6), '33': fixed_to_price(close + 2), '6': '2',
+                '40': fixed_to_price(close + 20), '41': fixed_to_price(close + 27),
+                '42': fixed_to_price(close + 14), '43': fixed_to_price(close + 22), '1098': '2', '666': '20'
+            })
+            close += 2
+            moment += datetime.timedelta(minutes=1)
+        return rows
+
+    def request_fid_data_list(self, rid, fields, pn, pnc, screen_no, req_count, wait=True):
+        """ prepare FID response page, the response event is delivered now (wait) or by process_events
+        :return: FID number
+        """
+        if rid not in self._fid_inputs:
+            return -1
+        rows = self._fid_rows(rid)
+        offset = int(pnc) if pnc else 0
+        page = rows[offset:offset + int(req_count)]
+        self._fid_outputs[rid] = {
+            'fields': [field.strip() for field in str(fields).split(',') if field.strip()],
+            'rows': page,
+            'next': str(offset + len(page)) if offset + len(page) < len(rows) else ''
+        }
+        if wait is True:
+            self.fid_data_handler(rid, self._fid_block(rid), len(page))
+        else:
+            self._fid_pending.append((rid, len(page)))
+        return 0
+
+    def _fid_block(self, rid):
+        """ data block delivered with the FID event (requested fields of every row, request order)
+        :param rid: request id
+        :return: data block
+        """
+        output = self._fid_outputs.get(rid)
+        if output is None:
+            return ''
+        fields = output['fields']
+        return ''.join(FID_BLOCK_FIELD_SEPARATOR.join(str(row.get(fid, '')) for fid in fields)
+                       + FID_BLOCK_ROW_SEPARATOR for row in output['rows'])
+
+    def get_fid_next_context(self):
+        if self._fid_received_rid not in self._fid_outputs:
+            return '', ''
+        pnc = self._fid_outputs[self._fid_received_rid]['next']
+        return ('3' if pnc else '0'), pnc
+
+    def get_fid_output_count(self, rid):
+        return len(self._fid_outputs.get(rid, {}).get('rows', ()))
+
+    def get_fid_output_data(self, rid, fid, row):
+        return self._fid_outputs[rid]['rows'][row].get(str(fid), '')
+
+    def get_fid_output_column(self, rid, fid, count):
+        fid = str(fid)
+        return [row.get(fid, '') for row in self._fid_outputs[rid]['rows'][:count]]
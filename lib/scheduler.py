@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+    Periodic task
+    author: modorigoon
+    since: 0.2.0
+"""
+import threading
+
+
+class PeriodicTask:
+    """ call a function periodically
+    runs on a QTimer when a Qt application exists (agent calls stay on the Qt thread), otherwise on a
+    background thread (replay stand-in, no Qt).
+    """
+
+    def __init__(self, name, interval_s, callback):
+        """ constructor
+        :param name: task name (thread name)
+        :param interval_s: call interval in seconds
+        :param callback: function()
+        """
+        self._name = name
+        self._interval = float(interval_s)
+        self._callback = callback
+        self._timer = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    def start(self):
+        """ start calling
+        :return: void
+        """
+        qt_app = None
+        try:
+            from PyQt5.QtCore import QCoreApplication, QTimer
+            qt_app = QCoreApplication.instance()
+        except ImportError:
+            pass
+        if qt_app is not None:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self._callback)
+            self._timer.start(int(self._interval * 1000))
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stop calling
+        :return: void
+        """
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        if self._thread is not None:
+            self._stop_event.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            self._callback()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+    Restart-safe transaction sequences and duplicate index
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import itertools
+import json
+import os
+import time
+from urllib.parse import quote
+from common.config import resolve_path
+from common.logger import log
+
+# ticks between checkpoint time checks (keeps the clock off the tick path)
+_CHECK_EVERY = 256
+
+
+class SequenceProcessException(Exception):
+    pass
+
+
+class _SymbolSequence:
+    """ sequence block and duplicate index of one symbol
+    a tick is identified by (date_time_seq, price, ordinal) where ordinal counts the same date time
+    sequence and price within the current run of that second, so a quote repeated in one second stays
+    unique while a re-delivered second (replay, reconnect) produces the same keys again. keys are kept in
+    arrival order up to capacity; ticks not newer than the last evicted second are duplicates.
+    """
+
+    __slots__ = ('symbol', 'next', 'high', 'keys', 'order', 'capacity', 'evicted_upto', 'current', 'ordinals',
+                 'duplicated')
+
+    def __init__(self, symbol, capacity):
+        self.symbol = symbol
+        self.next = 0
+        self.high = 0
+        self.keys = set()
+        self.order = collections.deque()
+        self.capacity = capacity
+        self.evicted_upto = ''
+        self.current = None
+        self.ordinals = {}
+        self.duplicated = 0
+
+    def add(self, key) -> bool:
+        """ remember key
+        :param key: (date_time_seq, price, ordinal)
+        :return: key is new
+        """
+        if key[0] <= self.evicted_upto or key in self.keys:
+            return False
+        self.keys.add(key)
+        self.order.append(key)
+        if len(self.order) > self.capacity:
+            evicted = self.order.popleft()
+            self.keys.discard(evicted)
+            if evicted[0] > self.evicted_upto:
+                self.evicted_upto = evicted[0]
+        return True
+
+    def to_state(self, persist_keys) -> dict:
+        """ checkpoint state: evicted_upto and the whole seconds of the newest keys
+        only the persisted tail is walked (from the newest key), never the whole duplicate index.
+        :param persist_keys: maximum number of persisted keys
+        :return: state dictionary
+        """
+        order = self.order
+        evicted_upto = self.evicted_upto
+        if len(order) <= persist_keys:
+            tail = list(order)
+        else:
+            tail = list(itertools.islice(reversed(order), persist_keys))
+            tail.reverse()
+            # the oldest persisted second may be partial, it is taken as evicted
+            first_second = tail[0][0] if tail else order[-1][0]
+            tail = [key for key in tail if key[0] > first_second]
+            evicted_upto = max(evicted_upto, first_second)
+        return {'symbol': self.symbol, 'high': self.high, 'evicted_upto': evicted_upto, 'keys': tail}
+
+    def load_state(self, state):
+        self.next = self.high = int(state['high'])
+        self.evicted_upto = state.get('evicted_upto') or ''
+        for date_time_seq, price, ordinal in state.get('keys', []):
+            self.add((date_time_seq, price, ordinal))
+
+
+class SequenceStore:
+    """ monotonic per-symbol transaction sequences surviving restarts, with a bounded duplicate index
+    sequences are reserved in blocks: the state file of a symbol is written when a block is reserved
+    (before its first number is used) and at checkpoints, never per tick. numbers of a block not used
+    before a restart are skipped, so sequences stay unique and increasing (not gapless).
+    one state file per symbol, so worker processes collecting other symbols can share the directory.
+    """
+
+    def __init__(self, path, block_size=10000, dedup_capacity=100000, persist_keys=5000, checkpoint_interval_s=5):
+        """ constructor
+        :param path: state directory
+        :param block_size: sequence numbers reserved per state write
+        :param dedup_capacity: remembered tick keys per symbol
+        :param persist_keys: newest tick keys written at checkpoints (duplicates across restarts)
+        :param checkpoint_interval_s: minimum time between checkpoints of the duplicate index
+        """
+        if int(block_size) <= 0 or int(dedup_capacity) <= 0:
+            raise SequenceProcessException('[sequence] block size and dedup capacity must be positive.')
+        self._path = resolve_path(path)
+        self._block_size = int(block_size)
+        self._capacity = int(dedup_capacity)
+        self._persist_keys = int(persist_keys)
+        self._checkpoint_interval = float(checkpoint_interval_s)
+        self._symbols = {}
+        self._dirty = set()
+        self._countdown = _CHECK_EVERY
+        self._next_checkpoint_at = time.monotonic() + self._checkpoint_interval
+        self.checkpoints = 0
+
+    def _state_path(self, symbol) -> str:
+        return os.path.join(self._path, quote(str(symbol), safe='') + '.json')
+
+    def _symbol(self, symbol) -> _SymbolSequence:
+        """ sequence of symbol (state loaded on first use)
+        :param symbol: symbol
+        :return: symbol sequence
+        """
+        sequence = _SymbolSequence(symbol, self._capacity)
+        path = self._state_path(symbol)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as rf:
+                sequence.load_state(json.load(rf))
+            log.info('[sequence] state loaded: {} (next: {}, keys: {})'
+                     .format(str(symbol), str(sequence.next), str(len(sequence.order))))
+        self._symbols[symbol] = sequence
+        return sequence
+
+    def assign(self, symbol, date_time_seq, price):
+        """ sequence number of a tick (tick path)
+        :param symbol: symbol
+        :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+        :param price: fixed-point price
+        :return: sequence number or None (duplicated tick)
+        """
+        sequence = self._symbols.get(symbol)
+        if sequence is None:
+            sequence = self._symbol(symbol)
+        if date_time_seq != sequence.current:
+            sequence.current = date_time_seq
+            sequence.ordinals = {}
+        ordinal = sequence.ordinals.get(price, 0)
+        sequence.ordinals[price] = ordinal + 1
+        if not sequence.add((date_time_seq, price, ordinal)):
+            sequence.duplicated += 1
+            return None
+        seq = sequence.next
+        if seq >= sequence.high:
+            sequence.high = seq + self._block_size
+            self._write(sequence)
+        sequence.next = seq + 1
+        self._dirty.add(symbol)
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = _CHECK_EVERY
+            if time.monotonic() >= self._next_checkpoint_at:
+                self.checkpoint()
+        return seq
+
+    def restart_run(self):
+        """ a new delivery run starts (reconnect): re-delivered ticks of the current second are duplicates
+        :return: void
+        """
+        for sequence in self._symbols.values():
+            sequence.current = None
+            sequence.ordinals = {}
+
+    def _write(self, sequence):
+        """ write state file of symbol (atomic replace)
+        :param sequence: symbol sequence
+        :return: void
+        """
+        os.makedirs(self._path, exist_ok=True)
+        path = self._state_path(sequence.symbol)
+        with open(path + '.tmp', 'w', encoding='utf-8') as wf:
+            json.dump(sequence.to_state(self._persist_keys), wf, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def checkpoint(self):
+        """ write state of every symbol that changed since the last checkpoint
+        :return: void
+        """
+        for symbol in self._dirty:
+            self._write(self._symbols[symbol])
+        self._dirty.clear()
+        self._next_checkpoint_at = time.monotonic() + self._checkpoint_interval
+        self.checkpoints += 1
+
+    def close(self):
+        """ final checkpoint
+        :return: void
+        """
+        try:
+            self.checkpoint()
+        except Exception as _e:
+            log.error('[sequence] checkpoint failed. ({})'.format(str(_e)))
+
+    def stats(self) -> dict:
+        """ per-symbol counters
+        :return: symbol - counters dictionary
+        """
+        return {symbol: {'next': sequence.next, 'keys': len(sequence.order), 'duplicated': sequence.duplicated}
+                for symbol, sequence in self._symbols.items()}
+
+
+def create_sequence_store(config):
+    """ create sequence store from configuration
+    :param config: sequence configuration (None: per-run counters, no duplicate detection)
+    :return: sequence store or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return SequenceStore(config['path'], block_size=config.get('block_size', 10000),
+                         dedup_capacity=config.get('dedup_capacity', 100000),
+                         persist_keys=config.get('persist_keys', 5000),
+                         checkpoint_interval_s=config.get('checkpoint_interval_s', 5))
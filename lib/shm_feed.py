@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+    Shared memory tick feed (publisher and reader)
+    author: modorigoon
+    since: 0.2.0
+"""
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from common.logger import log
+
+# segment layout:
+# header (64 bytes): magic, layout version, slot capacity, slot size, maximum symbols, registered symbols,
+#                    owner pid (publisher process), write index (ticks published so far)
+# symbol table (max_symbols * 32 bytes): utf-8 symbol names, index = symbol id
+# slots (capacity * 48 bytes): version, symbol id, date time (YYYYMMDDHHMMSS), price, seq, published at (ns)
+MAGIC = b'HQSF'
+LAYOUT_VERSION = 2
+_HEADER = struct.Struct('<4sIIIII')
+_WRITE_INDEX = struct.Struct('<Q')
+_WRITE_INDEX_OFFSET = 32
+_HEADER_SIZE = 64
+_SYMBOL_SIZE = 32
+_SLOT = struct.Struct('<QIxxxxqqqq')
+_SLOT_PAYLOAD = struct.Struct('<Ixxxxqqqq')
+_SLOT_VERSION = struct.Struct('<Q')
+_SYMBOL_COUNT_OFFSET = 20
+_OWNER_PID = struct.Struct('<I')
+_OWNER_PID_OFFSET = 24
+# time given to a publisher between creating its segment and writing its pid
+_OWNER_WAIT_S = 1.0
+# owner liveness on Windows (ref. _windows_process_alive)
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_ERROR_ACCESS_DENIED = 5
+_STILL_ACTIVE = 259
+# names of the segments created by the publishers of this process
+_PUBLISHED = set()
+
+# tick read from the feed: (symbol, date time sequence integer, fixed-point price, seq, published at ns)
+TICK_COLUMNS = ('symbol', 'date_time_seq', 'price', 'seq', 'published_ns')
+
+
+class ShmFeedProcessException(Exception):
+    pass
+
+
+def _attach(name) -> shared_memory.SharedMemory:
+    """ attach existing segment without taking ownership (a reader exiting must not remove the segment)
+    :param name: segment name
+    :return: shared memory
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # python < 3.13: attaching registers the segment with the resource tracker, which unlinks it when the
+    # reader exits, so the registration is withdrawn. a publisher of this process (or of the forking parent,
+    # same tracker) registered the name itself and the registrations are one per name: that one is kept.
+    segment = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix' and name not in _PUBLISHED:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(getattr(segment, '_name', name), 'shared_memory')
+    return segment
+
+
+def _owner_alive(pid) -> bool:
+    """ check publisher process (same pid namespace as the collector)
+    :param pid: owner pid (0: not written yet)
+    :return: process exists
+    """
+    if pid == 0:
+        return False
+    if os.name == 'nt':
+        return _windows_process_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _windows_process_alive(pid) -> bool:
+    """ check process with a query handle (os.kill on Windows terminates the process or sends CTRL_C_EVENT)
+    :param pid: process id
+    :return: process exists and has not exited
+    """
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.GetExitCodeProcess.argtypes = (wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD))
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # a process of another user (or elevated) cannot be opened but exists
+        return ctypes.get_last_error() == _ERROR_ACCESS_DENIED
+    try:
+        exit_code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == _STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _reclaim(name):
+    """ remove existing segment of a publisher that is gone (never the segment of a running publisher)
+    :param name: segment name
+    :return: void
+    """
+    deadline = time.monotonic() + _OWNER_WAIT_S
+    while True:
+        try:
+            segment = _attach(name)
+        except FileNotFoundError:
+            return
+        try:
+            pid = _OWNER_PID.unpack_from(segment.buf, _OWNER_PID_OFFSET)[0] if segment.size >= _HEADER_SIZE else 0
+        finally:
+            segment.close()
+        if _owner_alive(pid):
+            raise ShmFeedProcessException('[shm_feed] segment in use: {} (owner pid: {})'.format(name, str(pid)))
+        if pid != 0 or time.monotonic() >= deadline:
+            break
+        # created by a publisher that has not written its pid yet
+        time.sleep(0.05)
+    try:
+        stale = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    stale.close()
+    stale.unlink()
+    log.warning('[shm_feed] stale segment removed: {} (owner pid: {})'.format(name, str(pid)))
+
+
+class SharedMemoryPublisher:
+    """ single writer of the shared memory ring (event thread)
+    every slot is a seqlock: the version is odd (2i+1) while tick i is written and 2i+2 once it is complete, then
+    the write index is moved. readers validate the version before and after reading a slot, nobody locks.
+    the ordering of the stores is that of the program (x86/x64 store order, the agent host).
+    """
+
+    def __init__(self, name, capacity=65536, max_symbols=64):
+        """ constructor
+        :param name: segment name
+        :param capacity: number of slots (newest ticks kept)
+        :param max_symbols: symbol table size
+        """
+        if int(capacity) <= 0 or int(max_symbols) <= 0:
+            raise ShmFeedProcessException('[shm_feed] capacity and max symbols must be positive.')
+        self.name = name
+        self.capacity = int(capacity)
+        self.max_symbols = int(max_symbols)
+        self._slots_offset = _HEADER_SIZE + _SYMBOL_SIZE * self.max_symbols
+        size = self._slots_offset + _SLOT.size * self.capacity
+        try:
+            self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left by a collector that did not stop cleanly (refused while its publisher is running)
+            _reclaim(name)
+            self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _PUBLISHED.add(name)
+        self._buf = self._segment.buf
+        self._buf[:self._slots_offset] = bytes(self._slots_offset)
+        _HEADER.pack_into(self._buf, 0, MAGIC, LAYOUT_VERSION, self.capacity, _SLOT.size, self.max_symbols, 0)
+        _OWNER_PID.pack_into(self._buf, _OWNER_PID_OFFSET, os.getpid())
+        self._write_index = 0
+        self._symbol_ids = {}
+        self._last_text = None
+        self._last_time = 0
+        self.rejected = 0
+        log.info('[shm_feed] segment created: {} ({} slots, {} bytes)'.format(name, str(self.capacity), str(size)))
+
+    def _register(self, symbol):
+        """ add symbol to the symbol table (readers see it once the symbol count includes it)
+        :param symbol: symbol
+        :return: symbol id or None (symbol table full)
+        """
+        symbol_id = len(self._symbol_ids)
+        encoded = str(symbol).encode('utf-8')
+        if symbol_id >= self.max_symbols or len(encoded) > _SYMBOL_SIZE:
+            log.error('[shm_feed] symbol not published: {} (table: {}/{})'
+                      .format(str(symbol), str(symbol_id), str(self.max_symbols)))
+            self._symbol_ids[symbol] = None
+            return None
+        offset = _HEADER_SIZE + _SYMBOL_SIZE * symbol_id
+        self._buf[offset:offset + _SYMBOL_SIZE] = encoded.ljust(_SYMBOL_SIZE, b'\0')
+        struct.pack_into('<I', self._buf, _SYMBOL_COUNT_OFFSET, symbol_id + 1)
+        self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    def publish(self, transaction) -> bool:
+        """ write transaction into the next slot (tick path)
+        :param transaction: transaction record
+        :return: published (False: symbol table full)
+        """
+        symbol_id = self._symbol_ids.get(transaction.symbol, -1)
+        if symbol_id == -1:
+            symbol_id = self._register(transaction.symbol)
+        if symbol_id is None:
+            self.rejected += 1
+            return False
+        # consecutive ticks share the date time sequence, converted once per sequence
+        if transaction.date_time_seq != self._last_text:
+            self._last_text = transaction.date_time_seq
+            self._last_time = int(transaction.date_time_seq)
+        i = self._write_index
+        buf = self._buf
+        offset = self._slots_offset + (i % self.capacity) * _SLOT.size
+        _SLOT_VERSION.pack_into(buf, offset, 2 * i + 1)
+        _SLOT_PAYLOAD.pack_into(buf, offset + 8, symbol_id, self._last_time, transaction.price,
+                                transaction.seq if transaction.seq is not None else -1, time.monotonic_ns())
+        _SLOT_VERSION.pack_into(buf, offset, 2 * i + 2)
+        self._write_index = i + 1
+        _WRITE_INDEX.pack_into(buf, _WRITE_INDEX_OFFSET, i + 1)
+        return True
+
+    @property
+    def published(self):
+        return self._write_index
+
+    def close(self):
+        """ remove the segment (attached readers keep their mapping until they close)
+        :return: void
+        """
+        if self._segment is None:
+            return
+        self._buf.release()
+        self._segment.close()
+        try:
+            self._segment.unlink()
+        except FileNotFoundError:
+            pass
+        _PUBLISHED.discard(self.name)
+        self._segment = None
+        log.info('[shm_feed] segment removed: {} (published: {})'.format(self.name, str(self._write_index)))
+
+
+class SharedMemoryReader:
+    """ subscriber of the shared memory ring (any number of processes, each with its own cursor)
+    slots are decoded straight from the mapped segment. a slot overwritten before it was read (reader more than
+    capacity ticks behind) is skipped and counted as overrun.
+    """
+
+    def __init__(self, name, from_start=False):
+        """ constructor
+        :param name: segment name
+        :param from_start: read the ticks already in the ring (default: only ticks published from now on)
+        """
+        self.name = name
+        self._segment = _attach(name)
+        self._buf = self._segment.buf
+        magic, layout_version, capacity, slot_size, max_symbols, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or layout_version != LAYOUT_VERSION or slot_size != _SLOT.size:
+            self.close()
+            raise ShmFeedProcessException('[shm_feed] unsupported segment: {} (magic: {}, layout: {})'
+                                          .format(name, repr(magic), str(layout_version)))
+        self.capacity = capacity
+        self._slots_offset = _HEADER_SIZE + _SYMBOL_SIZE * max_symbols
+        self._symbols = []
+        write_index = self.write_index()
+        self._cursor = max(0, write_index - capacity) if from_start else write_index
+        self.overruns = 0
+
+    def write_index(self) -> int:
+        """ number of ticks published so far
+        :return: write index
+        """
+        return _WRITE_INDEX.unpack_from(self._buf, _WRITE_INDEX_OFFSET)[0]
+
+    def _symbol(self, symbol_id):
+        if symbol_id >= len(self._symbols):
+            count = struct.unpack_from('<I', self._buf, _SYMBOL_COUNT_OFFSET)[0]
+            self._symbols = [bytes(self._buf[_HEADER_SIZE + _SYMBOL_SIZE * i:_HEADER_SIZE + _SYMBOL_SIZE * (i + 1)])
+                             .rstrip(b'\0').decode('utf-8') for i in range(count)]
+        return self._symbols[symbol_id]
+
+    def _read_slot(self, index):
+        """ tick of write index (seqlock validated)
+        :param index: write index of the tick
+        :return: tick or None (overwritten)
+        """
+        offset = self._slots_offset + (index % self.capacity) * _SLOT.size
+        version, symbol_id, date_time, price, seq, published_ns = _SLOT.unpack_from(self._buf, offset)
+        if version != 2 * index + 2 or _SLOT_VERSION.unpack_from(self._buf, offset)[0] != version:
+            return None
+        return self._symbol(symbol_id), date_time, price, seq, published_ns
+
+    def poll(self, max_count=None) -> list:
+        """ ticks published since the previous poll
+        :param max_count: maximum number of ticks (None: every available tick)
+        :return: list of ticks (ref. TICK_COLUMNS)
+        """
+        write_index = self.write_index()
+        cursor = self._cursor
+        if write_index - cursor > self.capacity:
+            self.overruns += write_index - cursor - self.capacity
+            cursor = write_index - self.capacity
+        stop = write_index if max_count is None else min(write_index, cursor + int(max_count))
+        ticks = []
+        while cursor < stop:
+            tick = self._read_slot(cursor)
+            if tick is None:
+                self.overruns += 1
+            else:
+                ticks.append(tick)
+            cursor += 1
+        self._cursor = cursor
+        return ticks
+
+    def latest(self, symbol=None):
+        """ newest tick in the ring (does not move the cursor)
+        :param symbol: symbol (None: any symbol)
+        :return: tick or None
+        """
+        write_index = self.write_index()
+        for index in range(write_index - 1, max(0, write_index - self.capacity) - 1, -1):
+            tick = self._read_slot(index)
+            if tick is not None and (symbol is None or tick[0] == symbol):
+                return tick
+        return None
+
+    def close(self):
+        if self._segment is None:
+            return
+        self._buf.release()
+        self._segment.close()
+        self._segment = None
+
+
+def create_shm_publisher(config):
+    """ create shared memory publisher from configuration
+    :param config: shared memory feed configuration (None: feed disabled)
+    :return: publisher or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return SharedMemoryPublisher(config.get('name', 'hana1q-ticks'), capacity=config.get('capacity', 65536),
+                                 max_symbols=config.get('max_symbols', 64))
@@ -0,0 +1,768 @@
+# -*- coding: utf-8 -*-
+"""
+    Transaction sink pipeline
+    author: modorigoon
+    since: 0.2.0
+"""
+import collections
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from common.config import resolve_path
+from common.logger import log
+from lib.metrics import REGISTRY
+from lib.transaction import Transaction
+
+_FLUSH_SECONDS = REGISTRY.histogram('hana1q_sink_flush_seconds', 'Sink batch write latency.', ('pipeline',))
+
+
+class SinkProcessException(Exception):
+    pass
+
+
+def _ensure_parent(path):
+    """ create parent directory of path
+    :param path: file path
+    :return: void
+    """
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+
+def to_row(item) -> dict:
+    """ convert pipeline item to serializable row
+    :param item: transaction object
+    :return: row dictionary
+    """
+    if hasattr(item, 'to_dict'):
+        return item.to_dict()
+    return dict(item)
+
+
+def encode_spill(item) -> str:
+    """ encode pipeline item as a spill line (transactions as arrays of their fields, rows as objects)
+    :param item: transaction object or row
+    :return: JSON line (without line break)
+    """
+    if isinstance(item, Transaction):
+        return json.dumps(item, separators=(',', ':'))
+    return encode_line(item)
+
+
+def decode_spill(line):
+    """ decode spill line into the item that was spilled
+    :param line: JSON line
+    :return: transaction object or row
+    """
+    value = json.loads(line)
+    if isinstance(value, list):
+        return Transaction(*value)
+    return value
+
+
+def encode_line(item) -> str:
+    """ encode pipeline item as a single JSON line
+    :param item: transaction object
+    :return: JSON line (without line break)
+    """
+    return json.dumps(to_row(item), separators=(',', ':'))
+
+
+# -------------------------------------------------------------------------------------------------
+# sink part
+# -------------------------------------------------------------------------------------------------
+
+class Sink:
+    """ destination of transaction batches
+    every method is called from the pipeline writer thread only.
+    """
+
+    name = 'sink'
+    # seconds between syncs (0: after every batch, the flush barrier moves past a batch once synced)
+    sync_interval = 0.0
+
+    def open(self):
+        """ open resources
+        :return: void
+        """
+        pass
+
+    def write_batch(self, batch):
+        """ write batch
+        :param batch: list of transaction objects
+        :return: void
+        """
+        raise NotImplementedError
+
+    def sync(self):
+        """ make written batches durable (sinks that buffer batches)
+        :return: void
+        """
+        pass
+
+    def close(self):
+        """ release resources
+        :return: void
+        """
+        pass
+
+
+class NullSink(Sink):
+
+    name = 'none'
+
+    def write_batch(self, batch):
+        pass
+
+
+class FileSink(Sink):
+
+    name = 'file'
+
+    def __init__(self, path, fsync=False):
+        """ constructor
+        :param path: append-only output file path
+        :param fsync: fsync after every batch
+        """
+        self._path = resolve_path(path)
+        self._fsync = fsync
+        self._file = None
+
+    def open(self):
+        _ensure_parent(self._path)
+        self._file = open(self._path, 'a', encoding='utf-8')
+
+    def write_batch(self, batch):
+        self._file.write(''.join(encode_line(item) + '\n' for item in batch))
+        self._file.flush()
+        if self._fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SQLiteSink(Sink):
+    """ ticks into the embedded SQLite tick store (ref. lib.sqlite_store) """
+
+    name = 'sqlite'
+
+    def __init__(self, path, synchronous='NORMAL'):
+        """ constructor
+        :param path: database file path
+        :param synchronous: synchronous pragma
+        """
+        self._path = path
+        self._synchronous = synchronous
+        self._store = None
+
+    def open(self):
+        from lib.sqlite_store import SQLiteTickStore
+        self._store = SQLiteTickStore(self._path, synchronous=self._synchronous)
+
+    def write_batch(self, batch):
+        self._store.insert_batch(batch)
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+class ColumnarSink(Sink):
+    """ ticks and bars into the columnar store (ref. lib.columnar_store)
+    rows are buffered into row groups, every sync writes them and closes the open part files.
+    """
+
+    name = 'columnar'
+
+    def __init__(self, config):
+        """ constructor
+        :param config: columnar configuration (path, row_group_size, max_row_groups, compression_level, format,
+                       roll_hour, sync_interval_ms)
+        """
+        self._config = config
+        self._writer = None
+        self.sync_interval = float(config.get('sync_interval_ms', 10000)) / 1000
+
+    def open(self):
+        from lib.columnar_store import create_columnar_writer
+        self._writer = create_columnar_writer(self._config)
+
+    def write_batch(self, batch):
+        append = self._writer.append
+        for item in batch:
+            append(item)
+
+    def sync(self):
+        self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class TcpLineSink(Sink):
+
+    name = 'tcp'
+
+    def __init__(self, host, port, timeout=5.0):
+        """ constructor
+        :param host: receiver host
+        :param port: receiver port
+        :param timeout: connect/send timeout in seconds
+        """
+        self._address = (host, int(port))
+        self._timeout = timeout
+        self._socket = None
+
+    def open(self):
+        self._connect()
+
+    def _connect(self):
+        self._socket = socket.create_connection(self._address, timeout=self._timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def encode(self, batch) -> bytes:
+        """ payload of batch
+        :param batch: list of transaction objects
+        :return: JSON lines
+        """
+        return ''.join(encode_line(item) + '\n' for item in batch).encode('utf-8')
+
+    def write_batch(self, batch):
+        payload = self.encode(batch)
+        try:
+            if self._socket is None:
+                self._connect()
+            self._socket.sendall(payload)
+        except OSError:
+            # reconnect once, the pipeline reports the error if it fails again
+            self.close()
+            self._connect()
+            self._socket.sendall(payload)
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
+
+class TcpWireSink(TcpLineSink):
+    """ transactions as length-prefixed delta batches of the binary wire format over TCP (ref. lib.wire)
+    every batch embeds the symbol table of the connection, symbol ids stay stable across batches.
+    """
+
+    name = 'wire'
+
+    def __init__(self, host, port, timeout=5.0, utc_offset_s=None):
+        """ constructor
+        :param host: receiver host
+        :param port: receiver port
+        :param timeout: connect/send timeout in seconds
+        :param utc_offset_s: UTC offset of the date time sequences (None: exchange time, ref. lib.wire)
+        """
+        super().__init__(host, port, timeout)
+        from lib import wire
+        self._wire = wire
+        self._symbols = wire.SymbolTable()
+        self._utc_offset_s = wire.EXCHANGE_UTC_OFFSET_S if utc_offset_s is None else int(utc_offset_s)
+
+    def encode(self, batch) -> bytes:
+        wire = self._wire
+        symbols = self._symbols
+        utc_offset_s = self._utc_offset_s
+        records = [wire.to_record(item, symbols, utc_offset_s=utc_offset_s) for item in batch]
+        return wire.encode_frame(records, symbols.symbols)
+
+
+class TcpLineStandInServer(socketserver.ThreadingTCPServer):
+    """ local stand-in receiver for TcpLineSink
+    every received line is decoded and kept in memory (and optionally appended to a file).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, output_path=None):
+        """ constructor
+        :param host: bind host
+        :param port: bind port (0: any free port)
+        :param output_path: append received lines to this file
+        """
+        super().__init__((host, port), _TcpLineRequestHandler)
+        self.received = []
+        self._lock = threading.Lock()
+        self._output = None
+        if output_path is not None:
+            output_path = resolve_path(output_path)
+            _ensure_parent(output_path)
+            self._output = open(output_path, 'a', encoding='utf-8')
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def on_line(self, line: str):
+        """ handle received line
+        :param line: JSON line
+        :return: void
+        """
+        with self._lock:
+            self.received.append(json.loads(line))
+            if self._output is not None:
+                self._output.write(line + '\n')
+                self._output.flush()
+
+    def start(self):
+        """ serve on a background thread
+        :return: void
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name='tcp-line-stand-in', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stop serving
+        :return: void
+        """
+        self.shutdown()
+        self.server_close()
+        if self._output is not None:
+            self._output.close()
+
+
+class _TcpLineRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if line:
+                self.server.on_line(line)
+
+
+# -------------------------------------------------------------------------------------------------
+# pipeline part
+# -------------------------------------------------------------------------------------------------
+
+class SinkPipeline:
+    """ bounded queue drained by a background writer thread in size/time bounded batches """
+
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    SPILL = 'spill'
+    _POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+    def __init__(self, sink: Sink, queue_size=100000, batch_size=500, flush_interval_ms=200,
+                 backpressure=DROP_OLDEST, spill_path=None, block_timeout_ms=None, name=None):
+        """ constructor
+        :param sink: destination sink
+        :param queue_size: maximum number of queued transactions
+        :param batch_size: maximum number of transactions per batch
+        :param flush_interval_ms: maximum time a transaction waits before being flushed
+        :param backpressure: policy when queue is full (block, drop_oldest, spill)
+        :param spill_path: spill file path (spill policy)
+        :param block_timeout_ms: maximum blocking time (block policy, None: wait forever)
+        :param name: pipeline name (metrics label, default: sink name)
+        """
+        if backpressure not in self._POLICIES:
+            raise SinkProcessException('[sink] invalid backpressure policy. (policy: {})'.format(backpressure))
+        if backpressure == self.SPILL and not spill_path:
+            raise SinkProcessException('[sink] spill policy requires spill path.')
+        self._sink = sink
+        self.name = name or sink.name
+        self._queue_size = int(queue_size)
+        self._batch_size = int(batch_size)
+        self._flush_interval = float(flush_interval_ms) / 1000
+        self._backpressure = backpressure
+        self._block_timeout = None if block_timeout_ms is None else float(block_timeout_ms) / 1000
+        self._spill_path = resolve_path(spill_path) if spill_path else None
+        self._spill_file = None
+        self._spill_pending = 0
+        # once a transaction is spilled, every transaction is spilled until the spill file is drained (FIFO order)
+        self._spilling = False
+
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._running = False
+        self._thread = None
+
+        # flush barrier: positions of accepted transactions (queued or spilled, in arrival order), taken out of
+        # the queue/spill file (batch or drop_oldest), handed to the sink and synced, handed to the sink and not
+        # synced yet (None: nothing), and the last one lost (drop, failed batch or sync)
+        self._accepted = 0
+        self._taken = 0
+        self._handled = 0
+        self._unsynced = None
+        self._next_sync_at = 0.0
+        self._lost_through = 0
+        self._enqueued = 0
+        self._dropped = 0
+        self._spilled = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._flush_seconds = _FLUSH_SECONDS.labels(self.name)
+
+    @property
+    def sink(self) -> Sink:
+        return self._sink
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """ open sink and start writer thread
+        :return: void
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            if self._spill_path is not None:
+                self._collect_spill_leftovers()
+        self._thread = threading.Thread(target=self._run, name='sink-writer-' + self.name, daemon=True)
+        self._thread.start()
+        log.info('[sink] pipeline started. (sink: {}, backpressure: {})'.format(self._sink.name, self._backpressure))
+
+    def stop(self, timeout=None):
+        """ stop writer thread after draining queued transactions
+        :param timeout: join timeout in seconds
+        :return: void
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        log.info('[sink] pipeline stopped. {}'.format(str(self.stats())))
+
+    def put(self, item) -> bool:
+        """ enqueue transaction (called from the event thread)
+        :param item: transaction object
+        :return: accepted (queued or spilled)
+        """
+        with self._lock:
+            if self._spilling:
+                self._spill(item)
+                return True
+            if len(self._queue) >= self._queue_size:
+                if self._backpressure == self.DROP_OLDEST:
+                    self._queue.popleft()
+                    self._dropped += 1
+                    self._taken += 1
+                    self._lost_through = self._taken
+                elif self._backpressure == self.SPILL:
+                    self._spill(item)
+                    return True
+                else:
+                    deadline = None if self._block_timeout is None else time.monotonic() + self._block_timeout
+                    while len(self._queue) >= self._queue_size and self._running:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._dropped += 1
+                            return False
+                        self._not_full.wait(remaining)
+                    if len(self._queue) >= self._queue_size:
+                        # no writer (not started, stopped or sink open failed): nothing will free the queue
+                        self._dropped += 1
+                        return False
+            self._queue.append(item)
+            self._accepted += 1
+            self._enqueued += 1
+            if len(self._queue) >= self._batch_size:
+                self._not_empty.notify()
+            return True
+
+    def position(self) -> int:
+        """ position of the last accepted transaction (flush barrier, ref. flushed)
+        :return: number of transactions accepted so far
+        """
+        return self._accepted
+
+    def flushed(self, position) -> bool:
+        """ check every transaction accepted up to position has been handed to the sink and synced (written or failed)
+        :param position: position returned by position()
+        :return: flushed
+        """
+        return self._handled >= position
+
+    def lost_after(self, position) -> bool:
+        """ check a transaction accepted after position was dropped or failed to be written
+        :param position: position returned by position()
+        :return: lost (conservative: transactions of other producers count as well)
+        """
+        return self._lost_through > position
+
+    def _spill(self, item):
+        """ append transaction to spill file (lock held)
+        :param item: transaction object
+        :return: void
+        """
+        if self._spill_file is None:
+            _ensure_parent(self._spill_path)
+            self._spill_file = open(self._spill_path, 'a', encoding='utf-8')
+        self._spill_file.write(encode_spill(item) + '\n')
+        self._accepted += 1
+        self._spill_pending += 1
+        self._spilled += 1
+        if not self._spilling:
+            self._spilling = True
+            # the writer flushes the queue without waiting for a full batch, then drains the spill file
+            self._not_empty.notify()
+
+    def _collect_spill_leftovers(self):
+        """ move spill files left by a previous run (crash) into the recover file, replayed by the writer
+        before anything else. they are not positions of this run (ref. position).
+        :return: void
+        """
+        recover_path = self._spill_path + '.recover'
+        leftovers = [path for path in (self._spill_path + '.drain', self._spill_path) if os.path.exists(path)]
+        if not leftovers:
+            return
+        with open(recover_path, 'ab') as wf:
+            for path in leftovers:
+                with open(path, 'rb') as rf:
+                    data = rf.read()
+                if data and not data.endswith(b'\n'):
+                    # the last line of a crashed run may be cut
+                    data = data[:data.rfind(b'\n') + 1]
+                wf.write(data)
+        for path in leftovers:
+            os.remove(path)
+        log.info('[sink] spill files of a previous run will be written first. (path: {})'.format(recover_path))
+
+    def _replay_leftovers(self):
+        """ write the recover file of a previous run (at least once: replayed again after a crash meanwhile)
+        :return: void
+        """
+        path = self._spill_path + '.recover'
+        if not os.path.exists(path):
+            return
+        batch = []
+        with open(path, encoding='utf-8') as rf:
+            for line in rf:
+                batch.append(decode_spill(line))
+                if len(batch) >= self._batch_size:
+                    self._flush(batch, self._handled)
+                    batch = []
+        if batch:
+            self._flush(batch, self._handled)
+        os.remove(path)
+
+    def _take_spill(self):
+        """ detach current spill file for draining
+        :return: path of detached spill file or None
+        """
+        with self._lock:
+            if self._spill_pending == 0:
+                return None
+            self._spill_file.close()
+            self._spill_file = None
+            self._spill_pending = 0
+            draining_path = self._spill_path + '.drain'
+            os.replace(self._spill_path, draining_path)
+            return draining_path
+
+    def _next_batch(self):
+        """ wait for next batch
+        :return: (list of transactions (empty when stopped and drained), position of the last one)
+        """
+        with self._lock:
+            deadline = time.monotonic() + self._flush_interval
+            while len(self._queue) < self._batch_size and self._running and not self._spilling:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            size = min(len(self._queue), self._batch_size)
+            batch = [self._queue.popleft() for _ in range(size)]
+            self._taken += size
+            if size:
+                self._not_full.notify_all()
+            return batch, self._taken
+
+    def _flush(self, batch, position):
+        """ write batch into sink and update counters
+        :param batch: list of transactions
+        :param position: position of the last transaction of batch
+        :return: void
+        """
+        started_at = time.perf_counter()
+        try:
+            self._sink.write_batch(batch)
+            self._written += len(batch)
+        except Exception as _e:
+            self._failed += len(batch)
+            self._lost_through = position
+            log.error('[sink] write batch failed. (size: {}, error: {})'.format(str(len(batch)), str(_e)))
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        self._batches += 1
+        self._last_batch_size = len(batch)
+        self._max_batch_size = max(self._max_batch_size, len(batch))
+        self._last_flush_ms = elapsed_ms
+        self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        self._flush_seconds.observe(elapsed_ms / 1000)
+        self._unsynced = position
+        self._sync()
+
+    def _sync(self, force=False):
+        """ sync the sink once its sync interval elapsed and move the flush barrier past the synced batches
+        :param force: sync now (stop)
+        :return: void
+        """
+        position = self._unsynced
+        if position is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_sync_at:
+            return
+        try:
+            self._sink.sync()
+        except Exception as _e:
+            self._lost_through = position
+            log.error('[sink] sync failed. (sink: {}, error: {})'.format(self._sink.name, str(_e)))
+        self._next_sync_at = now + self._sink.sync_interval
+        self._unsynced = None
+        self._handled = position
+
+    def _take(self, size) -> int:
+        """ take spilled transactions (their positions follow the queued ones)
+        :param size: number of transactions
+        :return: position of the last one
+        """
+        with self._lock:
+            self._taken += size
+            return self._taken
+
+    def _drain_spill(self):
+        """ replay spilled transactions into the sink
+        :return: void
+        """
+        path = self._take_spill()
+        if path is None:
+            return
+        batch = []
+        with open(path, encoding='utf-8') as rf:
+            for line in rf:
+                batch.append(decode_spill(line))
+                if len(batch) >= self._batch_size:
+                    self._flush(batch, self._take(len(batch)))
+                    batch = []
+        if batch:
+            self._flush(batch, self._take(len(batch)))
+        os.remove(path)
+        with self._lock:
+            if self._spill_pending == 0:
+                # drained: transactions queue again
+                self._spilling = False
+
+    def _run(self):
+        """ writer thread main loop
+        :return: void
+        """
+        try:
+            self._sink.open()
+        except Exception as _e:
+            log.error('[sink] open sink failed. (sink: {}, error: {})'.format(self._sink.name, str(_e)))
+            with self._lock:
+                self._running = False
+                self._not_full.notify_all()
+            return
+        try:
+            if self._spill_path is not None:
+                self._replay_leftovers()
+            while True:
+                batch, position = self._next_batch()
+                if batch:
+                    self._flush(batch, position)
+                elif self._spill_pending:
+                    self._drain_spill()
+                elif not self._running:
+                    self._sync(force=True)
+                    break
+                else:
+                    self._sync()
+        finally:
+            self._sink.close()
+
+    def stats(self) -> dict:
+        """ pipeline counters
+        :return: counters dictionary
+        """
+        with self._lock:
+            queue_depth = len(self._queue)
+        return {
+            'queue_depth': queue_depth,
+            'enqueued': self._enqueued,
+            'dropped': self._dropped,
+            'spilled': self._spilled,
+            'written': self._written,
+            'failed': self._failed,
+            'batches': self._batches,
+            'last_batch_size': self._last_batch_size,
+            'max_batch_size': self._max_batch_size,
+            'last_flush_ms': round(self._last_flush_ms, 3),
+            'max_flush_ms': round(self._max_flush_ms, 3),
+            'avg_flush_ms': round(self._total_flush_ms / self._batches, 3) if self._batches else 0.0
+        }
+
+
+def create_sink(config) -> Sink:
+    """ create sink from configuration
+    :param config: sink configuration
+    :return: sink
+    """
+    sink_type = str(config.get('type', 'none')).lower()
+    if sink_type == FileSink.name:
+        return FileSink(config['file']['path'], config['file'].get('fsync', False))
+    if sink_type == SQLiteSink.name:
+        return SQLiteSink(config['sqlite']['path'], config['sqlite'].get('synchronous', 'NORMAL'))
+    if sink_type == ColumnarSink.name:
+        return ColumnarSink(config['columnar'])
+    if sink_type == TcpLineSink.name:
+        return TcpLineSink(config['tcp']['host'], config['tcp']['port'])
+    if sink_type == TcpWireSink.name:
+        return TcpWireSink(config['wire']['host'], config['wire']['port'],
+                           utc_offset_s=config['wire'].get('utc_offset_s'))
+    if sink_type == NullSink.name:
+        return NullSink()
+    raise SinkProcessException('[sink] invalid sink type. (type: {})'.format(sink_type))
+
+
+def create_sink_pipeline(config, name=None):
+    """ create sink pipeline from configuration
+    :param config: sink configuration (None: no pipeline)
+    :param name: pipeline name (metrics label, default: sink name)
+    :return: sink pipeline or None
+    """
+    if not config or str(config.get('type', 'none')).lower() == NullSink.name:
+        return None
+    return SinkPipeline(create_sink(config),
+                        queue_size=config.get('queue_size', 100000),
+                        batch_size=config.get('batch_size', 500),
+                        flush_interval_ms=config.get('flush_interval_ms', 200),
+                        backpressure=config.get('backpressure', SinkPipeline.DROP_OLDEST),
+                        spill_path=config.get('spill_path'),
+                        block_timeout_ms=config.get('block_timeout_ms'),
+                        name=name)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+    Embedded SQLite tick/bar store
+    author: modorigoon
+    since: 0.2.0
+"""
+import os
+import sqlite3
+from common.config import resolve_path
+from lib.columnar_store import BAR_FIELDS, bar_values, is_bar_row
+from lib.transaction import Transaction
+
+# rows per multi-row INSERT (4 parameters per row, below the 999 parameter limit of older SQLite builds)
+_ROWS_PER_STATEMENT = 200
+_BAR_COLUMNS = ('symbol', 'date_time_seq', 'resolution', 'ticks') + tuple(name for name, _, _ in BAR_FIELDS)
+
+
+class SQLiteStoreProcessException(Exception):
+    pass
+
+
+class SQLiteTickStore:
+    """ tick table clustered on (symbol, date_time_seq, seq), bar table (FID bar rows) clustered on
+    (symbol, resolution, date_time_seq)
+    WITHOUT ROWID keeps the rows in primary key order, so range scans and latest-N lookups of one symbol
+    read adjacent pages. the database runs in WAL mode: one writer (sink pipeline thread) and any number
+    of readers (own connections) work concurrently.
+    """
+
+    _CREATE_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS ticks (' \
+                        'symbol TEXT NOT NULL, date_time_seq INTEGER NOT NULL, seq INTEGER NOT NULL, ' \
+                        'price INTEGER NOT NULL, PRIMARY KEY (symbol, date_time_seq, seq)) WITHOUT ROWID'
+    _CREATE_BAR_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS bars (' \
+                            'symbol TEXT NOT NULL, date_time_seq INTEGER NOT NULL, resolution TEXT NOT NULL, ' \
+                            + ', '.join('{} INTEGER NOT NULL'.format(name) for name in _BAR_COLUMNS[3:]) \
+                            + ', PRIMARY KEY (symbol, resolution, date_time_seq)) WITHOUT ROWID'
+    _INSERT_BAR_SQL = 'INSERT OR IGNORE INTO bars ({}) VALUES ({})'.format(', '.join(_BAR_COLUMNS),
+                                                                         ', '.join('?' * len(_BAR_COLUMNS)))
+    _INSERT_ROW_SQL = '(?, ?, ?, ?)'
+    _RANGE_SQL = 'SELECT symbol, date_time_seq, seq, price FROM ticks ' \
+                 'WHERE symbol = ? AND date_time_seq BETWEEN ? AND ? ORDER BY date_time_seq, seq'
+    _LATEST_SQL = 'SELECT symbol, date_time_seq, seq, price FROM ticks ' \
+                  'WHERE symbol = ? ORDER BY date_time_seq DESC, seq DESC LIMIT ?'
+    _BAR_RANGE_SQL = 'SELECT {} FROM bars WHERE symbol = ? AND resolution = ? AND date_time_seq BETWEEN ? AND ? ' \
+                     'ORDER BY date_time_seq'.format(', '.join(_BAR_COLUMNS))
+
+    def __init__(self, path, readonly=False, synchronous='NORMAL', cache_size_kb=65536):
+        """ constructor
+        :param path: database file path
+        :param readonly: query connection (no schema changes, no inserts)
+        :param synchronous: synchronous pragma (NORMAL: durable at checkpoints in WAL mode, FULL: every commit)
+        :param cache_size_kb: page cache size
+        """
+        self._path = resolve_path(path)
+        self._readonly = readonly
+        if readonly:
+            self._connection = sqlite3.connect('file:{}?mode=ro'.format(self._path), uri=True,
+                                               check_same_thread=False)
+        else:
+            parent = os.path.dirname(self._path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._connection = sqlite3.connect(self._path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(self._CREATE_TABLE_SQL)
+            self._connection.execute(self._CREATE_BAR_TABLE_SQL)
+            self._connection.commit()
+        self._connection.execute('PRAGMA synchronous={}'.format(synchronous))
+        self._connection.execute('PRAGMA cache_size=-{}'.format(int(cache_size_kb)))
+        self._insert_sql = 'INSERT OR IGNORE INTO ticks (symbol, date_time_seq, seq, price) VALUES ' \
+                           + ', '.join([self._INSERT_ROW_SQL] * _ROWS_PER_STATEMENT)
+        self._insert_one_sql = 'INSERT OR IGNORE INTO ticks (symbol, date_time_seq, seq, price) VALUES ' \
+                               + self._INSERT_ROW_SQL
+        # rows actually inserted (duplicated keys are not counted)
+        self.inserted = 0
+
+    @staticmethod
+    def to_record(item) -> tuple:
+        """ row values of a transaction (Transaction or its dictionary)
+        :param item: transaction
+        :return: (symbol, date_time_seq, seq, price)
+        """
+        if isinstance(item, Transaction):
+            return item.symbol, int(item.date_time_seq), item.seq or 0, item.price
+        row = item if isinstance(item, dict) else item.to_dict()
+        return row.get('symbol'), int(row['date_time_seq']), row.get('seq') or 0, row['price']
+
+    @staticmethod
+    def to_bar_record(row) -> tuple:
+        """ row values of a FID bar row (ref. lib.columnar_store.bar_values)
+        :param row: FID bar row
+        :return: values in bars column order
+        """
+        date_time_seq, values = bar_values(row)
+        return (row.get('symbol'), date_time_seq) + tuple(values)
+
+    def insert_batch(self, batch):
+        """ insert transactions and bar rows in one transaction (multi-row statements, duplicated keys are ignored)
+        :param batch: list of transactions or FID bar rows
+        :return: void
+        """
+        if self._readonly:
+            raise SQLiteStoreProcessException('[sqlite] store is read only.')
+        records = []
+        bars = []
+        for item in batch:
+            if isinstance(item, dict) and is_bar_row(item):
+                bars.append(self.to_bar_record(item))
+            else:
+                records.append(self.to_record(item))
+        full = len(records) - len(records) % _ROWS_PER_STATEMENT
+        connection = self._connection
+        changes = connection.total_changes
+        with connection:
+            for start in range(0, full, _ROWS_PER_STATEMENT):
+                connection.execute(self._insert_sql,
+                                   [value for record in records[start:start + _ROWS_PER_STATEMENT] for value in record])
+            if full < len(records):
+                connection.executemany(self._insert_one_sql, records[full:])
+            if bars:
+                connection.executemany(self._INSERT_BAR_SQL, bars)
+        self.inserted += connection.total_changes - changes
+
+    def range(self, symbol, from_date_time_seq, to_date_time_seq, limit=None):
+        """ ticks of symbol between two date time sequences (inclusive, key order)
+        :param symbol: symbol
+        :param from_date_time_seq: first date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param to_date_time_seq: last date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param limit: maximum number of rows (None: every row)
+        :return: list of (symbol, date_time_seq, seq, price)
+        """
+        low = int(str(from_date_time_seq).ljust(14, '0'))
+        high = int(str(to_date_time_seq).ljust(14, '9'))
+        if limit is None:
+            return self._connection.execute(self._RANGE_SQL, (symbol, low, high)).fetchall()
+        return self._connection.execute(self._RANGE_SQL + ' LIMIT ?', (symbol, low, high, int(limit))).fetchall()
+
+    def bars(self, symbol, resolution, from_date_time_seq, to_date_time_seq):
+        """ bars of symbol and resolution between two date time sequences (inclusive, key order)
+        :param symbol: symbol
+        :param resolution: bar resolution ('': untagged FID rows)
+        :param from_date_time_seq: first date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param to_date_time_seq: last date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :return: list of rows in bars column order (symbol, date_time_seq, resolution, ticks, sell_sign, ...)
+        """
+        low = int(str(from_date_time_seq).ljust(14, '0'))
+        high = int(str(to_date_time_seq).ljust(14, '9'))
+        return self._connection.execute(self._BAR_RANGE_SQL, (symbol, resolution, low, high)).fetchall()
+
+    def latest(self, symbol, count=1):
+        """ latest ticks of symbol (newest first)
+        :param symbol: symbol
+        :param count: number of rows
+        :return: list of (symbol, date_time_seq, seq, price)
+        """
+        return self._connection.execute(self._LATEST_SQL, (symbol, int(count))).fetchall()
+
+    def count(self, symbol=None) -> int:
+        """ number of stored ticks
+        :param symbol: symbol (None: every symbol)
+        :return: count
+        """
+        if symbol is None:
+            return self._connection.execute('SELECT COUNT(*) FROM ticks').fetchone()[0]
+        return self._connection.execute('SELECT COUNT(*) FROM ticks WHERE symbol = ?', (symbol,)).fetchone()[0]
+
+    def checkpoint(self):
+        """ move the WAL content into the database file
+        :return: void
+        """
+        self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
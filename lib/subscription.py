@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+    Real subscription manager
+    author: modorigoon
+    since: 0.2.0
+"""
+import time
+from common.logger import log
+
+
+class Subscription:
+    """ one (real name, symbol) registration with its handler and throughput counters """
+
+    __slots__ = ('real_name', 'symbol', 'handler', 'registered', 'received', 'errors', 'last_received_at',
+                 '_rate_count', '_rate_at')
+
+    def __init__(self, real_name, symbol, handler):
+        """ constructor
+        :param real_name: real name (ex: V00)
+        :param symbol: symbol (real key)
+        :param handler: block handler(block)
+        """
+        self.real_name = real_name
+        self.symbol = symbol
+        self.handler = handler
+        self.registered = False
+        self.received = 0
+        self.errors = 0
+        self.last_received_at = None
+        self._rate_count = 0
+        self._rate_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """ throughput counters (rate since the previous call)
+        :return: counters dictionary
+        """
+        now = time.monotonic()
+        elapsed = now - self._rate_at
+        received = self.received
+        rate = (received - self._rate_count) / elapsed if elapsed > 0 else 0.0
+        self._rate_count = received
+        self._rate_at = now
+        return {
+            'real_name': self.real_name,
+            'symbol': self.symbol,
+            'registered': self.registered,
+            'received': received,
+            'errors': self.errors,
+            'ticks_per_second': round(rate, 3),
+            'last_received_at': self.last_received_at
+        }
+
+
+class SubscriptionManager:
+    """ registers (real name, symbol) pairs and routes real events to per-symbol handlers """
+
+    def __init__(self, register, unregister):
+        """ constructor
+        :param register: function(real_name, symbol) -> register successful
+        :param unregister: function(real_name, symbol) -> unregister successful
+        """
+        self._register = register
+        self._unregister = unregister
+        self._subscriptions = {}
+        self.unrouted = 0
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def __iter__(self):
+        return iter(list(self._subscriptions.values()))
+
+    def get(self, real_name, symbol) -> Subscription:
+        return self._subscriptions.get((real_name, symbol))
+
+    def add(self, real_name, symbol, handler, register=True) -> bool:
+        """ add subscription (registered immediately, no reconnect required)
+        :param real_name: real name
+        :param symbol: symbol
+        :param handler: block handler(block)
+        :param register: register real now
+        :return: register successful
+        """
+        key = (real_name, symbol)
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            subscription = Subscription(real_name, symbol, handler)
+            self._subscriptions[key] = subscription
+        else:
+            subscription.handler = handler
+        if register is True and subscription.registered is False:
+            subscription.registered = self._register(real_name, symbol)
+            log.info('[subscription] register real: {} {} ({})'.format(real_name, symbol,
+                                                                        str(subscription.registered)))
+        return subscription.registered
+
+    def remove(self, real_name, symbol) -> bool:
+        """ unregister and remove subscription
+        :param real_name: real name
+        :param symbol: symbol
+        :return: unregister successful
+        """
+        subscription = self._subscriptions.pop((real_name, symbol), None)
+        if subscription is None:
+            return False
+        result = True
+        if subscription.registered:
+            subscription.registered = False
+            result = self._unregister(real_name, symbol)
+        log.info('[subscription] unregister real: {} {} ({})'.format(real_name, symbol, str(result)))
+        return result
+
+    def register_all(self, force=False) -> bool:
+        """ register every subscription not registered yet (after reconnect)
+        :param force: register again even if marked registered (the previous session is gone)
+        :return: every register successful
+        """
+        results = []
+        for subscription in self:
+            if force is True and subscription.registered is True:
+                subscription.registered = self._register(subscription.real_name, subscription.symbol)
+                log.info('[subscription] register real again: {} {} ({})'
+                         .format(subscription.real_name, subscription.symbol, str(subscription.registered)))
+                results.append(subscription.registered)
+            else:
+                results.append(self.add(subscription.real_name, subscription.symbol, subscription.handler))
+        return all(results)
+
+    def mark_unregistered(self):
+        """ mark every subscription unregistered (after AllUnRegisterReal or a lost session)
+        :return: void
+        """
+        for subscription in self._subscriptions.values():
+            subscription.registered = False
+
+    def active(self) -> bool:
+        """ check registered subscriptions
+        :return: at least one subscription is registered
+        """
+        return any(subscription.registered for subscription in self._subscriptions.values())
+
+    def dispatch(self, name, key, block) -> bool:
+        """ route real event to the subscription handler
+        :param name: real name
+        :param key: real key (symbol)
+        :param block: data block
+        :return: routed
+        """
+        subscription = self._subscriptions.get((name, key))
+        if subscription is None:
+            subscription = self._subscriptions.get((str(name).strip(), str(key).strip()))
+            if subscription is None:
+                self.unrouted += 1
+                return False
+        subscription.received += 1
+        subscription.last_received_at = time.time()
+        try:
+            subscription.handler(block)
+        except Exception as _e:
+            subscription.errors += 1
+            log.error('[subscription] handler error: {} {} ({})'.format(str(name), str(key), str(_e)))
+        return True
+
+    def stats(self) -> dict:
+        """ per-symbol throughput counters
+        :return: "real_name:symbol" - counters dictionary
+        """
+        return {'{}:{}'.format(subscription.real_name, subscription.symbol): subscription.stats()
+                for subscription in self}
+
+
+def configured_targets(api_config):
+    """ configured real subscriptions
+    :param api_config: configuration for API HANDLER ("targets" list, or the single "target")
+    :return: list of (real name, symbol)
+    """
+    targets = api_config.get('targets') or [api_config['target']]
+    return [(target['real_name'], target['symbol']) for target in targets]
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+    Multi-process collector supervisor
+    author: modorigoon
+    since: 0.2.0
+"""
+import copy
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from common.config import get_opts, set_config_object, set_opts
+from common.logger import init_logging, log
+from lib.subscription import configured_targets
+
+# maximum wait of a worker transaction sink on a full queue when no spill file is configured
+_WORKER_BLOCK_TIMEOUT_MS = 1000
+
+
+class SupervisorProcessException(Exception):
+    pass
+
+
+def shard_targets(targets, workers):
+    """ split subscriptions into worker shards (round robin, empty shards are dropped)
+    :param targets: list of (real name, symbol)
+    :param workers: number of workers
+    :return: list of target lists
+    """
+    shards = [[] for _ in range(max(1, int(workers)))]
+    for index, target in enumerate(targets):
+        shards[index % len(shards)].append(target)
+    return [shard for shard in shards if shard]
+
+
+def worker_path(path, worker_id) -> str:
+    """ per-worker variant of a file path (ex: data/bars.jsonl - data/bars-worker-1.jsonl)
+    :param path: file path
+    :param worker_id: worker id
+    :return: file path of the worker
+    """
+    root, ext = os.path.splitext(path)
+    return '{}-worker-{}{}'.format(root, str(worker_id), ext)
+
+
+def _worker_sink_config(config, worker_id):
+    """ sink configuration of a worker (every file it writes gets a per-worker path, ref. worker_path)
+    :param config: sink configuration (None: no sink)
+    :param worker_id: worker id
+    :return: sink configuration of the worker
+    """
+    if not config:
+        return config
+    config = dict(config)
+    for key in ('file', 'sqlite'):
+        if config.get(key) and config[key].get('path'):
+            config[key] = dict(config[key], path=worker_path(config[key]['path'], worker_id))
+    if config.get('columnar') and config['columnar'].get('path'):
+        config['columnar'] = dict(config['columnar'], path='{}/worker-{}'.format(
+            config['columnar']['path'].rstrip('/'), str(worker_id)))
+    if config.get('spill_path'):
+        config['spill_path'] = worker_path(config['spill_path'], worker_id)
+    return config
+
+
+def worker_config(worker_id, config, shard, host, port, journal_path=None) -> dict:
+    """ environment configuration of a collector worker
+    :param worker_id: worker id
+    :param config: environment configuration of the supervisor
+    :param shard: list of (real name, symbol)
+    :param host: merge server host
+    :param port: merge server port
+    :param journal_path: journal directory of this worker (None: journal disabled)
+    :return: configuration of the worker (copy)
+    """
+    config = copy.deepcopy(config)
+    config['1q_api']['targets'] = [{'real_name': real_name, 'symbol': symbol} for real_name, symbol in shard]
+    config['1q_api']['target'] = config['1q_api']['targets'][0]
+    sink_config = dict(_worker_sink_config(config.get('sink'), worker_id) or {})
+    sink_config.update({'type': 'tcp', 'tcp': {'host': host, 'port': port}})
+    # a stalled merge server must not hold the agent event thread: the overflow spills into the worker file
+    # and is sent once the socket drains (bounded wait when no spill file is configured)
+    if sink_config.get('spill_path'):
+        sink_config['backpressure'] = 'spill'
+    else:
+        sink_config.update({'backpressure': 'block',
+                            'block_timeout_ms': sink_config.get('block_timeout_ms') or _WORKER_BLOCK_TIMEOUT_MS})
+    config['sink'] = sink_config
+    if journal_path is None:
+        config['journal'] = None
+    else:
+        config['journal'] = dict(config['journal'], path=journal_path)
+    # N processes appending to one file interleave their lines (and read each other's gap state)
+    for key in ('bars', 'gaps'):
+        if config.get(key) and config[key].get('sink'):
+            config[key] = dict(config[key], sink=_worker_sink_config(config[key]['sink'], worker_id))
+    if config.get('gaps') and config['gaps'].get('merged_path'):
+        config['gaps'] = dict(config['gaps'], merged_path=worker_path(config['gaps']['merged_path'], worker_id))
+    if config.get('watchdog') and config['watchdog'].get('gap_path'):
+        config['watchdog'] = dict(config['watchdog'], gap_path=worker_path(config['watchdog']['gap_path'], worker_id))
+    if config.get('profiler'):
+        config['profiler'] = dict(config['profiler'], **{
+            key: worker_path(config['profiler'][key], worker_id) for key in ('report_path', 'folded_path')
+            if config['profiler'].get(key)})
+    if config.get('log') and config['log'].get('file_name'):
+        config['log'] = dict(config['log'], file_name=worker_path(config['log']['file_name'], worker_id))
+    metrics_config = config.get('metrics')
+    if metrics_config and metrics_config.get('enabled') is True:
+        # one endpoint per worker next to the supervisor port (port 0: any free port)
+        metrics_port = int(metrics_config.get('port', 9108))
+        config['metrics'] = dict(metrics_config, port=metrics_port + 1 + int(worker_id) if metrics_port else 0)
+    tick_cache_config = config.get('tick_cache')
+    if tick_cache_config and tick_cache_config.get('port'):
+        # one query endpoint per worker next to the configured port
+        config['tick_cache'] = dict(tick_cache_config, port=int(tick_cache_config['port']) + 1 + int(worker_id))
+    shm_feed_config = config.get('shm_feed')
+    if shm_feed_config and shm_feed_config.get('enabled') is True:
+        # one segment per worker (single writer per ring)
+        config['shm_feed'] = dict(shm_feed_config, name='{}-{}'.format(shm_feed_config.get('name', 'hana1q-ticks'),
+                                                                       str(worker_id)))
+    pubsub_config = config.get('pubsub')
+    if pubsub_config and pubsub_config.get('enabled') is True:
+        # one TCP and WebSocket port pair per worker after the configured pair (port 0: any free port)
+        config['pubsub'] = dict(pubsub_config, **{
+            key: int(pubsub_config[key]) + 2 * (1 + int(worker_id)) if pubsub_config.get(key)
+            else pubsub_config.get(key) for key in ('tcp_port', 'ws_port')})
+    return config
+
+
+def run_worker(worker_id, config, shard, host, port, journal_path=None, opts=None):
+    """ collector worker process entry (own API session for the shard, transactions sent to the supervisor)
+    :param worker_id: worker id
+    :param config: environment configuration of the supervisor
+    :param shard: list of (real name, symbol)
+    :param host: merge server host
+    :param port: merge server port
+    :param journal_path: journal directory of this worker (None: journal disabled)
+    :param opts: execution parameters of the supervisor (None: parsed from the inherited command line)
+    :return: void (exit code of the headless collector)
+    """
+    import sys
+    if opts is not None:
+        set_opts(opts)
+    set_config_object(worker_config(worker_id, config, shard, host, port, journal_path))
+    # per-worker log file
+    init_logging()
+    log.info('[supervisor] worker {} started. (symbols: {})'
+             .format(str(worker_id), ', '.join(symbol for _, symbol in shard)))
+    from headless import run_headless
+    sys.exit(run_headless())
+
+
+class StreamMerger:
+    """ reorder buffer merging worker streams into one stream ordered by (date time sequence, symbol, seq)
+    a transaction is released once it has waited reorder_window_ms; transactions arriving after a later
+    one was released are passed through and counted as late.
+    """
+
+    def __init__(self, emit, reorder_window_ms=200):
+        """ constructor
+        :param emit: function(row) receiving merged rows
+        :param reorder_window_ms: time a row is held for ordering
+        """
+        self._emit = emit
+        self._window = float(reorder_window_ms) / 1000
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._last_key = None
+        self.received = 0
+        self.emitted = 0
+        self.late = 0
+
+    def put(self, row: dict):
+        """ buffer row (called from the merge server threads)
+        :param row: transaction row
+        :return: void
+        """
+        key = (str(row.get('date_time_seq')), str(row.get('symbol')), row.get('seq') or 0)
+        with self._lock:
+            heapq.heappush(self._heap, (key, next(self._counter), time.monotonic(), row))
+            self.received += 1
+
+    def release(self, flush=False):
+        """ emit rows held longer than the reorder window
+        :param flush: emit every buffered row
+        :return: number of emitted rows
+        """
+        deadline = time.monotonic() - self._window
+        rows = []
+        with self._lock:
+            heap = self._heap
+            while heap and (flush or heap[0][2] <= deadline):
+                key, _, _, row = heapq.heappop(heap)
+                if self._last_key is not None and key < self._last_key:
+                    self.late += 1
+                else:
+                    self._last_key = key
+                rows.append(row)
+        for row in rows:
+            self._emit(row)
+        self.emitted += len(rows)
+        return len(rows)
+
+    def depth(self) -> int:
+        return len(self._heap)
+
+
+class MergeServer(socketserver.ThreadingTCPServer):
+    """ local socket receiving JSON lines (TcpLineSink) from collector workers """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, merger: StreamMerger, host='127.0.0.1', port=0):
+        """ constructor
+        :param merger: stream merger
+        :param host: bind host
+        :param port: bind port (0: any free port)
+        """
+        super().__init__((host, port), _MergeRequestHandler)
+        self.merger = merger
+        self.invalid = 0
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='merge-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _MergeRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        merger = self.server.merger
+        for raw in self.rfile:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                merger.put(json.loads(line))
+            except ValueError:
+                self.server.invalid += 1
+
+
+class _Worker:
+
+    __slots__ = ('worker_id', 'shard', 'process', 'started_at', 'restarts', 'restart_at', 'finished')
+
+    def __init__(self, worker_id, shard):
+        self.worker_id = worker_id
+        self.shard = shard
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.restart_at = None
+        self.finished = False
+
+
+class Supervisor:
+    """ launch collector worker processes over symbol shards, merge their streams and restart crashed workers """
+
+    def __init__(self, config, pipeline, workers=2, host='127.0.0.1', port=0, reorder_window_ms=200,
+                 restart_delay_s=1.0, max_restart_delay_s=30.0, max_restarts=None, poll_interval_ms=100,
+                 stop_timeout_s=10.0):
+        """ constructor
+        :param config: environment configuration (handed to the workers, 1q_api targets are sharded)
+        :param pipeline: sink pipeline of the merged stream (None: merged rows are discarded)
+        :param workers: number of worker processes
+        :param host: merge server host
+        :param port: merge server port (0: any free port)
+        :param reorder_window_ms: time a row is held for ordering
+        :param restart_delay_s: first restart delay (doubled per consecutive crash)
+        :param max_restart_delay_s: maximum restart delay
+        :param max_restarts: restarts per worker (None: unlimited)
+        :param poll_interval_ms: worker check and merge release interval
+        :param stop_timeout_s: graceful stop timeout before a worker is killed
+        """
+        shards = shard_targets(configured_targets(config['1q_api']), workers)
+        if not shards:
+            raise SupervisorProcessException('[supervisor] no targets configured.')
+        self._config = config
+        self._workers = [_Worker(worker_id, shard) for worker_id, shard in enumerate(shards)]
+        self._pipeline = pipeline
+        self._merger = StreamMerger(pipeline.put if pipeline is not None else lambda row: None, reorder_window_ms)
+        self._server = MergeServer(self._merger, host, port)
+        self._restart_delay = float(restart_delay_s)
+        self._max_restart_delay = float(max_restart_delay_s)
+        self._max_restarts = max_restarts
+        self._poll_interval = float(poll_interval_ms) / 1000
+        self._stop_timeout = float(stop_timeout_s)
+        # every worker journals into its own sub directory
+        journal_config = config.get('journal') or {}
+        self._journal_path = journal_config['path'] if journal_config.get('enabled') is True else None
+        # a fresh interpreter per worker (the COM control must not be inherited through fork)
+        self._context = multiprocessing.get_context('spawn')
+        # handed to the workers as parsed, the command line of the supervisor is not theirs to parse
+        self._opts = get_opts()
+        self._stop_event = threading.Event()
+
+    def _start_worker(self, worker):
+        """ start worker process
+        :param worker: worker state
+        :return: void
+        """
+        journal_path = None
+        if self._journal_path:
+            journal_path = '{}/worker-{}'.format(self._journal_path.rstrip('/'), worker.worker_id)
+        worker.process = self._context.Process(
+            target=run_worker, name='collector-worker-{}'.format(worker.worker_id),
+            args=(worker.worker_id, self._config, worker.shard, self._server.server_address[0], self._server.port,
+                  journal_path, self._opts))
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        log.info('[supervisor] worker {} launched. (pid: {}, symbols: {})'
+                 .format(str(worker.worker_id), str(worker.process.pid),
+                         ', '.join(symbol for _, symbol in worker.shard)))
+
+    def _check_worker(self, worker):
+        """ detect exited worker and schedule/perform its restart
+        :param worker: worker state
+        :return: void
+        """
+        if worker.finished:
+            return
+        now = time.monotonic()
+        if worker.restart_at is not None:
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                self._start_worker(worker)
+            return
+        if worker.process.is_alive():
+            return
+        exit_code = worker.process.exitcode
+        if exit_code == 0:
+            worker.finished = True
+            log.info('[supervisor] worker {} finished.'.format(str(worker.worker_id)))
+            return
+        if self._max_restarts is not None and worker.restarts >= self._max_restarts:
+            worker.finished = True
+            log.error('[supervisor] worker {} crashed, restart limit reached. (exit code: {})'
+                      .format(str(worker.worker_id), str(exit_code)))
+            return
+        # back off on consecutive crashes, a worker that ran for a while restarts quickly again
+        if now - worker.started_at > self._max_restart_delay:
+            delay = self._restart_delay
+        else:
+            delay = min(self._max_restart_delay, self._restart_delay * (2 ** min(worker.restarts, 16)))
+        worker.restart_at = now + delay
+        log.error('[supervisor] worker {} crashed. (exit code: {}, restart in {:.1f}s)'
+                  .format(str(worker.worker_id), str(exit_code), delay))
+
+    def run(self) -> dict:
+        """ supervise workers until every worker finished or stop() is called
+        :return: counters dictionary
+        """
+        self._server.start()
+        if self._pipeline is not None:
+            self._pipeline.start()
+        log.info('[supervisor] merge server listening. (port: {}, workers: {})'
+                 .format(str(self._server.port), str(len(self._workers))))
+        try:
+            for worker in self._workers:
+                self._start_worker(worker)
+            while not self._stop_event.is_set():
+                for worker in self._workers:
+                    self._check_worker(worker)
+                self._merger.release()
+                if all(worker.finished for worker in self._workers):
+                    break
+                self._stop_event.wait(self._poll_interval)
+        finally:
+            self._shutdown()
+        stats = self.stats()
+        log.info('[supervisor] finished. {}'.format(str(stats)))
+        return stats
+
+    def stop(self, *args):
+        """ request stop (also used as signal handler)
+        :return: void
+        """
+        self._stop_event.set()
+
+    def _shutdown(self):
+        """ stop workers (terminate, then kill after the stop timeout) and drain the merged stream
+        :return: void
+        """
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(self._stop_timeout)
+            if worker.process.is_alive():
+                log.error('[supervisor] worker {} did not stop, killed.'.format(str(worker.worker_id)))
+                worker.process.kill()
+                worker.process.join()
+        # workers flush their sinks before exiting, give the last lines a moment to arrive
+        time.sleep(self._poll_interval)
+        self._server.stop()
+        self._merger.release(flush=True)
+        if self._pipeline is not None:
+            self._pipeline.stop()
+
+    def stats(self) -> dict:
+        """ supervisor counters
+        :return: counters dictionary
+        """
+        return {
+            'workers': len(self._workers),
+            'restarts': sum(worker.restarts for worker in self._workers),
+            'received': self._merger.received,
+            'emitted': self._merger.emitted,
+            'late': self._merger.late,
+            'reorder_depth': self._merger.depth(),
+            'invalid': self._server.invalid,
+            'sink': self._pipeline.stats() if self._pipeline is not None else None
+        }
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+    Synthetic V00 real block generator
+    author: modorigoon
+    since: 0.2.0
+"""
+import datetime
+import random
+
+_BLOCK_FORMAT = '{:<12}{:<6}{:<16}{:<3}{:<12}{:<3}{:<12}'
+
+
+def format_v00_block(symbol, date_time_seq, bid, ask) -> str:
+    """ format V00 real block (whitespace padded fixed width layout)
+    :param symbol: symbol
+    :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+    :param bid: sell price string
+    :param ask: buy price string
+    :return: real block
+    """
+    return _BLOCK_FORMAT.format(symbol, 'V00', date_time_seq, '2', bid, '2', ask)
+
+
+def generate_v00_blocks(count, symbol='D05GBP/AUD', start=None, ticks_per_second=10, price=1.89234,
+                        spread=0.0002, digits=5, seed=0):
+    """ generate synthetic V00 real blocks (random walk price)
+    :param count: number of blocks
+    :param symbol: symbol
+    :param start: first tick date time (default: 2020-03-02 09:00:00)
+    :param ticks_per_second: ticks sharing the same date time sequence
+    :param price: initial sell price
+    :param spread: buy - sell spread
+    :param digits: price digits
+    :param seed: random seed
+    :return: generator of real blocks
+    """
+    rnd = random.Random(seed)
+    moment = start or datetime.datetime(2020, 3, 2, 9, 0, 0)
+    one_second = datetime.timedelta(seconds=1)
+    step = 10 ** -digits
+    price_format = '{:.' + str(digits) + 'f}'
+    date_time_seq = moment.strftime('%Y%m%d%H%M%S')
+    for i in range(count):
+        if i and i % ticks_per_second == 0:
+            moment += one_second
+            date_time_seq = moment.strftime('%Y%m%d%H%M%S')
+        price = max(step, price + rnd.randint(-3, 3) * step)
+        yield format_v00_block(symbol, date_time_seq, price_format.format(price), price_format.format(price + spread))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+    In-memory ring buffer tick cache
+    author: modorigoon
+    since: 0.2.0
+"""
+import bisect
+import threading
+import time
+from array import array
+from lib.transaction import PRICE_DIGITS
+
+# tick row: (date_time_seq as YYYYMMDDHHMMSS integer, sell price, buy price, seq)
+TICK_COLUMNS = ('date_time_seq', 'price', 'buy_price', 'seq')
+
+
+class TickCacheProcessException(Exception):
+    pass
+
+
+class TickRing:
+    """ most recent ticks of one symbol in preallocated int64 columns (fixed memory, oldest tick overwritten)
+    ticks are kept in date time order: a tick older than the newest cached one is counted as late and not cached
+    (the sink still receives it). the ring is two sorted segments, [oldest, capacity) and [0, next), so range
+    lookups binary search the time column directly.
+    the writer takes no lock: it makes the version odd while a tick is stored, readers copy and retry when the
+    version changed meanwhile (a lock per tick costs more than the rest of the append).
+    """
+
+    __slots__ = ('symbol', 'capacity', 'price_digits', 'late', 'appended', '_times', '_sells', '_buys', '_seqs',
+                 '_next', '_count', '_last_text', '_last_time', '_version')
+
+    def __init__(self, symbol, capacity, price_digits=PRICE_DIGITS):
+        """ constructor
+        :param symbol: symbol
+        :param capacity: number of cached ticks
+        :param price_digits: fixed-point digits of prices
+        """
+        if int(capacity) <= 0:
+            raise TickCacheProcessException('[tick_cache] capacity must be positive.')
+        self.symbol = symbol
+        self.capacity = int(capacity)
+        self.price_digits = price_digits
+        self.late = 0
+        self.appended = 0
+        self._times = array('q', bytes(8 * self.capacity))
+        self._sells = array('q', bytes(8 * self.capacity))
+        self._buys = array('q', bytes(8 * self.capacity))
+        self._seqs = array('q', bytes(8 * self.capacity))
+        self._next = 0
+        self._count = 0
+        self._last_text = None
+        self._last_time = 0
+        self._version = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, date_time_seq, sell, buy, seq) -> bool:
+        """ cache tick (tick path)
+        :param date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+        :param sell: fixed-point sell price
+        :param buy: fixed-point buy price
+        :param seq: sequence number
+        :return: cached (False: late tick)
+        """
+        # consecutive ticks share the date time sequence, converted once per sequence
+        if date_time_seq != self._last_text:
+            date_time = int(date_time_seq)
+            if date_time < self._last_time:
+                self.late += 1
+                return False
+            self._last_text = date_time_seq
+            self._last_time = date_time
+        self._version += 1
+        i = self._next
+        self._times[i] = self._last_time
+        self._sells[i] = sell
+        self._buys[i] = buy
+        self._seqs[i] = seq if seq is not None else -1
+        self._next = i + 1 if i + 1 < self.capacity else 0
+        if self._count < self.capacity:
+            self._count += 1
+        self._version += 1
+        self.appended += 1
+        return True
+
+    def append_transaction(self, transaction) -> bool:
+        """ cache processed transaction (tick path, prices already parsed into the record)
+        :param transaction: transaction record
+        :return: cached (False: late tick)
+        """
+        buy = transaction.buy_price
+        return self.append(transaction.date_time_seq, transaction.price, buy if buy is not None else 0,
+                           transaction.seq)
+
+    def _bisect(self, date_time, right) -> int:
+        """ logical position of date time (reader)
+        :param date_time: date time sequence integer
+        :param right: position after equal times (bisect right)
+        :return: position (0: oldest)
+        """
+        search = bisect.bisect_right if right else bisect.bisect_left
+        times = self._times
+        if self._count < self.capacity or self._next == 0:
+            return search(times, date_time, 0, self._count)
+        oldest = self._next
+        # [oldest, capacity) holds times not after times[0], the oldest of the newer segment
+        if date_time < times[0] or (not right and date_time == times[0]):
+            return search(times, date_time, oldest, self.capacity) - oldest
+        return self.capacity - oldest + search(times, date_time, 0, oldest)
+
+    def _rows(self, start, stop) -> list:
+        """ ticks between logical positions (reader)
+        :param start: first position (0: oldest)
+        :param stop: position after the last tick
+        :return: list of tick rows
+        """
+        if start >= stop:
+            return []
+        oldest = self._next - self._count
+        begin = (oldest + start) % self.capacity
+        end = begin + stop - start
+        if end <= self.capacity:
+            return list(zip(self._times[begin:end], self._sells[begin:end], self._buys[begin:end],
+                            self._seqs[begin:end]))
+        end -= self.capacity
+        return list(zip(self._times[begin:] + self._times[:end], self._sells[begin:] + self._sells[:end],
+                        self._buys[begin:] + self._buys[:end], self._seqs[begin:] + self._seqs[:end]))
+
+    def _read(self, read, *args):
+        """ consistent read (retried while the writer stored a tick meanwhile)
+        :param read: function(*args) reading the ring
+        :param args: arguments
+        :return: read result
+        """
+        while True:
+            version = self._version
+            if not version & 1:
+                result = read(*args)
+                if self._version == version:
+                    return result
+            # let the writer finish the tick
+            time.sleep(0)
+
+    def _latest(self):
+        if self._count == 0:
+            return None
+        i = self._next - 1
+        return self._times[i], self._sells[i], self._buys[i], self._seqs[i]
+
+    def latest(self):
+        """ newest tick
+        :return: tick row or None
+        """
+        return self._read(self._latest)
+
+    def _last(self, count):
+        return self._rows(max(0, self._count - count), self._count)
+
+    def last(self, count) -> list:
+        """ newest ticks (oldest first)
+        :param count: number of ticks
+        :return: list of tick rows
+        """
+        return self._read(self._last, int(count))
+
+    def _range(self, low, high, limit):
+        start = self._bisect(low, False)
+        stop = self._bisect(high, True)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return self._rows(start, stop)
+
+    def range(self, from_date_time_seq, to_date_time_seq, limit=None) -> list:
+        """ ticks between two date time sequences (inclusive, oldest first)
+        :param from_date_time_seq: first date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param to_date_time_seq: last date time sequence (YYYYMMDD or YYYYMMDDHHMMSS)
+        :param limit: maximum number of ticks (None: every tick)
+        :return: list of tick rows
+        """
+        low = int(str(from_date_time_seq).ljust(14, '0'))
+        high = int(str(to_date_time_seq).ljust(14, '9'))
+        return self._read(self._range, low, high, int(limit) if limit is not None else None)
+
+    def _stats(self):
+        return {'cached': self._count, 'capacity': self.capacity, 'appended': self.appended, 'late': self.late,
+                'oldest': self._times[self._next - self._count] if self._count else None,
+                'newest': self._times[self._next - 1] if self._count else None}
+
+    def stats(self) -> dict:
+        return self._read(self._stats)
+
+
+class TickCache:
+    """ tick rings of every symbol (written by the event thread, read by the query server threads) """
+
+    def __init__(self, capacity=100000, price_digits=PRICE_DIGITS):
+        """ constructor
+        :param capacity: cached ticks per symbol
+        :param price_digits: fixed-point digits of prices
+        """
+        self.capacity = int(capacity)
+        self.price_digits = price_digits
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def ring(self, symbol) -> TickRing:
+        """ ring of symbol (created on first use)
+        :param symbol: symbol
+        :return: tick ring
+        """
+        ring = self._rings.get(symbol)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.get(symbol)
+                if ring is None:
+                    ring = TickRing(symbol, self.capacity, self.price_digits)
+                    # replaced, not updated: server threads iterate the rings without the lock
+                    rings = dict(self._rings)
+                    rings[symbol] = ring
+                    self._rings = rings
+        return ring
+
+    def get(self, symbol):
+        """ ring of symbol
+        :param symbol: symbol
+        :return: tick ring or None (symbol not cached)
+        """
+        return self._rings.get(symbol)
+
+    def symbols(self) -> list:
+        return sorted(self._rings)
+
+    def stats(self) -> dict:
+        """ per-symbol counters
+        :return: symbol - counters dictionary
+        """
+        return {symbol: ring.stats() for symbol, ring in self._rings.items()}
+
+
+def create_tick_cache(config):
+    """ create tick cache from configuration
+    :param config: tick cache configuration (None: cache disabled)
+    :return: tick cache or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return TickCache(config.get('capacity', 100000))
+
+
+def create_tick_cache_server(config, cache):
+    """ create the local query endpoint of the tick cache
+    :param config: tick cache configuration
+    :param cache: tick cache (None: cache disabled)
+    :return: tick cache server or None
+    """
+    if cache is None or config.get('port') is None:
+        return None
+    # the HTTP server modules are imported only when the endpoint is enabled
+    from lib.tick_cache_server import TickCacheServer
+    return TickCacheServer(cache, config.get('host', '127.0.0.1'), config['port'])
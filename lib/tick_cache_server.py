@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+    Tick cache query endpoint
+    author: modorigoon
+    since: 0.2.0
+"""
+import http.server
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+from common.logger import log
+from lib.tick_cache import TICK_COLUMNS
+from lib.transaction import fixed_to_price
+
+# maximum number of ticks of one response
+MAX_TICKS = 100000
+
+
+class TickCacheServer(http.server.ThreadingHTTPServer):
+    """ local HTTP endpoint answering tick cache queries (JSON) from background threads
+    GET /symbols                                         cached symbols and ring counters
+    GET /ticks/latest?symbol=S                           newest tick
+    GET /ticks/last?symbol=S&n=N                         newest N ticks (oldest first)
+    GET /ticks/range?symbol=S&from=F&to=T[&limit=N]      ticks between two date time sequences (inclusive)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, cache, host='127.0.0.1', port=9120):
+        """ constructor
+        :param cache: tick cache
+        :param host: bind host
+        :param port: bind port (0: any free port)
+        """
+        super().__init__((host, int(port)), _TickCacheRequestHandler)
+        self.cache = cache
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='tick-cache-server', daemon=True)
+        self._thread.start()
+        log.info('[tick_cache] serving on {}:{}'.format(self.server_address[0], str(self.port)))
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+
+def _to_dict(symbol, row, digits) -> dict:
+    tick = dict(zip(TICK_COLUMNS, row))
+    tick['symbol'] = symbol
+    tick['date_time_seq'] = str(tick['date_time_seq'])
+    tick['price_text'] = fixed_to_price(tick['price'], digits)
+    tick['buy_price_text'] = fixed_to_price(tick['buy_price'], digits)
+    return tick
+
+
+class _TickCacheRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        cache = self.server.cache
+        if url.path == '/symbols':
+            self._send(200, cache.stats())
+            return
+        if url.path not in ('/ticks/latest', '/ticks/last', '/ticks/range'):
+            self._send(404, {'error': 'unknown path: {}'.format(url.path)})
+            return
+        ring = cache.get(query.get('symbol'))
+        if ring is None:
+            self._send(404, {'error': 'symbol not cached: {}'.format(query.get('symbol'))})
+            return
+        try:
+            if url.path == '/ticks/latest':
+                row = ring.latest()
+                self._send(200, _to_dict(ring.symbol, row, ring.price_digits) if row is not None else None)
+                return
+            if url.path == '/ticks/last':
+                rows = ring.last(min(int(query.get('n', 1)), MAX_TICKS))
+            else:
+                rows = ring.range(query['from'], query['to'], min(int(query.get('limit', MAX_TICKS)), MAX_TICKS))
+        except (KeyError, ValueError) as _e:
+            self._send(400, {'error': 'invalid query: {}'.format(str(_e))})
+            return
+        self._send(200, [_to_dict(ring.symbol, row, ring.price_digits) for row in rows])
+
+    def _send(self, status, document):
+        body = json.dumps(document, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format, *args):
+        pass
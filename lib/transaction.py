@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+    Transaction record and fast V00 block parser
+    author: modorigoon
+    since: 0.2.0
+"""
+from collections import namedtuple
+from util.datetime_util import sequence_to_epoch
+
+# V00 real block layout (whitespace separated)
+DATE_TIME_SEQ_FIELD = 2
+PRICE_FIELD = 4
+BUY_PRICE_FIELD = 6
+
+# fixed-point price: 1.89234 -> 189234 (PRICE_DIGITS = 5)
+PRICE_DIGITS = 5
+
+
+class TransactionParseException(Exception):
+    pass
+
+
+class Transaction(namedtuple('Transaction', 'symbol date_time_seq price seq buy_price', defaults=(None,))):
+    """ compact transaction record
+    symbol: symbol
+    date_time_seq: date time sequence (YYYYMMDDHHMMSS)
+    price: fixed-point sell (transaction) price (scaled by 10 ** PRICE_DIGITS)
+    seq: sequence number
+    buy_price: fixed-point buy price of the block (None: unknown)
+    """
+
+    __slots__ = ()
+
+    def to_dict(self, digits=PRICE_DIGITS) -> dict:
+        """ convert to dictionary
+        :param digits: fixed-point digits of price
+        :return: transaction dictionary
+        """
+        return {
+            'symbol': self.symbol,
+            'date_time_seq': self.date_time_seq,
+            'price': self.price,
+            'price_text': fixed_to_price(self.price, digits),
+            'buy_price': self.buy_price,
+            'seq': self.seq
+        }
+
+
+def price_to_fixed(text: str, digits=PRICE_DIGITS) -> int:
+    """ convert decimal price string to fixed-point integer (extra digits are truncated)
+    :param text: price string (ex: 1.89234)
+    :param digits: fixed-point digits
+    :return: fixed-point price (ex: 189234)
+    """
+    whole, _, fraction = text.partition('.')
+    length = len(fraction)
+    if length == digits:
+        return int(whole + fraction)
+    if length < digits:
+        return int(whole + fraction + '0' * (digits - length))
+    return int(whole + fraction[:digits])
+
+
+def fixed_to_price(value: int, digits=PRICE_DIGITS) -> str:
+    """ convert fixed-point integer to decimal price string
+    :param value: fixed-point price
+    :param digits: fixed-point digits
+    :return: price string
+    """
+    if value is None:
+        return None
+    if digits == 0:
+        return str(value)
+    sign = '-' if value < 0 else ''
+    whole, fraction = divmod(abs(value), 10 ** digits)
+    return '{}{}.{}'.format(sign, whole, str(fraction).zfill(digits))
+
+
+def date_time_sequence_to_epoch(sequence: str) -> float:
+    """ convert date time sequence to epoch seconds (sequence taken as UTC wall clock)
+    :param sequence: date time sequence (YYYYMMDDHHMMSS)
+    :return: epoch seconds
+    """
+    return float(sequence_to_epoch(sequence))
+
+
+class TransactionParser:
+    """ V00 block parser bound to a fixed field layout
+    the block is split only up to the last needed field (no join/re-split of the whole block) and the sell and
+    buy prices are converted once into the record, so later consumers (tick cache, bars, wire) never split the
+    block again. prices with exactly price_digits fraction digits take the fast path (remove the dot and convert
+    once).
+    """
+
+    def __init__(self, symbol=None, date_time_seq_field=DATE_TIME_SEQ_FIELD, price_field=PRICE_FIELD,
+                 price_digits=PRICE_DIGITS, buy_price_field=BUY_PRICE_FIELD):
+        """ constructor
+        :param symbol: symbol set into parsed records
+        :param date_time_seq_field: index of date time sequence field
+        :param price_field: index of price field
+        :param price_digits: fixed-point digits of price
+        :param buy_price_field: index of buy price field
+        """
+        fields = (date_time_seq_field, price_field, buy_price_field)
+        if len(set(fields)) != len(fields) or min(fields) < 0:
+            raise TransactionParseException('[parse] invalid field layout.')
+        self._symbol = symbol
+        self._price_digits = price_digits
+        self._parse = self._bind(date_time_seq_field, price_field, buy_price_field)
+
+    @property
+    def price_digits(self):
+        return self._price_digits
+
+    def _bind(self, date_time_seq_field, price_field, buy_price_field):
+        """ parse function closed over the field layout (hot path: locals and cells only, no attribute lookup)
+        :param date_time_seq_field: index of date time sequence field
+        :param price_field: index of price field
+        :param buy_price_field: index of buy price field
+        :return: parse function
+        """
+        symbol = self._symbol
+        digits = self._price_digits
+        max_split = max(date_time_seq_field, price_field, buy_price_field) + 1
+        dot_index = -digits - 1
+        dot_end = -digits if digits else None
+        new_record = tuple.__new__
+
+        def parse(block, seq=None):
+            fields = block.split(None, max_split)
+            price = fields[price_field]
+            buy = fields[buy_price_field]
+            if price[dot_index:dot_end] == '.' and buy[dot_index:dot_end] == '.':
+                return new_record(Transaction, (symbol, fields[date_time_seq_field], int(price.replace('.', '', 1)),
+                                                seq, int(buy.replace('.', '', 1))))
+            return new_record(Transaction, (symbol, fields[date_time_seq_field], price_to_fixed(price, digits), seq,
+                                            price_to_fixed(buy, digits)))
+
+        return parse
+
+    def parse(self, block, seq=None) -> Transaction:
+        """ parse V00 block
+        :param block: raw real block
+        :param seq: sequence number
+        :return: transaction record
+        """
+        try:
+            return self._parse(block, seq)
+        except (AttributeError, IndexError, ValueError) as _e:
+            raise TransactionParseException('[parse] invalid transaction block. ({})'.format(repr(block))) from _e
+
+    def parse_function(self):
+        """ bound parse function without error translation (hot path)
+        :return: parse(block, seq=None) function
+        """
+        return self._parse
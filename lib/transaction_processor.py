@@ -5,17 +5,43 @@
     since: 0.1.0
 """
 import itertools
+import logging
 from common.logger import log
+from lib.metrics import REGISTRY
+from lib.transaction import Transaction, TransactionParser, PRICE_DIGITS
+
+_PROCESSED = REGISTRY.counter('hana1q_ticks_processed_total', 'Parsed real transactions.', ('symbol',))
+_SENT = REGISTRY.counter('hana1q_ticks_sent_total', 'Transactions accepted by the sink pipeline.', ('symbol',))
+_SEND_FAILED = REGISTRY.counter('hana1q_ticks_send_failed_total', 'Transactions rejected by the sink pipeline.',
+                                ('symbol',))
+_DUPLICATED = REGISTRY.counter('hana1q_ticks_duplicated_total', 'Re-delivered transactions dropped.', ('symbol',))
 
 
 class TransactionProcessor:
 
-    def __init__(self):
+    def __init__(self, pipeline=None, symbol=None, price_digits=PRICE_DIGITS, sequences=None, tick_cache=None):
+        """ constructor
+        :param pipeline: sink pipeline (None: transactions are not forwarded)
+        :param symbol: symbol of processed transactions
+        :param price_digits: fixed-point digits of price
+        :param sequences: sequence store (None: sequences restart at 0, no duplicate detection)
+        :param tick_cache: in-memory tick cache (None: recent ticks are not cached)
+        """
         self.counter = itertools.count()
+        self._symbol = symbol
+        self._sequences = sequences
+        self._pipeline = pipeline
+        self._parser = TransactionParser(symbol, price_digits=price_digits)
+        self._ring = tick_cache.ring(symbol) if tick_cache is not None else None
+        label = str(symbol) if symbol is not None else ''
+        self._processed = _PROCESSED.labels(label)
+        self._sent = _SENT.labels(label)
+        self._send_failed = _SEND_FAILED.labels(label)
+        self._duplicated = _DUPLICATED.labels(label)
 
     @staticmethod
     def parse(transaction):
-        """ parsing transaction string
+        """ parsing transaction string (legacy parser, kept for comparison)
         :param transaction: transaction string
         :return: transaction object(seq, price)
         """
@@ -25,23 +51,41 @@ class TransactionProcessor:
             'price': as_list[4]
         }
 
-    @staticmethod
-    def send(transaction_object) -> bool:
+    def send(self, transaction_object) -> bool:
         """ forward to the message pipe cache
         :param transaction_object: transaction object
         :return: send message successful
         """
-        log.info('[send] transaction: {}'.format(str(transaction_object)))
-        # send to MQ or storage
-        return True
+        if self._pipeline is None:
+            return True
+        # queued here, written to MQ or storage by the pipeline writer thread
+        return self._pipeline.put(transaction_object)
 
     def process(self, transaction_source):
         """ transaction processing
         :param transaction_source: transaction string
-        :return: transaction object
+        :return: transaction record (seq None: duplicated, not sent)
         """
-        transaction = self.parse(transaction_source)
-        transaction['seq'] = next(self.counter)
+        if self._sequences is None:
+            transaction = self._parser.parse(transaction_source, next(self.counter))
+        else:
+            transaction = self._parser.parse(transaction_source)
+            seq = self._sequences.assign(self._symbol, transaction.date_time_seq, transaction.price)
+            if seq is None:
+                self._duplicated.inc()
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('[process] duplicated transaction: %r', transaction)
+                return transaction
+            transaction = tuple.__new__(Transaction, (transaction[0], transaction[1], transaction[2], seq,
+                                                      transaction[4]))
+        self._processed.inc()
+        if self._ring is not None:
+            self._ring.append_transaction(transaction)
         send_successful = self.send(transaction)
-        log.info('[process] transaction: {}, sent: {}'.format(str(transaction), str(send_successful)))
+        if send_successful:
+            self._sent.inc()
+        else:
+            self._send_failed.inc()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('[process] transaction: %r, sent: %s', transaction, send_successful)
         return transaction
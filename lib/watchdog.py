@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+    Connection watchdog
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import os
+import time
+from common.config import resolve_path
+from common.logger import log
+from lib.metrics import REGISTRY
+from lib.scheduler import PeriodicTask
+
+_OUTAGES = REGISTRY.counter('hana1q_outages_total', 'Detected agent session or tick flow outages.')
+_RECONNECTS = REGISTRY.counter('hana1q_reconnects_total', 'Reconnect attempts.', ('result',))
+_RECONNECT_SECONDS = REGISTRY.histogram('hana1q_reconnect_seconds', 'Reconnect and resubscribe latency.')
+
+
+class ConnectionWatchdog:
+    """ probe the agent session and real data flow, reconnect and resubscribe with exponential backoff
+    every outage is recorded as a gap window (last tick before the outage - first tick after recovery)
+    so it can be backfilled. checks run on the agent event thread (app.call_soon), never concurrently with real
+    event handling.
+    """
+
+    def __init__(self, app, interval_s=5, inactivity_s=120, backoff_initial_s=1.0, backoff_max_s=60.0,
+                 max_attempts=None, gap_path=None, detector=None):
+        """ constructor
+        :param app: application (get_connection_state, reconnect, get_state)
+        :param interval_s: probe interval
+        :param inactivity_s: reconnect when no tick arrived for this long (0: disabled)
+        :param backoff_initial_s: delay after the first failed reconnect (doubled per failure)
+        :param backoff_max_s: maximum reconnect delay
+        :param max_attempts: reconnect attempts per outage (None: unlimited)
+        :param gap_path: gap windows are appended to this JSON lines file (None: kept in memory only)
+        :param detector: gap detector, inactivity is ignored while its session threshold is 0 (market closed) and
+                         at least the session threshold otherwise (None: inactivity_s all day)
+        """
+        self._app = app
+        self._task = PeriodicTask('connection-watchdog', interval_s, self._post_check)
+        self._check_pending = False
+        self._detector = detector
+        self._inactivity = float(inactivity_s)
+        self._backoff_initial = float(backoff_initial_s)
+        self._backoff_max = float(backoff_max_s)
+        self._max_attempts = max_attempts
+        self._gap_path = resolve_path(gap_path) if gap_path else None
+
+        self._last_tick_count = 0
+        self._last_tick_at = time.monotonic()
+        self._outage = None
+        self._attempts = 0
+        self._next_attempt_at = 0.0
+        self.gaps = []
+
+        self.outages = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.last_reconnect_ms = 0.0
+        self.max_reconnect_ms = 0.0
+        self.last_downtime_s = 0.0
+        self.total_downtime_s = 0.0
+
+    # -------------------------------------------------------------------------------------------------
+    # scheduling part
+    # -------------------------------------------------------------------------------------------------
+
+    def start(self):
+        """ start periodic checks
+        :return: void
+        """
+        self._last_tick_count = self._app.get_state().tick_count
+        self._last_tick_at = time.monotonic()
+        self._task.start()
+        log.info('[watchdog] started. (interval: {}s, inactivity: {}s)'.format(self._task.interval, self._inactivity))
+
+    def stop(self):
+        """ stop periodic checks
+        :return: void
+        """
+        self._task.stop()
+
+    def _post_check(self):
+        """ timer callback: run check on the agent event thread (one pending check at most)
+        :return: void
+        """
+        if self._check_pending:
+            return
+        self._check_pending = True
+        self._app.call_soon(self._run_check)
+
+    def _run_check(self):
+        self._check_pending = False
+        self.check()
+
+    # -------------------------------------------------------------------------------------------------
+    # probe part
+    # -------------------------------------------------------------------------------------------------
+
+    def _inactivity_limit(self) -> float:
+        """ tick inactivity considered an outage now
+        :return: seconds (0: disabled)
+        """
+        if self._inactivity <= 0 or self._detector is None:
+            return self._inactivity
+        threshold = self._detector.threshold(time.strftime('%Y%m%d%H%M%S'))
+        return max(self._inactivity, threshold) if threshold > 0 else 0.0
+
+    def _probe(self):
+        """ check session and tick flow
+        :return: (session alive, seconds since the last tick)
+        """
+        now = time.monotonic()
+        tick_count = self._app.get_state().tick_count
+        if tick_count != self._last_tick_count:
+            self._last_tick_count = tick_count
+            self._last_tick_at = now
+        return self._app.get_connection_state(), now - self._last_tick_at
+
+    def check(self):
+        """ probe and reconnect when required (agent event thread)
+        :return: void
+        """
+        try:
+            alive, idle = self._probe()
+            limit = self._inactivity_limit()
+            stale = 0 < limit < idle
+            outage = self._outage
+            if outage is None:
+                if alive and not stale:
+                    return
+                self._open_outage('session lost' if not alive else 'no tick for {:.0f}s'.format(idle))
+            elif alive:
+                if self._app.get_state().tick_count > outage['tick_count']:
+                    self._close_outage()
+                    return
+                if outage['reconnected_at'] is not None:
+                    if not stale:
+                        # reconnected, waiting for the first tick
+                        return
+                    # reconnected but still no tick: the next attempt backs off like a failed one
+                    outage['reconnected_at'] = None
+                    self.failures += 1
+                    delay = self._backoff()
+                    log.error('[watchdog] no tick after reconnect. (attempt: {}, retry in {:.1f}s)'
+                              .format(self._attempts, delay))
+            self._reconnect()
+        except Exception as _e:
+            log.error('[watchdog] check ERROR: {}'.format(str(_e)))
+
+    # -------------------------------------------------------------------------------------------------
+    # outage part
+    # -------------------------------------------------------------------------------------------------
+
+    def _open_outage(self, reason):
+        state = self._app.get_state()
+        last = state.last_transaction
+        self.outages += 1
+        _OUTAGES.inc()
+        self._attempts = 0
+        self._next_attempt_at = 0.0
+        self._outage = {
+            'reason': reason,
+            'detected_at': time.time(),
+            'detected_monotonic': time.monotonic(),
+            'reconnected_at': None,
+            'tick_count': state.tick_count,
+            'from_date_time_seq': last.date_time_seq if last is not None else None
+        }
+        log.error('[watchdog] outage detected: {} (last tick: {})'
+                  .format(reason, str(self._outage['from_date_time_seq'])))
+
+    def _reconnect(self):
+        """ reconnect and resubscribe (exponential backoff between failed attempts)
+        :return: void
+        """
+        now = time.monotonic()
+        if now < self._next_attempt_at:
+            return
+        if self._max_attempts is not None and self._attempts >= self._max_attempts:
+            return
+        self._attempts += 1
+        started_at = time.perf_counter()
+        try:
+            successful = self._app.reconnect()
+        except Exception as _e:
+            log.error('[watchdog] reconnect ERROR: {}'.format(str(_e)))
+            successful = False
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        _RECONNECT_SECONDS.observe(elapsed_ms / 1000)
+        _RECONNECTS.labels('success' if successful else 'failure').inc()
+        if successful:
+            self.reconnects += 1
+            self.last_reconnect_ms = elapsed_ms
+            self.max_reconnect_ms = max(self.max_reconnect_ms, elapsed_ms)
+            self._outage['reconnected_at'] = time.time()
+            self._outage['tick_count'] = self._app.get_state().tick_count
+            self._last_tick_at = time.monotonic()
+            log.info('[watchdog] reconnected. (attempt: {}, reconnect: {:.1f}ms)'.format(self._attempts, elapsed_ms))
+            return
+        self.failures += 1
+        delay = self._backoff()
+        log.error('[watchdog] reconnect failed. (attempt: {}, retry in {:.1f}s)'.format(self._attempts, delay))
+
+    def _backoff(self) -> float:
+        """ delay the next reconnect attempt (doubled per attempt of the outage)
+        :return: delay seconds
+        """
+        delay = min(self._backoff_max, self._backoff_initial * (2 ** min(max(self._attempts - 1, 0), 16)))
+        self._next_attempt_at = time.monotonic() + delay
+        return delay
+
+    def _close_outage(self):
+        """ ticks are flowing again: record the gap window
+        :return: void
+        """
+        outage = self._outage
+        self._outage = None
+        self._attempts = 0
+        self._next_attempt_at = 0.0
+        state = self._app.get_state()
+        downtime = time.monotonic() - outage['detected_monotonic']
+        self.last_downtime_s = downtime
+        self.total_downtime_s += downtime
+        gap = {
+            'reason': outage['reason'],
+            'detected_at': outage['detected_at'],
+            'reconnected_at': outage['reconnected_at'],
+            'recovered_at': time.time(),
+            'downtime_s': round(downtime, 3),
+            'from_date_time_seq': outage['from_date_time_seq'],
+            'to_date_time_seq': state.last_transaction.date_time_seq if state.last_transaction is not None else None,
+            'symbols': self._app.get_symbols()
+        }
+        self.gaps.append(gap)
+        log.info('[watchdog] recovered. {}'.format(json.dumps(gap)))
+        if self._gap_path is not None:
+            parent = os.path.dirname(self._gap_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with open(self._gap_path, 'a', encoding='utf-8') as wf:
+                wf.write(json.dumps(gap) + '\n')
+
+    def stats(self) -> dict:
+        """ watchdog counters
+        :return: counters dictionary
+        """
+        return {
+            'down': self._outage is not None,
+            'outages': self.outages,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'last_reconnect_ms': round(self.last_reconnect_ms, 3),
+            'max_reconnect_ms': round(self.max_reconnect_ms, 3),
+            'last_downtime_s': round(self.last_downtime_s, 3),
+            'total_downtime_s': round(self.total_downtime_s, 3),
+            'gaps': len(self.gaps)
+        }
+
+
+def create_watchdog(config, app, detector=None):
+    """ create connection watchdog from configuration
+    :param config: watchdog configuration (None: watchdog disabled)
+    :param app: application
+    :param detector: gap detector (session thresholds gate inactivity, None: inactivity_s all day)
+    :return: watchdog or None
+    """
+    if not config or config.get('enabled') is not True:
+        return None
+    return ConnectionWatchdog(app, interval_s=config.get('interval_s', 5),
+                              inactivity_s=config.get('inactivity_s', 120),
+                              backoff_initial_s=config.get('backoff_initial_s', 1.0),
+                              backoff_max_s=config.get('backoff_max_s', 60.0),
+                              max_attempts=config.get('max_attempts'),
+                              gap_path=config.get('gap_path'), detector=detector)
@@ -8,6 +8,8 @@ from datetime import datetime
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
+import util.datetime_util as datetime_util
+from lib.transaction import fixed_to_price
 
 
 class Window(QMainWindow):
@@ -24,10 +26,16 @@ class Window(QMainWindow):
     _LOGO_WIDTH_SIZE = 185
     _LOGO_HEIGHT_SIZE = 45
 
-    def __init__(self, name=''):
+    def __init__(self, name='', max_log_lines=1000):
         super().__init__()
 
         self._name = name
+        self._max_log_lines = int(max_log_lines)
+        self._status_text = None
+        self._refresh_timer = None
+        self._state = None
+        self._stats_provider = None
+        self._shown_transaction = None
         self._real_text = None
         self._symbol_text = None
         self._log_text = None
@@ -111,11 +119,27 @@ class Window(QMainWindow):
         self._received_at_text.setFont(QFont('Verdana', 9))
         self._received_at_text.move(130, 170)
 
-        # LOG
-        self._log_text = QTextEdit(self)
-        self._log_text.setFixedSize(self._WINDOW_WIDTH_SIZE - 50, (self._WINDOW_HEIGHT_SIZE / 2) - 30)
+        # STATUS (ticks/sec, sink queue depth)
+        status_label = QLabel(self)
+        status_label.setFont(bold_font)
+        status_label.setFixedWidth(180)
+        status_label.setPalette(bold_font_palette)
+        status_label.setText("STATUS")
+        status_label.move(20, 210)
+
+        self._status_text = QLineEdit(self)
+        self._status_text.setFixedWidth(340)
+        self._status_text.setFont(QFont('Verdana', 9))
+        self._status_text.setReadOnly(True)
+        self._status_text.move(130, 210)
+
+        # LOG (bounded: the oldest lines are removed beyond max_log_lines)
+        self._log_text = QPlainTextEdit(self)
+        self._log_text.setReadOnly(True)
+        self._log_text.setMaximumBlockCount(self._max_log_lines)
+        self._log_text.setFixedSize(self._WINDOW_WIDTH_SIZE - 50, (self._WINDOW_HEIGHT_SIZE / 2) - 60)
         self._log_text.setFont(QFont('Verdana', 9))
-        self._log_text.move(20, 210)
+        self._log_text.move(20, 250)
 
         # START
         self._run_button = QPushButton('START', self)
@@ -207,4 +231,57 @@ class Window(QMainWindow):
         :param message: log message
         :return: void
         """
-        self._log_text.append(message)
+        self._log_text.appendPlainText(message)
+
+    def set_status(self, status: str):
+        """ set status line
+        :param status: status text
+        :return: void
+        """
+        self._status_text.setText(status)
+
+    def bind_state(self, state, refresh_hz=5, stats_provider=None):
+        """ refresh window from collector state at a fixed frame rate
+        :param state: collector state
+        :param refresh_hz: refresh frequency
+        :param stats_provider: function returning sink counters (or None)
+        :return: void
+        """
+        self._state = state
+        self._stats_provider = stats_provider
+        if self._refresh_timer is None:
+            self._refresh_timer = QTimer(self)
+            self._refresh_timer.timeout.connect(self.refresh)
+        self._refresh_timer.start(max(1, int(1000 / float(refresh_hz))))
+
+    def unbind_state(self):
+        """ stop refresh timer
+        :return: void
+        """
+        if self._refresh_timer is not None:
+            self._refresh_timer.stop()
+        self.refresh()
+        self._state = None
+
+    def refresh(self):
+        """ coalesced update of every state widget (one repaint per frame regardless of tick rate)
+        :return: void
+        """
+        state = self._state
+        if state is None:
+            return
+        lines = state.drain_log()
+        if lines:
+            self._log_text.appendPlainText('\n'.join(lines))
+        transaction = state.last_transaction
+        if transaction is not None and transaction is not self._shown_transaction:
+            self._shown_transaction = transaction
+            received_at = datetime_util.datetime_sequence_to_datetime(transaction.date_time_seq)
+            if received_at is not None:
+                self.set_received_at(received_at)
+            self.set_last_transaction('ID: {}, VALUE: {}'.format(str(transaction.seq),
+                                                                 fixed_to_price(transaction.price)))
+        stats = self._stats_provider() if self._stats_provider is not None else None
+        queue_depth = stats['queue_depth'] if stats else 0
+        self.set_status('{:,.1f} ticks/s, queue: {:,}, ticks: {:,}, duplicated: {:,}'
+                        .format(state.ticks_per_second(), queue_depth, state.tick_count, state.duplicated_count))
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+    Binary wire format of transactions (fixed-width records and delta batch codec)
+    author: modorigoon
+    since: 0.2.0
+"""
+import functools
+import itertools
+import math
+import operator
+import struct
+from collections import namedtuple
+from lib.transaction import PRICE_DIGITS
+from util.datetime_util import sequence_to_epoch
+
+WIRE_VERSION = 1
+# date time sequences are exchange wall clock, Korea Standard Time (UTC+9, no daylight saving time)
+EXCHANGE_UTC_OFFSET_S = 9 * 3600
+
+# record flags
+FLAG_NO_ASK = 0x01
+FLAG_NO_SEQ = 0x02
+
+# fixed-width record (36 bytes, little endian):
+# version (uint8), symbol id (uint16), epoch micros (int64), bid (int64), ask (int64), seq (int64), flags (uint8)
+# bid/ask are fixed-point prices (scaled by 10 ** price digits). bid is the transaction (sell) price, ask the buy price
+# of the block (0 with FLAG_NO_ASK), seq is -1 with FLAG_NO_SEQ.
+_RECORD_FORMAT = 'BHqqqqB'
+_RECORD = struct.Struct('<' + _RECORD_FORMAT)
+RECORD_SIZE = _RECORD.size
+_RECORD_FIELDS = 7
+
+# delta batch:
+# header: magic, version, price digits, symbol count, record count
+# symbol names: length (uint8) + utf-8, index = symbol id of the batch
+# base row: epoch micros, bid, spread (ask - bid), seq of the first record (int64)
+# columns: byte length (uint32), delta unit (uint64) + varints of symbol ids, zigzag deltas of epoch micros, bid,
+#          spread and seq (divided by the delta unit, the greatest common divisor of the deltas), flags
+BATCH_MAGIC = b'HQWB'
+_BATCH_HEADER = struct.Struct('<4sBBHI')
+_BATCH_BASE = struct.Struct('<qqqq')
+_COLUMN_HEADER = struct.Struct('<IQ')
+# stream of batches: byte length (uint32) before every batch
+_FRAME_HEADER = struct.Struct('<I')
+_ZIGZAG_COLUMNS = (False, True, True, True, True, False)
+
+# single byte varints of zigzag values (most deltas of a tick batch)
+_UNZIGZAG = tuple((value >> 1) ^ -(value & 1) for value in range(128))
+
+
+class WireProcessException(Exception):
+    pass
+
+
+class WireRecord(namedtuple('WireRecord', 'symbol_id epoch_us bid ask seq flags')):
+    """ transaction in wire representation
+    symbol_id: symbol id (ref. SymbolTable)
+    epoch_us: epoch microseconds (UTC)
+    bid: fixed-point bid price
+    ask: fixed-point ask price (0 with FLAG_NO_ASK)
+    seq: sequence number (-1 with FLAG_NO_SEQ)
+    flags: record flags
+    """
+
+    __slots__ = ()
+
+
+_new_record = functools.partial(tuple.__new__, WireRecord)
+
+
+class SymbolTable:
+    """ symbol - symbol id (in registration order) """
+
+    def __init__(self, symbols=()):
+        self._ids = {}
+        self.symbols = []
+        for symbol in symbols:
+            self.id(symbol)
+
+    def id(self, symbol) -> int:
+        """ id of symbol (registered on first use)
+        :param symbol: symbol
+        :return: symbol id
+        """
+        symbol_id = self._ids.get(symbol)
+        if symbol_id is None:
+            if len(self.symbols) > 0xFFFF:
+                raise WireProcessException('[wire] symbol table full. (symbol: {})'.format(str(symbol)))
+            symbol_id = self._ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def symbol(self, symbol_id):
+        return self.symbols[symbol_id]
+
+
+def to_record(transaction, symbols: SymbolTable, ask=None, utc_offset_s=EXCHANGE_UTC_OFFSET_S) -> WireRecord:
+    """ convert transaction to wire record
+    :param transaction: transaction record
+    :param symbols: symbol table
+    :param ask: fixed-point buy price (None: buy price of the record)
+    :param utc_offset_s: UTC offset of the date time sequence wall clock
+    :return: wire record
+    """
+    flags = 0
+    if ask is None:
+        ask = transaction.buy_price
+    if ask is None:
+        ask = 0
+        flags |= FLAG_NO_ASK
+    seq = transaction.seq
+    if seq is None:
+        seq = -1
+        flags |= FLAG_NO_SEQ
+    return _new_record((symbols.id(transaction.symbol),
+                        (sequence_to_epoch(transaction.date_time_seq) - utc_offset_s) * 1000000,
+                        transaction.price, ask, seq, flags))
+
+
+# -------------------------------------------------------------------------------------------------
+# fixed-width records
+# -------------------------------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=64)
+def _records_struct(count) -> struct.Struct:
+    return struct.Struct('<' + _RECORD_FORMAT * count)
+
+
+def encode_record(record) -> bytes:
+    return _RECORD.pack(WIRE_VERSION, *record)
+
+
+def decode_record(data, offset=0) -> WireRecord:
+    """ decode one fixed-width record
+    :param data: bytes-like
+    :param offset: record offset
+    :return: wire record
+    """
+    row = _RECORD.unpack_from(data, offset)
+    if row[0] != WIRE_VERSION:
+        raise WireProcessException('[wire] unsupported record version: {}'.format(str(row[0])))
+    return _new_record(row[1:])
+
+
+def encode_records(records) -> bytes:
+    """ encode records as consecutive fixed-width records (one pack call per batch)
+    :param records: list of wire records
+    :return: encoded records
+    """
+    prefix = (WIRE_VERSION,)
+    return _records_struct(len(records)).pack(*itertools.chain.from_iterable(map(prefix.__add__, records)))
+
+
+def decode_records(data) -> list:
+    """ decode consecutive fixed-width records (one unpack call per batch)
+    :param data: bytes-like (multiple of RECORD_SIZE)
+    :return: list of wire records
+    """
+    count, remainder = divmod(len(data), RECORD_SIZE)
+    if remainder:
+        raise WireProcessException('[wire] truncated records. (size: {})'.format(str(len(data))))
+    values = _records_struct(count).unpack(data)
+    if values[0::_RECORD_FIELDS].count(WIRE_VERSION) != count:
+        raise WireProcessException('[wire] unsupported record version.')
+    return list(map(_new_record, zip(*(values[i::_RECORD_FIELDS] for i in range(1, _RECORD_FIELDS)))))
+
+
+# -------------------------------------------------------------------------------------------------
+# delta batch
+# -------------------------------------------------------------------------------------------------
+
+def _encode_varints(values) -> bytes:
+    """ unsigned LEB128 of every value (values below 0x80 are their own encoding)
+    :param values: list of non-negative integers
+    :return: encoded column
+    """
+    if not values or max(values) < 0x80:
+        return bytes(values)
+    encoded = bytearray()
+    append = encoded.append
+    for value in values:
+        while value >= 0x80:
+            append((value & 0x7F) | 0x80)
+            value >>= 7
+        append(value)
+    return bytes(encoded)
+
+
+def _decode_varints(data, count) -> list:
+    """ decode count unsigned LEB128 values
+    :param data: encoded column
+    :param count: number of values
+    :return: list of integers
+    """
+    if len(data) == count:
+        return list(data)
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        else:
+            append(value | (byte << shift))
+            value = shift = 0
+    if len(values) != count:
+        raise WireProcessException('[wire] corrupted column. (values: {}, expected: {})'
+                                   .format(str(len(values)), str(count)))
+    return values
+
+
+def _deltas(column):
+    """ zigzag encoded differences to the previous value (first value: 0) in units of their greatest common divisor
+    (date time sequences have second resolution: epoch micros deltas become 0 or 1)
+    :param column: list of integers
+    :return: (list of non-negative integers, delta unit)
+    """
+    deltas = list(map(operator.sub, column, column[:1] + column[:-1]))
+    unit = math.gcd(*deltas) or 1
+    if unit > 1:
+        deltas = [delta // unit for delta in deltas]
+    return [(delta << 1) ^ (delta >> 63) for delta in deltas], unit
+
+
+def _accumulate(base, values, unit, single_byte) -> list:
+    if single_byte:
+        deltas = map(_UNZIGZAG.__getitem__, values)
+    else:
+        deltas = ((value >> 1) ^ -(value & 1) for value in values)
+    if unit > 1:
+        deltas = map(operator.mul, deltas, itertools.repeat(unit))
+    return list(itertools.accumulate(deltas, initial=base))[1:]
+
+
+def encode_batch(records, symbols=(), price_digits=PRICE_DIGITS) -> bytes:
+    """ encode records as delta batch (columns of varint deltas)
+    :param records: list of wire records
+    :param symbols: symbol names by symbol id, embedded in the batch (ex: SymbolTable.symbols)
+    :param price_digits: fixed-point digits of prices
+    :return: encoded batch
+    """
+    encoded_symbols = [str(symbol).encode('utf-8') for symbol in symbols]
+    parts = [_BATCH_HEADER.pack(BATCH_MAGIC, WIRE_VERSION, price_digits, len(encoded_symbols), len(records))]
+    parts.extend(bytes((len(symbol),)) + symbol for symbol in encoded_symbols)
+    if not records:
+        return b''.join(parts)
+    symbol_ids, epochs, bids, asks, seqs, flags = map(list, zip(*records))
+    spreads = [0 if flag & FLAG_NO_ASK else ask - bid for bid, ask, flag in zip(bids, asks, flags)]
+    parts.append(_BATCH_BASE.pack(epochs[0], bids[0], spreads[0], seqs[0]))
+    for column, unit in ((symbol_ids, 1), _deltas(epochs), _deltas(bids), _deltas(spreads), _deltas(seqs), (flags, 1)):
+        encoded = _encode_varints(column)
+        parts.append(_COLUMN_HEADER.pack(len(encoded), unit))
+        parts.append(encoded)
+    return b''.join(parts)
+
+
+def decode_batch(data):
+    """ decode delta batch
+    :param data: encoded batch
+    :return: (list of wire records, list of symbol names by symbol id, price digits)
+    """
+    data = memoryview(data)
+    magic, version, price_digits, symbol_count, count = _BATCH_HEADER.unpack_from(data, 0)
+    if magic != BATCH_MAGIC or version != WIRE_VERSION:
+        raise WireProcessException('[wire] unsupported batch. (magic: {}, version: {})'
+                                   .format(repr(magic), str(version)))
+    offset = _BATCH_HEADER.size
+    symbols = []
+    for _ in range(symbol_count):
+        length = data[offset]
+        symbols.append(bytes(data[offset + 1:offset + 1 + length]).decode('utf-8'))
+        offset += 1 + length
+    if count == 0:
+        return [], symbols, price_digits
+    bases = _BATCH_BASE.unpack_from(data, offset)
+    offset += _BATCH_BASE.size
+    columns = []
+    for zigzag in _ZIGZAG_COLUMNS:
+        length, unit = _COLUMN_HEADER.unpack_from(data, offset)
+        offset += _COLUMN_HEADER.size
+        encoded = bytes(data[offset:offset + length])
+        offset += length
+        values = _decode_varints(encoded, count)
+        if zigzag:
+            values = _accumulate(bases[len(columns) - 1], values, unit, length == count)
+        columns.append(values)
+    symbol_ids, epochs, bids, spreads, seqs, flags = columns
+    asks = [0 if flag & FLAG_NO_ASK else bid + spread for bid, spread, flag in zip(bids, spreads, flags)]
+    return list(map(_new_record, zip(symbol_ids, epochs, bids, asks, seqs, flags))), symbols, price_digits
+
+
+# -------------------------------------------------------------------------------------------------
+# batch stream
+# -------------------------------------------------------------------------------------------------
+
+def encode_frame(records, symbols=(), price_digits=PRICE_DIGITS) -> bytes:
+    """ encode records as a length-prefixed delta batch (one frame of a batch stream)
+    :param records: list of wire records
+    :param symbols: symbol names by symbol id
+    :param price_digits: fixed-point digits of prices
+    :return: encoded frame
+    """
+    data = encode_batch(records, symbols, price_digits)
+    return _FRAME_HEADER.pack(len(data)) + data
+
+
+def _read_exactly(stream, size) -> bytes:
+    data = stream.read(size)
+    while 0 < len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def read_frame(stream):
+    """ read and decode the next frame of a batch stream
+    :param stream: binary file-like (ex: socket.makefile('rb'))
+    :return: (list of wire records, list of symbol names by symbol id, price digits) or None (end of stream)
+    """
+    header = _read_exactly(stream, _FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _FRAME_HEADER.size:
+        raise WireProcessException('[wire] truncated frame header.')
+    length = _FRAME_HEADER.unpack(header)[0]
+    data = _read_exactly(stream, length)
+    if len(data) < length:
+        raise WireProcessException('[wire] truncated frame. (size: {}, expected: {})'
+                                   .format(str(len(data)), str(length)))
+    return decode_batch(data)
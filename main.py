@@ -6,27 +6,28 @@
 """
 import sys
 import atexit
-from common.logger import log
+from common.logger import init_logging, log
 from common.config import get_config, get_opts
-from PyQt5.QtWidgets import *
-from lib.window import Window
-from application import Application
+from lib.subscription import configured_targets
 
 
 class MainGui:
 
     def __init__(self):
+        from lib.window import Window
         self._API_CONFIG = get_config('1q_api')
-        self._window = Window(get_config('node_name'))
-        self._app = Application(self._window)
+        self._window = Window(get_config('node_name', ''), get_config('ui', {}).get('max_log_lines', 1000))
+        # created on the first start (window shows before the API control and sinks are built)
+        self._app = None
 
     def exec(self, start=False):
         """ execution
         :return: void
         """
         try:
-            self._window.set_real_name(self._API_CONFIG['target']['real_name'])
-            self._window.set_symbol_name(self._API_CONFIG['target']['symbol'])
+            targets = configured_targets(self._API_CONFIG)
+            self._window.set_real_name(', '.join(sorted(set(real_name for real_name, _ in targets))))
+            self._window.set_symbol_name(', '.join(symbol for _, symbol in targets))
             self._window.append_log('[run] Initialize main application.')
             self._window.set_quit_button_listener(self.quit)
             self._window.set_run_button_listener(self.run)
@@ -44,7 +45,8 @@ class MainGui:
             self._window.append_log('[stop] service stopping..')
             self._window.set_run_button_text('STOPPING..')
             self._window.delete_run_button_listener()
-            self._app.disconnect()
+            if self._app is not None:
+                self._app.disconnect()
             self._window.append_log('[stop] service stop complete.')
         except Exception as _e:
             self._window.append_log('[stop] ERROR: {}'.format(str(_e)))
@@ -67,6 +69,9 @@ class MainGui:
         try:
             self._window.set_run_button_text('STARTING..')
             self._window.delete_run_button_listener()
+            if self._app is None:
+                from application import Application
+                self._app = Application(self._window)
             self._app.connect()
             self._window.set_run_button_text('STOP')
             self._window.set_run_button_listener(self.stop)
@@ -76,16 +81,17 @@ class MainGui:
             self.stop()
 
 
-app = QApplication(sys.argv)
-opts = get_opts()
-auto_start = False
-if 's' in opts:
-    auto_start = True
-main_gui = MainGui()
+main_gui = None
 
 
 def main():
+    global main_gui
+    init_logging()
     try:
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication(sys.argv)
+        auto_start = 's' in get_opts()
+        main_gui = MainGui()
         main_gui.exec(auto_start)
         sys.exit(app.exec_())
     except Exception as _e:
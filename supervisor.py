@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+    Multi-process collector supervisor
+    author: modorigoon
+    since: 0.2.0
+"""
+import signal
+import sys
+from common.logger import init_logging, log
+from common.config import get_config, get_config_object
+from lib.sink import create_sink_pipeline
+from lib.supervisor import Supervisor
+
+
+def main():
+    init_logging()
+    config = get_config('supervisor', {})
+    supervisor = Supervisor(get_config_object(), create_sink_pipeline(get_config('sink', None)),
+                            workers=config.get('workers', 2),
+                            host=config.get('host', '127.0.0.1'),
+                            port=config.get('port', 0),
+                            reorder_window_ms=config.get('reorder_window_ms', 200),
+                            restart_delay_s=config.get('restart_delay_s', 1.0),
+                            max_restart_delay_s=config.get('max_restart_delay_s', 30.0),
+                            max_restarts=config.get('max_restarts'),
+                            stop_timeout_s=config.get('stop_timeout_s', 10.0))
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    try:
+        supervisor.run()
+    except Exception as _e:
+        log.error('[supervisor] ERROR: {}'.format(str(_e)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
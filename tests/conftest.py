@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+    Test configuration (local environment, replay stand-in, files under a temporary directory)
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from common import config
+from common.logger import init_logging
+
+# the command line belongs to pytest
+config.set_opts({'e': 'local', 'l': 'WARNING'})
+_BASE = config.get_config_object()
+_BASE['log']['file_name'] = None
+config.set_config_object(_BASE)
+init_logging()
+
+
+@pytest.fixture
+def env(tmp_path):
+    """ replay configuration writing into tmp_path, no servers, no shared memory (applied by the test)
+    :return: config object (mutable copy)
+    """
+    c = config.get_config_object()
+    c['1q_api']['replay'].update({'enabled': True, 'count': 300, 'ticks_per_second': 1000, 'speed': 0})
+    c['journal']['enabled'] = False
+    c['sink'].update({'type': 'file', 'file': {'path': str(tmp_path / 'transactions.jsonl')},
+                      'spill_path': str(tmp_path / 'spill.jsonl')})
+    c['bars']['sink']['file']['path'] = str(tmp_path / 'bars.jsonl')
+    c['gaps'].update({'enabled': False, 'merged_path': str(tmp_path / 'gap-merged.jsonl')})
+    c['watchdog']['enabled'] = False
+    c['sequence']['path'] = str(tmp_path / 'sequence')
+    c['backfill']['checkpoint_path'] = str(tmp_path / 'backfill-checkpoint.json')
+    for name in ('tick_cache', 'shm_feed', 'pubsub', 'metrics', 'profiler'):
+        c[name]['enabled'] = False
+    yield c
+    config.set_config_object(_BASE)
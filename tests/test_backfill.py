@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+    Backfill engine tests (checkpoint after the sink wrote a chunk, resume, per symbol keys, FID only app)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import os
+import pytest
+from common.config import get_config, set_config_object
+from lib.backfill import BackfillEngine, split_date_range
+from lib.replay_api import ReplayHanaAPI
+from lib.sink import FileSink, Sink, SinkPipeline
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+class _LosingReplayHanaAPI(ReplayHanaAPI):
+    """ loses the response of the second page once (the request times out) """
+
+    lost = 0
+
+    def request_fid_data_list(self, rid, fields, pn, pnc, screen_no, req_count, wait=True):
+        response = super().request_fid_data_list(rid, fields, pn, pnc, screen_no, req_count, wait)
+        if pnc == '500' and self.lost == 0:
+            self.lost += 1
+            self._fid_pending.pop()
+        return response
+
+
+class _FailingSink(Sink):
+
+    name = 'failing'
+
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.batches = 0
+
+    def write_batch(self, batch):
+        self.batches += 1
+        if self.batches == self.fail_at:
+            raise OSError('[test] disk full')
+
+
+@pytest.fixture
+def app_factory(env):
+    set_config_object(env)
+    from application import Application
+    apps = []
+
+    def factory(api_class=ReplayHanaAPI):
+        app = Application(api=api_class(get_config('1q_api')), collect=False)
+        app.connect()
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        app.disconnect()
+
+
+def _read_rows(path):
+    with open(path, encoding='utf-8') as rf:
+        return [json.loads(line) for line in rf]
+
+
+def _checkpoint(path):
+    with open(path, encoding='utf-8') as rf:
+        return json.load(rf)['completed']
+
+
+def test_split_date_range():
+    assert [chunk.key for chunk in split_date_range('20200302', '20200306', 2)] == [
+        '20200302-20200303', '20200304-20200305', '20200306-20200306']
+
+
+def test_timed_out_chunk_resumes_without_duplicates(app_factory, tmp_path):
+    app = app_factory(_LosingReplayHanaAPI)
+    output = str(tmp_path / 'backfill.jsonl')
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    engine = BackfillEngine(app, SinkPipeline(FileSink(output), batch_size=100, backpressure='block'), _SYMBOL,
+                            page_size=500, request_timeout_s=0.5, requests_per_second=0, checkpoint_path=checkpoint)
+    stats = engine.run('20200302', '20200304')
+    assert stats['retries'] == 1 and stats['chunks_completed'] == 3
+    rows = _read_rows(output)
+    assert len(rows) == stats['rows']
+    assert len({json.dumps(row, sort_keys=True) for row in rows}) == len(rows)
+    assert {row['resolution'] for row in rows} == {'1m'}
+    assert _checkpoint(checkpoint) == ['{}:{}'.format(_SYMBOL, day) for day in (
+        '20200302-20200302', '20200303-20200303', '20200304-20200304')]
+
+
+def test_chunk_not_written_is_not_checkpointed(app_factory, tmp_path):
+    app = app_factory()
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    sink = SinkPipeline(_FailingSink(fail_at=20), batch_size=100, backpressure='block')
+    stats = BackfillEngine(app, sink, _SYMBOL, page_size=500, requests_per_second=0,
+                           checkpoint_path=checkpoint).run('20200302', '20200304')
+    assert stats['chunks_unconfirmed'] >= 1
+    completed = _checkpoint(checkpoint)
+    assert len(completed) == stats['chunks_completed'] < 3
+
+    # the next run requests the unconfirmed chunks only
+    output = str(tmp_path / 'backfill.jsonl')
+    resumed = BackfillEngine(app_factory(), SinkPipeline(FileSink(output), batch_size=100, backpressure='block'),
+                             _SYMBOL, page_size=500, requests_per_second=0, checkpoint_path=checkpoint)
+    stats = resumed.run('20200302', '20200304')
+    assert stats['chunks_skipped'] == len(completed)
+    assert stats['chunks_completed'] == 3 - len(completed)
+    assert len(_checkpoint(checkpoint)) == 3
+    assert len(_read_rows(output)) == stats['rows']
+
+
+def test_symbols_share_checkpoint_file(app_factory, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    output = str(tmp_path / 'backfill.jsonl')
+    for symbol in (_SYMBOL, 'D05EUR/USD'):
+        stats = BackfillEngine(app_factory(), SinkPipeline(FileSink(output), batch_size=100, backpressure='block'),
+                               symbol, page_size=500, requests_per_second=0,
+                               checkpoint_path=checkpoint).run('20200302', '20200303')
+        # chunks of the other symbol are not skipped
+        assert stats.get('chunks_skipped', 0) == 0 and stats['chunks_completed'] == 2
+    assert len(_checkpoint(checkpoint)) == 4
+
+
+def test_fid_only_application_opens_no_collector_file(env, tmp_path):
+    env['journal'].update(enabled=True, path=str(tmp_path / 'journal'))
+    env['sequence']['enabled'] = True
+    set_config_object(env)
+    from application import Application
+    app = Application(api=ReplayHanaAPI(get_config('1q_api')), collect=False)
+    app.connect()
+    try:
+        assert app.get_sink_stats() is None and app.get_sequence_stats() is None
+    finally:
+        app.disconnect()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+    Bar aggregator tests (OHLC per resolution, roll into coarser bars, late ticks, flush)
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from lib.bar_aggregator import SIGN_DOWN, SIGN_FLAT, SIGN_UP, BarAggregator, BarAggregatorProcessException
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+def _aggregator(resolutions=('1s', '1m')):
+    bars = []
+    return BarAggregator(bars.append, _SYMBOL, resolutions), bars
+
+
+def test_ohlc_of_one_bar():
+    aggregator, bars = _aggregator(('1s',))
+    for sell in (189237, 189240, 189230, 189235):
+        aggregator.on_tick('20200302090000', sell, sell + 20)
+    assert bars == []
+    aggregator.flush()
+    bar = bars[0]
+    assert (bar['30'], bar['31'], bar['32'], bar['33']) == ('1.89237', '1.89240', '1.89230', '1.89235')
+    assert (bar['40'], bar['41'], bar['42'], bar['43']) == ('1.89257', '1.89260', '1.89250', '1.89255')
+    assert bar['9'] == 20200302 and bar['8'] == 90000 and bar['ticks'] == 4 and bar['666'] == 20
+    assert bar['symbol'] == _SYMBOL and bar['resolution'] == '1s'
+
+
+def test_bars_roll_into_coarser_resolutions():
+    aggregator, bars = _aggregator()
+    aggregator.on_tick('20200302090000', 189237, 189257)
+    aggregator.on_tick('20200302090030', 189250, 189270)
+    aggregator.on_tick('20200302090059', 189220, 189240)
+    # the first tick of the next minute closes the last second and the minute
+    aggregator.on_tick('20200302090100', 189230, 189250)
+    assert [(bar['resolution'], bar['8']) for bar in bars] == [('1s', 90000), ('1s', 90030), ('1s', 90059),
+                                                               ('1m', 90000)]
+    minute = bars[-1]
+    assert minute['ticks'] == 3
+    assert (minute['30'], minute['31'], minute['32'], minute['33']) == ('1.89237', '1.89250', '1.89220', '1.89220')
+    aggregator.flush()
+    assert [(bar['resolution'], bar['8']) for bar in bars[4:]] == [('1s', 90100), ('1m', 90100)]
+    assert aggregator.stats() == {'ticks': 4, 'late': 0, 'emitted': 6}
+
+
+def test_bar_sign_follows_previous_close():
+    aggregator, bars = _aggregator(('1s',))
+    for second, sell in enumerate((189237, 189240, 189240, 189230)):
+        aggregator.on_tick('2020030209000{}'.format(second), sell, sell + 20)
+    aggregator.flush()
+    assert [bar['1098'] for bar in bars] == [SIGN_FLAT, SIGN_UP, SIGN_FLAT, SIGN_DOWN]
+
+
+def test_tick_older_than_open_bar_is_late():
+    aggregator, bars = _aggregator(('1s',))
+    aggregator.on_tick('20200302090001', 189237, 189257)
+    aggregator.on_tick('20200302090000', 189240, 189260)
+    aggregator.flush()
+    assert aggregator.late == 1 and len(bars) == 1 and bars[0]['ticks'] == 1
+
+
+def test_block_and_transaction_paths_agree():
+    from lib.transaction import TransactionParser
+    from lib.synthetic import generate_v00_blocks
+    blocks = list(generate_v00_blocks(500, symbol=_SYMBOL, ticks_per_second=10))
+    from_blocks, bars_from_blocks = _aggregator()
+    from_transactions, bars_from_transactions = _aggregator()
+    parse = TransactionParser(_SYMBOL).parse_function()
+    for block in blocks:
+        from_blocks.on_block(block)
+        from_transactions.on_transaction(parse(block))
+    from_blocks.flush()
+    from_transactions.flush()
+    assert bars_from_blocks == bars_from_transactions
+    assert sum(bar['ticks'] for bar in bars_from_blocks if bar['resolution'] == '1m') == 500
+
+
+def test_invalid_resolutions_are_refused():
+    with pytest.raises(BarAggregatorProcessException):
+        BarAggregator(lambda row: None, _SYMBOL, ('7s',))
+    with pytest.raises(BarAggregatorProcessException):
+        BarAggregator(lambda row: None, _SYMBOL, ())
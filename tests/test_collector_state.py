@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+    Collector state tests (tick path writes the snapshot only, bounded log, tick rate)
+    author: modorigoon
+    since: 0.2.0
+"""
+import time
+from common.config import get_config, set_config_object
+from lib.collector_state import CollectorState
+from lib.replay_api import ReplayHanaAPI
+from lib.transaction import Transaction
+
+
+class _Window:
+    """ window bound to the state, any other window call fails the tick path """
+
+    def __init__(self):
+        self.bound = None
+
+    def bind_state(self, state, refresh_hz, stats_provider):
+        self.bound = (state, refresh_hz, stats_provider)
+
+
+def test_log_lines_are_bounded():
+    state = CollectorState(max_log_lines=3)
+    for i in range(5):
+        state.append_log('line {}'.format(i))
+    assert state.drain_log() == ['line 2', 'line 3', 'line 4']
+    assert state.drain_log() == []
+
+
+def test_ticks_per_second_since_previous_call():
+    state = CollectorState()
+    state._rate_at = time.monotonic() - 2.0
+    for i in range(10):
+        state.on_transaction(Transaction('D05GBP/AUD', '20200302090000', '1.89237', i))
+    assert 4.0 < state.ticks_per_second() <= 5.0
+    # counted from the previous call
+    state._rate_at -= 1.0
+    assert state.ticks_per_second() < 1.0
+    assert state.last_transaction.seq == 9 and state.tick_count == 10
+
+
+def test_ticks_update_the_state_not_the_window(env):
+    set_config_object(env)
+    from application import Application
+    window = _Window()
+    app = Application(window=window, api=ReplayHanaAPI(get_config('1q_api')), serve=False)
+    try:
+        app.connect()
+        app.listen_real()
+    finally:
+        app.disconnect()
+    state, refresh_hz, stats_provider = window.bound
+    assert state is app.get_state() and refresh_hz == get_config('ui')['refresh_hz']
+    assert state.tick_count == 300 and state.last_transaction is not None
+    assert stats_provider()['written'] == 300
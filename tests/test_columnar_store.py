@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+    Columnar store tests (FID bar rows, trading day partitions, durable part files at the flush barrier)
+    author: modorigoon
+    since: 0.2.0
+"""
+import os
+import time
+from lib.columnar_store import BARS, TICKS, ColumnarStoreReader, ColumnarStoreWriter, partition_path
+from lib.sink import ColumnarSink, SinkPipeline
+from lib.transaction import Transaction
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+def _fid_row(date, time_seq, resolution=None):
+    """ row of FidColumnBatch.iter_rows (resolution tagged by the backfill) """
+    row = {'symbol': _SYMBOL, '9': date, '8': time_seq, '1098': 2, '30': '1.89230', '31': '1.89250',
+           '32': '1.89210', '33': '1.89240', '6': 5, '40': '1.89260', '41': '1.89280', '42': '1.89240',
+           '43': '1.89270', '666': 30}
+    if resolution is not None:
+        row['resolution'] = resolution
+    return row
+
+
+def _part_names(root, kind, date):
+    return sorted(os.listdir(partition_path(root, kind, _SYMBOL, date)))
+
+
+def test_fid_rows_are_stored_as_bars(tmp_path):
+    root = str(tmp_path / 'store')
+    writer = ColumnarStoreWriter(root, store_format='hcol')
+    writer.append(_fid_row(20200302, 90000))
+    writer.append(_fid_row(20200302, 90100, resolution='1m'))
+    writer.close()
+    bars = ColumnarStoreReader(root).read(BARS, _SYMBOL, '20200302', '20200302')
+    assert list(bars['date_time_seq']) == [20200302090000, 20200302090100]
+    assert bars['resolution'] == ['', '1m']
+    assert list(bars['sell_close']) == [189240, 189240] and list(bars['spread']) == [30, 30]
+
+
+def test_partitions_roll_at_the_trading_day(tmp_path):
+    root = str(tmp_path / 'store')
+    writer = ColumnarStoreWriter(root, store_format='hcol', roll_hour=7)
+    for date_time_seq in ('20200302230000', '20200303065959', '20200303070000'):
+        writer.append(Transaction(_SYMBOL, date_time_seq, 189234, 0))
+    assert writer.trading_day(20200301065959) == 20200229
+    writer.close()
+    assert len(_part_names(root, TICKS, 20200302)) == 1 and len(_part_names(root, TICKS, 20200303)) == 1
+    reader = ColumnarStoreReader(root)
+    # calendar range, the early hours are read from the partition of the previous trading day
+    ticks = reader.read(TICKS, _SYMBOL, '20200303', '20200303')
+    assert list(ticks['date_time_seq']) == [20200303065959, 20200303070000]
+
+
+def test_flush_closes_part_files(tmp_path):
+    root = str(tmp_path / 'store')
+    writer = ColumnarStoreWriter(root, store_format='hcol')
+    writer.append(Transaction(_SYMBOL, '20200302090000', 189234, 0))
+    writer.flush()
+    names = _part_names(root, TICKS, 20200302)
+    assert len(names) == 1 and names[0].endswith('.hcol')
+    writer.append(Transaction(_SYMBOL, '20200302090001', 189235, 0))
+    writer.flush()
+    writer.flush()
+    assert len(_part_names(root, TICKS, 20200302)) == 2 and writer.files == 2
+    ticks = ColumnarStoreReader(root).read(TICKS, _SYMBOL, '20200302', '20200302')
+    assert list(ticks['price']) == [189234, 189235]
+    writer.close()
+
+
+def _wait_flushed(pipeline, position, timeout_s):
+    deadline = time.monotonic() + timeout_s
+    while not pipeline.flushed(position) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pipeline.flushed(position)
+
+
+def test_flush_barrier_waits_for_sync(tmp_path):
+    root = str(tmp_path / 'store')
+    sink = ColumnarSink({'path': root, 'format': 'hcol', 'sync_interval_ms': 60000})
+    pipeline = SinkPipeline(sink, batch_size=10, flush_interval_ms=10)
+    pipeline.start()
+    try:
+        # the first batch is synced at once, the next one waits for the interval
+        pipeline.put(Transaction(_SYMBOL, '20200302090000', 189234, 0))
+        assert _wait_flushed(pipeline, pipeline.position(), 5)
+        pipeline.put(_fid_row(20200302, 90000, resolution='1m'))
+        position = pipeline.position()
+        assert not _wait_flushed(pipeline, position, 0.2)
+        assert pipeline.stats()['written'] == 2
+    finally:
+        pipeline.stop()
+    assert pipeline.flushed(position)
+    reader = ColumnarStoreReader(root)
+    assert len(reader.read(BARS, _SYMBOL, '20200302', '20200302')['date_time_seq']) == 1
+    assert not [name for name in _part_names(root, TICKS, 20200302) if name.endswith('.tmp')]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+    Datetime util tests (sequence parsing and formatting, epoch conversions)
+    author: modorigoon
+    since: 0.2.0
+"""
+import calendar
+import datetime
+import pytest
+from util.datetime_util import date_time_columns_to_epoch, datetime_sequence_to_datetime, datetime_to_sequence, \
+    sequence_to_epoch
+
+_SEQUENCES = ('19700101000000', '20200229235959', '20200302090000', '20201231120030')
+
+
+def test_sequence_to_datetime():
+    assert datetime_sequence_to_datetime('20200302090105') == datetime.datetime(2020, 3, 2, 9, 1, 5)
+    assert datetime_sequence_to_datetime(20200302090105) == datetime.datetime(2020, 3, 2, 9, 1, 5)
+    assert datetime_sequence_to_datetime('20200302') is None
+    with pytest.raises(ValueError):
+        datetime_sequence_to_datetime('2020030209010x')
+
+
+def test_datetime_to_sequence_units():
+    moment = datetime.datetime(2020, 3, 2, 9, 1, 5)
+    assert [datetime_to_sequence(moment, unit) for unit in ('date', 'hour', 'MINUTE', 'second')] == \
+        ['20200302', '2020030209', '202003020901', '20200302090105']
+    assert datetime_to_sequence(moment, 'week') is None
+    for sequence in _SEQUENCES:
+        assert datetime_to_sequence(datetime_sequence_to_datetime(sequence), 'second') == sequence
+
+
+def test_sequence_to_epoch_is_utc_wall_clock():
+    for sequence in _SEQUENCES:
+        assert sequence_to_epoch(sequence) == calendar.timegm(datetime_sequence_to_datetime(sequence).timetuple())
+
+
+def test_columns_to_epoch():
+    dates = [int(sequence[:8]) for sequence in _SEQUENCES]
+    times = [int(sequence[8:]) for sequence in _SEQUENCES]
+    epochs = date_time_columns_to_epoch(dates, times)
+    assert epochs.typecode == 'q' and list(epochs) == [sequence_to_epoch(sequence) for sequence in _SEQUENCES]
+    assert list(date_time_columns_to_epoch([], [])) == []
+    with pytest.raises(ValueError):
+        date_time_columns_to_epoch(dates, times[1:])
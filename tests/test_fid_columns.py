@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+    FID column batch tests (block extraction, separators checked, fallback to cell extraction)
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from common.config import get_config, set_config_object
+from lib.fid_columns import FidColumnProcessException, extract_block, extract_cells
+from lib.replay_api import ReplayHanaAPI
+
+_SYMBOL = 'D05GBP/AUD'
+_FIELDS = ('8', '9', '30', '31', '32', '33', '6', '40', '41', '42', '43', '1098', '666')
+# FID data block of a two row response (request field order, tab separated, trailing row separator)
+_BLOCK = ('090000\t20200302\t1.89234\t1.89241\t1.89228\t1.89236\t2\t1.89254\t1.89261\t1.89248\t1.89256\t2\t20\n'
+          '090100\t20200302\t1.89236\t1.89243\t1.89230\t1.89238\t2\t1.89256\t1.89263\t1.89250\t1.89258\t2\t20\n')
+
+
+def test_block_is_read_into_typed_columns():
+    batch = extract_block(_BLOCK, _FIELDS, _SYMBOL)
+    assert len(batch) == 2
+    assert list(batch.column('9')) == [20200302, 20200302] and list(batch.column('8')) == [90000, 90100]
+    assert list(batch.column('33')) == [189236, 189238] and list(batch.column('666')) == [20, 20]
+    rows = list(batch.iter_rows())
+    assert rows[1]['symbol'] == _SYMBOL and rows[1]['30'] == '1.89236' and rows[1]['8'] == 90100
+    assert batch.date_time_seq(0) == '20200302090000'
+
+
+def test_block_with_other_separators_is_refused():
+    with pytest.raises(FidColumnProcessException):
+        extract_block(_BLOCK.replace('\t', ';'), _FIELDS, _SYMBOL)
+    # one field too many: the columns would be shifted
+    with pytest.raises(FidColumnProcessException):
+        extract_block(_BLOCK.replace('\t20\n', '\t20\t7\n'), _FIELDS, _SYMBOL)
+
+
+def _fid_app(env, extraction='block', field_separator='\t'):
+    env['fid'] = {'extraction': extraction, 'block_row_separator': '\n', 'block_field_separator': field_separator}
+    set_config_object(env)
+    from application import Application
+    api = ReplayHanaAPI(get_config('1q_api'))
+    app = Application(api=api, collect=False)
+    app.connect()
+    return app, api
+
+
+def _response(app, api):
+    responses = []
+    app.set_fid_event_handler(lambda rid, block, length: responses.append((rid, block)))
+    rid = api.create_request_id()
+    api.set_fid_input(rid, '9034', '20200302')
+    app.request_fid(rid, '0', '', 120)
+    return responses[0]
+
+
+def test_replay_block_matches_cell_extraction(env):
+    app, api = _fid_app(env)
+    try:
+        rid, block = _response(app, api)
+        batch = app.get_fid_batch(rid, block, _SYMBOL)
+        assert list(batch.iter_rows()) == list(extract_cells(api, rid, _SYMBOL).iter_rows())
+        assert len(batch) == 120
+    finally:
+        app.disconnect()
+
+
+def test_separator_mismatch_falls_back_to_cells(env):
+    app, api = _fid_app(env, field_separator=';')
+    try:
+        rid, block = _response(app, api)
+        batch = app.get_fid_batch(rid, block, _SYMBOL)
+        assert len(batch) == 120 and batch.column('9')[0] == 20200302
+        assert app._fid_extraction == 'cell'
+    finally:
+        app.disconnect()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+    Gap detection and backfill tests (session thresholds, rows inside the gap, merged keys across restarts)
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from common.config import get_config, set_config_object
+from lib.gap_backfill import Gap, GapBackfiller, GapDetector
+from lib.replay_api import ReplayHanaAPI
+
+_SYMBOL = 'D05GBP/AUD'
+_GAP = Gap(_SYMBOL, '20200302090010', '20200302091030')
+
+
+def test_detector_flags_silent_intervals():
+    gaps = []
+    detector = GapDetector(gaps.append, threshold_s=30)
+    for date_time_seq in ('20200302090000', '20200302090000', '20200302090020', '20200302090100',
+                          '20200302090050', '20200302090110'):
+        detector.on_transaction(_SYMBOL, date_time_seq)
+    # an older tick does not move the last sequence back
+    assert gaps == [Gap(_SYMBOL, '20200302090020', '20200302090100')] and detector.detected == 1
+    assert gaps[0].seconds == 40 and gaps[0].key == _SYMBOL + ':20200302090020-20200302090100'
+
+
+def test_session_thresholds():
+    sessions = [{'start': '220000', 'end': '060000', 'threshold_s': 0},
+                {'start': '060000', 'end': '090000', 'threshold_s': 600}]
+    gaps = []
+    detector = GapDetector(gaps.append, threshold_s=30, sessions=sessions)
+    # the session wraps midnight
+    assert detector.threshold('20200302230000') == 0 and detector.threshold('20200302050000') == 0
+    assert detector.threshold('20200302070000') == 600 and detector.threshold('20200302120000') == 30
+    for date_time_seq in ('20200302230000', '20200303010000', '20200303061000', '20200303070500',
+                          '20200303070800'):
+        detector.on_transaction(_SYMBOL, date_time_seq)
+    # the closed session ignores gaps, the threshold is the one of the interval start
+    assert gaps == [Gap(_SYMBOL, '20200303061000', '20200303070500')]
+
+
+@pytest.fixture
+def fid_app(env):
+    set_config_object(env)
+    from application import Application
+    api = ReplayHanaAPI(get_config('1q_api'))
+    app = Application(api=api, collect=False)
+    app.connect()
+    yield app, api
+    app.disconnect()
+
+
+def _backfill(app, api, merged_path, gap=_GAP):
+    rows = []
+    backfiller = GapBackfiller(app, rows.append, requests_per_second=0, merged_path=merged_path)
+    app.set_fid_event_handler(backfiller.on_fid_event)
+    backfiller.schedule(gap)
+    while backfiller.stats()['pending']:
+        backfiller.poll()
+        api.process_events()
+    return backfiller, rows
+
+
+def test_rows_strictly_inside_the_gap(fid_app, tmp_path):
+    app, api = fid_app
+    backfiller, rows = _backfill(app, api, str(tmp_path / 'merged.jsonl'))
+    # bars of 09:00 and 09:10 hold live ticks
+    assert [row['8'] for row in rows] == [90000 + minute * 100 for minute in range(1, 10)]
+    assert {row['resolution'] for row in rows} == {'1m'} and rows[0]['symbol'] == _SYMBOL
+    stats = backfiller.stats()
+    assert stats['gaps_backfilled'] == 1 and stats['rows'] == 9
+
+
+def test_merged_rows_are_not_emitted_after_restart(fid_app, tmp_path):
+    app, api = fid_app
+    merged_path = str(tmp_path / 'merged.jsonl')
+    _backfill(app, api, merged_path)
+    # a cut last line (crash while appending) is ignored
+    with open(merged_path, 'a', encoding='utf-8') as wf:
+        wf.write('["D05GBP/AUD", 2020')
+    restarted, rows = _backfill(app, api, merged_path, Gap(_SYMBOL, '20200302090510', '20200302091530'))
+    # 09:06 - 09:09 were merged before the restart
+    assert [row['8'] for row in rows] == [91000 + minute * 100 for minute in range(0, 5)]
+    assert restarted.stats()['duplicates'] == 4
+
+
+def test_polls_are_posted_to_the_event_thread():
+    class _App:
+        calls = []
+
+        def call_soon(self, callback):
+            self.calls.append(callback)
+
+    app = _App()
+    backfiller = GapBackfiller(app, lambda row: None)
+    backfiller._post_poll()
+    backfiller._post_poll()
+    assert len(app.calls) == 1
+    app.calls.pop()()
+    backfiller._post_poll()
+    assert len(app.calls) == 1
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+    Headless collector tests (replay mode, no Qt, status reported, failure exit)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import sys
+from common.config import set_config_object
+
+
+def _read_rows(path):
+    with open(path, encoding='utf-8') as rf:
+        return [json.loads(line) for line in rf]
+
+
+def test_replay_collector_runs_without_qt(env, tmp_path):
+    set_config_object(env)
+    from headless import HeadlessCollector
+    collector = HeadlessCollector()
+    collector.run()
+    assert collector.failed is False
+    assert collector._app.get_state().tick_count == 300
+    assert len(_read_rows(str(tmp_path / 'transactions.jsonl'))) == 300
+    assert not any(name.startswith('PyQt5') for name in sys.modules)
+    # stopping twice (signal after the source ended) is harmless
+    collector.stop()
+
+
+def test_failed_collector_is_reported(env, tmp_path):
+    env['1q_api']['replay']['source'] = str(tmp_path / 'missing.txt')
+    set_config_object(env)
+    from headless import HeadlessCollector
+    collector = HeadlessCollector()
+    collector.run()
+    assert collector.failed is True
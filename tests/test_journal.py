@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+    Raw tick journal tests
+    author: modorigoon
+    since: 0.2.0
+"""
+import datetime
+import os
+import pytest
+from lib.journal import JournalProcessException, JournalReader, JournalWriter, trading_day
+from lib.synthetic import generate_v00_blocks
+
+
+def _ns(*moment) -> int:
+    return int(datetime.datetime(*moment).timestamp()) * 1000000000
+
+
+def _segment_names(path):
+    return [os.path.basename(segment) for segment in JournalReader(str(path)).segments()]
+
+
+def test_trading_day_rolls_at_roll_hour():
+    assert trading_day(_ns(2020, 3, 2, 6, 59), roll_hour=7) == '20200301'
+    assert trading_day(_ns(2020, 3, 2, 7, 0), roll_hour=7) == '20200302'
+    assert trading_day(_ns(2020, 3, 2, 0, 0)) == '20200302'
+
+
+def test_round_trip(tmp_path):
+    blocks = list(generate_v00_blocks(1000))
+    writer = JournalWriter(str(tmp_path), segment_size_mb=1)
+    started_ns = _ns(2020, 3, 2, 9, 0)
+    offsets = [writer.append(block, started_ns + i) for i, block in enumerate(blocks)]
+    writer.close()
+    reader = JournalReader(str(tmp_path))
+    assert list(reader.iter_blocks()) == [((started_ns + i) / 1e9, block) for i, block in enumerate(blocks)]
+    segment = reader.segments()[0]
+    assert list(reader.segment_index(segment)) == offsets
+    # the unused pre-allocated tail is truncated on close (record header: length u32, received ns i64)
+    assert os.path.getsize(segment) == offsets[-1] + 12 + len(blocks[-1])
+
+
+def test_segments_roll_by_size_and_trading_day(tmp_path):
+    writer = JournalWriter(str(tmp_path), segment_size_mb=1, roll_hour=7)
+    block = 'x' * 1000
+    for i in range(1100):
+        writer.append(block, _ns(2020, 3, 2, 6, 0) + i)
+    writer.append(block, _ns(2020, 3, 2, 7, 0))
+    writer.close()
+    assert _segment_names(tmp_path) == ['20200301-000000.seg', '20200301-000001.seg', '20200302-000000.seg']
+    reader = JournalReader(str(tmp_path))
+    assert len(list(reader.iter_records(to_day='20200301'))) == 1100
+    assert len(list(reader.iter_records(from_day='20200302'))) == 1
+
+
+def test_deleted_segment_does_not_reuse_a_name(tmp_path):
+    received_ns = _ns(2020, 3, 2, 9, 0)
+    for _ in range(3):
+        writer = JournalWriter(str(tmp_path), segment_size_mb=1)
+        writer.append('block', received_ns)
+        writer.close()
+    os.remove(os.path.join(str(tmp_path), '20200302-000000.seg'))
+    writer = JournalWriter(str(tmp_path), segment_size_mb=1)
+    writer.append('block', received_ns)
+    writer.close()
+    assert _segment_names(tmp_path) == ['20200302-000001.seg', '20200302-000002.seg', '20200302-000003.seg']
+
+
+def test_record_larger_than_segment_raises(tmp_path):
+    writer = JournalWriter(str(tmp_path), segment_size_mb=1)
+    with pytest.raises(JournalProcessException):
+        writer.append('x' * (1024 * 1024))
+
+
+def test_reader_sees_records_of_an_open_segment(tmp_path):
+    writer = JournalWriter(str(tmp_path), segment_size_mb=1)
+    writer.append('first', _ns(2020, 3, 2, 9, 0))
+    writer.flush()
+    assert [block for _, block in JournalReader(str(tmp_path)).iter_blocks()] == ['first']
+    writer.close()
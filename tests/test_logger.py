@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    Logger tests (explicit initialization, level option, queued and synchronous file handler)
+    author: modorigoon
+    since: 0.2.0
+"""
+import logging
+import pytest
+from common import logger as common_logger
+from common.config import get_opts, set_config_object, set_opts
+
+
+@pytest.fixture
+def file_logger(env, tmp_path):
+    """ logger configured like the common logger, writing into tmp_path """
+    opts = get_opts()
+    target = logging.getLogger('tests.logger.{}'.format(tmp_path.name))
+    target.propagate = False
+    yield target
+    common_logger.stop_listener()
+    for handler in list(target.handlers):
+        target.removeHandler(handler)
+        handler.close()
+    set_opts(opts)
+
+
+def _configure(env, target, tmp_path, level, asynchronous, option=None):
+    env['log'].update({'file_name': str(tmp_path / 'hana-1q.log'), 'level': level, 'async': asynchronous})
+    set_opts({'e': 'local', 'l': option} if option else {'e': 'local'})
+    set_config_object(env)
+    common_logger._apply_config(target)
+
+
+def _read_log(tmp_path):
+    with open(str(tmp_path / 'hana-1q.log'), encoding='utf-8') as rf:
+        return rf.read()
+
+
+def test_init_logging_is_applied_once():
+    log = common_logger.log
+    handlers = list(log.handlers)
+    common_logger.init_logging()
+    common_logger.init_logging()
+    # plain logger (no class swap), level of the -l option given by the test configuration
+    assert type(log) is logging.Logger and log.level == logging.WARNING
+    assert log.handlers == handlers
+
+
+def test_queued_file_handler(env, file_logger, tmp_path):
+    _configure(env, file_logger, tmp_path, 'INFO', True)
+    file_logger.debug('[test] not written')
+    file_logger.info('[test] queued %s', 'line')
+    # written by the listener thread, flushed when it stops
+    common_logger.stop_listener()
+    text = _read_log(tmp_path)
+    assert '[test] queued line' in text and 'not written' not in text
+
+
+def test_level_option_overrides_configuration(env, file_logger, tmp_path):
+    _configure(env, file_logger, tmp_path, 'DEBUG', False, option='ERROR')
+    file_logger.warning('[test] below the option level')
+    file_logger.error('[test] synchronous')
+    assert file_logger.level == logging.ERROR
+    text = _read_log(tmp_path)
+    assert '[test] synchronous' in text and 'below' not in text
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+    Metrics tests (registry, text exposition, scrape time collectors, HTTP endpoint)
+    author: modorigoon
+    since: 0.2.0
+"""
+import urllib.error
+import urllib.request
+import pytest
+from lib.metrics import CONTENT_TYPE, MetricsProcessException, MetricsRegistry
+from lib.metrics_server import MetricsServer
+
+
+def test_counter_gauge_histogram_exposition():
+    registry = MetricsRegistry()
+    registry.counter('ticks_total', 'Ticks.', ('symbol',)).labels('D05GBP/AUD').inc(3)
+    gauge = registry.gauge('queue_depth', 'Queue depth.')
+    gauge.set(7)
+    gauge.inc()
+    histogram = registry.histogram('flush_seconds', 'Flush latency.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+    assert '# TYPE ticks_total counter' in lines
+    assert 'ticks_total{symbol="D05GBP/AUD"} 3' in lines
+    assert 'queue_depth 8' in lines
+    # buckets are cumulative
+    assert ['flush_seconds_bucket{le="0.1"} 1', 'flush_seconds_bucket{le="1"} 3', 'flush_seconds_bucket{le="+Inf"} 4',
+            'flush_seconds_sum 6.05', 'flush_seconds_count 4'] == [line for line in lines
+                                                                   if line.startswith('flush_seconds_')]
+
+
+def test_registration_is_idempotent_per_type():
+    registry = MetricsRegistry()
+    counter = registry.counter('logins_total', 'Logins.', ('result',))
+    assert registry.counter('logins_total', 'Logins.', ('result',)) is counter
+    with pytest.raises(MetricsProcessException):
+        registry.gauge('logins_total', 'Logins.', ('result',))
+    with pytest.raises(MetricsProcessException):
+        counter.labels('success', 'extra')
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.gauge('info', 'Info.', ('path',)).labels('a"b\\c\nd').set(1)
+    assert 'info{path="a\\"b\\\\c\\nd"} 1' in registry.render().splitlines()
+
+
+def test_collectors_run_at_scrape_time():
+    registry = MetricsRegistry()
+    depth = {'value': 1}
+
+    def collector():
+        return [('sink_queue_depth', 'gauge', 'Sink queue depth.', [({'sink': 'file'}, depth['value'])])]
+
+    def failing():
+        raise RuntimeError('[test] collector failed')
+
+    registry.register_collector(failing)
+    registry.register_collector(collector)
+    depth['value'] = 42
+    # a failing collector does not hide the others
+    assert 'sink_queue_depth{sink="file"} 42' in registry.render().splitlines()
+    registry.unregister_collector(collector)
+    assert 'sink_queue_depth' not in registry.render()
+
+
+def test_http_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('ticks_total', 'Ticks.').inc()
+    server = MetricsServer(registry, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(server.port), timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert 'ticks_total 1' in response.read().decode('utf-8').splitlines()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen('http://127.0.0.1:{}/other'.format(server.port), timeout=5)
+    finally:
+        server.stop()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    Call profiler tests (call statistics, stalls, stack samples, report files)
+    author: modorigoon
+    since: 0.2.0
+"""
+import time
+import pytest
+from common.config import get_config, set_config_object
+from lib.profiler import CallProfiler, fold_stack
+from lib.replay_api import ReplayHanaAPI
+
+
+class _ControlAPI:
+    """ agent control stand-in with a dynamicCall like _call """
+
+    def __init__(self):
+        self.calls = []
+
+    def _call(self, signature, *args):
+        self.calls.append(signature)
+        if signature == 'Fail()':
+            raise RuntimeError('[test] call failed')
+        if signature == 'Slow()':
+            time.sleep(0.2)
+        return 0
+
+
+def _stats(profiler):
+    return {item['name']: item for item in profiler.stats()}
+
+
+def test_calls_are_counted_per_signature():
+    api = _ControlAPI()
+    profiler = CallProfiler(stall_ms=0)
+    profiler.install(api)
+    for _ in range(3):
+        api._call('CommGetConnectState()')
+    with pytest.raises(RuntimeError):
+        api._call('Fail()')
+    stats = _stats(profiler)
+    assert stats['CommGetConnectState()']['count'] == 3 and stats['CommGetConnectState()']['errors'] == 0
+    assert stats['Fail()']['errors'] == 1
+    assert api.calls == ['CommGetConnectState()'] * 3 + ['Fail()']
+
+
+def test_stalls_are_recorded_with_the_event_thread_stack():
+    api = _ControlAPI()
+    profiler = CallProfiler(stall_ms=20, sample_interval_ms=5)
+    profiler.install(api)
+    profiler.start()
+    try:
+        api._call('Slow()')
+        api._call('CommGetConnectState()')
+    finally:
+        profiler.stop()
+    stalls = list(profiler._stalls)
+    assert [stall['name'] for stall in stalls] == ['Slow()']
+    # reported by the watcher while running, the duration completed when the call returned
+    assert stalls[0]['stack'] is not None and 'test_profiler.py:_call' in stalls[0]['stack']
+    assert stalls[0]['elapsed_ms'] >= 200
+    assert 'stalls: 1' in profiler.report()
+    assert any('test_profiler.py' in line for line in profiler.folded().splitlines())
+
+
+def test_stand_in_methods_and_real_handler_are_wrapped(env, tmp_path):
+    set_config_object(env)
+    api = ReplayHanaAPI(get_config('1q_api'))
+    profiler = CallProfiler(stall_ms=0, report_path=str(tmp_path / 'report.txt'),
+                            folded_path=str(tmp_path / 'stacks.folded'))
+
+    class _App:
+        received = 0
+
+        def on_receive_real_event(self, name, key, block):
+            self.received += 1
+
+    app = _App()
+    profiler.install(api, app)
+    api.comm_init()
+    api.login()
+    app.on_receive_real_event('V00', 'D05GBP/AUD', '')
+    stats = _stats(profiler)
+    assert stats['comm_init']['count'] == 1 and stats['login']['count'] == 1
+    assert stats['event:real']['count'] == 1 and app.received == 1
+    profiler.dump()
+    with open(str(tmp_path / 'report.txt'), encoding='utf-8') as rf:
+        assert rf.readline().split()[0] == 'call'
+    assert (tmp_path / 'stacks.folded').exists()
+
+
+def test_fold_stack_is_root_first():
+    def inner():
+        import sys
+        return fold_stack(sys._getframe())
+    stack = inner().split(';')
+    assert stack[-1] == 'test_profiler.py:inner'
+    assert stack[-2] == 'test_profiler.py:test_fold_stack_is_root_first'
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+    Pub/sub frame and server round-trip tests
+    author: modorigoon
+    since: 0.2.0
+"""
+import base64
+import json
+import os
+import socket
+import struct
+import time
+import pytest
+from lib.pubsub import (FRAME_SYMBOL, FRAME_TICKS, PubSubClient, PubSubProcessException, PubSubServer, decode_frame,
+                        encode_symbol, encode_ticks)
+from lib.transaction import Transaction
+
+
+def _wait_subscribed(server, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        connections = server.stats()['connections'].values()
+        if sum(1 for connection in connections if connection['symbols']) >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError('[test] subscriptions not applied')
+
+
+def _ws_connect(port):
+    connection = socket.create_connection(('127.0.0.1', port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    connection.sendall('GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                       'Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n'.format(key).encode('latin-1'))
+    reader = connection.makefile('rb')
+    assert reader.readline().startswith(b'HTTP/1.1 101')
+    while reader.readline() != b'\r\n':
+        pass
+    return connection, reader
+
+
+def _ws_send_text(connection, text):
+    data = text.encode('utf-8')
+    mask = os.urandom(4)
+    connection.sendall(bytes((0x81, 0x80 | len(data))) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+
+def _ws_read(reader):
+    first, second = reader.read(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', reader.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', reader.read(8))[0]
+    return first & 0x0F, reader.read(length)
+
+
+def test_frame_round_trip():
+    assert decode_frame(encode_symbol(7, 'D05GBP/AUD')) == (FRAME_SYMBOL, (7, 'D05GBP/AUD'))
+    ticks = [(7, 20200302090000, 189234, 1), (8, 20200302090001, -5, -1), (0, 0, 2 ** 62, 2 ** 62)]
+    assert decode_frame(encode_ticks(ticks)) == (FRAME_TICKS, ticks)
+    assert decode_frame(encode_ticks([])) == (FRAME_TICKS, [])
+    with pytest.raises(PubSubProcessException):
+        decode_frame(b'\x09\x00\x00')
+
+
+def test_invalid_slow_client_policy():
+    with pytest.raises(PubSubProcessException):
+        PubSubServer(slow_client='ignore')
+
+
+@pytest.fixture
+def server():
+    pubsub_server = PubSubServer(tcp_port=0, ws_port=0, queue_size=100000, max_batch=100)
+    pubsub_server.start()
+    yield pubsub_server
+    pubsub_server.stop()
+
+
+def test_tcp_round_trip_filters_symbols(server):
+    client = PubSubClient(port=server.ports['tcp'], timeout_s=5)
+    everything = PubSubClient(port=server.ports['tcp'], timeout_s=5)
+    try:
+        client.subscribe(['D05EUR/USD'])
+        everything.subscribe(['*'])
+        _wait_subscribed(server, 2)
+        count = 1000
+        for seq in range(count):
+            server.publish(Transaction(('D05EUR/USD', 'D05GBP/AUD')[seq % 2], '20200302090000', 1000 + seq, seq))
+        received = []
+        while len(received) < count // 2:
+            received.extend(client.read())
+        assert received == [('D05EUR/USD', 20200302090000, 1000 + seq, seq) for seq in range(0, count, 2)]
+        received = []
+        while len(received) < count:
+            received.extend(everything.read())
+        assert [tick[3] for tick in received] == list(range(count))
+    finally:
+        client.close()
+        everything.close()
+
+
+def test_websocket_round_trip(server):
+    connection, reader = _ws_connect(server.ports['ws'])
+    try:
+        _ws_send_text(connection, json.dumps({'subscribe': ['D05GBP/AUD']}))
+        _wait_subscribed(server, 1)
+        for seq in range(10):
+            server.publish(Transaction(('D05EUR/USD', 'D05GBP/AUD')[seq % 2], '20200302090000', 1000 + seq, seq))
+        symbols = {}
+        received = []
+        while len(received) < 5:
+            opcode, payload = _ws_read(reader)
+            assert opcode == 0x2
+            frame_type, value = decode_frame(payload)
+            if frame_type == FRAME_SYMBOL:
+                symbols[value[0]] = value[1]
+            else:
+                received.extend((symbols[symbol_id], seq) for symbol_id, _, _, seq in value)
+        assert received == [('D05GBP/AUD', seq) for seq in range(1, 10, 2)]
+    finally:
+        reader.close()
+        connection.close()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+    Replay API stand-in tests
+    author: modorigoon
+    since: 0.2.0
+"""
+import time
+import pytest
+from common.config import get_config, set_config_object
+from lib.replay_api import ReplayHanaAPI, read_recorded_blocks
+from lib.synthetic import generate_v00_blocks
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+@pytest.fixture
+def api_config(env):
+    set_config_object(env)
+    return get_config('1q_api')
+
+
+def _logged_in(api):
+    api.comm_init()
+    api.login()
+    return api
+
+
+def test_blocks_are_delivered_in_order(api_config):
+    blocks = list(generate_v00_blocks(200))
+    api = _logged_in(ReplayHanaAPI(api_config, blocks=blocks, speed=0, record_latency=True))
+    received = []
+    api.subscriptions.add('V00', _SYMBOL, received.append)
+    api.wait_real_events()
+    assert received == blocks
+    assert api.delivered == 200 and len(api.handler_latencies) == 200
+
+
+def test_loop_ends_when_every_real_is_unregistered(api_config):
+    api = _logged_in(ReplayHanaAPI(api_config, blocks=list(generate_v00_blocks(100)), speed=0))
+    received = []
+
+    def handler(block):
+        received.append(block)
+        if len(received) == 10:
+            api.unregister_real_all()
+
+    api.subscriptions.add('V00', _SYMBOL, handler)
+    api.wait_real_events()
+    assert len(received) == 10
+
+
+def test_dropped_session_loses_blocks_until_login(api_config):
+    blocks = list(generate_v00_blocks(100))
+
+    def source():
+        for index, block in enumerate(blocks):
+            if index == 40:
+                api.comm_init()
+                api.login()
+            yield block
+
+    api = _logged_in(ReplayHanaAPI(api_config, blocks=source(), speed=0))
+    received = []
+
+    def handler(block):
+        received.append(block)
+        if len(received) == 20:
+            api.drop_session()
+
+    api.subscriptions.add('V00', _SYMBOL, handler)
+    api.wait_real_events()
+    assert api.lost == 20
+    assert received == blocks[:20] + blocks[40:]
+
+
+def test_speed_follows_tick_times(api_config):
+    # 2 ticks per second over 3 seconds, replayed at 10x: about 0.2 s
+    blocks = list(generate_v00_blocks(6, ticks_per_second=2))
+    api = _logged_in(ReplayHanaAPI(api_config, blocks=blocks, speed=10))
+    api.subscriptions.add('V00', _SYMBOL, lambda block: None)
+    started_at = time.monotonic()
+    api.wait_real_events()
+    assert 0.15 <= time.monotonic() - started_at < 2
+
+
+def test_read_recorded_blocks(tmp_path):
+    path = tmp_path / 'recorded.txt'
+    path.write_text('1583139600.5\tD05GBP/AUD  V00 20200302090000 2 1.89237 2 1.89257\n\n'
+                    'D05GBP/AUD  V00 20200302090001 2 1.89238 2 1.89258\n', encoding='utf-8')
+    assert list(read_recorded_blocks(str(path))) == [
+        (1583139600.5, 'D05GBP/AUD  V00 20200302090000 2 1.89237 2 1.89257'),
+        (None, 'D05GBP/AUD  V00 20200302090001 2 1.89238 2 1.89258')]
+
+
+def test_fid_pages_follow_the_continuation_context(api_config):
+    api = _logged_in(ReplayHanaAPI(api_config))
+    pages = []
+    api.set_fid_event_handler(lambda rid, block, length: pages.append(length))
+    rid = api.create_request_id()
+    api.set_fid_input(rid, '9034', '20200302')
+    api.set_fid_input(rid, '9035', '20200302')
+    rows = []
+    pn, pnc = '0', ''
+    while True:
+        api.request_fid_data_list(rid, '8,9,30', pn, pnc, '1001', 500)
+        rows.extend(api.get_fid_output_column(rid, '8', api.get_fid_output_count(rid)))
+        pn, pnc = api.get_fid_next_context()
+        if not pnc:
+            break
+    assert pages == [500, 500, 440]
+    assert len(rows) == 1440 and rows[0] == '000000' and rows[-1] == '235900'
+    # responses queued without wait are delivered by process_events
+    api.request_fid_data_list(rid, '8', '0', '', '1001', 10, wait=False)
+    assert len(pages) == 3
+    api.process_events()
+    assert pages[-1] == 10
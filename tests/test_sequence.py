@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    Sequence store tests (numbering, duplicates across restarts, checkpoint state)
+    author: modorigoon
+    since: 0.2.0
+"""
+from lib.sequence import SequenceStore
+
+_TICKS = [('20200302090000', 189234), ('20200302090000', 189234), ('20200302090001', 189240),
+          ('20200302090002', 189238), ('20200302090002', 189241)]
+
+
+def _assign(store, ticks, symbol='D05GBP/AUD'):
+    return [store.assign(symbol, date_time_seq, price) for date_time_seq, price in ticks]
+
+
+def test_same_second_same_price_is_not_duplicate(tmp_path):
+    store = SequenceStore(str(tmp_path), block_size=3)
+    assert _assign(store, _TICKS) == [0, 1, 2, 3, 4]
+
+
+def test_dedup_across_restart(tmp_path):
+    store = SequenceStore(str(tmp_path), block_size=3)
+    first = _assign(store, _TICKS)
+    store.close()
+
+    restarted = SequenceStore(str(tmp_path), block_size=3)
+    # re-delivered ticks (journal replay, second run over the same source) are dropped
+    assert _assign(restarted, _TICKS) == [None] * len(_TICKS)
+    # new ticks continue above every number used before the restart
+    seqs = _assign(restarted, [('20200302090003', 189250), ('20200302090004', 189251)])
+    assert seqs[0] > max(first) and seqs[1] == seqs[0] + 1
+    assert restarted.stats()['D05GBP/AUD']['duplicated'] == len(_TICKS)
+
+
+def test_numbers_stay_increasing_after_crash(tmp_path):
+    store = SequenceStore(str(tmp_path), block_size=10, checkpoint_interval_s=3600)
+    first = _assign(store, _TICKS)
+    # no close: the reserved block is skipped, keys written at the last block reservation only
+    restarted = SequenceStore(str(tmp_path), block_size=10)
+    seq = restarted.assign('D05GBP/AUD', '20200302090010', 189260)
+    assert seq >= 10 > max(first)
+
+
+def test_restart_run_redelivery_of_current_second(tmp_path):
+    store = SequenceStore(str(tmp_path))
+    assert _assign(store, _TICKS[:2]) == [0, 1]
+    store.restart_run()
+    # the reconnect delivers the current second again
+    assert _assign(store, _TICKS[:3]) == [None, None, 2]
+
+
+def test_symbols_are_independent(tmp_path):
+    store = SequenceStore(str(tmp_path))
+    assert _assign(store, _TICKS[:1]) == [0]
+    assert _assign(store, _TICKS[:1], symbol='D05EUR/USD') == [0]
+
+
+def test_state_holds_the_tail_only(tmp_path):
+    store = SequenceStore(str(tmp_path), block_size=100, dedup_capacity=1000, persist_keys=3)
+    ticks = [('2020030209000{}'.format(second), 189234 + i) for second in range(5) for i in range(2)]
+    _assign(store, ticks)
+    state = store._symbols['D05GBP/AUD'].to_state(3)
+    # the newest 3 keys start inside second 3, taken as evicted
+    assert state['evicted_upto'] == '20200302090003'
+    assert state['keys'] == [('20200302090004', 189234, 0), ('20200302090004', 189235, 0)]
+    store.close()
+    restarted = SequenceStore(str(tmp_path), block_size=100, persist_keys=3)
+    # seconds up to evicted_upto are duplicates after the restart, newer keys are looked up
+    assert _assign(restarted, ticks[4:] + [('20200302090004', 189236)]) == [None] * 6 + [100]
+
+
+def test_state_without_persisted_keys(tmp_path):
+    store = SequenceStore(str(tmp_path), persist_keys=0)
+    _assign(store, _TICKS)
+    state = store._symbols['D05GBP/AUD'].to_state(0)
+    assert state['keys'] == [] and state['evicted_upto'] == '20200302090002'
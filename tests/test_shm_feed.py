@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+    Shared memory feed tests (seqlock slots, overruns, symbol table, reader ownership, stale segments)
+    author: modorigoon
+    since: 0.2.0
+"""
+import os
+import subprocess
+import sys
+import uuid
+import pytest
+from common.config import ROOT_DIR
+from lib import shm_feed
+from lib.shm_feed import SharedMemoryPublisher, SharedMemoryReader, ShmFeedProcessException
+from lib.transaction import Transaction
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+@pytest.fixture
+def name():
+    return 'hana1q-test-{}'.format(uuid.uuid4().hex[:12])
+
+
+@pytest.fixture
+def publisher(name):
+    publisher = SharedMemoryPublisher(name, capacity=8, max_symbols=2)
+    yield publisher
+    publisher.close()
+
+
+def _publish(publisher, count, symbol=_SYMBOL, first=0):
+    for seq in range(first, first + count):
+        publisher.publish(Transaction(symbol, '20200302090000', 189000 + seq, seq))
+
+
+def test_reader_follows_the_write_index(publisher, name):
+    _publish(publisher, 3)
+    reader = SharedMemoryReader(name)
+    try:
+        assert reader.poll() == []
+        _publish(publisher, 2, first=3)
+        ticks = reader.poll()
+        assert [tick[3] for tick in ticks] == [3, 4]
+        assert ticks[0][:4] == (_SYMBOL, 20200302090000, 189003, 3)
+        assert reader.poll() == [] and reader.latest(_SYMBOL)[3] == 4
+    finally:
+        reader.close()
+
+
+def test_overrun_and_from_start(publisher, name):
+    _publish(publisher, 5)
+    reader = SharedMemoryReader(name, from_start=True)
+    try:
+        assert [tick[3] for tick in reader.poll(max_count=2)] == [0, 1]
+        # 10 more ticks: the ring holds the newest 8
+        _publish(publisher, 10, first=5)
+        assert [tick[3] for tick in reader.poll()] == list(range(7, 15))
+        assert reader.overruns == 5
+    finally:
+        reader.close()
+
+
+def test_torn_slot_is_skipped(publisher, name):
+    _publish(publisher, 2)
+    reader = SharedMemoryReader(name, from_start=True)
+    try:
+        # a slot whose version is odd is being written
+        offset = publisher._slots_offset + shm_feed._SLOT.size
+        shm_feed._SLOT_VERSION.pack_into(publisher._buf, offset, 3)
+        assert [tick[3] for tick in reader.poll()] == [0] and reader.overruns == 1
+        assert reader.latest()[3] == 0
+    finally:
+        reader.close()
+
+
+def test_symbol_table_is_bounded(publisher, name):
+    _publish(publisher, 1)
+    _publish(publisher, 1, symbol='D05EUR/USD')
+    _publish(publisher, 1, symbol='D05USD/JPY')
+    assert publisher.rejected == 1 and publisher.published == 2
+    reader = SharedMemoryReader(name, from_start=True)
+    try:
+        assert [tick[0] for tick in reader.poll()] == [_SYMBOL, 'D05EUR/USD']
+        assert reader.latest('D05USD/JPY') is None
+    finally:
+        reader.close()
+
+
+def test_segment_survives_a_reader_process(publisher, name):
+    _publish(publisher, 1)
+    code = 'from lib.shm_feed import SharedMemoryReader\n' \
+           'reader = SharedMemoryReader({!r}, from_start=True)\n' \
+           'print(len(reader.poll()))\n' \
+           'reader.close()\n'.format(name)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, check=True, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert output.stdout.strip() == '1' and 'leaked' not in output.stderr
+    # the exiting reader did not remove the segment
+    reader = SharedMemoryReader(name, from_start=True)
+    try:
+        assert len(reader.poll()) == 1
+    finally:
+        reader.close()
+
+
+def test_segment_of_a_running_publisher_is_refused(publisher, name):
+    with pytest.raises(ShmFeedProcessException):
+        SharedMemoryPublisher(name, capacity=8)
+
+
+def test_stale_segment_is_reclaimed(name):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    stale = SharedMemoryPublisher(name, capacity=8)
+    shm_feed._OWNER_PID.pack_into(stale._buf, shm_feed._OWNER_PID_OFFSET, process.pid)
+    # crashed publisher: the segment is left behind
+    shm_feed._PUBLISHED.discard(name)
+    stale._buf.release()
+    stale._segment.close()
+    assert not shm_feed._owner_alive(process.pid) and shm_feed._owner_alive(os.getpid())
+    publisher = SharedMemoryPublisher(name, capacity=4)
+    try:
+        assert publisher.capacity == 4
+    finally:
+        publisher.close()
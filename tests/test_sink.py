@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+    Sink pipeline backpressure tests
+    author: modorigoon
+    since: 0.2.0
+"""
+import threading
+import time
+import pytest
+from lib.sink import Sink, SinkPipeline, SinkProcessException
+from lib.transaction import Transaction
+
+
+class _MemorySink(Sink):
+
+    name = 'memory'
+
+    def __init__(self, delay_s=0.0, fail_on_open=False):
+        self.delay_s = delay_s
+        self.fail_on_open = fail_on_open
+        self.seqs = []
+        self.written = threading.Event()
+
+    def open(self):
+        if self.fail_on_open:
+            raise OSError('[test] sink unavailable')
+
+    def write_batch(self, batch):
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        self.seqs.extend(item['seq'] if isinstance(item, dict) else item.seq for item in batch)
+        self.written.set()
+
+
+def _transaction(seq):
+    return Transaction('D05GBP/AUD', '20200302090000', 189234, seq)
+
+
+def test_spill_policy_requires_path():
+    with pytest.raises(SinkProcessException):
+        SinkPipeline(_MemorySink(), backpressure=SinkPipeline.SPILL)
+
+
+def test_drop_oldest_keeps_newest():
+    sink = _MemorySink()
+    pipeline = SinkPipeline(sink, queue_size=10, batch_size=100, backpressure=SinkPipeline.DROP_OLDEST)
+    accepted = [pipeline.put(_transaction(seq)) for seq in range(25)]
+    pipeline.start()
+    pipeline.stop()
+    assert all(accepted)
+    assert sink.seqs == list(range(15, 25))
+    assert pipeline.stats()['dropped'] == 15
+
+
+def test_block_waits_for_writer():
+    sink = _MemorySink(delay_s=0.001)
+    pipeline = SinkPipeline(sink, queue_size=20, batch_size=5, flush_interval_ms=10, backpressure=SinkPipeline.BLOCK)
+    pipeline.start()
+    accepted = [pipeline.put(_transaction(seq)) for seq in range(500)]
+    pipeline.stop()
+    assert all(accepted)
+    assert sink.seqs == list(range(500))
+    assert pipeline.stats()['dropped'] == 0
+
+
+def test_block_without_writer_drops():
+    pipeline = SinkPipeline(_MemorySink(), queue_size=10, backpressure=SinkPipeline.BLOCK)
+    accepted = [pipeline.put(_transaction(seq)) for seq in range(30)]
+    assert accepted.count(True) == 10
+    assert pipeline.stats()['dropped'] == 20
+
+
+def test_block_with_failed_sink_drops():
+    pipeline = SinkPipeline(_MemorySink(fail_on_open=True), queue_size=10, backpressure=SinkPipeline.BLOCK)
+    pipeline.start()
+    time.sleep(0.2)
+    accepted = [pipeline.put(_transaction(seq)) for seq in range(30)]
+    pipeline.stop()
+    assert accepted.count(False) >= 20
+    assert pipeline.stats()['dropped'] >= 20
+
+
+def test_spill_keeps_fifo_order(tmp_path):
+    sink = _MemorySink(delay_s=0.002)
+    pipeline = SinkPipeline(sink, queue_size=50, batch_size=10, flush_interval_ms=20, backpressure=SinkPipeline.SPILL,
+                            spill_path=str(tmp_path / 'spill.jsonl'))
+    pipeline.start()
+    for seq in range(5000):
+        pipeline.put(_transaction(seq))
+        if seq % 100 == 0:
+            time.sleep(0.001)
+    pipeline.stop()
+    assert pipeline.stats()['spilled'] > 0
+    assert sink.seqs == list(range(5000))
+
+
+def test_flush_barrier():
+    sink = _MemorySink()
+    pipeline = SinkPipeline(sink, queue_size=100, batch_size=10, flush_interval_ms=10)
+    for seq in range(15):
+        pipeline.put(_transaction(seq))
+    position = pipeline.position()
+    assert not pipeline.flushed(position)
+    pipeline.start()
+    deadline = time.monotonic() + 5
+    while not pipeline.flushed(position) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pipeline.stop()
+    assert pipeline.flushed(position)
+    assert not pipeline.lost_after(0)
+
+
+class _RecordingSink(_MemorySink):
+
+    name = 'recording'
+
+    def __init__(self, delay_s=0.0):
+        super().__init__(delay_s)
+        self.items = []
+
+    def write_batch(self, batch):
+        super().write_batch(batch)
+        self.items.extend(batch)
+
+
+def test_spilled_items_keep_their_type(tmp_path):
+    sink = _RecordingSink(delay_s=0.005)
+    pipeline = SinkPipeline(sink, queue_size=5, batch_size=5, flush_interval_ms=10, backpressure=SinkPipeline.SPILL,
+                            spill_path=str(tmp_path / 'spill.jsonl'))
+    pipeline.start()
+    for seq in range(200):
+        pipeline.put(_transaction(seq))
+        pipeline.put({'resolution': '1s', 'seq': 1000 + seq})
+    pipeline.stop()
+    assert pipeline.stats()['spilled'] > 0
+    assert sink.items[::2] == [_transaction(seq) for seq in range(200)]
+    assert all(isinstance(item, dict) for item in sink.items[1::2])
+
+
+def test_spill_left_by_crashed_run_is_written_first(tmp_path):
+    spill_path = tmp_path / 'spill.jsonl'
+    # a crashed run: one file being drained, one being spilled into (last line cut)
+    spill_path.with_name('spill.jsonl.drain').write_text('["D05GBP/AUD","20200302090000",189234,0]\n')
+    spill_path.write_text('["D05GBP/AUD","20200302090000",189234,1]\n{"resolution":"1s","seq":2}\n["D05GB')
+    sink = _RecordingSink()
+    pipeline = SinkPipeline(sink, queue_size=10, batch_size=10, flush_interval_ms=10,
+                            backpressure=SinkPipeline.SPILL, spill_path=str(spill_path))
+    pipeline.start()
+    pipeline.put(_transaction(3))
+    position = pipeline.position()
+    pipeline.stop()
+    assert sink.items == [_transaction(0), _transaction(1), {'resolution': '1s', 'seq': 2}, _transaction(3)]
+    assert position == 1 and pipeline.flushed(position)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+    SQLite store tests (ticks and FID bar rows, inserted count of duplicated keys, read only connection)
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from lib.sqlite_store import SQLiteStoreProcessException, SQLiteTickStore
+from lib.transaction import Transaction
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+def _fid_row(time_seq, resolution='1m'):
+    return {'symbol': _SYMBOL, '9': 20200302, '8': time_seq, '1098': 2, '30': '1.89230', '31': '1.89250',
+            '32': '1.89210', '33': '1.89240', '6': 5, '40': '1.89260', '41': '1.89280', '42': '1.89240',
+            '43': '1.89270', '666': 30, 'resolution': resolution}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteTickStore(str(tmp_path / 'ticks.db'))
+    yield store
+    store.close()
+
+
+def test_duplicated_keys_are_not_counted(store):
+    # more rows than one multi-row statement
+    batch = [Transaction(_SYMBOL, '20200302090000', 189234 + seq, seq) for seq in range(250)]
+    store.insert_batch(batch)
+    assert store.inserted == 250
+    store.insert_batch(batch[200:] + [Transaction(_SYMBOL, '20200302090001', 189300, 0)])
+    assert store.inserted == 251 and store.count(_SYMBOL) == 251
+    assert store.latest(_SYMBOL) == [(_SYMBOL, 20200302090001, 0, 189300)]
+
+
+def test_fid_rows_are_stored_as_bars(store):
+    store.insert_batch([_fid_row(90000), _fid_row(90100), _fid_row(90100),
+                        {'symbol': _SYMBOL, 'date_time_seq': '20200302090005', 'seq': 1, 'price': 189235}])
+    assert store.inserted == 3 and store.count() == 1
+    bars = store.bars(_SYMBOL, '1m', '20200302', '20200302')
+    assert [bar[1] for bar in bars] == [20200302090000, 20200302090100]
+    # symbol, date_time_seq, resolution, ticks, sell sign/open/high/low/close, buy sign/open/high/low/close, spread
+    assert bars[0][2:] == ('1m', 0, 2, 189230, 189250, 189210, 189240, 5, 189260, 189280, 189240, 189270, 30)
+    assert store.bars(_SYMBOL, '5m', '20200302', '20200302') == []
+
+
+def test_read_only_connection(store, tmp_path):
+    store.insert_batch([Transaction(_SYMBOL, '20200302090000', 189234, 0)])
+    reader = SQLiteTickStore(str(tmp_path / 'ticks.db'), readonly=True)
+    try:
+        assert reader.range(_SYMBOL, '20200302', '20200302') == [(_SYMBOL, 20200302090000, 0, 189234)]
+        with pytest.raises(SQLiteStoreProcessException):
+            reader.insert_batch([])
+    finally:
+        reader.close()
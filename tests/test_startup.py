@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+    Lazy startup tests (nothing loaded at import, configuration parsed once and read only)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import subprocess
+import sys
+import pytest
+from common.config import ROOT_DIR, Configuration, ConfigurationProcessException, get_config, get_config_object, \
+    get_configuration, set_config_object
+
+_IMPORT_PROBE = '''
+import json, sys
+import main
+from common import config, logger
+print(json.dumps({
+    'modules': sorted(name for name in sys.modules
+                      if name.split('.')[0] in ('PyQt5', 'application', 'numpy', 'pyarrow')
+                      or name in ('lib.window', 'lib.hana_api', 'lib.metrics_server')),
+    'config_loaded': config.__CONFIG__ is not None,
+    'opts_parsed': config.__opts__ is not None,
+    'handlers': len(logger.log.handlers)
+}))
+'''
+
+
+def test_import_loads_nothing():
+    # a fresh interpreter: the test process has configured everything already
+    output = subprocess.run([sys.executable, '-c', _IMPORT_PROBE], cwd=ROOT_DIR, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True, timeout=60).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == {'modules': [], 'config_loaded': False,
+                                                          'opts_parsed': False, 'handlers': 0}
+
+
+def test_configuration_is_read_only(env):
+    set_config_object(env)
+    configuration = get_configuration()
+    assert get_configuration() is configuration and configuration.env == 'local'
+    with pytest.raises(TypeError):
+        configuration.values['sink']['type'] = 'none'
+    assert isinstance(get_config('1q_api')['targets'], tuple)
+    # mutable copies are detached from the configuration
+    copy = get_config_object()
+    copy['sink']['type'] = 'none'
+    assert get_config('sink')['type'] == 'file'
+
+
+def test_get_config_default(env):
+    # env restores the test configuration afterwards
+    configuration = Configuration('local', {'e': 'local'}, {'node_name': 'node-1'})
+    set_config_object(configuration)
+    assert get_config('node_name') == 'node-1' and get_config('missing', None) is None
+    with pytest.raises(ConfigurationProcessException):
+        get_config('missing')
+    assert configuration.options['e'] == 'local'
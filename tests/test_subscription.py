@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+    Subscription routing tests
+    author: modorigoon
+    since: 0.2.0
+"""
+from common.config import get_config, set_config_object
+from lib.replay_api import ReplayHanaAPI
+from lib.subscription import SubscriptionManager
+from lib.synthetic import generate_v00_blocks
+
+
+def _manager():
+    registered = []
+    manager = SubscriptionManager(lambda real_name, symbol: registered.append((real_name, symbol)) is None,
+                                  lambda real_name, symbol: True)
+    return manager, registered
+
+
+def test_dispatch_routes_by_real_name_and_key():
+    manager, registered = _manager()
+    received = {'A': [], 'B': []}
+    manager.add('V00', 'A', received['A'].append)
+    manager.add('V00', 'B', received['B'].append)
+    assert registered == [('V00', 'A'), ('V00', 'B')]
+    assert manager.dispatch('V00', 'A', 'a1')
+    assert manager.dispatch('V00 ', ' B', 'b1')
+    assert received == {'A': ['a1'], 'B': ['b1']}
+
+
+def test_unrouted_block_is_dropped():
+    manager, _ = _manager()
+    received = []
+    manager.add('V00', 'A', received.append)
+    assert not manager.dispatch('V00', 'C', 'c1')
+    assert not manager.dispatch('V01', 'A', 'a1')
+    manager.remove('V00', 'A')
+    assert not manager.dispatch('V00', 'A', 'a2')
+    assert received == []
+    assert manager.unrouted == 3
+
+
+def test_handler_error_is_counted():
+    manager, _ = _manager()
+
+    def handler(block):
+        raise ValueError(block)
+
+    manager.add('V00', 'A', handler)
+    assert manager.dispatch('V00', 'A', 'a1')
+    assert manager.get('V00', 'A').errors == 1
+
+
+def test_register_all_after_reconnect():
+    manager, registered = _manager()
+    manager.add('V00', 'A', lambda block: None)
+    manager.mark_unregistered()
+    assert not manager.active()
+    assert manager.register_all()
+    assert manager.active() and registered == [('V00', 'A'), ('V00', 'A')]
+
+
+def test_replay_drops_blocks_of_other_symbols(env):
+    set_config_object(env)
+    from application import Application
+    blocks = list(generate_v00_blocks(100)) + list(generate_v00_blocks(50, symbol='D05XXX/YYY'))
+    api = ReplayHanaAPI(get_config('1q_api'), blocks=blocks, speed=0)
+    app = Application(api=api, serve=False)
+    app.connect()
+    app.listen_real()
+    try:
+        assert api.subscriptions.unrouted == 50
+        assert app.get_state().tick_count == 100
+        assert [stats['received'] for stats in app.get_subscription_stats().values()] == [100]
+    finally:
+        app.disconnect()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+    Supervisor tests (shards, per worker configuration, stream merge, merge server)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import socket
+import time
+from lib.supervisor import MergeServer, StreamMerger, shard_targets, worker_config, worker_path
+
+_TARGETS = [('V00', 'D05GBP/AUD'), ('V00', 'D05EUR/USD'), ('V00', 'D05USD/JPY')]
+
+
+def _row(date_time_seq, symbol='D05GBP/AUD', seq=1):
+    return {'symbol': symbol, 'date_time_seq': date_time_seq, 'price': '1.89237', 'seq': seq}
+
+
+def test_shard_targets_round_robin():
+    assert shard_targets(_TARGETS, 2) == [[_TARGETS[0], _TARGETS[2]], [_TARGETS[1]]]
+    # no empty shard when there are more workers than targets
+    assert shard_targets(_TARGETS[:1], 4) == [_TARGETS[:1]]
+
+
+def test_worker_path():
+    assert worker_path('data/bars.jsonl', 1) == 'data/bars-worker-1.jsonl'
+    assert worker_path('data/sequence', 0) == 'data/sequence-worker-0'
+
+
+def test_worker_sink_spills_instead_of_blocking(env):
+    config = worker_config(1, env, _TARGETS[:2], '127.0.0.1', 9500)
+    assert [target['symbol'] for target in config['1q_api']['targets']] == ['D05GBP/AUD', 'D05EUR/USD']
+    sink = config['sink']
+    assert sink['type'] == 'tcp' and sink['tcp'] == {'host': '127.0.0.1', 'port': 9500}
+    assert sink['backpressure'] == 'spill' and sink['spill_path'] == worker_path(env['sink']['spill_path'], 1)
+    assert config['bars']['sink']['file']['path'] == worker_path(env['bars']['sink']['file']['path'], 1)
+    assert config['journal'] is None
+    # the supervisor configuration is not changed
+    assert env['sink']['type'] == 'file'
+
+
+def test_worker_sink_without_spill_file_waits_bounded(env):
+    env['sink'].pop('spill_path')
+    env['sink'].pop('block_timeout_ms', None)
+    sink = worker_config(0, env, _TARGETS, '127.0.0.1', 9500)['sink']
+    assert sink['backpressure'] == 'block' and sink['block_timeout_ms'] == 1000
+
+
+def test_merger_orders_within_window():
+    merged = []
+    merger = StreamMerger(merged.append, reorder_window_ms=50)
+    merger.put(_row('20200302090002', seq=3))
+    merger.put(_row('20200302090000', seq=1))
+    merger.put(_row('20200302090001', 'D05EUR/USD', seq=1))
+    # rows are held for the reorder window
+    assert merger.release() == 0
+    time.sleep(0.06)
+    assert merger.release() == 3
+    assert [row['date_time_seq'] for row in merged] == ['20200302090000', '20200302090001', '20200302090002']
+    # a row older than the last released one is passed through as late
+    merger.put(_row('20200302085959'))
+    assert merger.release(flush=True) == 1
+    assert merger.late == 1 and merger.emitted == 4 and merger.depth() == 0
+
+
+def test_merge_server_receives_lines():
+    merger = StreamMerger(lambda row: None, reorder_window_ms=0)
+    server = MergeServer(merger)
+    server.start()
+    try:
+        with socket.create_connection(('127.0.0.1', server.port)) as connection:
+            connection.sendall((json.dumps(_row('20200302090000')) + '\n' + 'not json\n'
+                                + json.dumps(_row('20200302090001')) + '\n').encode('utf-8'))
+        deadline = time.monotonic() + 5
+        while (merger.received < 2 or server.invalid < 1) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        server.stop()
+    assert merger.received == 2 and server.invalid == 1
+
+
+def test_replay_workers_are_merged(env, tmp_path):
+    from lib.sink import FileSink, SinkPipeline
+    from lib.supervisor import Supervisor
+    env['1q_api']['targets'] = [{'real_name': real_name, 'symbol': symbol} for real_name, symbol in _TARGETS[:2]]
+    output = str(tmp_path / 'merged.jsonl')
+    supervisor = Supervisor(env, SinkPipeline(FileSink(output), backpressure='block'), workers=2,
+                            reorder_window_ms=0, max_restarts=0, poll_interval_ms=50)
+    stats = supervisor.run()
+    with open(output, encoding='utf-8') as rf:
+        rows = [json.loads(line) for line in rf]
+    assert stats['workers'] == 2 and stats['restarts'] == 0
+    # each worker replays the configured count for its own symbol
+    assert len(rows) == stats['received'] == 600
+    assert sorted(row['symbol'] for row in rows).count('D05EUR/USD') == 300
+    keys = [(row['date_time_seq'], row['symbol'], row['seq']) for row in rows]
+    assert len(set(keys)) == 600
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+    Tick cache tests (ring wrap, range lookups, late ticks, concurrent readers, query endpoint)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from lib.tick_cache import TickCache, TickCacheProcessException, TickRing
+from lib.tick_cache_server import TickCacheServer
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+def _sequence(second):
+    return '2020030209{:02d}{:02d}'.format(second // 60, second % 60)
+
+
+def _fill(ring, seconds):
+    """ two ticks per second, seq counts every tick """
+    rows = []
+    for second in seconds:
+        for _ in range(2):
+            seq = len(rows)
+            ring.append(_sequence(second), 189000 + seq, 189010 + seq, seq)
+            rows.append((int(_sequence(second)), 189000 + seq, 189010 + seq, seq))
+    return rows
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(TickCacheProcessException):
+        TickRing(_SYMBOL, 0)
+
+
+def test_ring_keeps_the_newest_ticks():
+    ring = TickRing(_SYMBOL, 7)
+    assert ring.latest() is None and ring.last(3) == [] and ring.range('20200302', '20200302') == []
+    rows = _fill(ring, range(10))
+    assert len(ring) == 7 and ring.appended == 20
+    assert ring.latest() == rows[-1]
+    assert ring.last(3) == rows[-3:] and ring.last(100) == rows[-7:]
+    stats = ring.stats()
+    assert (stats['oldest'], stats['newest']) == (rows[-7][0], rows[-1][0])
+
+
+@pytest.mark.parametrize('count', [3, 7, 10, 13])
+def test_range_across_the_wrap(count):
+    ring = TickRing(_SYMBOL, 7)
+    cached = _fill(ring, range(1, count + 1))[-7:]
+    for low in range(count + 2):
+        for high in range(low, count + 2):
+            expected = [row for row in cached if int(_sequence(low)) <= row[0] <= int(_sequence(high))]
+            assert ring.range(_sequence(low), _sequence(high)) == expected
+    assert ring.range('20200302', '20200302', limit=2) == cached[:2]
+
+
+def test_late_ticks_are_not_cached():
+    ring = TickRing(_SYMBOL, 10)
+    _fill(ring, (5, 6))
+    assert ring.append(_sequence(4), 1, 1, None) is False
+    assert ring.late == 1 and len(ring) == 4
+    # same second as the newest one is in order, no sequence is stored as -1
+    assert ring.append(_sequence(6), 1, 1, None) is True and ring.latest()[3] == -1
+
+
+def test_readers_see_consistent_rows_while_writing():
+    ring = TickRing(_SYMBOL, 64)
+    done = threading.Event()
+
+    def write():
+        for i in range(20000):
+            ring.append(_sequence(i // 100 % 3600), i, i, i)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        while not done.is_set():
+            rows = ring.last(64)
+            # every row is complete and the rows are one run of consecutive appends
+            assert all(row[1] == row[2] == row[3] for row in rows)
+            if rows:
+                assert [row[3] for row in rows] == list(range(rows[0][3], rows[0][3] + len(rows)))
+    finally:
+        writer.join()
+
+
+def test_query_endpoint():
+    cache = TickCache(capacity=10)
+    _fill(cache.ring(_SYMBOL), range(3))
+    server = TickCacheServer(cache, port=0)
+    server.start()
+    base = 'http://127.0.0.1:{}'.format(server.port)
+
+    def get(path):
+        with urllib.request.urlopen(base + path, timeout=5) as response:
+            return json.loads(response.read().decode('utf-8'))
+    try:
+        assert get('/symbols')[_SYMBOL]['cached'] == 6
+        latest = get('/ticks/latest?symbol=D05GBP%2FAUD')
+        assert latest['date_time_seq'] == _sequence(2) and latest['price_text'] == '1.89005'
+        assert [tick['seq'] for tick in get('/ticks/last?symbol=D05GBP%2FAUD&n=2')] == [4, 5]
+        ticks = get('/ticks/range?symbol=D05GBP%2FAUD&from={}&to={}'.format(_sequence(1), _sequence(1)))
+        assert [tick['seq'] for tick in ticks] == [2, 3]
+        for path, status in (('/ticks/latest?symbol=OTHER', 404), ('/ticks/range?symbol=D05GBP%2FAUD', 400),
+                             ('/other', 404)):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                get(path)
+            assert error.value.code == status
+    finally:
+        server.stop()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+    V00 parser and transaction processor tests
+    author: modorigoon
+    since: 0.2.0
+"""
+import pytest
+from lib.sequence import SequenceStore
+from lib.synthetic import format_v00_block
+from lib.transaction import (Transaction, TransactionParseException, TransactionParser, fixed_to_price,
+                             price_to_fixed)
+from lib.transaction_processor import TransactionProcessor
+
+_SYMBOL = 'D05GBP/AUD'
+
+
+def test_price_conversions():
+    assert price_to_fixed('1.89234') == 189234
+    assert price_to_fixed('1.8923') == 189230
+    assert price_to_fixed('1.892345') == 189234
+    assert price_to_fixed('105') == 10500000
+    assert fixed_to_price(189234) == '1.89234'
+    assert fixed_to_price(-5) == '-0.00005'
+    assert fixed_to_price(None) is None
+
+
+def test_parse_reads_both_prices_once():
+    parser = TransactionParser(_SYMBOL)
+    transaction = parser.parse(format_v00_block(_SYMBOL, '20200302090000', '1.89237', '1.89257'), 7)
+    assert transaction == Transaction(_SYMBOL, '20200302090000', 189237, 7, 189257)
+    assert transaction.to_dict() == {'symbol': _SYMBOL, 'date_time_seq': '20200302090000', 'price': 189237,
+                                     'price_text': '1.89237', 'buy_price': 189257, 'seq': 7}
+
+
+@pytest.mark.parametrize('sell, buy, expected', [
+    ('1.8923', '1.89257', (189230, 189257)),
+    ('1.89237', '1.892571', (189237, 189257)),
+    ('189', '190', (18900000, 19000000)),
+])
+def test_parse_other_fraction_lengths(sell, buy, expected):
+    transaction = TransactionParser(_SYMBOL).parse(format_v00_block(_SYMBOL, '20200302090000', sell, buy))
+    assert (transaction.price, transaction.buy_price) == expected
+
+
+def test_parse_zero_digits():
+    transaction = TransactionParser(_SYMBOL, price_digits=0).parse(
+        format_v00_block(_SYMBOL, '20200302090000', '1890', '1891'))
+    assert (transaction.price, transaction.buy_price) == (1890, 1891)
+
+
+def test_invalid_block_raises():
+    parser = TransactionParser(_SYMBOL)
+    with pytest.raises(TransactionParseException):
+        parser.parse('D05GBP/AUD V00 20200302090000')
+    with pytest.raises(TransactionParseException):
+        parser.parse(format_v00_block(_SYMBOL, '20200302090000', 'x.y', '1.89257'))
+    with pytest.raises(TransactionParseException):
+        TransactionParser(_SYMBOL, date_time_seq_field=4)
+
+
+def test_processor_numbers_and_drops_duplicates(tmp_path):
+    sequences = SequenceStore(str(tmp_path))
+    processor = TransactionProcessor(symbol=_SYMBOL, sequences=sequences)
+    block = format_v00_block(_SYMBOL, '20200302090000', '1.89237', '1.89257')
+    first = processor.process(block)
+    # a reconnect delivers the same tick again
+    sequences.restart_run()
+    again = processor.process(block)
+    assert (first.seq, first.buy_price) == (0, 189257)
+    assert again.seq is None
+
+
+def test_processor_counts_without_sequence_store():
+    processor = TransactionProcessor(symbol=_SYMBOL)
+    block = format_v00_block(_SYMBOL, '20200302090000', '1.89237', '1.89257')
+    assert [processor.process(block).seq for _ in range(3)] == [0, 1, 2]
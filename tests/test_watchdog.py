@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+    Connection watchdog tests (outage, backoff, recovery gap, session gating, event thread checks)
+    author: modorigoon
+    since: 0.2.0
+"""
+import json
+import time
+from lib.collector_state import CollectorState
+from lib.transaction import Transaction
+from lib.watchdog import ConnectionWatchdog
+
+
+class _App:
+
+    def __init__(self):
+        self.state = CollectorState()
+        self.alive = True
+        self.reconnect_results = []
+        self.reconnects = 0
+        self.calls = []
+
+    def get_state(self):
+        return self.state
+
+    def get_connection_state(self):
+        return self.alive
+
+    def reconnect(self):
+        self.reconnects += 1
+        self.alive = self.reconnect_results.pop(0)
+        return self.alive
+
+    def call_soon(self, callback):
+        self.calls.append(callback)
+
+    def get_symbols(self):
+        return ['D05GBP/AUD']
+
+    def tick(self, date_time_seq):
+        self.state.on_transaction(Transaction('D05GBP/AUD', date_time_seq, 189237, self.state.tick_count))
+
+
+class _Detector:
+
+    def __init__(self, threshold):
+        self.value = threshold
+
+    def threshold(self, date_time_seq):
+        return self.value
+
+
+def _watchdog(app, **kwargs):
+    options = dict(interval_s=3600, inactivity_s=60, backoff_initial_s=1.0, backoff_max_s=4.0)
+    options.update(kwargs)
+    watchdog = ConnectionWatchdog(app, **options)
+    watchdog.start()
+    return watchdog
+
+
+def test_outage_backoff_and_recovery(tmp_path):
+    app = _App()
+    gap_path = str(tmp_path / 'gaps.jsonl')
+    watchdog = _watchdog(app, gap_path=gap_path)
+    try:
+        app.tick('20200302090000')
+        watchdog.check()
+        app.alive = False
+        app.reconnect_results = [False, False, True]
+        watchdog.check()
+        assert watchdog.stats()['down'] is True and app.reconnects == 1
+        # the next attempt waits for the backoff
+        watchdog.check()
+        assert app.reconnects == 1
+        assert 0.5 < watchdog._next_attempt_at - time.monotonic() <= 1.0
+        watchdog._next_attempt_at = 0.0
+        watchdog.check()
+        # doubled after the second failure
+        assert app.reconnects == 2 and 1.5 < watchdog._next_attempt_at - time.monotonic() <= 2.0
+        watchdog._next_attempt_at = 0.0
+        watchdog.check()
+        assert app.reconnects == 3 and watchdog.reconnects == 1
+        # reconnected, still down until the first tick
+        watchdog.check()
+        assert watchdog.stats()['down'] is True
+        app.tick('20200302090500')
+        watchdog.check()
+    finally:
+        watchdog.stop()
+    stats = watchdog.stats()
+    assert stats['down'] is False and stats['outages'] == 1 and stats['failures'] == 2 and stats['gaps'] == 1
+    assert watchdog._attempts == 0 and watchdog._next_attempt_at == 0.0
+    with open(gap_path, encoding='utf-8') as rf:
+        gap = json.loads(rf.readline())
+    assert (gap['from_date_time_seq'], gap['to_date_time_seq']) == ('20200302090000', '20200302090500')
+    assert gap['reason'] == 'session lost' and gap['symbols'] == ['D05GBP/AUD']
+
+
+def test_inactivity_is_gated_by_session_threshold():
+    app = _App()
+    detector = _Detector(0)
+    watchdog = _watchdog(app, inactivity_s=1, detector=detector)
+    try:
+        watchdog._last_tick_at -= 10
+        # market closed: no tick is no outage
+        watchdog.check()
+        assert watchdog.stats()['outages'] == 0
+        # open session with a longer threshold than inactivity_s
+        detector.value = 30
+        watchdog.check()
+        assert watchdog.stats()['outages'] == 0
+        watchdog._last_tick_at -= 30
+        app.reconnect_results = [True]
+        watchdog.check()
+        assert watchdog.stats()['outages'] == 1 and app.reconnects == 1
+    finally:
+        watchdog.stop()
+
+
+def test_no_tick_after_reconnect_backs_off():
+    app = _App()
+    watchdog = _watchdog(app, inactivity_s=1)
+    try:
+        watchdog._last_tick_at -= 10
+        app.reconnect_results = [True, True]
+        watchdog.check()
+        assert app.reconnects == 1 and watchdog.reconnects == 1
+        watchdog._last_tick_at -= 10
+        watchdog.check()
+        # counted as a failure, the next reconnect waits for the backoff
+        assert watchdog.failures == 1 and app.reconnects == 1
+        watchdog._next_attempt_at = 0.0
+        watchdog.check()
+        assert app.reconnects == 2
+    finally:
+        watchdog.stop()
+
+
+def test_checks_are_posted_to_the_event_thread():
+    app = _App()
+    watchdog = ConnectionWatchdog(app, interval_s=3600)
+    app.alive = False
+    app.reconnect_results = [True]
+    watchdog._post_check()
+    watchdog._post_check()
+    # one pending check at most, nothing ran on the timer thread
+    assert len(app.calls) == 1 and app.reconnects == 0
+    app.calls.pop()()
+    assert app.reconnects == 1
+    watchdog._post_check()
+    assert len(app.calls) == 1
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    Wire format tests (round trips, exchange time offset, batch stream over the wire sink)
+    author: modorigoon
+    since: 0.2.0
+"""
+import calendar
+import io
+import random
+import socket
+import threading
+import pytest
+from lib.sink import SinkPipeline, TcpWireSink
+from lib.transaction import PRICE_DIGITS, Transaction
+from lib.wire import (FLAG_NO_ASK, RECORD_SIZE, SymbolTable, WireProcessException, WireRecord, decode_batch,
+                      decode_record, decode_records, encode_batch, encode_frame, encode_record, encode_records,
+                      read_frame, to_record)
+
+
+@pytest.fixture
+def records():
+    symbols = SymbolTable()
+    rng = random.Random(1)
+    rows = []
+    for i in range(5000):
+        transaction = Transaction(rng.choice(['D05GBP/AUD', 'D05EUR/USD', '한글']), '20200302%06d' % (90000 + i // 7),
+                                  189234 + rng.randint(-300, 300), None if i % 97 == 0 else i)
+        ask = None if i % 5 == 0 else transaction.price + rng.randint(0, 40)
+        rows.append(to_record(transaction, symbols, ask=ask))
+    # extreme values
+    rows.append(WireRecord(1, -5, -(2 ** 60), 2 ** 60, 2 ** 40, 2))
+    return rows, symbols
+
+
+def test_record_round_trip(records):
+    rows, _ = records
+    assert decode_record(encode_record(rows[3])) == rows[3]
+    encoded = encode_records(rows)
+    assert len(encoded) == RECORD_SIZE * len(rows)
+    assert decode_records(encoded) == rows
+
+
+def test_batch_round_trip(records):
+    rows, symbols = records
+    decoded, names, price_digits = decode_batch(encode_batch(rows, symbols.symbols))
+    assert decoded == rows
+    assert names == symbols.symbols
+    assert price_digits == PRICE_DIGITS
+    assert decode_batch(encode_batch([], symbols.symbols))[0] == []
+    assert decode_batch(encode_batch(rows[:1]))[0] == rows[:1]
+
+
+def test_batch_is_smaller_than_records(records):
+    rows, symbols = records
+    assert len(encode_batch(rows, symbols.symbols)) < len(encode_records(rows)) / 4
+
+
+def test_invalid_records_raise(records):
+    rows, _ = records
+    with pytest.raises(WireProcessException):
+        decode_records(encode_records(rows)[:-1])
+    with pytest.raises(WireProcessException):
+        decode_records(b'x' * RECORD_SIZE)
+    with pytest.raises(WireProcessException):
+        decode_batch(b'XXXX' + encode_batch(rows)[4:])
+
+
+def test_epoch_is_utc():
+    transaction = Transaction('D05GBP/AUD', '20200302090000', 189234, 7)
+    # 09:00 KST is 00:00 UTC
+    assert to_record(transaction, SymbolTable()).epoch_us == calendar.timegm((2020, 3, 2, 0, 0, 0)) * 1000000
+    assert to_record(transaction, SymbolTable(), utc_offset_s=0).epoch_us == \
+        calendar.timegm((2020, 3, 2, 9, 0, 0)) * 1000000
+
+
+def test_frame_stream(records):
+    rows, symbols = records
+    stream = io.BytesIO(encode_frame(rows[:10], symbols.symbols) + encode_frame(rows[10:], symbols.symbols))
+    assert read_frame(stream)[0] == rows[:10] and read_frame(stream)[0] == rows[10:]
+    assert read_frame(stream) is None
+    with pytest.raises(WireProcessException):
+        read_frame(io.BytesIO(encode_frame(rows[:10])[:-1]))
+
+
+def test_wire_sink_sends_frames():
+    listener = socket.create_server(('127.0.0.1', 0))
+    frames = []
+
+    def receive():
+        connection, _ = listener.accept()
+        with connection, connection.makefile('rb') as stream:
+            while True:
+                frame = read_frame(stream)
+                if frame is None:
+                    break
+                frames.append(frame)
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    pipeline = SinkPipeline(TcpWireSink('127.0.0.1', listener.getsockname()[1]), batch_size=3, flush_interval_ms=10)
+    pipeline.start()
+    for seq, symbol in enumerate(('D05GBP/AUD', 'D05EUR/USD', 'D05GBP/AUD', 'D05USD/JPY', 'D05GBP/AUD')):
+        pipeline.put(Transaction(symbol, '20200302090000', 189234 + seq, seq))
+    pipeline.stop()
+    receiver.join(10)
+    listener.close()
+    assert pipeline.stats()['written'] == 5 and len(frames) == 2
+    records = frames[0][0] + frames[1][0]
+    assert [record.seq for record in records] == [0, 1, 2, 3, 4]
+    # symbol ids are stable across batches, every batch carries the table of the connection
+    assert frames[1][1] == ['D05GBP/AUD', 'D05EUR/USD', 'D05USD/JPY']
+    assert [frames[1][1][record.symbol_id] for record in frames[1][0]] == ['D05USD/JPY', 'D05GBP/AUD']
+    assert records[0].flags & FLAG_NO_ASK and records[0].epoch_us == calendar.timegm((2020, 3, 2, 0, 0, 0)) * 1000000
@@ -5,6 +5,38 @@
     since: 0.1.0
 """
 import datetime
+import functools
+from array import array
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+# sequence unit - sequence length
+_SEQUENCE_LENGTHS = {
+    'date': 8,
+    'hour': 10,
+    'minute': 12,
+    'second': 14
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _sequence_datetime(sequence: str) -> datetime.datetime:
+    """ parse date time sequence (memo per second, ticks of one second share the result)
+    :param sequence: date time sequence (YYYYMMDDHHMMSS)
+    :return: DATETIME
+    """
+    if not sequence.isdigit():
+        raise ValueError('invalid date time sequence: {}'.format(sequence))
+    return datetime.datetime(int(sequence[0:4]), int(sequence[4:6]), int(sequence[6:8]),
+                             int(sequence[8:10]), int(sequence[10:12]), int(sequence[12:14]))
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_epoch(date: int) -> int:
+    """ epoch seconds of 00:00:00 UTC of a date (memo per day)
+    :param date: date (YYYYMMDD)
+    :return: epoch seconds
+    """
+    return (datetime.date(date // 10000, date // 100 % 100, date % 100).toordinal() - _EPOCH_ORDINAL) * 86400
 
 
 def datetime_sequence_to_datetime(sequence):
@@ -12,9 +44,10 @@ def datetime_sequence_to_datetime(sequence):
     :param sequence: date time sequence
     :return: DATETIME
     """
+    sequence = str(sequence)
     if len(sequence) != 14:
         return None
-    return datetime.datetime.strptime(str(sequence), '%Y%m%d%H%M%S')
+    return _sequence_datetime(sequence)
 
 
 def datetime_to_sequence(date_time: datetime, return_time_unit=None):
@@ -23,15 +56,32 @@ def datetime_to_sequence(date_time: datetime, return_time_unit=None):
     :param return_time_unit: sequence unit
     :return: date time sequence
     """
-    _format = None
-    if str(return_time_unit).lower() == 'date':
-        _format = '%Y%m%d'
-    elif str(return_time_unit).lower() == 'hour':
-        _format = '%Y%m%d%H'
-    elif str(return_time_unit).lower() == 'minute':
-        _format = '%Y%m%d%H%M'
-    elif str(return_time_unit).lower() == 'second':
-        _format = '%Y%m%d%H%M%S'
-    if _format is not None:
-        return date_time.strftime(_format)
-    return None
+    length = _SEQUENCE_LENGTHS.get(str(return_time_unit).lower())
+    if length is None:
+        return None
+    return ('%04d%02d%02d%02d%02d%02d' % (date_time.year, date_time.month, date_time.day, date_time.hour,
+                                          date_time.minute, date_time.second))[:length]
+
+
+@functools.lru_cache(maxsize=4096)
+def sequence_to_epoch(sequence: str) -> int:
+    """ convert date time sequence to epoch seconds (sequence taken as UTC wall clock, memo per second)
+    :param sequence: date time sequence (YYYYMMDDHHMMSS)
+    :return: epoch seconds
+    """
+    return _day_epoch(int(sequence[0:8])) + int(sequence[8:10]) * 3600 + int(sequence[10:12]) * 60 \
+        + int(sequence[12:14])
+
+
+def date_time_columns_to_epoch(dates, times) -> array:
+    """ convert FID date (9, YYYYMMDD) and time (8, HHMMSS) columns to epoch seconds at once
+    :param dates: integer dates
+    :param times: integer times
+    :return: epoch seconds (array of int64)
+    """
+    if len(dates) != len(times):
+        raise ValueError('date and time columns differ in size. ({}, {})'.format(len(dates), len(times)))
+    # rows of a response share a few dates: one conversion per distinct date
+    day_epochs = {date: _day_epoch(date) for date in set(dates)}
+    return array('q', [day_epochs[date] + hhmmss // 10000 * 3600 + hhmmss // 100 % 100 * 60 + hhmmss % 100
+                       for date, hhmmss in zip(dates, times)])